@@ -1,7 +1,8 @@
 import pathlib
 
-from aws_cdk import Stack, Duration, CfnParameter
+from aws_cdk import Stack, Duration, CfnCondition, CfnParameter, Fn, RemovalPolicy
 from aws_cdk import aws_cloudwatch as cloudwatch
+from aws_cdk import aws_dynamodb as dynamodb
 from aws_cdk import aws_events as events
 from aws_cdk import aws_events_targets as targets
 from aws_cdk import aws_iam as iam
@@ -23,6 +24,8 @@ class ALBMonitorStack(Stack):
                 'Must specify context parameter elbTargetGroupArn. Usage: cdk <COMMAND> -c elbTargetGroupArn ' +
                 '<ELB_TARGET_GROUP_ARN>')
 
+        cw_alarm_name = 'ALBTargetGroupAlarm'
+
         elb_arn_parameter = CfnParameter(
             self, 'elbArn', type='String', description='ARN for ELB')
         elb_listener_arn_parameter = CfnParameter(
@@ -42,6 +45,130 @@ class ALBMonitorStack(Stack):
         restore_mesg_delay_sec_parameter = CfnParameter(
             self, 'restoreMesgDelaySec', type='Number', description='Number of seconds to delay restore messages',
             min_value=60, max_value=300, default=120)
+        max_rule_write_concurrency_parameter = CfnParameter(
+            self, 'maxRuleWriteConcurrency', type='Number',
+            description='Maximum number of listener rules updated in parallel per shed/restore step',
+            min_value=1, max_value=20, default=4)
+        rule_write_version_check_parameter = CfnParameter(
+            self, 'ruleWriteVersionCheck', type='String',
+            description='Re-read each listener rule just before writing it and merge changes made by other invocations',
+            allowed_values=['true', 'false'], default='false')
+        describe_rules_page_size_parameter = CfnParameter(
+            self, 'describeRulesPageSize', type='Number',
+            description='Number of listener rules read per DescribeRules call',
+            min_value=1, max_value=400, default=400)
+        rule_cache_ttl_sec_parameter = CfnParameter(
+            self, 'ruleCacheTtlSec', type='Number',
+            description='Seconds to cache listener rules across warm invocations. 0 disables the cache',
+            min_value=0, max_value=3600, default=0)
+        rule_cache_validate_parameter = CfnParameter(
+            self, 'ruleCacheValidate', type='String',
+            description='Check cached rules for changes made outside of the tool before using them',
+            allowed_values=['true', 'false'], default='true')
+        lease_duration_sec_parameter = CfnParameter(
+            self, 'leaseDurationSec', type='Number',
+            description='Seconds a shed/restore control loop lease is held without being renewed',
+            min_value=300, max_value=3600, default=900)
+        shed_controller_parameter = CfnParameter(
+            self, 'shedController', type='String',
+            description='How shed steps are sized: fixed elbShedPercent steps, or proportional to how far the alarm metric is over the threshold',
+            allowed_values=['fixed', 'proportional'], default='fixed')
+        shed_target_utilization_parameter = CfnParameter(
+            self, 'shedTargetUtilization', type='Number',
+            description='Fraction of the alarm threshold the proportional shed controller aims for',
+            min_value=0.1, max_value=1, default=0.9)
+        shed_policy_parameter = CfnParameter(
+            self, 'shedPolicy', type='String',
+            description='How much each step moves: linear steps, or aimd to shed a fraction of the remaining weight and restore in linear steps',
+            allowed_values=['linear', 'aimd'], default='linear')
+        aimd_decrease_factor_parameter = CfnParameter(
+            self, 'aimdDecreaseFactor', type='Number',
+            description='Fraction of the remaining weight shed per step by the aimd shed policy',
+            min_value=0.1, max_value=1, default=0.5)
+        shed_distribution_parameter = CfnParameter(
+            self, 'shedDistribution', type='String',
+            description='Where shed weight goes when a rule forwards to more than one other target group: even, or capacity to split it by healthy targets',
+            allowed_values=['even', 'capacity'], default='even')
+        secondary_guard_parameter = CfnParameter(
+            self, 'secondaryGuard', type='String',
+            description='Read the alarm metric of the other target groups of a rule and do not shed into saturated ones',
+            allowed_values=['true', 'false'], default='false')
+        secondary_max_utilization_parameter = CfnParameter(
+            self, 'secondaryMaxUtilization', type='Number',
+            description='Fraction of the alarm threshold above which another target group is saturated',
+            min_value=0.1, max_value=1, default=1)
+        shed_budget_weight_parameter = CfnParameter(
+            self, 'shedBudgetWeight', type='Number',
+            description='Most weight all target groups together may shed into one other target group, 0 for no limit',
+            min_value=0, max_value=100, default=0)
+        emf_metrics_parameter = CfnParameter(
+            self, 'emfMetrics', type='String',
+            description='Write API latency, decision time, actions and target group weights as Embedded Metric Format logs',
+            allowed_values=['true', 'false'], default='false')
+        metrics_namespace_parameter = CfnParameter(
+            self, 'metricsNamespace', type='String',
+            description='CloudWatch namespace of the Embedded Metric Format metrics',
+            default='ALBLoadShedding')
+        tracing_parameter = CfnParameter(
+            self, 'tracing', type='String',
+            description='Log trace spans of rule loading, control steps, rule writes and SQS sends',
+            allowed_values=['true', 'false'], default='false')
+        shed_hold_sec_parameter = CfnParameter(
+            self, 'shedHoldSec', type='Number',
+            description='Minimum seconds after a shed step before restoring starts',
+            min_value=0, max_value=3600, default=0)
+        restore_cooldown_sec_parameter = CfnParameter(
+            self, 'restoreCooldownSec', type='Number',
+            description='Seconds the alarm must have been OK before restoring starts',
+            min_value=0, max_value=3600, default=0)
+        restore_ok_evaluations_parameter = CfnParameter(
+            self, 'restoreOkEvaluations', type='Number',
+            description='Number of OK evaluations in a row required before restoring starts',
+            min_value=1, max_value=60, default=1)
+        adaptive_delay_parameter = CfnParameter(
+            self, 'adaptiveDelay', type='String',
+            description='Work out the delay before the next evaluation from the alarm metric trend instead of using fixed delays',
+            allowed_values=['true', 'false'], default='false')
+        min_mesg_delay_sec_parameter = CfnParameter(
+            self, 'minMesgDelaySec', type='Number',
+            description='Shortest delay before the next evaluation with adaptiveDelay',
+            min_value=0, max_value=900, default=10)
+        max_mesg_delay_sec_parameter = CfnParameter(
+            self, 'maxMesgDelaySec', type='Number',
+            description='Longest delay before the next evaluation with adaptiveDelay',
+            min_value=0, max_value=900, default=900)
+        poll_mode_parameter = CfnParameter(
+            self, 'pollMode', type='String',
+            description='Poll the alarm metric and shed without waiting for the alarm to change state',
+            allowed_values=['true', 'false'], default='false')
+        poll_period_sec_parameter = CfnParameter(
+            self, 'pollPeriodSec', type='Number',
+            description='Period in seconds of the datapoints read when polling. Below 60 needs a high-resolution metric',
+            allowed_values=['10', '30', '60'], default=60)
+        poll_evaluation_periods_parameter = CfnParameter(
+            self, 'pollEvaluationPeriods', type='Number',
+            description='Number of polled datapoints that must breach the alarm threshold',
+            min_value=1, max_value=10, default=3)
+        poll_interval_sec_parameter = CfnParameter(
+            self, 'pollIntervalSec', type='Number',
+            description='Seconds between polls of the alarm metric',
+            min_value=5, max_value=60, default=10)
+        predictive_shed_parameter = CfnParameter(
+            self, 'predictiveShed', type='String',
+            description='Shed a little load when the trend of the alarm metric predicts a breach',
+            allowed_values=['true', 'false'], default='false')
+        predict_horizon_sec_parameter = CfnParameter(
+            self, 'predictHorizonSec', type='Number',
+            description='How far ahead in seconds the trend of the alarm metric is projected',
+            min_value=60, max_value=1800, default=300)
+        predict_datapoints_parameter = CfnParameter(
+            self, 'predictDatapoints', type='Number',
+            description='Number of alarm metric datapoints the trend is fitted over',
+            min_value=3, max_value=30, default=5)
+        pre_shed_percent_parameter = CfnParameter(
+            self, 'preShedPercent', type='Number',
+            description='Percentage shed ahead of a predicted breach expressed as an integer',
+            min_value=0, max_value=100, default=5)
         
         # These are the parameters for the CloudWatch Alarm
         cw_alarm_namespace = CfnParameter(
@@ -76,6 +203,16 @@ class ALBMonitorStack(Stack):
             encryption=sqs.QueueEncryption.SQS_MANAGED
         )
 
+        # Lease table that keeps a single control loop running per target group and alarm
+        lease_table = dynamodb.Table(
+            self,
+            'ALBMonitorLeaseTable',
+            partition_key=dynamodb.Attribute(name='leaseId', type=dynamodb.AttributeType.STRING),
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            time_to_live_attribute='expiresAt',
+            removal_policy=RemovalPolicy.DESTROY
+        )
+
         # Least-privilege ELB policy (generated by IAM Policy Autopilot)
         inline_policy_json_elb = {
             'Version': '2012-10-17',
@@ -94,7 +231,8 @@ class ALBMonitorStack(Stack):
                 {
                     "Effect": "Allow",
                     "Action": [
-                        "elasticloadbalancing:DescribeRules"
+                        "elasticloadbalancing:DescribeRules",
+                        "elasticloadbalancing:DescribeTargetHealth"
                     ],
                     "Resource": "*"
                 }
@@ -111,6 +249,14 @@ class ALBMonitorStack(Stack):
                         "cloudwatch:DescribeAlarms"
                     ],
                     "Resource": "arn:aws:cloudwatch:*:*:alarm:*"
+                },
+                {
+                    # GetMetricData does not support resource-level permissions
+                    "Effect": "Allow",
+                    "Action": [
+                        "cloudwatch:GetMetricData"
+                    ],
+                    "Resource": "*"
                 }
             ]
         }
@@ -151,6 +297,23 @@ class ALBMonitorStack(Stack):
         }
 
 
+        # DynamoDB policy for the control loop lease
+        inline_policy_json_dynamodb = {
+            'Version': '2012-10-17',
+            'Statement': [
+                {
+                    "Effect": "Allow",
+                    "Action": [
+                        "dynamodb:GetItem",
+                        "dynamodb:PutItem",
+                        "dynamodb:UpdateItem",
+                        "dynamodb:DeleteItem"
+                    ],
+                    "Resource": lease_table.table_arn
+                }
+            ]
+        }
+
         alarm_lambda_execution_role = iam.Role(
             self, 'ALBAlarmLambdaRole', 
             assumed_by=iam.ServicePrincipal('lambda.amazonaws.com'),
@@ -159,7 +322,8 @@ class ALBMonitorStack(Stack):
                 "elb": iam.PolicyDocument.from_json(inline_policy_json_elb),
                 "cloudwatch": iam.PolicyDocument.from_json(inline_policy_json_cloudwatch),
                 "sqs": iam.PolicyDocument.from_json(inline_policy_json_sqs),
-                "logs": iam.PolicyDocument.from_json(inline_policy_json_logs)
+                "logs": iam.PolicyDocument.from_json(inline_policy_json_logs),
+                "dynamodb": iam.PolicyDocument.from_json(inline_policy_json_dynamodb)
             }
         )
 
@@ -192,7 +356,7 @@ class ALBMonitorStack(Stack):
             handler='alb_alarm_lambda_handler.lambda_handler',
             runtime=lambda_.Runtime.PYTHON_3_13, 
             description='Lambda Handler for ALB Alarms',
-            timeout=Duration.seconds(30),
+            timeout=Duration.seconds(60),
             environment={
                 'ELB_ARN': elb_arn_parameter.value_as_string,
                 'ELB_LISTENER_ARN': elb_listener_arn_parameter.value_as_string,
@@ -201,7 +365,38 @@ class ALBMonitorStack(Stack):
                 'MAX_ELB_SHED_PERCENT': max_elb_shed_percent_parameter.value_as_string,
                 'ELB_RESTORE_PERCENT': elb_restore_percent_parameter.value_as_string,
                 'SHED_MESG_DELAY_SEC': shed_mesg_delay_sec_parameter.value_as_string,
-                'RESTORE_MESG_DELAY_SEC': restore_mesg_delay_sec_parameter.value_as_string
+                'RESTORE_MESG_DELAY_SEC': restore_mesg_delay_sec_parameter.value_as_string,
+                'MAX_RULE_WRITE_CONCURRENCY': max_rule_write_concurrency_parameter.value_as_string,
+                'RULE_WRITE_VERSION_CHECK': rule_write_version_check_parameter.value_as_string,
+                'DESCRIBE_RULES_PAGE_SIZE': describe_rules_page_size_parameter.value_as_string,
+                'RULE_CACHE_TTL_SEC': rule_cache_ttl_sec_parameter.value_as_string,
+                'RULE_CACHE_VALIDATE': rule_cache_validate_parameter.value_as_string,
+                'LEASE_TABLE_NAME': lease_table.table_name,
+                'LEASE_DURATION_SEC': lease_duration_sec_parameter.value_as_string,
+                'SHED_CONTROLLER': shed_controller_parameter.value_as_string,
+                'SHED_TARGET_UTILIZATION': shed_target_utilization_parameter.value_as_string,
+                'SHED_POLICY': shed_policy_parameter.value_as_string,
+                'AIMD_DECREASE_FACTOR': aimd_decrease_factor_parameter.value_as_string,
+                'SHED_DISTRIBUTION': shed_distribution_parameter.value_as_string,
+                'SECONDARY_GUARD': secondary_guard_parameter.value_as_string,
+                'SECONDARY_MAX_UTILIZATION': secondary_max_utilization_parameter.value_as_string,
+                'SHED_BUDGET_WEIGHT': shed_budget_weight_parameter.value_as_string,
+                'EMF_METRICS': emf_metrics_parameter.value_as_string,
+                'METRICS_NAMESPACE': metrics_namespace_parameter.value_as_string,
+                'TRACING': tracing_parameter.value_as_string,
+                'SHED_HOLD_SEC': shed_hold_sec_parameter.value_as_string,
+                'RESTORE_COOLDOWN_SEC': restore_cooldown_sec_parameter.value_as_string,
+                'RESTORE_OK_EVALUATIONS': restore_ok_evaluations_parameter.value_as_string,
+                'POLL_MODE': poll_mode_parameter.value_as_string,
+                'POLL_PERIOD_SEC': poll_period_sec_parameter.value_as_string,
+                'POLL_EVALUATION_PERIODS': poll_evaluation_periods_parameter.value_as_string,
+                'POLL_INTERVAL_SEC': poll_interval_sec_parameter.value_as_string,
+                'CW_ALARM_NAME': cw_alarm_name,
+                'ELB_TARGET_GROUP_ARN': elb_target_group_arn,
+                'PREDICTIVE_SHED': predictive_shed_parameter.value_as_string,
+                'PREDICT_HORIZON_SEC': predict_horizon_sec_parameter.value_as_string,
+                'PREDICT_DATAPOINTS': predict_datapoints_parameter.value_as_string,
+                'PRE_SHED_PERCENT': pre_shed_percent_parameter.value_as_string
             },
             layers=[elb_monitor_layer], 
             memory_size=128,
@@ -226,6 +421,22 @@ class ALBMonitorStack(Stack):
             source_arn= event_rule.rule_arn
         )
 
+        # In poll mode or with predictive shedding the alarm Lambda is invoked every minute and
+        # polls the alarm metric
+        poll_mode_condition = CfnCondition(
+            self, 'PollScheduleEnabled', expression=Fn.condition_or(
+                Fn.condition_equals(poll_mode_parameter.value_as_string, 'true'),
+                Fn.condition_equals(predictive_shed_parameter.value_as_string, 'true')))
+
+        poll_rule = events.Rule(
+            self, 'ALBTargetGroupPollRule', rule_name='ALBTargetGroupPollRule',
+            description='Schedule for polling the ALB target group alarm metric',
+            schedule=events.Schedule.rate(Duration.minutes(1)))
+        poll_rule.add_target(
+            targets.LambdaFunction(self.alb_alarm_lambda))
+        poll_rule.node.default_child.add_property_override(
+            'State', Fn.condition_if(poll_mode_condition.logical_id, 'ENABLED', 'DISABLED'))
+
         # The role for the ALB Alarm Check Queue Lambda
         sqs_message_lambda_execution_role = iam.Role(
             self, 'ALBSQSMessageLambdaRole', 
@@ -235,7 +446,8 @@ class ALBMonitorStack(Stack):
                 "elb": iam.PolicyDocument.from_json(inline_policy_json_elb),
                 "cloudwatch": iam.PolicyDocument.from_json(inline_policy_json_cloudwatch),
                 "sqs": iam.PolicyDocument.from_json(inline_policy_json_sqs),
-                "logs": iam.PolicyDocument.from_json(inline_policy_json_logs)
+                "logs": iam.PolicyDocument.from_json(inline_policy_json_logs),
+                "dynamodb": iam.PolicyDocument.from_json(inline_policy_json_dynamodb)
             }
         )
 
@@ -252,13 +464,51 @@ class ALBMonitorStack(Stack):
             runtime=lambda_.Runtime.PYTHON_3_13, 
             description='Lambda Handler for SQS Messages from ALB Monitor',
             timeout=Duration.seconds(30),
+            environment={
+                'MAX_RULE_WRITE_CONCURRENCY': max_rule_write_concurrency_parameter.value_as_string,
+                'RULE_WRITE_VERSION_CHECK': rule_write_version_check_parameter.value_as_string,
+                'DESCRIBE_RULES_PAGE_SIZE': describe_rules_page_size_parameter.value_as_string,
+                'RULE_CACHE_TTL_SEC': rule_cache_ttl_sec_parameter.value_as_string,
+                'RULE_CACHE_VALIDATE': rule_cache_validate_parameter.value_as_string,
+                'LEASE_TABLE_NAME': lease_table.table_name,
+                'LEASE_DURATION_SEC': lease_duration_sec_parameter.value_as_string,
+                'SHED_CONTROLLER': shed_controller_parameter.value_as_string,
+                'SHED_TARGET_UTILIZATION': shed_target_utilization_parameter.value_as_string,
+                'SHED_POLICY': shed_policy_parameter.value_as_string,
+                'AIMD_DECREASE_FACTOR': aimd_decrease_factor_parameter.value_as_string,
+                'SHED_DISTRIBUTION': shed_distribution_parameter.value_as_string,
+                'SECONDARY_GUARD': secondary_guard_parameter.value_as_string,
+                'SECONDARY_MAX_UTILIZATION': secondary_max_utilization_parameter.value_as_string,
+                'SHED_BUDGET_WEIGHT': shed_budget_weight_parameter.value_as_string,
+                'EMF_METRICS': emf_metrics_parameter.value_as_string,
+                'METRICS_NAMESPACE': metrics_namespace_parameter.value_as_string,
+                'TRACING': tracing_parameter.value_as_string,
+                'SHED_HOLD_SEC': shed_hold_sec_parameter.value_as_string,
+                'RESTORE_COOLDOWN_SEC': restore_cooldown_sec_parameter.value_as_string,
+                'RESTORE_OK_EVALUATIONS': restore_ok_evaluations_parameter.value_as_string,
+                'ADAPTIVE_DELAY': adaptive_delay_parameter.value_as_string,
+                'MIN_MESG_DELAY_SEC': min_mesg_delay_sec_parameter.value_as_string,
+                'MAX_MESG_DELAY_SEC': max_mesg_delay_sec_parameter.value_as_string,
+                'POLL_MODE': poll_mode_parameter.value_as_string,
+                'POLL_PERIOD_SEC': poll_period_sec_parameter.value_as_string,
+                'POLL_EVALUATION_PERIODS': poll_evaluation_periods_parameter.value_as_string,
+                'PREDICTIVE_SHED': predictive_shed_parameter.value_as_string,
+                'PREDICT_HORIZON_SEC': predict_horizon_sec_parameter.value_as_string,
+                'PREDICT_DATAPOINTS': predict_datapoints_parameter.value_as_string,
+                'PRE_SHED_PERCENT': pre_shed_percent_parameter.value_as_string
+            },
             layers=[elb_monitor_layer], 
             memory_size=128,
             role=sqs_message_lambda_execution_role
         )
 
+        # Process every message in the batch and only redeliver the ones that failed
         alb_sqs_message_lambda.add_event_source(
-            lambda_event_sources.SqsEventSource(queue))
+            lambda_event_sources.SqsEventSource(
+                queue,
+                batch_size=10,
+                report_batch_item_failures=True
+            ))
 
         ##################################
         ## Set up the CloudWatch Alarm
@@ -285,7 +535,7 @@ class ALBMonitorStack(Stack):
 
         cw_alarm = cloudwatch.Alarm(
             self, 'ALBTargetGroupAlarm', 
-            alarm_name='ALBTargetGroupAlarm',
+            alarm_name=cw_alarm_name,
             alarm_description='Alarm for RequestCountPerTarget',
             metric=request_count_per_target_metric, 
             threshold=cw_alarm_threshold.value_as_number,
@@ -35,8 +35,8 @@ def test_stack_creates_cloudwatch_alarms(template):
 
 
 def test_stack_creates_eventbridge_rule(template):
-    """Test stack creates EventBridge rule"""
-    template.resource_count_is("AWS::Events::Rule", 1)
+    """Test stack creates EventBridge rules for alarm events and polling"""
+    template.resource_count_is("AWS::Events::Rule", 2)
 
 
 def test_lambda_has_python_313_runtime(template):
@@ -103,3 +103,238 @@ def test_lambda_has_environment_variables(template):
             }
         })
     )
+
+
+def test_sqs_event_source_reports_batch_item_failures(template):
+    """Test SQS event source processes batches with partial failure reporting"""
+    template.has_resource_properties("AWS::Lambda::EventSourceMapping", {
+        "BatchSize": 10,
+        "FunctionResponseTypes": ["ReportBatchItemFailures"]
+    })
+
+
+def test_sqs_lambda_has_rule_write_concurrency(template):
+    """Test both Lambda functions receive the rule write concurrency setting"""
+    template.has_resource_properties("AWS::Lambda::Function", {
+        "Handler": "alb_alarm_check_lambda_handler.lambda_handler",
+        "Environment": {
+            "Variables": {
+                "MAX_RULE_WRITE_CONCURRENCY": Match.any_value(),
+                "DESCRIBE_RULES_PAGE_SIZE": Match.any_value()
+            }
+        }
+    })
+    template.has_resource_properties("AWS::Lambda::Function", {
+        "Handler": "alb_alarm_lambda_handler.lambda_handler",
+        "Environment": {
+            "Variables": Match.object_like({
+                "MAX_RULE_WRITE_CONCURRENCY": Match.any_value(),
+                "RULE_WRITE_VERSION_CHECK": Match.any_value()
+            })
+        }
+    })
+
+
+def test_stack_creates_lease_table(template):
+    """Test stack creates the control loop lease table with TTL"""
+    template.resource_count_is("AWS::DynamoDB::Table", 1)
+    template.has_resource_properties("AWS::DynamoDB::Table", {
+        "KeySchema": [{"AttributeName": "leaseId", "KeyType": "HASH"}],
+        "BillingMode": "PAY_PER_REQUEST",
+        "TimeToLiveSpecification": {"AttributeName": "expiresAt", "Enabled": True}
+    })
+    template.has_resource_properties("AWS::Lambda::Function", {
+        "Handler": "alb_alarm_check_lambda_handler.lambda_handler",
+        "Environment": {
+            "Variables": Match.object_like({
+                "LEASE_TABLE_NAME": Match.any_value(),
+                "LEASE_DURATION_SEC": Match.any_value()
+            })
+        }
+    })
+
+
+def test_lambdas_can_read_alarm_metrics(template):
+    """Test both Lambda functions receive the shed controller settings and may call GetMetricData"""
+    for handler in ("alb_alarm_lambda_handler.lambda_handler", "alb_alarm_check_lambda_handler.lambda_handler"):
+        template.has_resource_properties("AWS::Lambda::Function", {
+            "Handler": handler,
+            "Environment": {
+                "Variables": Match.object_like({
+                    "SHED_CONTROLLER": Match.any_value(),
+                    "SHED_TARGET_UTILIZATION": Match.any_value(),
+                    "SHED_POLICY": Match.any_value(),
+                    "AIMD_DECREASE_FACTOR": Match.any_value(),
+                    "SHED_HOLD_SEC": Match.any_value(),
+                    "RESTORE_COOLDOWN_SEC": Match.any_value(),
+                    "RESTORE_OK_EVALUATIONS": Match.any_value()
+                })
+            }
+        })
+    template.has_resource_properties("AWS::IAM::Role", {
+        "Policies": Match.array_with([
+            Match.object_like({
+                "PolicyName": "cloudwatch",
+                "PolicyDocument": {
+                    "Statement": Match.array_with([
+                        Match.object_like({"Action": "cloudwatch:GetMetricData", "Resource": "*"})
+                    ])
+                }
+            })
+        ])
+    })
+
+
+def test_sqs_lambda_has_adaptive_delay(template):
+    """Test the SQS Lambda function receives the adaptive delay settings"""
+    template.has_resource_properties("AWS::Lambda::Function", {
+        "Handler": "alb_alarm_check_lambda_handler.lambda_handler",
+        "Environment": {
+            "Variables": Match.object_like({
+                "ADAPTIVE_DELAY": Match.any_value(),
+                "MIN_MESG_DELAY_SEC": Match.any_value(),
+                "MAX_MESG_DELAY_SEC": Match.any_value()
+            })
+        }
+    })
+
+
+def test_poll_rule_is_enabled_by_poll_mode(template):
+    """Test the polling schedule is only enabled when pollMode or predictiveShed is true"""
+    template.has_resource_properties("AWS::Events::Rule", {
+        "ScheduleExpression": "rate(1 minute)",
+        "State": {
+            "Fn::If": ["PollScheduleEnabled", "ENABLED", "DISABLED"]
+        }
+    })
+
+
+def test_alarm_lambda_has_poll_settings(template):
+    """Test the alarm Lambda function receives the poll settings and can poll for a minute"""
+    template.has_resource_properties("AWS::Lambda::Function", {
+        "Handler": "alb_alarm_lambda_handler.lambda_handler",
+        "Timeout": 60,
+        "Environment": {
+            "Variables": Match.object_like({
+                "POLL_MODE": Match.any_value(),
+                "POLL_PERIOD_SEC": Match.any_value(),
+                "POLL_EVALUATION_PERIODS": Match.any_value(),
+                "POLL_INTERVAL_SEC": Match.any_value(),
+                "CW_ALARM_NAME": "ALBTargetGroupAlarm",
+                "ELB_TARGET_GROUP_ARN": Match.any_value()
+            })
+        }
+    })
+
+
+def test_lambdas_have_predictive_shed_settings(template):
+    """Test both Lambda functions receive the predictive shedding settings"""
+    for handler in ("alb_alarm_lambda_handler.lambda_handler", "alb_alarm_check_lambda_handler.lambda_handler"):
+        template.has_resource_properties("AWS::Lambda::Function", {
+            "Handler": handler,
+            "Environment": {
+                "Variables": Match.object_like({
+                    "PREDICTIVE_SHED": Match.any_value(),
+                    "PREDICT_HORIZON_SEC": Match.any_value(),
+                    "PREDICT_DATAPOINTS": Match.any_value(),
+                    "PRE_SHED_PERCENT": Match.any_value()
+                })
+            }
+        })
+
+
+def test_lambdas_can_read_target_health(template):
+    """Test both Lambda functions receive the shed distribution and may call DescribeTargetHealth"""
+    for handler in ("alb_alarm_lambda_handler.lambda_handler", "alb_alarm_check_lambda_handler.lambda_handler"):
+        template.has_resource_properties("AWS::Lambda::Function", {
+            "Handler": handler,
+            "Environment": {
+                "Variables": Match.object_like({
+                    "SHED_DISTRIBUTION": Match.any_value()
+                })
+            }
+        })
+    template.has_resource_properties("AWS::IAM::Role", {
+        "Policies": Match.array_with([
+            Match.object_like({
+                "PolicyName": "elb",
+                "PolicyDocument": {
+                    "Statement": Match.array_with([
+                        Match.object_like({
+                            "Action": Match.array_with(["elasticloadbalancing:DescribeTargetHealth"]),
+                            "Resource": "*"
+                        })
+                    ])
+                }
+            })
+        ])
+    })
+
+
+def test_lambdas_have_secondary_guard_settings(template):
+    """Test both Lambda functions receive the secondary guard settings"""
+    for handler in ("alb_alarm_lambda_handler.lambda_handler", "alb_alarm_check_lambda_handler.lambda_handler"):
+        template.has_resource_properties("AWS::Lambda::Function", {
+            "Handler": handler,
+            "Environment": {
+                "Variables": Match.object_like({
+                    "SECONDARY_GUARD": Match.any_value(),
+                    "SECONDARY_MAX_UTILIZATION": Match.any_value()
+                })
+            }
+        })
+
+
+def test_lambdas_have_shed_budget_settings(template):
+    """Test both Lambda functions receive the shed budget and can read it from the lease table"""
+    for handler in ("alb_alarm_lambda_handler.lambda_handler", "alb_alarm_check_lambda_handler.lambda_handler"):
+        template.has_resource_properties("AWS::Lambda::Function", {
+            "Handler": handler,
+            "Environment": {
+                "Variables": Match.object_like({
+                    "SHED_BUDGET_WEIGHT": Match.any_value(),
+                    "LEASE_TABLE_NAME": Match.any_value()
+                })
+            }
+        })
+
+    template.has_resource_properties("AWS::IAM::Role", {
+        "Policies": Match.array_with([
+            Match.object_like({
+                "PolicyDocument": {
+                    "Statement": Match.array_with([
+                        Match.object_like({
+                            "Action": Match.array_with(["dynamodb:GetItem"])
+                        })
+                    ])
+                }
+            })
+        ])
+    })
+
+
+def test_lambdas_have_metrics_settings(template):
+    """Test both Lambda functions receive the Embedded Metric Format settings"""
+    for handler in ("alb_alarm_lambda_handler.lambda_handler", "alb_alarm_check_lambda_handler.lambda_handler"):
+        template.has_resource_properties("AWS::Lambda::Function", {
+            "Handler": handler,
+            "Environment": {
+                "Variables": Match.object_like({
+                    "EMF_METRICS": Match.any_value(),
+                    "METRICS_NAMESPACE": Match.any_value()
+                })
+            }
+        })
+
+
+def test_lambdas_have_tracing_settings(template):
+    """Test both Lambda functions receive the tracing setting"""
+    for handler in ("alb_alarm_lambda_handler.lambda_handler", "alb_alarm_check_lambda_handler.lambda_handler"):
+        template.has_resource_properties("AWS::Lambda::Function", {
+            "Handler": handler,
+            "Environment": {
+                "Variables": Match.object_like({
+                    "TRACING": Match.any_value()
+                })
+            }
+        })
@@ -1,9 +1,28 @@
-import boto3
 import json
 import logging
+import time
 
+from elb_load_monitor.adaptive_delay import get_adaptive_delay
 from elb_load_monitor.alb_alarm_messages import ALBAlarmStatusMessage
 from elb_load_monitor.alb_listener_rules_handler import ALBAlarmAction, ALBListenerRulesHandler
+from elb_load_monitor.control_lease import get_control_lease
+from elb_load_monitor.hysteresis import get_shed_hysteresis
+from elb_load_monitor.metrics import EMFMetrics
+from elb_load_monitor.metrics import get_metrics
+from elb_load_monitor.metric_poller import get_metric_poller
+from elb_load_monitor.cw_alarms import describe_metric_alarms
+from elb_load_monitor.cw_alarms import get_alarm_states
+from elb_load_monitor.rule_writer import ELBRuleWriter
+from elb_load_monitor.secondary_guard import get_secondary_health_guard
+from elb_load_monitor.shed_budget import get_shed_budget
+from elb_load_monitor.shed_controller import get_shed_controller
+from elb_load_monitor.shed_predictor import get_shed_predictor
+from elb_load_monitor.shed_strategy import get_shed_strategy
+from elb_load_monitor.target_health import TargetHealthCounter
+from elb_load_monitor.tracing import get_tracer
+from elb_load_monitor import clients
+from elb_load_monitor import config
+from elb_load_monitor import rule_cache
 from elb_load_monitor import util
 
 
@@ -11,47 +30,178 @@ logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
 
-def lambda_handler(event, context, elbv2_client=None, sqs_client=None, cw_client=None):
+def lambda_handler(event, context, elbv2_client=None, sqs_client=None, cw_client=None, dynamodb_client=None):
     """
     Lambda handler for SQS messages.
-    
+
+    Every record in the batch is processed. Records are grouped by target group so that
+    the listener rules are only read once per group. Records that fail are reported in
+    batchItemFailures so that only those messages are redelivered by SQS.
+
     Args:
         event: SQS event
         context: Lambda context
         elbv2_client: Optional boto3 ELB client (for testing)
         sqs_client: Optional boto3 SQS client (for testing)
         cw_client: Optional boto3 CloudWatch client (for testing)
+        dynamodb_client: Optional boto3 DynamoDB client for the control loop lease (for testing)
     """
     logger.info(json.dumps(event, default=util.datetime_handler))
 
-    # Initialize clients if not provided (for testing)
+    if len(event['Records']) == 0:
+        logger.warning('No SQS message: ')
+        return
+
+    # Reuse pooled clients across warm invocations unless provided (for testing)
     if elbv2_client is None:
-        elbv2_client = boto3.client('elbv2')
+        elbv2_client = clients.get_client('elbv2')
     if sqs_client is None:
-        sqs_client = boto3.client('sqs')
+        sqs_client = clients.get_client('sqs')
     if cw_client is None:
-        cw_client = boto3.client('cloudwatch')
+        cw_client = clients.get_client('cloudwatch')
 
-    if len(event['Records']) == 0:
-        logger.warning('No SQS message: ')
-        return
+    alb_monitor_config = config.get_config()
+    metrics = get_metrics(alb_monitor_config.emf_metrics, alb_monitor_config.metrics_namespace)
+
+    if metrics is not None:
+        elbv2_client = metrics.instrument(elbv2_client, 'elbv2')
+        sqs_client = metrics.instrument(sqs_client, 'sqs')
+        cw_client = metrics.instrument(cw_client, 'cloudwatch')
+
+    try:
+        return process_records(event, alb_monitor_config, elbv2_client, sqs_client, cw_client, dynamodb_client, metrics)
+    finally:
+        if metrics is not None:
+            metrics.flush()
+
+
+def process_records(
+        event, alb_monitor_config: config.ALBMonitorConfig, elbv2_client, sqs_client, cw_client, dynamodb_client,
+        metrics: EMFMetrics = None):
+    """
+    Handles the alarm status messages of the batch and returns the Lambda response.
+    """
+    tracer = get_tracer(alb_monitor_config.tracing)
+    rule_writer = ELBRuleWriter(
+        max_concurrency=alb_monitor_config.max_rule_write_concurrency,
+        version_check=alb_monitor_config.rule_write_version_check, tracer=tracer)
+    listener_rule_cache = rule_cache.get_rule_cache(
+        alb_monitor_config.rule_cache_ttl_sec, alb_monitor_config.rule_cache_max_listeners,
+        alb_monitor_config.rule_cache_validate)
+    control_lease = get_control_lease(
+        alb_monitor_config.lease_table_name, alb_monitor_config.lease_duration_sec, dynamodb_client)
+    shed_controller = get_shed_controller(
+        alb_monitor_config.shed_controller, alb_monitor_config.shed_target_utilization)
+    shed_strategy = get_shed_strategy(
+        alb_monitor_config.shed_policy, alb_monitor_config.aimd_decrease_factor, alb_monitor_config.shed_distribution,
+        TargetHealthCounter(elbv2_client).get_healthy_target_count)
+    hysteresis = get_shed_hysteresis(
+        alb_monitor_config.shed_hold_sec, alb_monitor_config.restore_cooldown_sec,
+        alb_monitor_config.restore_ok_evaluations)
+    adaptive_delay = get_adaptive_delay(
+        alb_monitor_config.adaptive_delay, alb_monitor_config.min_mesg_delay_sec,
+        alb_monitor_config.max_mesg_delay_sec,
+        alb_monitor_config.lease_duration_sec if control_lease is not None else None)
+    metric_poller = get_metric_poller(
+        alb_monitor_config.poll_mode, alb_monitor_config.poll_period_sec, alb_monitor_config.poll_evaluation_periods)
+    shed_predictor = get_shed_predictor(
+        alb_monitor_config.predictive_shed, alb_monitor_config.predict_horizon_sec,
+        alb_monitor_config.predict_datapoints, alb_monitor_config.pre_shed_percent)
+    secondary_guard = get_secondary_health_guard(
+        alb_monitor_config.secondary_guard, alb_monitor_config.secondary_max_utilization)
+    shed_budget = get_shed_budget(
+        alb_monitor_config.shed_budget_weight, alb_monitor_config.lease_table_name, dynamodb_client,
+        alb_monitor_config.lease_duration_sec)
 
-    message = event['Records'][0]['body']
+    batch_item_failures = []
+    alarm_actions = []
+    # secondary target group decisions of the last shed per target group
+    secondary_health = dict()
 
-    alb_alarm_status_message = ALBAlarmStatusMessage.from_json(
-        json.loads(message))
+    groups = group_records(event['Records'], batch_item_failures)
 
-    alb_listener_rules_handler = ALBListenerRulesHandler(
-        elbv2_client, alb_alarm_status_message.load_balancer_arn,
-        alb_alarm_status_message.elb_listener_arn, alb_alarm_status_message.target_group_arn,
-        alb_alarm_status_message.elb_shed_percent, alb_alarm_status_message.max_elb_shed_percent,
-        alb_alarm_status_message.elb_restore_percent, alb_alarm_status_message.shed_mesg_delay_sec,
-        alb_alarm_status_message.restore_mesg_delay_sec)
+    # resolve the alarm state and definition of every message in the batch with as few calls as possible
+    alarm_names = [
+        alb_alarm_status_message.cw_alarm_name for group in groups.values()
+        for _, alb_alarm_status_message in group
+    ]
 
-    alb_alarm_action = alb_listener_rules_handler.handle_alarm_status_message(
-        cw_client, elbv2_client, sqs_client, alb_alarm_status_message)
+    try:
+        metric_alarms = describe_metric_alarms(cw_client, alarm_names)
+        cw_alarm_states = get_alarm_states(metric_alarms)
+    except Exception as e:
+        logger.warning(f'Unable to describe alarms for batch, describing per message: {str(e)}')
+        metric_alarms = None
+        cw_alarm_states = None
+
+    for group in groups.values():
+        alb_listener_rules_handler = None
+
+        for message_id, alb_alarm_status_message in group:
+            try:
+                if alb_listener_rules_handler is None:
+                    alb_listener_rules_handler = ALBListenerRulesHandler(
+                        elbv2_client, alb_alarm_status_message.load_balancer_arn,
+                        alb_alarm_status_message.elb_listener_arn, alb_alarm_status_message.target_group_arn,
+                        alb_alarm_status_message.elb_shed_percent, alb_alarm_status_message.max_elb_shed_percent,
+                        alb_alarm_status_message.elb_restore_percent, alb_alarm_status_message.shed_mesg_delay_sec,
+                        alb_alarm_status_message.restore_mesg_delay_sec, rule_writer=rule_writer,
+                        describe_rules_page_size=alb_monitor_config.describe_rules_page_size,
+                        target_group_rule_count=alb_alarm_status_message.target_group_rule_count,
+                        rule_cache=listener_rule_cache, control_lease=control_lease,
+                        shed_controller=shed_controller, shed_strategy=shed_strategy, hysteresis=hysteresis,
+                        adaptive_delay=adaptive_delay, metric_poller=metric_poller,
+                        shed_predictor=shed_predictor, secondary_guard=secondary_guard,
+                        shed_budget=shed_budget, metrics=metrics, tracer=tracer)
+
+                with alb_listener_rules_handler.trace_step(
+                        'handle_alarm_status_message', alb_alarm_status_message.trace_context) as span:
+                    start = time.perf_counter()
+                    alb_alarm_action = alb_listener_rules_handler.handle_alarm_status_message(
+                        cw_client, elbv2_client, sqs_client, alb_alarm_status_message, cw_alarm_states,
+                        metric_alarms)
+                    alb_listener_rules_handler.put_step_metrics(alb_alarm_action, start, span)
+
+                alarm_actions.append(alb_alarm_action.name)
+
+                if len(alb_listener_rules_handler.secondary_health) > 0:
+                    secondary_health[alb_alarm_status_message.target_group_arn] = \
+                        alb_listener_rules_handler.get_secondary_health_report()
+            except Exception as e:
+                logger.error(f'Error processing SQS message {message_id}: {str(e)}')
+                batch_item_failures.append({'itemIdentifier': message_id})
 
     return {
         'statusCode': 200,
-        'message': 'New Alarm State:' + alb_alarm_action.name
+        'message': 'New Alarm State:' + ','.join(alarm_actions),
+        'batchItemFailures': batch_item_failures,
+        'secondaryHealth': secondary_health
     }
+
+
+def group_records(records: list, batch_item_failures: list) -> dict:
+    """
+    Parses SQS records into ALBAlarmStatusMessages grouped by (listener, target group),
+    preserving the order in which they were received. Records that cannot be parsed are
+    added to batch_item_failures.
+    """
+    groups = dict()
+
+    for record in records:
+        message_id = record.get('messageId')
+
+        try:
+            alb_alarm_status_message = ALBAlarmStatusMessage.from_json(
+                json.loads(record['body']))
+        except Exception as e:
+            logger.error(f'Unable to parse SQS message {message_id}: {str(e)}')
+            batch_item_failures.append({'itemIdentifier': message_id})
+            continue
+
+        group_key = (alb_alarm_status_message.load_balancer_arn, alb_alarm_status_message.elb_listener_arn,
+                     alb_alarm_status_message.target_group_arn)
+
+        groups.setdefault(group_key, []).append(
+            (message_id, alb_alarm_status_message))
+
+    return groups
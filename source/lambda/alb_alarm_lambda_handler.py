@@ -1,46 +1,93 @@
+from elb_load_monitor.alb_alarm_messages import ALBAlarmAction
 from elb_load_monitor.alb_alarm_messages import CWAlarmState
 from elb_load_monitor.alb_alarm_messages import ALBAlarmEvent
 from elb_load_monitor.alb_listener_rules_handler import ALBListenerRulesHandler
+from elb_load_monitor.control_lease import get_control_lease
+from elb_load_monitor.cw_alarms import describe_metric_alarms
+from elb_load_monitor.hysteresis import get_shed_hysteresis
+from elb_load_monitor.metrics import EMFMetrics
+from elb_load_monitor.metrics import get_metrics
+from elb_load_monitor.metric_poller import get_metric_poller
+from elb_load_monitor.rule_writer import ELBRuleWriter
+from elb_load_monitor.secondary_guard import get_secondary_health_guard
+from elb_load_monitor.shed_budget import get_shed_budget
+from elb_load_monitor.shed_controller import SHED_CONTROLLER_PROPORTIONAL
+from elb_load_monitor.shed_controller import get_shed_controller
+from elb_load_monitor.shed_predictor import get_shed_predictor
+from elb_load_monitor.shed_strategy import get_shed_strategy
+from elb_load_monitor.target_health import TargetHealthCounter
+from elb_load_monitor.tracing import get_tracer
+from elb_load_monitor import clients
+from elb_load_monitor import config
+from elb_load_monitor import rule_cache
+from elb_load_monitor import util
 
-import boto3
 import json
 import logging
-import os
+import time
 
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
 
-def lambda_handler(event, context, elbv2_client=None, sqs_client=None):
+def lambda_handler(event, context, elbv2_client=None, sqs_client=None, dynamodb_client=None, cw_client=None):
     """
-    Lambda handler for ALB alarm events.
+    Lambda handler for ALB alarm events. In poll mode or with predictive shedding it is also
+    invoked on a schedule to poll the alarm metric.
     
     Args:
         event: EventBridge event
         context: Lambda context
         elbv2_client: Optional boto3 ELB client (for testing)
         sqs_client: Optional boto3 SQS client (for testing)
+        dynamodb_client: Optional boto3 DynamoDB client for the control loop lease (for testing)
+        cw_client: Optional boto3 CloudWatch client for the shed controller and polling (for testing)
     """
     logger.info(json.dumps(event))
 
-    # Initialize clients if not provided (for testing)
+    # Reuse pooled clients across warm invocations unless provided (for testing)
     if elbv2_client is None:
-        elbv2_client = boto3.client('elbv2')
+        elbv2_client = clients.get_client('elbv2')
     if sqs_client is None:
-        sqs_client = boto3.client('sqs')
-
-    # Load environment variables
-    load_balancer_arn = os.environ.get('ELB_ARN')
-    elb_listener_arn = os.environ.get('ELB_LISTENER_ARN')
-    sqs_queue_url = os.environ.get('SQS_QUEUE_URL')
-    elb_shed_percent = int(os.getenv('ELB_SHED_PERCENT', 5))
-    max_elb_shed_percent = int(os.getenv('MAX_ELB_SHED_PERCENT', 100))
-    elb_restore_percent = int(os.getenv('ELB_RESTORE_PERCENT', 5))
-    shed_mesg_delay_sec = int(os.getenv('SHED_MESG_DELAY_SEC', 60))
-    restore_mesg_delay_sec = int(os.getenv('RESTORE_MESG_DELAY_SEC', 60))
+        sqs_client = clients.get_client('sqs')
 
+    # Environment configuration is parsed once and cached across warm invocations
+    alb_monitor_config = config.get_config()
+
+    # the alarm metric is only read when shed steps are sized from it or polled
+    if (alb_monitor_config.shed_controller == SHED_CONTROLLER_PROPORTIONAL or alb_monitor_config.poll_mode or
+            alb_monitor_config.predictive_shed or alb_monitor_config.secondary_guard) and cw_client is None:
+        cw_client = clients.get_client('cloudwatch')
+
+    metrics = get_metrics(alb_monitor_config.emf_metrics, alb_monitor_config.metrics_namespace)
+
+    if metrics is not None:
+        elbv2_client = metrics.instrument(elbv2_client, 'elbv2')
+        sqs_client = metrics.instrument(sqs_client, 'sqs')
+
+        if cw_client is not None:
+            cw_client = metrics.instrument(cw_client, 'cloudwatch')
+
+    try:
+        return handle_event(event, alb_monitor_config, elbv2_client, sqs_client, dynamodb_client, cw_client, metrics)
+    finally:
+        if metrics is not None:
+            metrics.flush()
+
+
+def handle_event(
+        event, alb_monitor_config: config.ALBMonitorConfig, elbv2_client, sqs_client, dynamodb_client, cw_client,
+        metrics: EMFMetrics = None):
+    """
+    Handles an alarm state change, or polls the alarm metric on a scheduled event.
+    """
     event_type = event['detail-type']
+
+    if event_type == 'Scheduled Event':
+        return poll_alarm_metric(
+            event, alb_monitor_config, elbv2_client, sqs_client, cw_client, dynamodb_client, metrics=metrics)
+
     if event_type == 'Cloudwatch Alarm State Change':
         return {
             "statusCode": 403,
@@ -50,7 +97,8 @@ def lambda_handler(event, context, elbv2_client=None, sqs_client=None):
     alb_alarm_event = ALBAlarmEvent(
         alarm_event_id=event['id'], alarm_arn=event['resources'][0],
         alarm_name=event['detail']['alarmName'],
-        cw_alarm_state=CWAlarmState[event['detail']['state']['value']])
+        cw_alarm_state=CWAlarmState[event['detail']['state']['value']],
+        alarm_at=util.parse_timestamp(event['detail']['state'].get('timestamp') or event.get('time')))
 
     account_id = event['account']
     region = event['region']
@@ -60,14 +108,160 @@ def lambda_handler(event, context, elbv2_client=None, sqs_client=None):
     target_group_arn = 'arn:aws:elasticloadbalancing:' + \
         region + ':' + account_id + ':' + target_group_id
 
-    alb_listener_rules_handler = ALBListenerRulesHandler(
-        elbv2_client, load_balancer_arn, elb_listener_arn, target_group_arn, elb_shed_percent, max_elb_shed_percent,
-        elb_restore_percent, shed_mesg_delay_sec, restore_mesg_delay_sec)
+    alb_listener_rules_handler = create_alb_listener_rules_handler(
+        alb_monitor_config, elbv2_client, target_group_arn, dynamodb_client, metrics)
 
-    alb_alarm_action = alb_listener_rules_handler.handle_alarm(
-        elbv2_client, sqs_client, sqs_queue_url, alb_alarm_event)
+    with alb_listener_rules_handler.trace_step('handle_alarm') as span:
+        start = time.perf_counter()
+        alb_alarm_action = alb_listener_rules_handler.handle_alarm(
+            elbv2_client, sqs_client, alb_monitor_config.sqs_queue_url, alb_alarm_event, cw_client)
+        alb_listener_rules_handler.put_step_metrics(alb_alarm_action, start, span)
 
     return {
         'statusCode': 200,
-        'message': 'Processed alarm:' + alb_alarm_action.name
+        'message': 'Processed alarm:' + alb_alarm_action.name,
+        'secondaryHealth': alb_listener_rules_handler.get_secondary_health_report()
     }
+
+
+def poll_alarm_metric(
+        event, alb_monitor_config: config.ALBMonitorConfig, elbv2_client, sqs_client, cw_client, dynamodb_client,
+        sleep=time.sleep, clock=time.monotonic, metrics: EMFMetrics = None):
+    """
+    Polls the alarm metric every poll_interval_sec for poll_duration_sec. In poll mode shedding
+    starts as soon as the high-resolution datapoints breach, without waiting for the alarm to
+    change state. With predictive shedding a little load is shed as soon as the trend of the
+    metric predicts a breach.
+    """
+    cw_alarm_name = alb_monitor_config.cw_alarm_name
+
+    if not (alb_monitor_config.poll_mode or alb_monitor_config.predictive_shed) or cw_alarm_name is None or \
+            alb_monitor_config.target_group_arn is None:
+        logger.warning('Poll mode is not configured, ignoring scheduled event')
+
+        return {
+            'statusCode': 200,
+            'message': 'Polling disabled'
+        }
+
+    metric_alarm = describe_metric_alarms(cw_client, [cw_alarm_name]).get(cw_alarm_name)
+
+    if metric_alarm is None:
+        logger.error('No alarm with alarm name: ' + cw_alarm_name)
+
+        return {
+            'statusCode': 404,
+            'message': 'No alarm with alarm name: ' + cw_alarm_name
+        }
+
+    if metric_alarm['StateValue'] == CWAlarmState.ALARM.name:
+        # the alarm event has already started shedding
+        return {
+            'statusCode': 200,
+            'message': 'Polled alarm:' + ALBAlarmAction.NONE.name,
+            'polls': 0
+        }
+
+    metric_poller = get_metric_poller(
+        alb_monitor_config.poll_mode, alb_monitor_config.poll_period_sec, alb_monitor_config.poll_evaluation_periods)
+    shed_predictor = get_shed_predictor(
+        alb_monitor_config.predictive_shed, alb_monitor_config.predict_horizon_sec,
+        alb_monitor_config.predict_datapoints, alb_monitor_config.pre_shed_percent)
+
+    alb_alarm_action = ALBAlarmAction.NONE
+    alb_listener_rules_handler = None
+    polls = 0
+    start = clock()
+
+    while True:
+        polls += 1
+
+        if metric_poller is not None and metric_poller.poll(cw_client, metric_alarm) == CWAlarmState.ALARM:
+            logger.info('Polled metric for ' + cw_alarm_name + ' breaches its threshold, shedding')
+
+            alb_alarm_event = ALBAlarmEvent(
+                alarm_event_id=event['id'], alarm_arn=metric_alarm['AlarmArn'], alarm_name=cw_alarm_name,
+                cw_alarm_state=CWAlarmState.ALARM, alarm_at=time.time())
+
+            alb_listener_rules_handler = create_alb_listener_rules_handler(
+                alb_monitor_config, elbv2_client, alb_monitor_config.target_group_arn, dynamodb_client, metrics)
+
+            with alb_listener_rules_handler.trace_step('handle_polled_alarm') as span:
+                step_start = time.perf_counter()
+                alb_alarm_action = alb_listener_rules_handler.handle_alarm(
+                    elbv2_client, sqs_client, alb_monitor_config.sqs_queue_url, alb_alarm_event, cw_client)
+                alb_listener_rules_handler.put_step_metrics(alb_alarm_action, step_start, span)
+
+            break
+
+        if shed_predictor is not None and shed_predictor.is_breach_predicted(cw_client, metric_alarm):
+            alb_alarm_event = ALBAlarmEvent(
+                alarm_event_id=event['id'], alarm_arn=metric_alarm['AlarmArn'], alarm_name=cw_alarm_name,
+                cw_alarm_state=CWAlarmState.OK, alarm_at=time.time())
+
+            alb_listener_rules_handler = create_alb_listener_rules_handler(
+                alb_monitor_config, elbv2_client, alb_monitor_config.target_group_arn, dynamodb_client, metrics)
+
+            with alb_listener_rules_handler.trace_step('handle_predicted_breach') as span:
+                step_start = time.perf_counter()
+                alb_alarm_action = alb_listener_rules_handler.handle_predicted_breach(
+                    elbv2_client, sqs_client, alb_monitor_config.sqs_queue_url, alb_alarm_event, cw_client)
+                alb_listener_rules_handler.put_step_metrics(alb_alarm_action, step_start, span)
+
+            break
+
+        if clock() - start + alb_monitor_config.poll_interval_sec > alb_monitor_config.poll_duration_sec:
+            break
+
+        sleep(alb_monitor_config.poll_interval_sec)
+
+    secondary_health = []
+
+    if alb_listener_rules_handler is not None:
+        secondary_health = alb_listener_rules_handler.get_secondary_health_report()
+
+    return {
+        'statusCode': 200,
+        'message': 'Polled alarm:' + alb_alarm_action.name,
+        'polls': polls,
+        'secondaryHealth': secondary_health
+    }
+
+
+def create_alb_listener_rules_handler(
+        alb_monitor_config: config.ALBMonitorConfig, elbv2_client, target_group_arn: str,
+        dynamodb_client=None, metrics: EMFMetrics = None) -> ALBListenerRulesHandler:
+    tracer = get_tracer(alb_monitor_config.tracing)
+
+    return ALBListenerRulesHandler(
+        elbv2_client, alb_monitor_config.load_balancer_arn, alb_monitor_config.elb_listener_arn, target_group_arn,
+        alb_monitor_config.elb_shed_percent, alb_monitor_config.max_elb_shed_percent,
+        alb_monitor_config.elb_restore_percent, alb_monitor_config.shed_mesg_delay_sec,
+        alb_monitor_config.restore_mesg_delay_sec,
+        rule_writer=ELBRuleWriter(
+            max_concurrency=alb_monitor_config.max_rule_write_concurrency,
+            version_check=alb_monitor_config.rule_write_version_check, tracer=tracer),
+        describe_rules_page_size=alb_monitor_config.describe_rules_page_size,
+        rule_cache=rule_cache.get_rule_cache(
+            alb_monitor_config.rule_cache_ttl_sec, alb_monitor_config.rule_cache_max_listeners,
+            alb_monitor_config.rule_cache_validate),
+        control_lease=get_control_lease(
+            alb_monitor_config.lease_table_name, alb_monitor_config.lease_duration_sec, dynamodb_client),
+        shed_controller=get_shed_controller(
+            alb_monitor_config.shed_controller, alb_monitor_config.shed_target_utilization),
+        shed_strategy=get_shed_strategy(
+            alb_monitor_config.shed_policy, alb_monitor_config.aimd_decrease_factor,
+            alb_monitor_config.shed_distribution, TargetHealthCounter(elbv2_client).get_healthy_target_count),
+        hysteresis=get_shed_hysteresis(
+            alb_monitor_config.shed_hold_sec, alb_monitor_config.restore_cooldown_sec,
+            alb_monitor_config.restore_ok_evaluations),
+        shed_predictor=get_shed_predictor(
+            alb_monitor_config.predictive_shed, alb_monitor_config.predict_horizon_sec,
+            alb_monitor_config.predict_datapoints, alb_monitor_config.pre_shed_percent),
+        secondary_guard=get_secondary_health_guard(
+            alb_monitor_config.secondary_guard, alb_monitor_config.secondary_max_utilization),
+        shed_budget=get_shed_budget(
+            alb_monitor_config.shed_budget_weight, alb_monitor_config.lease_table_name, dynamodb_client,
+            alb_monitor_config.lease_duration_sec),
+        metrics=metrics, tracer=tracer)
+
@@ -0,0 +1,96 @@
+"""
+Works out how long to wait before re-evaluating an alarm instead of always using the fixed
+shed and restore message delays.
+
+- While the alarm is in ALARM and its metric is still rising the next evaluation is
+  min_delay_sec away so that a spike is followed closely. The metric values compared are
+  of complete periods, as a period in progress reads low and would look like the metric
+  falling. A step that sees no newer period than the last one sees no rise.
+- After a step that changed weights the configured message delay is used.
+- After a step that changed nothing, or while the alarm has INSUFFICIENT_DATA, the delay
+  backs off exponentially from the previous delay so that fewer messages are sent while
+  the target group settles.
+
+Delays are bounded by min_delay_sec and max_delay_sec. SQS accepts at most 900 seconds. With
+a control loop lease the delay also stays LEASE_MARGIN_SEC below the lease duration, so that
+the lease cannot expire between two steps of a chain and let a second chain start.
+"""
+from elb_load_monitor.alb_alarm_messages import CWAlarmState
+
+import logging
+
+logger = logging.getLogger()
+
+# maximum DelaySeconds accepted by SQS
+MAX_SQS_DELAY_SEC = 900
+# time allowed between the lease being renewed by one step and the next step renewing it,
+# besides the delay: the rest of the step, queue wait and the next invocation
+LEASE_MARGIN_SEC = 60
+
+
+class AdaptiveDelay:
+    def __init__(
+        self, min_delay_sec: int = 10, max_delay_sec: int = MAX_SQS_DELAY_SEC, backoff_factor: float = 2.0,
+        rising_tolerance: float = 0.05
+    ) -> None:
+        self.min_delay_sec = max(0, min_delay_sec)
+        self.max_delay_sec = min(MAX_SQS_DELAY_SEC, max_delay_sec)
+        self.backoff_factor = backoff_factor
+        # relative increase of the metric that counts as rising
+        self.rising_tolerance = rising_tolerance
+
+    def get_delay_sec(
+        self, base_delay_sec: int, cw_alarm_state: CWAlarmState, weights_changed: bool, metric_value: float = None,
+        previous_metric_value: float = None, previous_delay_sec: int = None
+    ) -> int:
+        if cw_alarm_state == CWAlarmState.INSUFFICIENT_DATA:
+            delay_sec = self.get_backoff_delay_sec(base_delay_sec, previous_delay_sec)
+
+            logger.info('Insufficient data, backing off re-evaluation to ' + str(delay_sec) + 's')
+        elif cw_alarm_state == CWAlarmState.ALARM and self.is_rising(metric_value, previous_metric_value):
+            delay_sec = self.min_delay_sec
+
+            logger.info('Alarm metric rising from ' + str(previous_metric_value) + ' to ' + str(metric_value) +
+                        ', re-evaluating in ' + str(delay_sec) + 's')
+        elif weights_changed:
+            delay_sec = base_delay_sec
+        else:
+            delay_sec = self.get_backoff_delay_sec(base_delay_sec, previous_delay_sec)
+
+            logger.info('No weight changes, re-evaluating in ' + str(delay_sec) + 's')
+
+        return int(min(self.max_delay_sec, max(self.min_delay_sec, delay_sec)))
+
+    def is_rising(self, metric_value: float, previous_metric_value: float) -> bool:
+        if metric_value is None or previous_metric_value is None:
+            return False
+
+        return metric_value > previous_metric_value * (1 + self.rising_tolerance)
+
+    def get_backoff_delay_sec(self, base_delay_sec: int, previous_delay_sec: int = None) -> int:
+        if previous_delay_sec is None:
+            return base_delay_sec
+
+        # a delay shortened while the metric was rising grows back from the base delay
+        return int(max(base_delay_sec, previous_delay_sec * self.backoff_factor))
+
+
+def get_adaptive_delay(
+    enabled: bool, min_delay_sec: int, max_delay_sec: int, lease_duration_sec: int = None
+) -> AdaptiveDelay:
+    """
+    Returns the adaptive delay for the settings, or None to use the fixed message delays.
+    lease_duration_sec is the duration of the control loop lease, if one is used.
+    """
+    if not enabled:
+        return None
+
+    if lease_duration_sec is not None and max_delay_sec > lease_duration_sec - LEASE_MARGIN_SEC:
+        lease_max_delay_sec = max(min_delay_sec, lease_duration_sec - LEASE_MARGIN_SEC)
+
+        logger.warning('Capping the maximum message delay of ' + str(max_delay_sec) + 's to ' +
+                       str(lease_max_delay_sec) + 's, within the ' + str(lease_duration_sec) + 's lease duration')
+
+        max_delay_sec = lease_max_delay_sec
+
+    return AdaptiveDelay(min_delay_sec, max_delay_sec)
@@ -14,11 +14,16 @@ class ALBAlarmAction(Enum):
 
 
 class ALBAlarmEvent:
-    def __init__(self, alarm_event_id: str, alarm_arn: str, alarm_name: str, cw_alarm_state: CWAlarmState) -> None:
+    def __init__(
+        self, alarm_event_id: str, alarm_arn: str, alarm_name: str, cw_alarm_state: CWAlarmState,
+        alarm_at: float = None
+    ) -> None:
         self.alarm_event_id = alarm_event_id
         self.alarm_arn = alarm_arn
         self.alarm_name = alarm_name
         self.cw_alarm_state = cw_alarm_state
+        # epoch seconds of the alarm state change
+        self.alarm_at = alarm_at
 
 
 class ALBAlarmStatusMessage:
@@ -31,7 +36,14 @@ class ALBAlarmStatusMessage:
             target_group_arn=message['targetGroupArn'], sqs_queue_url=message['sqsQueueURL'],
             shed_mesg_delay_sec=message['shedMesgDelaySec'], restore_mesg_delay_sec=message['restoreMesgDelaySec'],
             elb_shed_percent=message['elbShedPercent'], max_elb_shed_percent=message['maxElbShedPercent'],
-            elb_restore_percent=message['elbRestorePercent'], alb_alarm_action=ALBAlarmAction[message['albAlarmAction']]
+            elb_restore_percent=message['elbRestorePercent'], alb_alarm_action=ALBAlarmAction[message['albAlarmAction']],
+            target_group_rule_count=message.get('targetGroupRuleCount'), chain_id=message.get('chainId'),
+            last_shed_at=message.get('lastShedAt'), ok_since=message.get('okSince'),
+            ok_evaluations=message.get('okEvaluations'), delay_sec=message.get('delaySec'),
+            metric_value=message.get('metricValue'), pre_shed=message.get('preShed'),
+            pre_shed_weight=message.get('preShedWeight'),
+            alarm_at=message.get('alarmAt'), sent_at=message.get('sentAt'), hops=message.get('hops'),
+            trace_context=message.get('traceContext')
         )
 
         return alb_alarm_status_message
@@ -39,7 +51,11 @@ class ALBAlarmStatusMessage:
     def __init__(
         self, cw_alarm_arn: str, cw_alarm_name: str, load_balancer_arn: str, elb_listener_arn: str,
         target_group_arn: str, sqs_queue_url: str, shed_mesg_delay_sec: int, restore_mesg_delay_sec: int,
-        elb_shed_percent: int, max_elb_shed_percent: int, elb_restore_percent: int, alb_alarm_action: ALBAlarmAction
+        elb_shed_percent: int, max_elb_shed_percent: int, elb_restore_percent: int, alb_alarm_action: ALBAlarmAction,
+        target_group_rule_count: int = None, chain_id: str = None, last_shed_at: int = None, ok_since: int = None,
+        ok_evaluations: int = None, delay_sec: int = None, metric_value: float = None, pre_shed: bool = None,
+        alarm_at: float = None, sent_at: float = None, hops: int = None, trace_context: str = None,
+        pre_shed_weight: int = None
     ) -> None:
         self.cw_alarm_arn = cw_alarm_arn
         self.cw_alarm_name = cw_alarm_name
@@ -53,6 +69,28 @@ class ALBAlarmStatusMessage:
         self.shed_mesg_delay_sec = shed_mesg_delay_sec
         self.restore_mesg_delay_sec = restore_mesg_delay_sec
         self.alb_alarm_action = alb_alarm_action
+        # number of listener rules forwarding to the target group, used to stop reading rules early
+        self.target_group_rule_count = target_group_rule_count
+        # identifies the chain of messages that holds the control loop lease
+        self.chain_id = chain_id
+        # hysteresis between shedding and restoring
+        self.last_shed_at = last_shed_at
+        self.ok_since = ok_since
+        self.ok_evaluations = ok_evaluations
+        # delay this message was sent with and the alarm metric when it was sent
+        self.delay_sec = delay_sec
+        self.metric_value = metric_value
+        # load was shed ahead of a predicted breach and is given back if the breach does not happen
+        self.pre_shed = pre_shed
+        # weight shed from each rule ahead of the predicted breach
+        self.pre_shed_weight = pre_shed_weight
+        # epoch seconds of the alarm state change the chain reacts to and of sending this message,
+        # and the number of messages sent in the chain so far
+        self.alarm_at = alarm_at
+        self.sent_at = sent_at
+        self.hops = hops
+        # traceparent of the span that sent this message
+        self.trace_context = trace_context
 
     def to_json(self) -> list:
         message = {
@@ -70,4 +108,43 @@ class ALBAlarmStatusMessage:
             'targetGroupArn': self.target_group_arn
         }
 
+        if self.target_group_rule_count is not None:
+            message['targetGroupRuleCount'] = self.target_group_rule_count
+
+        if self.chain_id is not None:
+            message['chainId'] = self.chain_id
+
+        if self.last_shed_at is not None:
+            message['lastShedAt'] = self.last_shed_at
+
+        if self.ok_since is not None:
+            message['okSince'] = self.ok_since
+
+        if self.ok_evaluations is not None:
+            message['okEvaluations'] = self.ok_evaluations
+
+        if self.delay_sec is not None:
+            message['delaySec'] = self.delay_sec
+
+        if self.metric_value is not None:
+            message['metricValue'] = self.metric_value
+
+        if self.pre_shed is not None:
+            message['preShed'] = self.pre_shed
+
+        if self.pre_shed_weight is not None:
+            message['preShedWeight'] = self.pre_shed_weight
+
+        if self.alarm_at is not None:
+            message['alarmAt'] = self.alarm_at
+
+        if self.sent_at is not None:
+            message['sentAt'] = self.sent_at
+
+        if self.hops is not None:
+            message['hops'] = self.hops
+
+        if self.trace_context is not None:
+            message['traceContext'] = self.trace_context
+
         return message
@@ -1,25 +1,67 @@
 from boto3 import client
+from elb_load_monitor.adaptive_delay import AdaptiveDelay
 from elb_load_monitor.alb_alarm_messages import ALBAlarmAction
 from elb_load_monitor.alb_alarm_messages import ALBAlarmEvent
 from elb_load_monitor.alb_alarm_messages import ALBAlarmStatusMessage
 from elb_load_monitor.alb_alarm_messages import CWAlarmState
+from elb_load_monitor.control_lease import ControlLoopLease
+from elb_load_monitor.cw_alarms import describe_metric_alarms
+from elb_load_monitor.cw_alarms import get_alarm_states
+from elb_load_monitor.cw_metrics import get_latest_alarm_datapoints
 from elb_load_monitor.elb_listener_rule import ELBListenerRule
+from elb_load_monitor.hysteresis import HysteresisState
+from elb_load_monitor.hysteresis import ShedHysteresis
+from elb_load_monitor.metric_poller import MetricPoller
+from elb_load_monitor.metrics import EMFMetrics
+from elb_load_monitor.metrics import UNIT_MILLISECONDS
+from elb_load_monitor.metrics import put_control_step_metrics
+from elb_load_monitor.rule_cache import ListenerRuleCache
+from elb_load_monitor.rule_cache import get_forward_weights
+from elb_load_monitor.rule_writer import ELBRuleWriteError
+from elb_load_monitor.rule_writer import ELBRuleWriter
+from elb_load_monitor.secondary_guard import SecondaryHealthGuard
+from elb_load_monitor.shed_budget import ShedBudget
+from elb_load_monitor.shed_controller import ProportionalShedController
+from elb_load_monitor.shed_predictor import ShedPredictor
+from elb_load_monitor.shed_strategy import DEFAULT_SHED_STRATEGY
+from elb_load_monitor.shed_strategy import BudgetedWeightDistribution
+from elb_load_monitor.shed_strategy import GuardedWeightDistribution
+from elb_load_monitor.shed_strategy import LinearStepPolicy
+from elb_load_monitor.shed_strategy import ShedStrategy
+from elb_load_monitor.shed_strategy import StepPolicy
+from elb_load_monitor.tracing import Span
+from elb_load_monitor.tracing import Tracer
+from elb_load_monitor.tracing import trace_span
 from elb_load_monitor import util
 
 import boto3
 import json
 import logging
+import time
+import uuid
 
 
 logger = logging.getLogger()
 
+# alarm state a chain of each action reacts to
+CHAIN_ALARM_STATES = {
+    ALBAlarmAction.SHED: CWAlarmState.ALARM.name,
+    ALBAlarmAction.RESTORE: CWAlarmState.OK.name
+}
+
 
 class ALBListenerRulesHandler:
 
     def __init__(
             self, elbv2_client: client, load_balancer_arn: str, elb_listener_arn: str, target_group_arn: str,
             elb_shed_percent: int, max_elb_shed_percent: int, elb_restore_percent: int, shed_mesg_delay_sec: int,
-            restore_mesg_delay_sec: int
+            restore_mesg_delay_sec: int, rule_writer: ELBRuleWriter = None, describe_rules_page_size: int = None,
+            target_group_rule_count: int = None, rule_cache: ListenerRuleCache = None,
+            control_lease: ControlLoopLease = None, shed_controller: ProportionalShedController = None,
+            shed_strategy: ShedStrategy = None, hysteresis: ShedHysteresis = None,
+            adaptive_delay: AdaptiveDelay = None, metric_poller: MetricPoller = None,
+            shed_predictor: ShedPredictor = None, secondary_guard: SecondaryHealthGuard = None,
+            shed_budget: ShedBudget = None, metrics: EMFMetrics = None, clock=time.time, tracer: Tracer = None
     ) -> None:
         self.load_balancer_arn = load_balancer_arn
         self.elb_listener_arn = elb_listener_arn
@@ -30,60 +72,277 @@ class ALBListenerRulesHandler:
         self.shed_mesg_delay_sec = shed_mesg_delay_sec
         self.restore_mesg_delay_sec = restore_mesg_delay_sec
 
-        self.elb_rules = []
-        try:
-            describe_rules_response = elbv2_client.describe_rules(
-                ListenerArn=elb_listener_arn
-            )
+        if rule_writer is None:
+            rule_writer = ELBRuleWriter()
 
-            logger.debug('Listener rules for ' + elb_listener_arn +
-                         ': ' + json.dumps(describe_rules_response, default=util.datetime_handler))
+        self.rule_writer = rule_writer
 
-            elb_rules_entries = describe_rules_response['Rules']
+        # number of ModifyRule/ModifyListener calls made, rules skipped because their weights did
+        # not change and rules that could not be written
+        self.rule_writes = 0
+        self.rule_writes_skipped = 0
+        self.rule_write_failures = 0
+        # ELBRuleWriteResult for each rule written in the last save
+        self.rule_write_results = []
 
-            for elb_rule_entry in elb_rules_entries:
-                default_rule = False
-                if elb_rule_entry['IsDefault']:
-                    # skip the default rule
-                    default_rule = True
+        self.describe_rules_page_size = describe_rules_page_size
+        self.rule_cache = rule_cache
+        self.rule_cache_hit = False
+        # single-flight lease and the id of the message chain currently being handled
+        self.control_lease = control_lease
+        self.chain_id = None
+        # sizes shed steps from the alarm metric. None sheds elb_shed_percent per step
+        self.shed_controller = shed_controller
+        # how much each shed/restore step moves and where it moves it. None keeps linear steps
+        self.shed_strategy = shed_strategy
+        # delays restoring after a shed. None restores as soon as the alarm is OK
+        self.hysteresis = hysteresis
+        self.hysteresis_state = HysteresisState()
+        # works out the delay of the next message. None uses the fixed message delays
+        self.adaptive_delay = adaptive_delay
+        # decides the alarm state from high-resolution metric datapoints. None uses the alarm state
+        self.metric_poller = metric_poller
+        # sheds ahead of a breach predicted from the metric trend. None waits for the alarm
+        self.shed_predictor = shed_predictor
+        # whether the load shed by the current chain was shed ahead of a predicted breach
+        self.pre_shed = False
+        # weight shed from each rule ahead of the predicted breach, given back if it does not happen
+        self.pre_shed_weight = None
+        # checks the other target groups before shedding into them. None sheds into all of them
+        self.secondary_guard = secondary_guard
+        # SecondaryHealthDecision per other target group, from the last shed
+        self.secondary_health = dict()
+        # weight shared by every primary shedding into a secondary. None does not limit it
+        self.shed_budget = shed_budget
+        # whether the claims of the current step were recorded in the shed budget
+        self.shed_budget_recorded = False
+        # EMF metrics of each control step. None only logs
+        self.metrics = metrics
+        self.clock = clock
+        # spans around rule loading, rule writes and the SQS send. None does not trace
+        self.tracer = tracer
+        # epoch seconds of the alarm state change the chain reacts to and the messages sent so far
+        self.alarm_at = None
+        self.hops = 0
+        # seconds the last message waited beyond its delay, and from the alarm state change to
+        # the last applied weights
+        self.queue_wait_sec = None
+        self.alarm_to_apply_sec = None
+        # alarm definitions, metric values and the start of their periods read in the current step
+        self.metric_alarms = dict()
+        self.metric_values = dict()
+        self.metric_timestamps = dict()
+        self.target_group_rule_count = target_group_rule_count
+        # number of DescribeRules calls made and whether every page of rules was read
+        self.describe_rules_calls = 0
+        self.elb_rules_complete = False
+        self.elb_rules_loaded = False
 
-                rule_actions = elb_rule_entry['Actions']
-                rule_arn = elb_rule_entry['RuleArn']
+        # rules are read on first access to elb_rules so that paths which do not need them
+        # make no ELB API call
+        self.elbv2_client = elbv2_client
+        self.elb_rules_load_attempted = False
+        self._elb_rules = []
+        # index of target group ARN to the rules forwarding to it
+        self.target_group_rules = dict()
 
-                if len(rule_actions) == 0:
-                    logger.warn('No actions defined for rule ' + rule_arn)
-                    continue
+        return
+
+    @property
+    def elb_rules(self) -> list:
+        if not self.elb_rules_load_attempted:
+            self.load_elb_rules(self.elbv2_client)
+
+        return self._elb_rules
+
+    def load_elb_rules(self, elbv2_client: client) -> None:
+        with trace_span(self.tracer, 'load_rules', {'listenerArn': self.elb_listener_arn}) as span:
+            self.read_elb_rules(elbv2_client)
+
+            if span is not None:
+                span.set_attribute('rules', len(self._elb_rules))
+                span.set_attribute('cacheHit', self.rule_cache_hit)
+                span.set_attribute('describeRulesCalls', self.describe_rules_calls)
+
+        return
+
+    def read_elb_rules(self, elbv2_client: client) -> None:
+        """
+        Streams the listener rules page by page, parsing each rule as it arrives. If the number
+        of rules forwarding to the target group is known, stops once all of them have been read.
+        """
+        self.elb_rules_load_attempted = True
+
+        if self.load_cached_elb_rules(elbv2_client):
+            return
+
+        rule_entries = []
+
+        try:
+            for elb_rule_entry in self.describe_rules_pages(elbv2_client):
+                rule_entries.append(elb_rule_entry)
+                elb_listener_rule = self.parse_elb_rule(elb_rule_entry)
 
-                action_type = rule_actions[0]['Type']
-                if action_type != 'forward':
-                    # skip redirect and fixed response actions
+                if elb_listener_rule is None:
                     continue
 
-                elb_listener_rule = ELBListenerRule(
-                    rule_arn, elb_listener_arn, default_rule)
+                self.add_elb_rule(elb_listener_rule)
 
-                self.elb_rules.append(elb_listener_rule)
+                if self.target_group_rule_count is not None and \
+                        len(self.get_target_group_rules(self.target_group_arn)) >= self.target_group_rule_count:
+                    logger.debug('Found all ' + str(self.target_group_rule_count) + ' rules for ' +
+                                 self.target_group_arn + ', not reading remaining rules')
+                    break
+            else:
+                self.elb_rules_complete = True
 
-                for target_group in rule_actions[0]['ForwardConfig']['TargetGroups']:
-                    elb_listener_rule.add_forward_config(
-                        target_group['TargetGroupArn'], target_group['Weight'])
+                # only a complete read of the listener can be cached
+                if self.rule_cache is not None:
+                    self.rule_cache.put(self.elb_listener_arn, rule_entries)
+
+            self.elb_rules_loaded = True
         except Exception as e:
             logger.error(
-                f'Error describing rules for listener ARN {elb_listener_arn}: {str(e)}')
+                f'Error describing rules for listener ARN {self.elb_listener_arn}: {str(e)}')
 
         return
 
+    def load_cached_elb_rules(self, elbv2_client: client) -> bool:
+        if self.rule_cache is None:
+            return False
+
+        rule_entries = self.rule_cache.get(self.elb_listener_arn)
+
+        if rule_entries is None:
+            return False
+
+        if self.rule_cache.validate and not self.is_rule_cache_current(elbv2_client, rule_entries):
+            logger.info('Listener rules for ' + self.elb_listener_arn + ' changed outside of the cache, re-reading')
+            self.rule_cache.invalidate(self.elb_listener_arn)
+
+            return False
+
+        for elb_rule_entry in rule_entries:
+            elb_listener_rule = self.parse_elb_rule(elb_rule_entry)
+
+            if elb_listener_rule is not None:
+                self.add_elb_rule(elb_listener_rule)
+
+        logger.debug('Using cached listener rules for ' + self.elb_listener_arn)
+
+        self.rule_cache_hit = True
+        self.elb_rules_complete = True
+        self.elb_rules_loaded = True
+
+        return True
+
+    def is_rule_cache_current(self, elbv2_client: client, rule_entries: list) -> bool:
+        """
+        Cheap check for changes made outside of this tool: re-reads only the rules forwarding to the
+        target group and compares their weights with the cached weights.
+        """
+        cached_weights = {
+            rule_entry['RuleArn']: get_forward_weights(rule_entry) for rule_entry in rule_entries
+            if self.target_group_arn in get_forward_weights(rule_entry)
+        }
+
+        if len(cached_weights) == 0:
+            return True
+
+        try:
+            describe_rules_response = elbv2_client.describe_rules(RuleArns=list(cached_weights.keys()))
+            self.describe_rules_calls += 1
+        except Exception as e:
+            logger.warning('Unable to validate cached rules for ' + self.elb_listener_arn + ': ' + str(e))
+
+            return False
+
+        current_weights = {
+            rule_entry['RuleArn']: get_forward_weights(rule_entry) for rule_entry in describe_rules_response['Rules']
+        }
+
+        return current_weights == cached_weights
+
+    def describe_rules_pages(self, elbv2_client: client):
+        describe_rules_args = {'ListenerArn': self.elb_listener_arn}
+
+        if self.describe_rules_page_size is not None:
+            describe_rules_args['PageSize'] = self.describe_rules_page_size
+
+        while True:
+            describe_rules_response = elbv2_client.describe_rules(**describe_rules_args)
+            self.describe_rules_calls += 1
+
+            logger.debug('Listener rules for ' + self.elb_listener_arn +
+                         ': ' + json.dumps(describe_rules_response, default=util.datetime_handler))
+
+            for elb_rule_entry in describe_rules_response['Rules']:
+                yield elb_rule_entry
+
+            next_marker = describe_rules_response.get('NextMarker')
+
+            if not next_marker:
+                return
+
+            describe_rules_args['Marker'] = next_marker
+
+    def parse_elb_rule(self, elb_rule_entry: dict) -> ELBListenerRule:
+        default_rule = False
+        if elb_rule_entry['IsDefault']:
+            # skip the default rule
+            default_rule = True
+
+        rule_actions = elb_rule_entry['Actions']
+        rule_arn = elb_rule_entry['RuleArn']
+
+        if len(rule_actions) == 0:
+            logger.warn('No actions defined for rule ' + rule_arn)
+            return None
+
+        action_type = rule_actions[0]['Type']
+        if action_type != 'forward':
+            # skip redirect and fixed response actions
+            return None
+
+        elb_listener_rule = ELBListenerRule(
+            rule_arn, self.elb_listener_arn, default_rule)
+
+        for target_group in rule_actions[0]['ForwardConfig']['TargetGroups']:
+            elb_listener_rule.add_forward_config(
+                target_group['TargetGroupArn'], target_group['Weight'])
+
+        return elb_listener_rule
+
     def handle_alarm(
-            self, elbv2_client: client, sqs_client: client, sqs_queue_url: str, alb_alarm_event: ALBAlarmEvent
+            self, elbv2_client: client, sqs_client: client, sqs_queue_url: str, alb_alarm_event: ALBAlarmEvent,
+            cw_client: client = None
     ) -> ALBAlarmAction:
 
         alarm_action = ALBAlarmAction.NONE
+        self.alarm_at = alb_alarm_event.alarm_at
+
+        if alb_alarm_event.cw_alarm_state in (CWAlarmState.ALARM, CWAlarmState.OK) and \
+                not self.acquire_control_lease(alb_alarm_event.alarm_name):
+            # the running control loop takes the folded state and re-reads the alarm on its next step
+            logger.info('Control loop already running for ' + self.target_group_arn +
+                        ', folding ' + alb_alarm_event.cw_alarm_state.name + ' event into it')
+            self.control_lease.fold(
+                ControlLoopLease.get_lease_id(self.target_group_arn, alb_alarm_event.alarm_name),
+                alb_alarm_event.cw_alarm_state.name)
+
+            return alarm_action
 
         if alb_alarm_event.cw_alarm_state == CWAlarmState.ALARM:
             logger.info('Shedding: ' + str(self.elb_shed_percent) +
                         ' from ' + self.target_group_arn)
+            self.check_secondary_health(cw_client, alb_alarm_event.alarm_name)
             self.shed(elbv2_client, self.target_group_arn,
-                      self.elb_shed_percent, self.max_elb_shed_percent)
+                      self.elb_shed_percent, self.max_elb_shed_percent,
+                      self.get_load_ratio(cw_client, alb_alarm_event.alarm_name))
+
+            self.hysteresis_state = HysteresisState()
+
+            self.record_shed()
 
             if (self.is_sheddable(self.target_group_arn, self.max_elb_shed_percent)):
                 alarm_action = ALBAlarmAction.SHED
@@ -93,40 +352,132 @@ class ALBListenerRulesHandler:
             logger.info('Preparing to restore load to: ' +
                         self.target_group_arn)
 
+            self.hysteresis_state = HysteresisState()
+
+            if self.hysteresis is not None:
+                self.hysteresis.record_ok(self.hysteresis_state)
+
         if alarm_action != ALBAlarmAction.NONE:
             self.send_sqs_notification(
                 sqs_client, sqs_queue_url, alb_alarm_event.alarm_arn, alb_alarm_event.alarm_name, alarm_action)
+        else:
+            self.release_control_lease(alb_alarm_event.alarm_name)
 
         return alarm_action
 
+    def handle_predicted_breach(
+            self, elbv2_client: client, sqs_client: client, sqs_queue_url: str, alb_alarm_event: ALBAlarmEvent,
+            cw_client: client = None
+    ) -> ALBAlarmAction:
+        """
+        Sheds pre_shed_percent ahead of a breach predicted by the shed predictor and starts a
+        chain that holds the shed while the breach is still predicted, continues shedding if
+        the alarm fires and gives the load back otherwise. The pre-shed always moves a linear
+        step, whatever the step policy, as the breach has not happened yet.
+        """
+        if not self.acquire_control_lease(alb_alarm_event.alarm_name):
+            logger.info('Control loop already running for ' + self.target_group_arn + ', not pre-shedding')
+
+            return ALBAlarmAction.NONE
+
+        self.alarm_at = alb_alarm_event.alarm_at
+
+        logger.info('Pre-shedding: ' + str(self.shed_predictor.pre_shed_percent) + ' from ' + self.target_group_arn)
+
+        self.check_secondary_health(cw_client, alb_alarm_event.alarm_name)
+
+        elb_rules = self.get_target_group_rules(self.target_group_arn)
+        source_weights = [elb_rule.forward_configs.get(self.target_group_arn) for elb_rule in elb_rules]
+
+        self.shed(elbv2_client, self.target_group_arn, self.shed_predictor.pre_shed_percent,
+                  self.max_elb_shed_percent, step_policy=LinearStepPolicy())
+
+        if not any(result.saved for result in self.rule_write_results):
+            self.release_control_lease(alb_alarm_event.alarm_name)
+
+            return ALBAlarmAction.NONE
+
+        self.pre_shed_weight = max(
+            source_weight - elb_rule.forward_configs.get(self.target_group_arn)
+            for elb_rule, source_weight in zip(elb_rules, source_weights))
+
+        self.hysteresis_state = HysteresisState()
+
+        self.record_shed()
+
+        self.pre_shed = True
+
+        self.send_sqs_notification(
+            sqs_client, sqs_queue_url, alb_alarm_event.alarm_arn, alb_alarm_event.alarm_name, ALBAlarmAction.SHED)
+
+        return ALBAlarmAction.SHED
+
     def handle_alarm_status_message(
             self, cw_client: client, elbv2_client: client, sqs_client: client,
-            alb_alarm_status_message: ALBAlarmStatusMessage
+            alb_alarm_status_message: ALBAlarmStatusMessage, cw_alarm_states: dict = None,
+            metric_alarms: dict = None
     ) -> ALBAlarmAction:
 
-        alarm_response = cw_client.describe_alarms(
-            AlarmNames=[
-                alb_alarm_status_message.cw_alarm_name
-            ]
-        )
+        if not self.acquire_control_lease(alb_alarm_status_message.cw_alarm_name, alb_alarm_status_message.chain_id):
+            logger.info('Another control loop holds the lease for ' + alb_alarm_status_message.target_group_arn +
+                        ', ending this chain')
 
-        logger.debug('Alarm status for ' + alb_alarm_status_message.cw_alarm_name +
-                     ': ' + json.dumps(alarm_response, default=util.datetime_handler))
+            return ALBAlarmAction.NONE
+
+        self.metric_alarms = dict()
+        self.metric_values = dict()
+        self.metric_timestamps = dict()
+        self.rule_write_results = []
+        self.pre_shed = False
+        self.pre_shed_weight = None
+        self.secondary_health = dict()
+        self.shed_budget_recorded = False
+
+        # alarm states may already have been resolved for a whole batch of messages
+        if cw_alarm_states is None:
+            if metric_alarms is None:
+                metric_alarms = describe_metric_alarms(cw_client, [alb_alarm_status_message.cw_alarm_name])
+
+            cw_alarm_states = get_alarm_states(metric_alarms)
 
-        if len(alarm_response['MetricAlarms']) == 0:
+        cw_alarm_state = cw_alarm_states.get(alb_alarm_status_message.cw_alarm_name)
+
+        if cw_alarm_state is None:
             logger.error('No alarm with alarm name: ' +
                          alb_alarm_status_message.cw_alarm_name)
+            self.release_control_lease(alb_alarm_status_message.cw_alarm_name)
 
             return ALBAlarmAction.NONE
 
-        cw_alarm_state = CWAlarmState[alarm_response['MetricAlarms']
-                                      [0]['StateValue']]
+        self.track_message_latency(alb_alarm_status_message, metric_alarms)
+
+        if self.metric_poller is not None:
+            cw_alarm_state = self.get_polled_alarm_state(
+                cw_client, alb_alarm_status_message.cw_alarm_name, cw_alarm_state, metric_alarms)
 
         previous_alb_alarm_action = alb_alarm_status_message.alb_alarm_action
 
         new_alarm_action = ALBAlarmAction.NONE
 
+        self.hysteresis_state = HysteresisState(
+            alb_alarm_status_message.last_shed_at, alb_alarm_status_message.ok_since,
+            alb_alarm_status_message.ok_evaluations or 0)
+
+        # an ALARM event folded into the chain since its last step counts as the alarm firing
+        if self.get_folded_alarm_state(alb_alarm_status_message.cw_alarm_name) == CWAlarmState.ALARM.name:
+            logger.info('ALARM event was folded into the chain for ' + alb_alarm_status_message.target_group_arn)
+
+            if self.hysteresis is not None:
+                self.hysteresis.record_alarm(self.hysteresis_state)
+
+            # shed now rather than on the next step, as the event would have done on its own
+            if cw_alarm_state == CWAlarmState.ALARM and previous_alb_alarm_action == ALBAlarmAction.RESTORE:
+                previous_alb_alarm_action = ALBAlarmAction.SHED
+
         if cw_alarm_state == CWAlarmState.ALARM:
+            if self.hysteresis is not None:
+                self.hysteresis.record_alarm(self.hysteresis_state)
+
             # if current alarm state is ALARM, shed if previous alarm action was SHED
             # otherwise, set the state to SHED and send the message. This will trigger
             # shedding in the next interval
@@ -134,9 +485,13 @@ class ALBListenerRulesHandler:
                 logger.info('Shedding: ' + str(alb_alarm_status_message.elb_shed_percent) +
                             ' from ' + alb_alarm_status_message.target_group_arn)
 
+                self.check_secondary_health(cw_client, alb_alarm_status_message.cw_alarm_name, metric_alarms)
                 self.shed(
                     elbv2_client, alb_alarm_status_message.target_group_arn,
-                    alb_alarm_status_message.elb_shed_percent, alb_alarm_status_message.max_elb_shed_percent)
+                    alb_alarm_status_message.elb_shed_percent, alb_alarm_status_message.max_elb_shed_percent,
+                    self.get_load_ratio(cw_client, alb_alarm_status_message.cw_alarm_name, metric_alarms))
+
+                self.record_shed()
 
             if (self.is_sheddable(self.target_group_arn, self.max_elb_shed_percent)):
                 new_alarm_action = ALBAlarmAction.SHED
@@ -147,7 +502,31 @@ class ALBListenerRulesHandler:
             # if current CWAlarm state is OK, restore if the previous alarm action was RESTORE
             # otherwise, check if we have available capacity to restore and set the state to RESTORE.
             # This will trigger restore  in the next interval
-            if previous_alb_alarm_action == ALBAlarmAction.RESTORE:
+            restore_permitted = True
+
+            if self.hysteresis is not None:
+                self.hysteresis.record_ok(self.hysteresis_state)
+                restore_permitted = self.hysteresis.can_restore(self.hysteresis_state)
+
+            if alb_alarm_status_message.pre_shed and \
+                    self.is_breach_predicted(cw_client, alb_alarm_status_message.cw_alarm_name, metric_alarms):
+                logger.info('Breach still predicted for ' + alb_alarm_status_message.target_group_arn +
+                            ', holding pre-shed load')
+
+                self.pre_shed = True
+                self.pre_shed_weight = alb_alarm_status_message.pre_shed_weight
+
+            elif alb_alarm_status_message.pre_shed:
+                logger.info('Predicted breach did not happen, restoring pre-shed load to ' +
+                            alb_alarm_status_message.target_group_arn)
+
+                self.restore(elbv2_client, alb_alarm_status_message.target_group_arn, self.get_pre_shed_weight(
+                    alb_alarm_status_message), step_policy=LinearStepPolicy())
+
+            elif previous_alb_alarm_action == ALBAlarmAction.RESTORE and not restore_permitted:
+                logger.info('Not restoring to ' + alb_alarm_status_message.target_group_arn + ' yet')
+
+            elif previous_alb_alarm_action == ALBAlarmAction.RESTORE:
                 logger.info('Restoring: ' + str(alb_alarm_status_message.elb_shed_percent) +
                             ' to ' + alb_alarm_status_message.target_group_arn)
 
@@ -155,7 +534,9 @@ class ALBListenerRulesHandler:
                     elbv2_client, alb_alarm_status_message.target_group_arn,
                     alb_alarm_status_message.elb_restore_percent)
 
-            if self.is_restorable(alb_alarm_status_message.target_group_arn):
+            if self.pre_shed:
+                new_alarm_action = ALBAlarmAction.SHED
+            elif self.is_restorable(alb_alarm_status_message.target_group_arn):
                 # if there is more load available, continue to restore
                 new_alarm_action = ALBAlarmAction.RESTORE
 
@@ -166,17 +547,351 @@ class ALBListenerRulesHandler:
                         ' has insufficient data. Doing nothing and re-queuing: ' + previous_alb_alarm_action.name)
 
             new_alarm_action = previous_alb_alarm_action
+            self.pre_shed = bool(alb_alarm_status_message.pre_shed)
+            self.pre_shed_weight = alb_alarm_status_message.pre_shed_weight
 
         if new_alarm_action != ALBAlarmAction.NONE:
+            # renew the budget claims of a chain that holds its weights, so that they do not expire
+            if self.shed_budget is not None and not self.shed_budget_recorded:
+                self.record_shed_budget(self.target_group_arn, self.get_target_group_rules(self.target_group_arn))
+
+            delay_sec, metric_value = self.get_next_delay(
+                cw_client, alb_alarm_status_message, cw_alarm_state, new_alarm_action, metric_alarms)
+
             self.send_sqs_notification(
                 sqs_client, alb_alarm_status_message.sqs_queue_url, alb_alarm_status_message.cw_alarm_arn,
-                alb_alarm_status_message.cw_alarm_name, new_alarm_action)
+                alb_alarm_status_message.cw_alarm_name, new_alarm_action, delay_sec, metric_value)
+        else:
+            self.release_control_lease(alb_alarm_status_message.cw_alarm_name)
 
         return new_alarm_action
 
+    def track_message_latency(self, alb_alarm_status_message: ALBAlarmStatusMessage, metric_alarms: dict = None) -> None:
+        """
+        Picks up the alarm state change and hop count carried by the message and records how long
+        the message waited in the queue beyond the delay it was sent with.
+        """
+        self.alarm_at = alb_alarm_status_message.alarm_at
+        self.hops = alb_alarm_status_message.hops or 0
+        self.queue_wait_sec = None
+        self.alarm_to_apply_sec = None
+
+        # the alarm may have changed state since the chain started, for example from ALARM to OK.
+        # Only a newer change towards the action of the chain replaces the carried time, as chains
+        # started by the poller or the predictor run before the alarm changes state
+        metric_alarm = (metric_alarms or {}).get(alb_alarm_status_message.cw_alarm_name) or {}
+        state_transitioned_at = metric_alarm.get('StateTransitionedTimestamp')
+        chain_alarm_state = CHAIN_ALARM_STATES.get(alb_alarm_status_message.alb_alarm_action)
+
+        if state_transitioned_at is not None and metric_alarm.get('StateValue') == chain_alarm_state:
+            state_transitioned_at = round(state_transitioned_at.timestamp(), 3)
+
+            if self.alarm_at is None or state_transitioned_at > self.alarm_at:
+                self.alarm_at = state_transitioned_at
+
+        if alb_alarm_status_message.sent_at is None:
+            return
+
+        delay_sec = alb_alarm_status_message.delay_sec
+
+        if delay_sec is None and alb_alarm_status_message.alb_alarm_action == ALBAlarmAction.RESTORE:
+            delay_sec = alb_alarm_status_message.restore_mesg_delay_sec
+        elif delay_sec is None:
+            delay_sec = alb_alarm_status_message.shed_mesg_delay_sec
+
+        self.queue_wait_sec = max(0.0, self.clock() - alb_alarm_status_message.sent_at - delay_sec)
+
+        logger.info('Message ' + str(self.hops) + ' for ' + self.target_group_arn + ' waited ' +
+                    str(round(self.queue_wait_sec, 3)) + 's beyond its ' + str(delay_sec) + 's delay')
+
+        if self.metrics is not None:
+            self.metrics.put_metric(
+                'QueueWait', self.queue_wait_sec * 1000, UNIT_MILLISECONDS, {'TargetGroup': self.target_group_arn})
+
+        return
+
+    def track_apply_latency(self, alb_alarm_action: ALBAlarmAction) -> None:
+        """
+        Records the time from the alarm state change to weights applied by the last save.
+        """
+        if self.alarm_at is None or not any(result.saved for result in self.rule_write_results):
+            return
+
+        self.alarm_to_apply_sec = max(0.0, self.clock() - self.alarm_at)
+
+        logger.info(alb_alarm_action.name + ' applied to ' + self.target_group_arn + ' ' +
+                    str(round(self.alarm_to_apply_sec, 3)) + 's after the alarm changed state')
+
+        if self.metrics is not None:
+            self.metrics.put_metric(
+                'AlarmToApplyLag', self.alarm_to_apply_sec * 1000, UNIT_MILLISECONDS,
+                {'TargetGroup': self.target_group_arn, 'Action': alb_alarm_action.name})
+
+        return
+
+    def get_next_delay(
+            self, cw_client: client, alb_alarm_status_message: ALBAlarmStatusMessage, cw_alarm_state: CWAlarmState,
+            alarm_action: ALBAlarmAction, metric_alarms: dict = None
+    ) -> tuple:
+        """
+        Returns the delay of the next message and the alarm metric value to send with it, or
+        (None, None) to use the fixed message delay.
+        """
+        if self.adaptive_delay is None:
+            return None, None
+
+        base_delay_sec = self.shed_mesg_delay_sec
+
+        if alarm_action == ALBAlarmAction.RESTORE:
+            base_delay_sec = self.restore_mesg_delay_sec
+
+        metric_value = None
+
+        if cw_alarm_state != CWAlarmState.INSUFFICIENT_DATA:
+            metric_value = self.get_metric_value(cw_client, alb_alarm_status_message.cw_alarm_name, metric_alarms)
+
+        weights_changed = any(result.saved for result in self.rule_write_results)
+
+        delay_sec = self.adaptive_delay.get_delay_sec(
+            base_delay_sec, cw_alarm_state, weights_changed, metric_value, alb_alarm_status_message.metric_value,
+            alb_alarm_status_message.delay_sec)
+
+        return delay_sec, metric_value
+
+
+    def get_load_ratio(self, cw_client: client, cw_alarm_name: str, metric_alarms: dict = None) -> float:
+        """
+        Returns how far the alarm metric is over its target for the shed controller, or None to
+        shed the fixed elb_shed_percent.
+        """
+        if self.shed_controller is None or cw_client is None:
+            return None
+
+        metric_value = self.get_metric_value(cw_client, cw_alarm_name, metric_alarms)
+
+        if metric_value is None:
+            logger.info('No alarm metric for ' + cw_alarm_name + ', using the fixed shed step')
+
+            return None
+
+        # the weight shed since the datapoint does not show in it yet, sizing on it would shed it again
+        metric_timestamp = self.metric_timestamps.get(cw_alarm_name)
+        last_shed_at = self.hysteresis_state.last_shed_at
+
+        if metric_timestamp is not None and last_shed_at is not None and metric_timestamp.timestamp() < last_shed_at:
+            logger.info('Alarm metric for ' + cw_alarm_name + ' predates the last shed step, using the fixed shed step')
+
+            return None
+
+        return self.shed_controller.get_load_ratio(self.metric_alarms.get(cw_alarm_name), metric_value)
+
+    def get_metric_value(self, cw_client: client, cw_alarm_name: str, metric_alarms: dict = None) -> float:
+        """
+        Returns the latest value of the alarm metric, read at most once per step, or None if it
+        cannot be read.
+        """
+        if cw_alarm_name in self.metric_values:
+            return self.metric_values[cw_alarm_name]
+
+        self.metric_values[cw_alarm_name] = None
+
+        try:
+            metric_alarm = self.get_metric_alarm(cw_client, cw_alarm_name, metric_alarms)
+
+            if metric_alarm is None:
+                return None
+
+            latest_datapoint = get_latest_alarm_datapoints(cw_client, {cw_alarm_name: metric_alarm}).get(cw_alarm_name)
+
+            if latest_datapoint is not None:
+                self.metric_timestamps[cw_alarm_name], self.metric_values[cw_alarm_name] = latest_datapoint
+        except Exception as e:
+            logger.warning('Unable to read alarm metric for ' + cw_alarm_name + ': ' + str(e))
+
+        return self.metric_values[cw_alarm_name]
+
+    def get_metric_alarm(self, cw_client: client, cw_alarm_name: str, metric_alarms: dict = None) -> dict:
+        if metric_alarms is not None and cw_alarm_name in metric_alarms:
+            self.metric_alarms[cw_alarm_name] = metric_alarms[cw_alarm_name]
+
+        if cw_alarm_name not in self.metric_alarms:
+            metric_alarm = describe_metric_alarms(cw_client, [cw_alarm_name]).get(cw_alarm_name)
+
+            if metric_alarm is None:
+                return None
+
+            self.metric_alarms[cw_alarm_name] = metric_alarm
+
+        return self.metric_alarms[cw_alarm_name]
+
+    def get_polled_alarm_state(
+            self, cw_client: client, cw_alarm_name: str, cw_alarm_state: CWAlarmState, metric_alarms: dict = None
+    ) -> CWAlarmState:
+        """
+        Returns the alarm state decided from the polled metric, or cw_alarm_state if the metric
+        has no recent datapoints.
+        """
+        try:
+            metric_alarm = self.get_metric_alarm(cw_client, cw_alarm_name, metric_alarms)
+
+            if metric_alarm is None:
+                return cw_alarm_state
+
+            polled_alarm_state = self.metric_poller.poll(cw_client, metric_alarm)
+        except Exception as e:
+            logger.warning('Unable to poll alarm metric for ' + cw_alarm_name + ', using the alarm state: ' + str(e))
+
+            return cw_alarm_state
+
+        if polled_alarm_state == CWAlarmState.INSUFFICIENT_DATA:
+            return cw_alarm_state
+
+        if polled_alarm_state != cw_alarm_state:
+            logger.info('Polled metric for ' + cw_alarm_name + ' is ' + polled_alarm_state.name +
+                        ' ahead of alarm state ' + cw_alarm_state.name)
+
+        return polled_alarm_state
+
+    def check_secondary_health(self, cw_client: client, cw_alarm_name: str, metric_alarms: dict = None) -> None:
+        """
+        Reads the load of every other target group of the rules forwarding to the target group
+        with the secondary guard. Saturated target groups get no weight in the next shed.
+        """
+        self.secondary_health = dict()
+
+        if self.secondary_guard is None or cw_client is None:
+            return
+
+        secondary_target_group_arns = []
+
+        for elb_rule in self.get_target_group_rules(self.target_group_arn):
+            for target_group_arn in elb_rule.forward_configs.keys():
+                if target_group_arn != self.target_group_arn and target_group_arn not in secondary_target_group_arns:
+                    secondary_target_group_arns.append(target_group_arn)
+
+        if len(secondary_target_group_arns) == 0:
+            return
+
+        try:
+            metric_alarm = self.get_metric_alarm(cw_client, cw_alarm_name, metric_alarms)
+
+            if metric_alarm is not None:
+                self.secondary_health = self.secondary_guard.check(
+                    cw_client, metric_alarm, secondary_target_group_arns)
+        except Exception as e:
+            logger.warning('Unable to check secondary target groups of ' + self.target_group_arn + ': ' + str(e))
+
+        return
+
+    def get_secondary_health_report(self) -> list:
+        return [decision.to_json() for decision in self.secondary_health.values()]
+
+    def get_guarded_shed_strategy(self) -> ShedStrategy:
+        saturated_target_group_arns = {
+            target_group_arn for target_group_arn, decision in self.secondary_health.items() if decision.is_saturated()
+        }
+
+        shed_strategy = self.shed_strategy
+
+        if shed_strategy is None:
+            shed_strategy = DEFAULT_SHED_STRATEGY
+
+        if len(saturated_target_group_arns) == 0:
+            return shed_strategy
+
+        return ShedStrategy(shed_strategy.step_policy, GuardedWeightDistribution(
+            shed_strategy.weight_distribution, saturated_target_group_arns))
+
+    def is_breach_predicted(self, cw_client: client, cw_alarm_name: str, metric_alarms: dict = None) -> bool:
+        if self.shed_predictor is None:
+            return False
+
+        try:
+            metric_alarm = self.get_metric_alarm(cw_client, cw_alarm_name, metric_alarms)
+
+            return metric_alarm is not None and self.shed_predictor.is_breach_predicted(cw_client, metric_alarm)
+        except Exception as e:
+            logger.warning('Unable to predict alarm metric for ' + cw_alarm_name + ': ' + str(e))
+
+        return False
+
+    def get_pre_shed_weight(self, alb_alarm_status_message: ALBAlarmStatusMessage) -> int:
+        if alb_alarm_status_message.pre_shed_weight is not None:
+            return alb_alarm_status_message.pre_shed_weight
+
+        # messages sent before the pre-shed weight was recorded
+        if self.shed_predictor is None:
+            return alb_alarm_status_message.elb_restore_percent
+
+        return self.shed_predictor.pre_shed_percent
+
+    def trace_step(self, name: str, trace_context: str = None):
+        """
+        Returns the span of a control step, continuing the trace of trace_context if given.
+        """
+        return trace_span(
+            self.tracer, name, {'targetGroupArn': self.target_group_arn, 'listenerArn': self.elb_listener_arn},
+            trace_context=trace_context)
+
+    def put_step_metrics(self, alb_alarm_action: ALBAlarmAction, start: float, span: Span = None) -> None:
+        """
+        Records the action of a step started at start, a time.perf_counter() value, and the weights
+        of the rules forwarding to the target group after it. Rules that were not read are not read.
+        """
+        if span is not None:
+            span.set_attribute('action', alb_alarm_action.name)
+
+        if self.metrics is None:
+            return
+
+        elb_rules = []
+
+        if self.elb_rules_load_attempted:
+            elb_rules = self.target_group_rules.get(self.target_group_arn, [])
+
+        put_control_step_metrics(
+            self.metrics, self.target_group_arn, alb_alarm_action.name, (time.perf_counter() - start) * 1000,
+            elb_rules)
+
+        return
+
+    def acquire_control_lease(self, cw_alarm_name: str, chain_id: str = None) -> bool:
+        """
+        Acquires or renews the control loop lease for the target group and alarm. A new chain id
+        is created when the message does not belong to a chain yet.
+        """
+        if self.control_lease is None:
+            self.chain_id = chain_id
+
+            return True
+
+        self.chain_id = chain_id if chain_id is not None else str(uuid.uuid4())
+
+        return self.control_lease.acquire(
+            ControlLoopLease.get_lease_id(self.target_group_arn, cw_alarm_name), self.chain_id)
+
+    def get_folded_alarm_state(self, cw_alarm_name: str) -> str:
+        """
+        Returns the alarm state last folded into the lease of the chain, or None.
+        """
+        if self.control_lease is None:
+            return None
+
+        return self.control_lease.get_folded_state(
+            ControlLoopLease.get_lease_id(self.target_group_arn, cw_alarm_name))
+
+    def release_control_lease(self, cw_alarm_name: str) -> None:
+        if self.control_lease is None or self.chain_id is None:
+            return
+
+        self.control_lease.release(
+            ControlLoopLease.get_lease_id(self.target_group_arn, cw_alarm_name), self.chain_id)
+
+        return
+
     def send_sqs_notification(
             self, sqs_client: client, sqs_queue_url: str, cw_alarm_arn: str, cw_alarm_name: str,
-            alarm_action: ALBAlarmAction
+            alarm_action: ALBAlarmAction, delay_sec: int = None, metric_value: float = None
     ) -> None:
         alb_alarm_status_message = ALBAlarmStatusMessage(
             cw_alarm_arn=cw_alarm_arn, cw_alarm_name=cw_alarm_name,
@@ -185,54 +900,270 @@ class ALBListenerRulesHandler:
             shed_mesg_delay_sec=self.shed_mesg_delay_sec, restore_mesg_delay_sec=self.restore_mesg_delay_sec,
             elb_shed_percent=self.elb_shed_percent, max_elb_shed_percent=self.max_elb_shed_percent,
             elb_restore_percent=self.elb_restore_percent,
-            alb_alarm_action=alarm_action)
+            alb_alarm_action=alarm_action, target_group_rule_count=self.get_target_group_rule_count(),
+            chain_id=self.chain_id, alarm_at=self.alarm_at, sent_at=round(self.clock(), 3), hops=self.hops + 1)
+
+        if self.pre_shed:
+            alb_alarm_status_message.pre_shed = True
+            alb_alarm_status_message.pre_shed_weight = self.pre_shed_weight
+
+        if self.hysteresis_state.last_shed_at is not None:
+            alb_alarm_status_message.last_shed_at = self.hysteresis_state.last_shed_at
+
+        if self.hysteresis is not None:
+            alb_alarm_status_message.ok_since = self.hysteresis_state.ok_since
+            alb_alarm_status_message.ok_evaluations = self.hysteresis_state.ok_evaluations
 
         sqs_delay_sec = self.shed_mesg_delay_sec
 
         if alarm_action == ALBAlarmAction.RESTORE:
             sqs_delay_sec = self.restore_mesg_delay_sec
 
-        # if we took an action, we want to re-evaluate the decision in 60s
-        message_body = json.dumps(alb_alarm_status_message.to_json())
-        logger.debug('Queuing message: ' + message_body)
+        if delay_sec is not None:
+            sqs_delay_sec = delay_sec
+            alb_alarm_status_message.delay_sec = delay_sec
+            alb_alarm_status_message.metric_value = metric_value
+
+        with trace_span(self.tracer, 'send_message', {'action': alarm_action.name, 'delaySec': sqs_delay_sec}):
+            # the next step continues the trace from this span
+            if self.tracer is not None:
+                alb_alarm_status_message.trace_context = self.tracer.get_trace_context()
+
+            # if we took an action, we want to re-evaluate the decision in 60s
+            message_body = json.dumps(alb_alarm_status_message.to_json())
+            logger.debug('Queuing message: ' + message_body)
+
+            sqs_client.send_message(
+                QueueUrl=sqs_queue_url,
+                DelaySeconds=sqs_delay_sec,
+                MessageBody=message_body
+            )
+
+    def add_elb_rule(self, elb_listener_rule: ELBListenerRule) -> None:
+        self._elb_rules.append(elb_listener_rule)
 
-        sqs_client.send_message(
-            QueueUrl=sqs_queue_url,
-            DelaySeconds=sqs_delay_sec,
-            MessageBody=message_body
-        )
+        for target_group_arn in elb_listener_rule.forward_configs.keys():
+            self.target_group_rules.setdefault(
+                target_group_arn, []).append(elb_listener_rule)
+
+        return
+
+    def update_rule_cache(self, elb_rules: list) -> None:
+        if self.rule_cache is None:
+            return
+
+        if any(result.error is not None for result in self.rule_write_results):
+            # the listener state is unknown after a failed write
+            self.rule_cache.invalidate(self.elb_listener_arn)
+
+            return
+
+        saved_rule_arns = set(result.elb_rule_arn for result in self.rule_write_results if result.saved)
+
+        for elb_rule in elb_rules:
+            if elb_rule.elb_rule_arn in saved_rule_arns:
+                self.rule_cache.update_weights(
+                    self.elb_listener_arn, elb_rule.elb_rule_arn, elb_rule.get_target_groups())
+
+        return
 
     def get_elb_rules(self) -> list:
         return self.elb_rules
 
+    def get_target_group_rules(self, target_group_arn: str) -> list:
+        if not self.elb_rules_load_attempted:
+            self.load_elb_rules(self.elbv2_client)
+
+        return self.target_group_rules.get(target_group_arn, [])
+
+    def get_target_group_rule_count(self) -> int:
+        # only pass on a count that can be used to stop reading rules early in the next step
+        if not self.elb_rules_load_attempted:
+            return self.target_group_rule_count
+
+        if not self.elb_rules_loaded:
+            return None
+
+        target_group_rule_count = len(self.get_target_group_rules(self.target_group_arn))
+
+        if target_group_rule_count == 0:
+            return None
+
+        return target_group_rule_count
+
     def is_restorable(self, source_group_arn: str) -> bool:
-        for elb_rule in self.elb_rules:
+        for elb_rule in self.get_target_group_rules(source_group_arn):
             if elb_rule.is_restorable(source_group_arn):
                 return True
 
         return False
 
     def is_sheddable(self, source_group_arn: str, max_shed_weight: int) -> bool:
-        for elb_rule in self.elb_rules:
+        for elb_rule in self.get_target_group_rules(source_group_arn):
             if elb_rule.is_sheddable(source_group_arn, max_shed_weight):
                 return True
 
         return False
 
-    def restore(self, elbv2_client: client, source_group_arn: str, weight: int) -> None:
-        for elb_rule in self.elb_rules:
-            elb_rule.restore(source_group_arn, weight)
+    def restore(
+            self, elbv2_client: client, source_group_arn: str, weight: int, step_policy: StepPolicy = None
+    ) -> None:
+        elb_rules = self.get_target_group_rules(source_group_arn)
+        shed_strategy = self.shed_strategy
+
+        # a step policy overrides the one of the shed strategy for this step
+        if step_policy is not None:
+            shed_strategy = ShedStrategy(step_policy, (shed_strategy or DEFAULT_SHED_STRATEGY).weight_distribution)
+
+        for elb_rule in elb_rules:
+            elb_rule.restore(source_group_arn, weight, shed_strategy)
+
+        self.save(elbv2_client, elb_rules)
+        self.record_shed_budget(source_group_arn, elb_rules)
+        self.track_apply_latency(ALBAlarmAction.RESTORE)
+
+        return
+
+    def shed(
+            self, elbv2_client: client, source_group_arn: str, weight: int, max_shed_weight: int,
+            load_ratio: float = None, step_policy: StepPolicy = None
+    ) -> None:
+        elb_rules = self.get_target_group_rules(source_group_arn)
+        shed_strategy = self.get_guarded_shed_strategy()
+
+        # a step policy overrides the one of the shed strategy for this step
+        if step_policy is not None:
+            shed_strategy = ShedStrategy(step_policy, shed_strategy.weight_distribution)
+        rule_weights = []
+
+        for elb_rule in elb_rules:
+            rule_weight = weight
+
+            # with a load ratio each rule sheds in proportion to the weight it forwards
+            if self.shed_controller is not None and load_ratio is not None:
+                rule_weight = self.shed_controller.get_shed_weight(
+                    elb_rule.forward_configs.get(source_group_arn), load_ratio, weight)
+
+            rule_weights.append(rule_weight)
+
+        if self.shed_budget is not None:
+            shed_strategy = self.get_budgeted_shed_strategy(shed_strategy, source_group_arn, elb_rules, rule_weights)
 
-        for elb_rule in self.elb_rules:
-            elb_rule.save(elbv2_client)
+        for elb_rule, rule_weight in zip(elb_rules, rule_weights):
+            elb_rule.shed(source_group_arn, rule_weight, max_shed_weight, shed_strategy)
+
+        self.save(elbv2_client, elb_rules)
+        self.record_shed_budget(source_group_arn, elb_rules)
+        self.track_apply_latency(ALBAlarmAction.SHED)
 
         return
 
-    def shed(self, elbv2_client: client, source_group_arn: str, weight: int, max_shed_weight: int) -> None:
-        for elb_rule in self.elb_rules:
-            elb_rule.shed(source_group_arn, weight, max_shed_weight)
+    def get_budgeted_shed_strategy(
+            self, shed_strategy: ShedStrategy, source_group_arn: str, elb_rules: list, rule_weights: list
+    ) -> ShedStrategy:
+        """
+        Claims budget on every secondary for the weight this step would shed into it and returns
+        a strategy that keeps each secondary within the weight granted.
+        """
+        desired_weights = dict()
+
+        for elb_rule, rule_weight in zip(elb_rules, rule_weights):
+            source_weight = elb_rule.forward_configs.get(source_group_arn)
+            step_weight = shed_strategy.step_policy.get_shed_weight(source_weight, rule_weight)
+
+            for target_group_arn, current_weight in elb_rule.forward_configs.items():
+                if target_group_arn != source_group_arn:
+                    desired_weights[target_group_arn] = max(
+                        desired_weights.get(target_group_arn, 0), current_weight + step_weight)
+
+        budget_weights = dict()
+
+        for target_group_arn, desired_weight in desired_weights.items():
+            try:
+                budget_weights[target_group_arn] = self.shed_budget.acquire(
+                    target_group_arn, source_group_arn, desired_weight)
+            except Exception as e:
+                logger.warning('Unable to claim shed budget on ' + target_group_arn + ': ' + str(e))
+
+                continue
+
+            if budget_weights[target_group_arn] < desired_weight:
+                logger.info('Shed budget on ' + target_group_arn + ' limits ' + source_group_arn + ' to ' +
+                            str(budget_weights[target_group_arn]))
+
+        if len(budget_weights) == 0:
+            return shed_strategy
+
+        return ShedStrategy(shed_strategy.step_policy, BudgetedWeightDistribution(
+            shed_strategy.weight_distribution, budget_weights))
+
+    def record_shed(self) -> None:
+        """
+        Records a shed step. With a shed controller the time of the last shed step is carried to
+        the next message even without hysteresis, so that the controller knows which datapoints
+        predate it.
+        """
+        if self.hysteresis is not None:
+            self.hysteresis.record_shed(self.hysteresis_state)
+        elif self.shed_controller is not None:
+            self.hysteresis_state.last_shed_at = int(self.clock())
+
+        return
+
+    def record_shed_budget(self, source_group_arn: str, elb_rules: list) -> None:
+        """
+        Records the largest weight each secondary holds in the rules of the source as its claim.
+        """
+        if self.shed_budget is None:
+            return
+
+        claimed_weights = dict()
+
+        for elb_rule in elb_rules:
+            for target_group_arn, current_weight in elb_rule.forward_configs.items():
+                if target_group_arn != source_group_arn:
+                    claimed_weights[target_group_arn] = max(claimed_weights.get(target_group_arn, 0), current_weight)
+
+        for target_group_arn, claimed_weight in claimed_weights.items():
+            try:
+                self.shed_budget.record(target_group_arn, source_group_arn, claimed_weight)
+            except Exception as e:
+                logger.warning('Unable to record shed budget on ' + target_group_arn + ': ' + str(e))
+
+        self.shed_budget_recorded = True
+
+        return
+
+    def save(self, elbv2_client: client, elb_rules: list = None) -> None:
+        if elb_rules is None:
+            elb_rules = self.elb_rules
+
+        # rules given to save whose weights did not change
+        rule_writes_skipped = len([elb_rule for elb_rule in elb_rules if not elb_rule.is_dirty()])
+
+        with trace_span(self.tracer, 'save_rules', {'listenerArn': self.elb_listener_arn}) as span:
+            self.rule_write_results = self.rule_writer.write(elbv2_client, elb_rules)
+
+            if span is not None:
+                span.set_attribute('rulesWritten', len([result for result in self.rule_write_results if result.saved]))
+
+        rule_writes = len([result for result in self.rule_write_results if result.saved])
+        rule_write_failures = len([result for result in self.rule_write_results if result.error is not None])
+
+        self.update_rule_cache(elb_rules)
+
+        self.rule_writes += rule_writes
+        self.rule_writes_skipped += rule_writes_skipped
+        self.rule_write_failures += rule_write_failures
+
+        logger.info('Saved ' + str(rule_writes) + ' rules for ' + self.elb_listener_arn +
+                    ', skipped ' + str(rule_writes_skipped) + ' unchanged rules, failed to save ' +
+                    str(rule_write_failures) + ' rules')
+
+        for result in self.rule_write_results:
+            logger.info('Rule write: ' + json.dumps(result.to_json()))
 
-        for elb_rule in self.elb_rules:
-            elb_rule.save(elbv2_client)
+        if any(result.error is not None for result in self.rule_write_results):
+            raise ELBRuleWriteError(self.rule_write_results)
 
         return
@@ -0,0 +1,150 @@
+"""
+Synthetic listeners and stub ELB, SQS and CloudWatch clients for the benchmarks.
+
+The stubs are plain classes rather than MagicMock so that the time measured is the time
+spent in elb_load_monitor and not in recording mock calls.
+"""
+LOAD_BALANCER_ARN = 'arn:aws:elasticloadbalancing:us-east-1:123456789012:loadbalancer/app/BenchALB/bb6bb42b08f94c0b'
+LISTENER_ARN = 'arn:aws:elasticloadbalancing:us-east-1:123456789012:listener/app/BenchALB/bb6bb42b08f94c0b/b3784a6b090b3696'
+ALARM_NAME = 'ALB_bench'
+ALARM_ARN = 'arn:aws:cloudwatch:us-east-1:123456789012:alarm:' + ALARM_NAME
+SQS_QUEUE_URL = 'https://sqs.us-east-1.amazonaws.com/123456789012/bench'
+
+# target groups per rule and rules per listener the benchmarks scale over
+TARGET_GROUP_COUNTS = (2, 10, 50)
+RULE_COUNTS = (1, 10, 100, 500)
+
+
+def get_target_group_arn(index: int) -> str:
+    return 'arn:aws:elasticloadbalancing:us-east-1:123456789012:targetgroup/BenchTG' + str(index) + '/' + \
+        format(index, '016x')
+
+
+SOURCE_GROUP_ARN = get_target_group_arn(0)
+
+
+def get_forward_weights(target_group_count: int, source_weight: int = 100) -> dict:
+    """
+    Returns the weights of a rule forwarding source_weight to the source target group and the
+    rest spread evenly over the other target_group_count - 1 target groups.
+    """
+    other_weight, remainder = divmod(100 - source_weight, target_group_count - 1)
+    weights = {SOURCE_GROUP_ARN: source_weight}
+
+    for index in range(1, target_group_count):
+        weights[get_target_group_arn(index)] = other_weight + (1 if index <= remainder else 0)
+
+    return weights
+
+
+def get_rule_entries(rule_count: int, target_group_count: int, source_weight: int = 100) -> list:
+    """
+    Returns DescribeRules entries for a listener of rule_count rules, the last being the
+    default rule, each forwarding to target_group_count target groups.
+    """
+    rule_entries = []
+
+    for index in range(rule_count):
+        default_rule = index == rule_count - 1
+        target_groups = [
+            {'TargetGroupArn': target_group_arn, 'Weight': weight}
+            for target_group_arn, weight in get_forward_weights(target_group_count, source_weight).items()
+        ]
+
+        rule_entries.append({
+            'RuleArn': LISTENER_ARN.replace(':listener/', ':listener-rule/') + '/' + format(index, '016x'),
+            'Priority': 'default' if default_rule else str(index + 1),
+            'Conditions': [] if default_rule else [{
+                'Field': 'path-pattern', 'Values': ['/bench/' + str(index) + '/*']
+            }],
+            'Actions': [{
+                'Type': 'forward',
+                'TargetGroupArn': SOURCE_GROUP_ARN,
+                'ForwardConfig': {
+                    'TargetGroups': target_groups,
+                    'TargetGroupStickinessConfig': {'Enabled': False}
+                }
+            }],
+            'IsDefault': default_rule
+        })
+
+    return rule_entries
+
+
+class StubELBv2Client:
+    """
+    Serves DescribeRules from rule_entries, PageSize rules per page, and accepts every write
+    without changing the rules, so every invocation starts from the same listener.
+    """
+    def __init__(self, rule_entries: list) -> None:
+        self.rule_entries = rule_entries
+        self.rules_by_arn = {rule_entry['RuleArn']: rule_entry for rule_entry in rule_entries}
+        self.describe_rules_calls = 0
+        self.modify_calls = 0
+
+    def describe_rules(self, ListenerArn: str = None, RuleArns: list = None, PageSize: int = None,
+                       Marker: str = None) -> dict:
+        self.describe_rules_calls += 1
+
+        if RuleArns is not None:
+            return {'Rules': [self.rules_by_arn[rule_arn] for rule_arn in RuleArns]}
+
+        start = int(Marker or 0)
+        end = len(self.rule_entries) if PageSize is None else start + PageSize
+        describe_rules_response = {'Rules': self.rule_entries[start:end]}
+
+        if end < len(self.rule_entries):
+            describe_rules_response['NextMarker'] = str(end)
+
+        return describe_rules_response
+
+    def modify_rule(self, **kwargs) -> dict:
+        self.modify_calls += 1
+
+        return {}
+
+    def modify_listener(self, **kwargs) -> dict:
+        self.modify_calls += 1
+
+        return {}
+
+
+class StubSQSClient:
+    def __init__(self) -> None:
+        self.messages = []
+
+    def send_message(self, **kwargs) -> dict:
+        self.messages.append(kwargs)
+
+        return {'MessageId': str(len(self.messages))}
+
+
+class StubCloudWatchClient:
+    """
+    Serves DescribeAlarms for one alarm on the TargetGroup dimension of the source target group.
+    """
+    def __init__(self, state_value: str) -> None:
+        self.metric_alarm = {
+            'AlarmName': ALARM_NAME,
+            'AlarmArn': ALARM_ARN,
+            'StateValue': state_value,
+            'MetricName': 'RequestCountPerTarget',
+            'Namespace': 'AWS/ApplicationELB',
+            'Statistic': 'Sum',
+            'Dimensions': [{'Name': 'TargetGroup', 'Value': SOURCE_GROUP_ARN.split(':')[-1]}],
+            'Period': 60,
+            'EvaluationPeriods': 1,
+            'Threshold': 500.0,
+            'ComparisonOperator': 'GreaterThanThreshold'
+        }
+
+    def describe_alarms(self, **kwargs) -> dict:
+        return {'MetricAlarms': [self.metric_alarm], 'CompositeAlarms': []}
+
+
+def get_rounds(rule_count: int, target_group_count: int = 2) -> int:
+    """
+    Returns the number of rounds for a benchmark that is set up afresh every round, fewer for
+    larger listeners so that every size takes about as long to run.
+    """
+    return max(5, min(200, 20000 // (rule_count * target_group_count)))
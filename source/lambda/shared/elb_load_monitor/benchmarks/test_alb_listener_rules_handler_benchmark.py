@@ -0,0 +1,113 @@
+"""
+Benchmarks of ALBListenerRulesHandler as listeners grow, over stub clients.
+
+Rules are parsed on the first access to elb_rules rather than in __init__, so parsing is
+timed through load_elb_rules. Every invocation creates a new handler, as every Lambda
+invocation does.
+"""
+import itertools
+
+import pytest
+
+pytest.importorskip('pytest_benchmark')
+
+from elb_load_monitor.alb_alarm_messages import ALBAlarmAction
+from elb_load_monitor.alb_alarm_messages import ALBAlarmEvent
+from elb_load_monitor.alb_alarm_messages import ALBAlarmStatusMessage
+from elb_load_monitor.alb_alarm_messages import CWAlarmState
+from elb_load_monitor.alb_listener_rules_handler import ALBListenerRulesHandler
+
+from listener_stubs import ALARM_ARN
+from listener_stubs import ALARM_NAME
+from listener_stubs import LISTENER_ARN
+from listener_stubs import LOAD_BALANCER_ARN
+from listener_stubs import RULE_COUNTS
+from listener_stubs import SOURCE_GROUP_ARN
+from listener_stubs import SQS_QUEUE_URL
+from listener_stubs import TARGET_GROUP_COUNTS
+from listener_stubs import StubCloudWatchClient
+from listener_stubs import StubELBv2Client
+from listener_stubs import StubSQSClient
+from listener_stubs import get_rounds
+from listener_stubs import get_rule_entries
+
+LISTENER_SIZES = list(itertools.product(RULE_COUNTS, TARGET_GROUP_COUNTS))
+LISTENER_SIZE_IDS = [str(rule_count) + 'rules-' + str(target_group_count) + 'tgs'
+                     for rule_count, target_group_count in LISTENER_SIZES]
+
+ELB_SHED_PERCENT = 20
+MAX_ELB_SHED_PERCENT = 100
+ELB_RESTORE_PERCENT = 10
+
+
+def create_handler(elbv2_client: StubELBv2Client) -> ALBListenerRulesHandler:
+    return ALBListenerRulesHandler(
+        elbv2_client, LOAD_BALANCER_ARN, LISTENER_ARN, SOURCE_GROUP_ARN, ELB_SHED_PERCENT, MAX_ELB_SHED_PERCENT,
+        ELB_RESTORE_PERCENT, 60, 120)
+
+
+@pytest.mark.parametrize('rule_count,target_group_count', LISTENER_SIZES, ids=LISTENER_SIZE_IDS)
+def test_load_elb_rules(benchmark, rule_count, target_group_count):
+    elbv2_client = StubELBv2Client(get_rule_entries(rule_count, target_group_count))
+
+    def setup():
+        return (create_handler(elbv2_client), ), {}
+
+    def load_elb_rules(alb_listener_rules_handler):
+        alb_listener_rules_handler.load_elb_rules(elbv2_client)
+
+        return alb_listener_rules_handler
+
+    alb_listener_rules_handler = benchmark.pedantic(
+        load_elb_rules, setup=setup, rounds=get_rounds(rule_count, target_group_count))
+
+    assert len(alb_listener_rules_handler.elb_rules) == rule_count
+
+
+@pytest.mark.parametrize('rule_count,target_group_count', LISTENER_SIZES, ids=LISTENER_SIZE_IDS)
+def test_handle_alarm(benchmark, rule_count, target_group_count):
+    elbv2_client = StubELBv2Client(get_rule_entries(rule_count, target_group_count))
+    sqs_client = StubSQSClient()
+    alb_alarm_event = ALBAlarmEvent('bench', ALARM_ARN, ALARM_NAME, CWAlarmState.ALARM)
+
+    def setup():
+        # count the writes of each round on its own
+        elbv2_client.modify_calls = 0
+
+        return (create_handler(elbv2_client), ), {}
+
+    def handle_alarm(alb_listener_rules_handler):
+        return alb_listener_rules_handler.handle_alarm(elbv2_client, sqs_client, SQS_QUEUE_URL, alb_alarm_event)
+
+    rounds = get_rounds(rule_count, target_group_count)
+
+    assert benchmark.pedantic(handle_alarm, setup=setup, rounds=rounds) == ALBAlarmAction.SHED
+    assert elbv2_client.modify_calls == rule_count
+
+
+@pytest.mark.parametrize('rule_count,target_group_count', LISTENER_SIZES, ids=LISTENER_SIZE_IDS)
+def test_handle_alarm_status_message_restore(benchmark, rule_count, target_group_count):
+    elbv2_client = StubELBv2Client(get_rule_entries(rule_count, target_group_count, source_weight=40))
+    sqs_client = StubSQSClient()
+    cw_client = StubCloudWatchClient(CWAlarmState.OK.name)
+    alb_alarm_status_message = ALBAlarmStatusMessage(
+        cw_alarm_arn=ALARM_ARN, cw_alarm_name=ALARM_NAME, load_balancer_arn=LOAD_BALANCER_ARN,
+        elb_listener_arn=LISTENER_ARN, target_group_arn=SOURCE_GROUP_ARN, sqs_queue_url=SQS_QUEUE_URL,
+        shed_mesg_delay_sec=60, restore_mesg_delay_sec=120, elb_shed_percent=ELB_SHED_PERCENT,
+        max_elb_shed_percent=MAX_ELB_SHED_PERCENT, elb_restore_percent=ELB_RESTORE_PERCENT,
+        alb_alarm_action=ALBAlarmAction.RESTORE)
+
+    def setup():
+        # count the writes of each round on its own
+        elbv2_client.modify_calls = 0
+
+        return (create_handler(elbv2_client), ), {}
+
+    def handle_alarm_status_message(alb_listener_rules_handler):
+        return alb_listener_rules_handler.handle_alarm_status_message(
+            cw_client, elbv2_client, sqs_client, alb_alarm_status_message)
+
+    rounds = get_rounds(rule_count, target_group_count)
+
+    assert benchmark.pedantic(handle_alarm_status_message, setup=setup, rounds=rounds) == ALBAlarmAction.RESTORE
+    assert elbv2_client.modify_calls == rule_count
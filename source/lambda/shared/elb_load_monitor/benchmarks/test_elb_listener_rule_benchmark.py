@@ -0,0 +1,67 @@
+"""
+Benchmarks of the weight math of one listener rule as the number of target groups grows.
+"""
+import pytest
+
+pytest.importorskip('pytest_benchmark')
+
+from elb_load_monitor.elb_listener_rule import ELBListenerRule
+
+from listener_stubs import LISTENER_ARN
+from listener_stubs import SOURCE_GROUP_ARN
+from listener_stubs import TARGET_GROUP_COUNTS
+from listener_stubs import get_forward_weights
+from listener_stubs import get_rounds
+
+
+def create_rule(target_group_count: int, source_weight: int) -> ELBListenerRule:
+    elb_listener_rule = ELBListenerRule(LISTENER_ARN + '/rule', LISTENER_ARN, False)
+
+    for target_group_arn, weight in get_forward_weights(target_group_count, source_weight).items():
+        elb_listener_rule.add_forward_config(target_group_arn, weight)
+
+    return elb_listener_rule
+
+
+@pytest.mark.parametrize('target_group_count', TARGET_GROUP_COUNTS)
+def test_shed(benchmark, target_group_count):
+    def setup():
+        return (create_rule(target_group_count, 100), ), {}
+
+    def shed(elb_listener_rule):
+        elb_listener_rule.shed(SOURCE_GROUP_ARN, 20, 100)
+
+        return elb_listener_rule
+
+    elb_listener_rule = benchmark.pedantic(shed, setup=setup, rounds=get_rounds(1, target_group_count) * 10)
+
+    assert elb_listener_rule.forward_configs[SOURCE_GROUP_ARN] == 80
+
+
+@pytest.mark.parametrize('target_group_count', TARGET_GROUP_COUNTS)
+def test_restore(benchmark, target_group_count):
+    def setup():
+        return (create_rule(target_group_count, 40), ), {}
+
+    def restore(elb_listener_rule):
+        elb_listener_rule.restore(SOURCE_GROUP_ARN, 10)
+
+        return elb_listener_rule
+
+    elb_listener_rule = benchmark.pedantic(restore, setup=setup, rounds=get_rounds(1, target_group_count) * 10)
+
+    assert elb_listener_rule.forward_configs[SOURCE_GROUP_ARN] == 50
+
+
+@pytest.mark.parametrize('target_group_count', TARGET_GROUP_COUNTS)
+def test_is_sheddable(benchmark, target_group_count):
+    elb_listener_rule = create_rule(target_group_count, 40)
+
+    assert benchmark(elb_listener_rule.is_sheddable, SOURCE_GROUP_ARN, 100)
+
+
+@pytest.mark.parametrize('target_group_count', TARGET_GROUP_COUNTS)
+def test_is_restorable(benchmark, target_group_count):
+    elb_listener_rule = create_rule(target_group_count, 40)
+
+    assert benchmark(elb_listener_rule.is_restorable, SOURCE_GROUP_ARN)
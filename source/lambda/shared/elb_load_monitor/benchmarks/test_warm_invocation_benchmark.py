@@ -0,0 +1,68 @@
+"""
+Benchmarks of the per invocation setup of the Lambda handlers, cold and warm.
+
+A cold invocation creates its elbv2, sqs and cloudwatch clients and parses the environment,
+as the handlers did on every invocation. A warm invocation takes the clients from the pool
+in elb_load_monitor.clients and the cached configuration from elb_load_monitor.config.
+"""
+import boto3
+import pytest
+
+pytest.importorskip('pytest_benchmark')
+
+from elb_load_monitor import clients
+from elb_load_monitor import config
+
+from listener_stubs import LISTENER_ARN
+from listener_stubs import LOAD_BALANCER_ARN
+from listener_stubs import SQS_QUEUE_URL
+
+SERVICE_NAMES = ('elbv2', 'sqs', 'cloudwatch')
+
+ENVIRON = {
+    'ELB_ARN': LOAD_BALANCER_ARN,
+    'ELB_LISTENER_ARN': LISTENER_ARN,
+    'SQS_QUEUE_URL': SQS_QUEUE_URL,
+    'ELB_SHED_PERCENT': '20',
+    'ELB_RESTORE_PERCENT': '10',
+    'SHED_MESG_DELAY_SEC': '60',
+    'RESTORE_MESG_DELAY_SEC': '120'
+}
+
+
+@pytest.fixture(autouse=True)
+def reset_pools():
+    clients.reset_clients()
+    config.reset_config()
+
+    yield
+
+    clients.reset_clients()
+    config.reset_config()
+
+
+def test_cold_invocation(benchmark):
+    def cold_invocation():
+        service_clients = [boto3.client(service_name) for service_name in SERVICE_NAMES]
+
+        return service_clients, config.ALBMonitorConfig.from_environ(ENVIRON)
+
+    service_clients, alb_monitor_config = benchmark.pedantic(cold_invocation, rounds=20)
+
+    assert len(service_clients) == len(SERVICE_NAMES)
+    assert alb_monitor_config.elb_shed_percent == 20
+
+
+def test_warm_invocation(benchmark):
+    pooled_clients = [clients.get_client(service_name) for service_name in SERVICE_NAMES]
+    cached_config = config.get_config(ENVIRON)
+
+    def warm_invocation():
+        service_clients = [clients.get_client(service_name) for service_name in SERVICE_NAMES]
+
+        return service_clients, config.get_config(ENVIRON)
+
+    service_clients, alb_monitor_config = benchmark(warm_invocation)
+
+    assert service_clients == pooled_clients
+    assert alb_monitor_config is cached_config
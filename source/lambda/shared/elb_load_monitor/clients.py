@@ -0,0 +1,35 @@
+"""
+Module level pool of boto3 clients.
+
+Clients are created on first use and kept for the lifetime of the Lambda execution
+environment so that warm invocations reuse the same clients and their connections.
+"""
+from boto3 import client
+
+import boto3
+import threading
+
+
+_clients = dict()
+_clients_lock = threading.Lock()
+
+
+def get_client(service_name: str) -> client:
+    cached_client = _clients.get(service_name)
+
+    if cached_client is not None:
+        return cached_client
+
+    # boto3 client creation is not thread safe
+    with _clients_lock:
+        if service_name not in _clients:
+            _clients[service_name] = boto3.client(service_name)
+
+        return _clients[service_name]
+
+
+def reset_clients() -> None:
+    with _clients_lock:
+        _clients.clear()
+
+    return
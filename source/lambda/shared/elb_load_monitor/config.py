@@ -0,0 +1,176 @@
+"""
+Typed configuration for the ALB monitor Lambda functions.
+
+The configuration is read from the environment once and cached at module scope. It is
+only re-parsed when one of the environment variables it is built from changes.
+"""
+from collections.abc import Mapping
+
+import os
+import threading
+
+
+ENVIRONMENT_VARIABLES = (
+    'ELB_ARN', 'ELB_LISTENER_ARN', 'SQS_QUEUE_URL', 'ELB_SHED_PERCENT', 'MAX_ELB_SHED_PERCENT',
+    'ELB_RESTORE_PERCENT', 'SHED_MESG_DELAY_SEC', 'RESTORE_MESG_DELAY_SEC', 'MAX_RULE_WRITE_CONCURRENCY',
+    'RULE_WRITE_VERSION_CHECK',
+    'DESCRIBE_RULES_PAGE_SIZE', 'RULE_CACHE_TTL_SEC', 'RULE_CACHE_MAX_LISTENERS', 'RULE_CACHE_VALIDATE',
+    'LEASE_TABLE_NAME', 'LEASE_DURATION_SEC', 'SHED_CONTROLLER', 'SHED_TARGET_UTILIZATION',
+    'SHED_POLICY', 'AIMD_DECREASE_FACTOR', 'SHED_HOLD_SEC', 'RESTORE_COOLDOWN_SEC', 'RESTORE_OK_EVALUATIONS',
+    'ADAPTIVE_DELAY', 'MIN_MESG_DELAY_SEC', 'MAX_MESG_DELAY_SEC', 'POLL_MODE', 'POLL_PERIOD_SEC',
+    'POLL_EVALUATION_PERIODS', 'POLL_INTERVAL_SEC', 'POLL_DURATION_SEC', 'CW_ALARM_NAME', 'ELB_TARGET_GROUP_ARN',
+    'PREDICTIVE_SHED', 'PREDICT_HORIZON_SEC', 'PREDICT_DATAPOINTS', 'PRE_SHED_PERCENT', 'SHED_DISTRIBUTION',
+    'SECONDARY_GUARD', 'SECONDARY_MAX_UTILIZATION', 'SHED_BUDGET_WEIGHT', 'EMF_METRICS', 'METRICS_NAMESPACE',
+    'TRACING'
+)
+
+
+class ALBMonitorConfig:
+
+    @classmethod
+    def from_environ(cls, environ: Mapping) -> 'ALBMonitorConfig':
+        alb_monitor_config = ALBMonitorConfig(
+            load_balancer_arn=environ.get('ELB_ARN'), elb_listener_arn=environ.get('ELB_LISTENER_ARN'),
+            sqs_queue_url=environ.get('SQS_QUEUE_URL'),
+            elb_shed_percent=int(environ.get('ELB_SHED_PERCENT', 5)),
+            max_elb_shed_percent=int(environ.get('MAX_ELB_SHED_PERCENT', 100)),
+            elb_restore_percent=int(environ.get('ELB_RESTORE_PERCENT', 5)),
+            shed_mesg_delay_sec=int(environ.get('SHED_MESG_DELAY_SEC', 60)),
+            restore_mesg_delay_sec=int(environ.get('RESTORE_MESG_DELAY_SEC', 60)),
+            max_rule_write_concurrency=int(environ.get('MAX_RULE_WRITE_CONCURRENCY', 4)),
+            rule_write_version_check=parse_bool(environ.get('RULE_WRITE_VERSION_CHECK', 'false')),
+            describe_rules_page_size=int(environ.get('DESCRIBE_RULES_PAGE_SIZE', 400)),
+            rule_cache_ttl_sec=int(environ.get('RULE_CACHE_TTL_SEC', 0)),
+            rule_cache_max_listeners=int(environ.get('RULE_CACHE_MAX_LISTENERS', 16)),
+            rule_cache_validate=parse_bool(environ.get('RULE_CACHE_VALIDATE', 'true')),
+            lease_table_name=environ.get('LEASE_TABLE_NAME') or None,
+            lease_duration_sec=int(environ.get('LEASE_DURATION_SEC', 900)),
+            shed_controller=environ.get('SHED_CONTROLLER', 'fixed'),
+            shed_target_utilization=float(environ.get('SHED_TARGET_UTILIZATION', 0.9)),
+            shed_policy=environ.get('SHED_POLICY', 'linear'),
+            aimd_decrease_factor=float(environ.get('AIMD_DECREASE_FACTOR', 0.5)),
+            shed_distribution=environ.get('SHED_DISTRIBUTION', 'even'),
+            shed_hold_sec=int(environ.get('SHED_HOLD_SEC', 0)),
+            restore_cooldown_sec=int(environ.get('RESTORE_COOLDOWN_SEC', 0)),
+            restore_ok_evaluations=int(environ.get('RESTORE_OK_EVALUATIONS', 1)),
+            adaptive_delay=parse_bool(environ.get('ADAPTIVE_DELAY', 'false')),
+            min_mesg_delay_sec=int(environ.get('MIN_MESG_DELAY_SEC', 10)),
+            max_mesg_delay_sec=int(environ.get('MAX_MESG_DELAY_SEC', 900)),
+            poll_mode=parse_bool(environ.get('POLL_MODE', 'false')),
+            poll_period_sec=int(environ.get('POLL_PERIOD_SEC', 60)),
+            poll_evaluation_periods=int(environ.get('POLL_EVALUATION_PERIODS', 3)),
+            poll_interval_sec=int(environ.get('POLL_INTERVAL_SEC', 10)),
+            poll_duration_sec=int(environ.get('POLL_DURATION_SEC', 50)),
+            cw_alarm_name=environ.get('CW_ALARM_NAME') or None,
+            target_group_arn=environ.get('ELB_TARGET_GROUP_ARN') or None,
+            predictive_shed=parse_bool(environ.get('PREDICTIVE_SHED', 'false')),
+            predict_horizon_sec=int(environ.get('PREDICT_HORIZON_SEC', 300)),
+            predict_datapoints=int(environ.get('PREDICT_DATAPOINTS', 5)),
+            pre_shed_percent=int(environ.get('PRE_SHED_PERCENT', 5)),
+            secondary_guard=parse_bool(environ.get('SECONDARY_GUARD', 'false')),
+            secondary_max_utilization=float(environ.get('SECONDARY_MAX_UTILIZATION', 1.0)),
+            shed_budget_weight=int(environ.get('SHED_BUDGET_WEIGHT', 0)),
+            emf_metrics=parse_bool(environ.get('EMF_METRICS', 'false')),
+            metrics_namespace=environ.get('METRICS_NAMESPACE') or 'ALBLoadShedding',
+            tracing=parse_bool(environ.get('TRACING', 'false'))
+        )
+
+        return alb_monitor_config
+
+    def __init__(
+        self, load_balancer_arn: str, elb_listener_arn: str, sqs_queue_url: str, elb_shed_percent: int,
+        max_elb_shed_percent: int, elb_restore_percent: int, shed_mesg_delay_sec: int, restore_mesg_delay_sec: int,
+        max_rule_write_concurrency: int = 4, rule_write_version_check: bool = False,
+        describe_rules_page_size: int = 400, rule_cache_ttl_sec: int = 0,
+        rule_cache_max_listeners: int = 16, rule_cache_validate: bool = True, lease_table_name: str = None,
+        lease_duration_sec: int = 900, shed_controller: str = 'fixed', shed_target_utilization: float = 0.9,
+        shed_policy: str = 'linear', aimd_decrease_factor: float = 0.5, shed_hold_sec: int = 0,
+        restore_cooldown_sec: int = 0, restore_ok_evaluations: int = 1, adaptive_delay: bool = False,
+        min_mesg_delay_sec: int = 10, max_mesg_delay_sec: int = 900, poll_mode: bool = False,
+        poll_period_sec: int = 60, poll_evaluation_periods: int = 3, poll_interval_sec: int = 10,
+        poll_duration_sec: int = 50, cw_alarm_name: str = None, target_group_arn: str = None,
+        predictive_shed: bool = False, predict_horizon_sec: int = 300, predict_datapoints: int = 5,
+        pre_shed_percent: int = 5, shed_distribution: str = 'even', secondary_guard: bool = False,
+        secondary_max_utilization: float = 1.0, shed_budget_weight: int = 0, emf_metrics: bool = False,
+        metrics_namespace: str = 'ALBLoadShedding', tracing: bool = False
+    ) -> None:
+        self.load_balancer_arn = load_balancer_arn
+        self.elb_listener_arn = elb_listener_arn
+        self.sqs_queue_url = sqs_queue_url
+        self.elb_shed_percent = elb_shed_percent
+        self.max_elb_shed_percent = max_elb_shed_percent
+        self.elb_restore_percent = elb_restore_percent
+        self.shed_mesg_delay_sec = shed_mesg_delay_sec
+        self.restore_mesg_delay_sec = restore_mesg_delay_sec
+        self.max_rule_write_concurrency = max_rule_write_concurrency
+        self.rule_write_version_check = rule_write_version_check
+        self.describe_rules_page_size = describe_rules_page_size
+        self.rule_cache_ttl_sec = rule_cache_ttl_sec
+        self.rule_cache_max_listeners = rule_cache_max_listeners
+        self.rule_cache_validate = rule_cache_validate
+        self.lease_table_name = lease_table_name
+        self.lease_duration_sec = lease_duration_sec
+        self.shed_controller = shed_controller
+        self.shed_target_utilization = shed_target_utilization
+        self.shed_policy = shed_policy
+        self.aimd_decrease_factor = aimd_decrease_factor
+        self.shed_distribution = shed_distribution
+        self.shed_hold_sec = shed_hold_sec
+        self.restore_cooldown_sec = restore_cooldown_sec
+        self.restore_ok_evaluations = restore_ok_evaluations
+        self.adaptive_delay = adaptive_delay
+        self.min_mesg_delay_sec = min_mesg_delay_sec
+        self.max_mesg_delay_sec = max_mesg_delay_sec
+        self.poll_mode = poll_mode
+        self.poll_period_sec = poll_period_sec
+        self.poll_evaluation_periods = poll_evaluation_periods
+        self.poll_interval_sec = poll_interval_sec
+        self.poll_duration_sec = poll_duration_sec
+        # alarm and target group polled on a schedule in poll mode
+        self.cw_alarm_name = cw_alarm_name
+        self.target_group_arn = target_group_arn
+        self.predictive_shed = predictive_shed
+        self.predict_horizon_sec = predict_horizon_sec
+        self.predict_datapoints = predict_datapoints
+        self.pre_shed_percent = pre_shed_percent
+        self.secondary_guard = secondary_guard
+        self.secondary_max_utilization = secondary_max_utilization
+        self.shed_budget_weight = shed_budget_weight
+        self.emf_metrics = emf_metrics
+        self.metrics_namespace = metrics_namespace
+        self.tracing = tracing
+
+
+def parse_bool(value: str) -> bool:
+    return str(value).strip().lower() in ('true', '1', 'yes')
+
+
+_config = None
+_config_key = None
+_config_lock = threading.Lock()
+
+
+def get_config(environ: Mapping = None) -> ALBMonitorConfig:
+    global _config, _config_key
+
+    if environ is None:
+        environ = os.environ
+
+    config_key = tuple(environ.get(name) for name in ENVIRONMENT_VARIABLES)
+
+    with _config_lock:
+        if _config is None or config_key != _config_key:
+            _config = ALBMonitorConfig.from_environ(environ)
+            _config_key = config_key
+
+        return _config
+
+
+def reset_config() -> None:
+    global _config, _config_key
+
+    with _config_lock:
+        _config = None
+        _config_key = None
+
+    return
@@ -0,0 +1,135 @@
+"""
+Lease that keeps a single shed/restore control loop running per target group and alarm.
+
+Leases are items in a DynamoDB table keyed by leaseId and written with conditional writes.
+A lease is owned by the chain of SQS messages identified by chainId. The owning chain renews
+the lease on every step and releases it when the chain ends. Leases that are not renewed
+expire after lease_duration_sec so that a lost chain does not block new ones.
+
+Alarm events that arrive while a chain holds the lease are folded into the lease item. The
+owning chain takes the last folded alarm state when it renews the lease on its next step.
+"""
+from boto3 import client
+from botocore.exceptions import ClientError
+
+import logging
+import time
+
+from elb_load_monitor import clients
+
+logger = logging.getLogger()
+
+
+class ControlLoopLease:
+    def __init__(
+        self, dynamodb_client: client, table_name: str, lease_duration_sec: int = 900, clock=time.time
+    ) -> None:
+        self.dynamodb_client = dynamodb_client
+        self.table_name = table_name
+        self.lease_duration_sec = lease_duration_sec
+        self.clock = clock
+        # alarm state last folded into each lease before it was renewed by its chain
+        self.folded_states = dict()
+
+    @staticmethod
+    def get_lease_id(target_group_arn: str, cw_alarm_name: str) -> str:
+        return target_group_arn + '#' + cw_alarm_name
+
+    def acquire(self, lease_id: str, chain_id: str) -> bool:
+        """
+        Acquires or renews the lease for chain_id. Returns False if another chain holds an
+        unexpired lease. Renewing the lease takes the events folded into it.
+        """
+        now = int(self.clock())
+
+        try:
+            response = self.dynamodb_client.put_item(
+                TableName=self.table_name,
+                Item={
+                    'leaseId': {'S': lease_id},
+                    'chainId': {'S': chain_id},
+                    'expiresAt': {'N': str(now + self.lease_duration_sec)}
+                },
+                ConditionExpression='attribute_not_exists(leaseId) OR expiresAt < :now OR chainId = :chain_id',
+                ExpressionAttributeValues={
+                    ':now': {'N': str(now)},
+                    ':chain_id': {'S': chain_id}
+                },
+                ReturnValues='ALL_OLD'
+            )
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+                logger.info('Lease ' + lease_id + ' is held by another control loop')
+
+                return False
+
+            raise
+
+        old_item = response.get('Attributes', {})
+        self.folded_states.pop(lease_id, None)
+
+        # events folded into a lease that expired belonged to another chain
+        if old_item.get('chainId', {}).get('S') == chain_id and 'lastFoldedState' in old_item:
+            self.folded_states[lease_id] = old_item['lastFoldedState']['S']
+
+            logger.info('Lease ' + lease_id + ' had ' + old_item['foldedEvents']['N'] +
+                        ' folded events, last ' + self.folded_states[lease_id])
+
+        return True
+
+    def get_folded_state(self, lease_id: str) -> str:
+        """
+        Returns the alarm state last folded into the lease before its last renewal, or None.
+        """
+        return self.folded_states.get(lease_id)
+
+    def fold(self, lease_id: str, cw_alarm_state: str) -> None:
+        """
+        Records an alarm event that was folded into the control loop holding the lease.
+        """
+        try:
+            self.dynamodb_client.update_item(
+                TableName=self.table_name,
+                Key={'leaseId': {'S': lease_id}},
+                UpdateExpression='ADD foldedEvents :one SET lastFoldedState = :state',
+                ConditionExpression='attribute_exists(leaseId)',
+                ExpressionAttributeValues={
+                    ':one': {'N': '1'},
+                    ':state': {'S': cw_alarm_state}
+                }
+            )
+        except ClientError as e:
+            logger.warning('Unable to record folded event for lease ' + lease_id + ': ' + str(e))
+
+        return
+
+    def release(self, lease_id: str, chain_id: str) -> None:
+        try:
+            self.dynamodb_client.delete_item(
+                TableName=self.table_name,
+                Key={'leaseId': {'S': lease_id}},
+                ConditionExpression='chainId = :chain_id',
+                ExpressionAttributeValues={
+                    ':chain_id': {'S': chain_id}
+                }
+            )
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+
+            logger.info('Lease ' + lease_id + ' is no longer held by chain ' + chain_id)
+
+        return
+
+
+def get_control_lease(table_name: str, lease_duration_sec: int, dynamodb_client: client = None) -> ControlLoopLease:
+    """
+    Returns a ControlLoopLease for the table, or None if no lease table is configured.
+    """
+    if table_name is None:
+        return None
+
+    if dynamodb_client is None:
+        dynamodb_client = clients.get_client('dynamodb')
+
+    return ControlLoopLease(dynamodb_client, table_name, lease_duration_sec)
@@ -0,0 +1,61 @@
+"""
+Resolves CloudWatch alarm states for many alarms with as few DescribeAlarms calls as possible.
+"""
+from boto3 import client
+
+import json
+import logging
+
+from elb_load_monitor.alb_alarm_messages import CWAlarmState
+from elb_load_monitor import util
+
+logger = logging.getLogger()
+
+# maximum number of alarm names accepted by a single DescribeAlarms call
+MAX_ALARM_NAMES = 100
+
+
+def describe_alarm_states(cw_client: client, alarm_names: list) -> dict:
+    """
+    Returns a dict of alarm name to CWAlarmState. Alarms that do not exist are not included.
+    """
+    return get_alarm_states(describe_metric_alarms(cw_client, alarm_names))
+
+
+def describe_metric_alarms(cw_client: client, alarm_names: list) -> dict:
+    """
+    Returns a dict of alarm name to the MetricAlarm returned by DescribeAlarms. Alarms that
+    do not exist are not included.
+    """
+    metric_alarms = dict()
+    unique_alarm_names = list(dict.fromkeys(alarm_names))
+
+    for i in range(0, len(unique_alarm_names), MAX_ALARM_NAMES):
+        describe_alarms_args = {
+            'AlarmNames': unique_alarm_names[i:i + MAX_ALARM_NAMES],
+            'MaxRecords': MAX_ALARM_NAMES
+        }
+
+        while True:
+            alarm_response = cw_client.describe_alarms(**describe_alarms_args)
+
+            logger.debug('Alarm status for ' + ','.join(describe_alarms_args['AlarmNames']) +
+                         ': ' + json.dumps(alarm_response, default=util.datetime_handler))
+
+            for metric_alarm in alarm_response['MetricAlarms']:
+                metric_alarms[metric_alarm['AlarmName']] = metric_alarm
+
+            next_token = alarm_response.get('NextToken')
+
+            if not next_token:
+                break
+
+            describe_alarms_args['NextToken'] = next_token
+
+    return metric_alarms
+
+
+def get_alarm_states(metric_alarms: dict) -> dict:
+    return {
+        alarm_name: CWAlarmState[metric_alarm['StateValue']] for alarm_name, metric_alarm in metric_alarms.items()
+    }
@@ -0,0 +1,167 @@
+"""
+Reads the latest datapoint of CloudWatch alarm metrics with GetMetricData.
+
+Only alarms on a single metric are supported. Alarms built from metric math return no value.
+Only complete periods are read, as the alarm evaluates them. The period in progress holds a
+partial aggregate, such as a partial Sum, that reads low.
+"""
+from boto3 import client
+from datetime import datetime, timedelta, timezone
+
+import logging
+
+logger = logging.getLogger()
+
+# maximum number of queries accepted by a single GetMetricData call
+MAX_METRIC_DATA_QUERIES = 500
+
+
+def get_metric_data_query(query_id: str, metric_alarm: dict, period_sec: int = None) -> dict:
+    """
+    Returns the GetMetricData query for the metric of an alarm, or None if the alarm is not
+    on a single metric. period_sec overrides the period of the alarm.
+    """
+    if 'MetricName' not in metric_alarm:
+        return None
+
+    if period_sec is None:
+        period_sec = metric_alarm['Period']
+
+    return {
+        'Id': query_id,
+        'MetricStat': {
+            'Metric': {
+                'Namespace': metric_alarm['Namespace'],
+                'MetricName': metric_alarm['MetricName'],
+                'Dimensions': metric_alarm.get('Dimensions', [])
+            },
+            'Period': period_sec,
+            'Stat': metric_alarm.get('Statistic') or metric_alarm.get('ExtendedStatistic')
+        },
+        'ReturnData': True
+    }
+
+
+def get_alarm_metric_values(
+    cw_client: client, metric_alarms: dict, end_time: datetime = None, lookback_periods: int = 3
+) -> dict:
+    """
+    Returns a dict of alarm name to the most recent value of the alarm metric. Alarms without
+    a datapoint in the last lookback_periods complete periods are not included.
+    """
+    latest_datapoints = get_latest_alarm_datapoints(cw_client, metric_alarms, end_time, lookback_periods)
+
+    return {alarm_name: value for alarm_name, (_, value) in latest_datapoints.items()}
+
+
+def get_latest_alarm_datapoints(
+    cw_client: client, metric_alarms: dict, end_time: datetime = None, lookback_periods: int = 3
+) -> dict:
+    """
+    Returns a dict of alarm name to the (timestamp, value) of the most recent complete period
+    of the alarm metric. The timestamp is the start of the period, or None if CloudWatch did
+    not return it. Alarms without a datapoint in the last lookback_periods complete periods
+    are not included.
+    """
+    if end_time is None:
+        end_time = datetime.now(timezone.utc)
+
+    queries = dict()
+
+    for alarm_name, metric_alarm in metric_alarms.items():
+        query = get_metric_data_query('m' + str(len(queries)), metric_alarm)
+
+        if query is None:
+            logger.debug('Alarm ' + alarm_name + ' is not on a single metric, no metric value')
+            continue
+
+        queries[query['Id']] = (alarm_name, query)
+
+    if len(queries) == 0:
+        return dict()
+
+    # every call ends at the start of the period in progress, so alarms are read per period
+    period_query_ids = dict()
+
+    for query_id, (_, query) in queries.items():
+        period_query_ids.setdefault(query['MetricStat']['Period'], []).append(query_id)
+
+    latest_datapoints = dict()
+
+    for period_sec, query_ids in sorted(period_query_ids.items()):
+        period_end_time = get_period_start(end_time, period_sec)
+
+        for i in range(0, len(query_ids), MAX_METRIC_DATA_QUERIES):
+            get_metric_data_args = {
+                'MetricDataQueries': [queries[query_id][1] for query_id in query_ids[i:i + MAX_METRIC_DATA_QUERIES]],
+                'StartTime': period_end_time - timedelta(seconds=period_sec * lookback_periods),
+                'EndTime': period_end_time,
+                'ScanBy': 'TimestampDescending'
+            }
+
+            while True:
+                metric_data_response = cw_client.get_metric_data(**get_metric_data_args)
+
+                for metric_data_result in metric_data_response['MetricDataResults']:
+                    alarm_name = queries[metric_data_result['Id']][0]
+                    values = metric_data_result.get('Values', [])
+                    timestamps = metric_data_result.get('Timestamps', [])
+
+                    # results are newest first, keep the first value seen across pages
+                    if len(values) > 0 and alarm_name not in latest_datapoints:
+                        latest_datapoints[alarm_name] = (timestamps[0] if len(timestamps) > 0 else None, values[0])
+
+                next_token = metric_data_response.get('NextToken')
+
+                if not next_token:
+                    break
+
+                get_metric_data_args['NextToken'] = next_token
+
+    return latest_datapoints
+
+
+def get_period_start(timestamp: datetime, period_sec: int) -> datetime:
+    """
+    Returns the start of the period_sec period timestamp falls in, periods being aligned to the
+    epoch as CloudWatch aligns them.
+    """
+    return timestamp - timedelta(seconds=timestamp.timestamp() % period_sec)
+
+
+def get_metric_datapoints(
+    cw_client: client, metric_alarm: dict, period_sec: int, datapoints: int, end_time: datetime = None
+) -> list:
+    """
+    Returns up to the last datapoints values of the alarm metric at period_sec resolution,
+    newest first. Periods below 60 seconds need a metric published at high resolution.
+
+    Only complete periods are read. The period in progress at end_time holds a partial
+    aggregate, such as a partial Sum, that would drag a trend fitted over the values down.
+    One more period than needed is read, as CloudWatch alarms do, so that the newest period
+    not being published yet does not leave too few datapoints.
+    """
+    if end_time is None:
+        end_time = datetime.now(timezone.utc)
+
+    end_time = get_period_start(end_time, period_sec)
+
+    query = get_metric_data_query('m0', metric_alarm, period_sec)
+
+    if query is None:
+        return []
+
+    metric_data_response = cw_client.get_metric_data(
+        MetricDataQueries=[query],
+        StartTime=end_time - timedelta(seconds=period_sec * (datapoints + 1)),
+        EndTime=end_time,
+        ScanBy='TimestampDescending',
+        MaxDatapoints=datapoints
+    )
+
+    values = []
+
+    for metric_data_result in metric_data_response['MetricDataResults']:
+        values.extend(metric_data_result.get('Values', []))
+
+    return values[:datapoints]
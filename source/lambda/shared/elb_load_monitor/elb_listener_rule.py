@@ -1,29 +1,42 @@
-from re import S
 from boto3 import client
-from builtins import divmod
 
 import json
 import logging
 
+from elb_load_monitor.shed_strategy import DEFAULT_SHED_STRATEGY
+from elb_load_monitor.shed_strategy import ShedStrategy
 from elb_load_monitor import util
 
 logger = logging.getLogger()
 
 
+class ELBRuleConflictError(Exception):
+    pass
+
+
 class ELBListenerRule:
     def __init__(self, elb_rule_arn: str, elb_listener_arn: str, default_rule: bool) -> None:
         self.elb_rule_arn = elb_rule_arn
         self.elb_listener_arn = elb_listener_arn
         self.default_rule = default_rule
         self.forward_configs = dict()
+        # weights as last read from or written to the listener. Used to skip saving unchanged rules
+        self.saved_forward_configs = dict()
 
     def add_forward_config(self, target_group_arn: str, weight: int) -> None:
         self.forward_configs[target_group_arn] = weight
+        self.saved_forward_configs[target_group_arn] = weight
         return
 
+    def is_dirty(self) -> bool:
+        return self.forward_configs != self.saved_forward_configs
+
     def is_sheddable(self, source_group_arn: str, max_shed_weight: int) -> bool:
         current_weight = self.forward_configs.get(source_group_arn)
 
+        if current_weight is None:
+            return False
+
         logger.debug(source_group_arn + ' ' + str(100 - current_weight) + ' max ' + str(max_shed_weight))
         
         if max_shed_weight == (100 - current_weight):
@@ -41,41 +54,37 @@ class ELBListenerRule:
 
         return False
 
-    def restore(self, source_group_arn: str, weight: int) -> None:
+    def restore(self, source_group_arn: str, weight: int, shed_strategy: ShedStrategy = None) -> None:
         if source_group_arn not in self.forward_configs:
             logger.debug('No target group ' + source_group_arn + ' found for rule ' + self.elb_rule_arn +
                          ' nothing to restore')
 
             return
 
-        remaining_weight = weight
+        if shed_strategy is None:
+            shed_strategy = DEFAULT_SHED_STRATEGY
 
-        for key in self.forward_configs.keys():
-            if key == source_group_arn:
-                continue
+        weight = shed_strategy.step_policy.get_restore_weight(self.forward_configs.get(source_group_arn), weight)
 
-            weight_to_shed = remaining_weight
-            current_weight = self.forward_configs.get(key)
+        restore_weights = shed_strategy.weight_distribution.get_restore_weights(
+            self.forward_configs, source_group_arn, weight)
 
-            # restore maximum weight possible from each target.
-            if (current_weight < remaining_weight):
-                weight_to_shed = current_weight
+        for key, weight_to_restore in restore_weights.items():
+            self.forward_configs[key] = self.forward_configs.get(key) - weight_to_restore
 
-            self.forward_configs[key] = current_weight - weight_to_shed
-
-            logger.debug('Restoring ' + str(weight_to_shed) +
+            logger.debug('Restoring ' + str(weight_to_restore) +
                          ' percent from ' + key + ' to ' + source_group_arn)
 
-            remaining_weight -= weight_to_shed
-
         self.forward_configs[source_group_arn] = self.forward_configs.get(
-            source_group_arn) + weight - remaining_weight
+            source_group_arn) + sum(restore_weights.values())
         logger.debug(
             'Restored ' + str(self.forward_configs[source_group_arn]) + ' to ' + source_group_arn)
 
         return
 
-    def shed(self, source_group_arn: str, weight_to_shed: int, max_shed_weight: int) -> None:
+    def shed(
+        self, source_group_arn: str, weight_to_shed: int, max_shed_weight: int, shed_strategy: ShedStrategy = None
+    ) -> None:
         if source_group_arn not in self.forward_configs:
             logger.debug('No target group ' + source_group_arn + ' found for rule ' + self.elb_rule_arn +
                          ' nothing to shed')
@@ -90,6 +99,10 @@ class ELBListenerRule:
 
             return
 
+        if shed_strategy is None:
+            shed_strategy = DEFAULT_SHED_STRATEGY
+
+        weight_to_shed = shed_strategy.step_policy.get_shed_weight(current_source_weight, weight_to_shed)
         new_source_weight = current_source_weight - weight_to_shed
 
         if max_shed_weight < (100 - new_source_weight):
@@ -108,33 +121,73 @@ class ELBListenerRule:
         logger.debug('Shedding ' + str(weight_to_shed) +
                      ' percent from ' + source_group_arn + '. new weight: ' + str(self.forward_configs[source_group_arn]))
 
-        per_target_weight_to_shed = weight_to_shed
+        shed_weights = shed_strategy.weight_distribution.get_shed_weights(
+            self.forward_configs, source_group_arn, weight_to_shed)
 
-        num_forwards = len(self.forward_configs)
-        remainder_weight = 0
+        for key, target_weight_to_shed in shed_weights.items():
+            new_weight = self.forward_configs.get(key) + target_weight_to_shed
 
-        if num_forwards > 2:
-            # if more than 2 forward configs, then split the weight evenly among the remaining 2 targets
-            div_mod = divmod(weight_to_shed, (len(self.forward_configs) - 1))
-            per_target_weight_to_shed = div_mod[0]
-            remainder_weight = div_mod[1]
+            logger.debug('Receiving ' + str(target_weight_to_shed) +
+                         ' percent from ' + source_group_arn + ' on ' +
+                         key + '. New load in : ' + key + ' ' + str(new_weight))
 
-        for key in self.forward_configs.keys():
-            num_forwards -= 1
-            if key == source_group_arn:
+            self.forward_configs[key] = new_weight
+
+        # weight no other target group could take stays with the source
+        unplaced_weight = weight_to_shed - sum(shed_weights.values())
+
+        if unplaced_weight > 0:
+            self.forward_configs[source_group_arn] += unplaced_weight
+
+            logger.debug('No target group could take ' + str(unplaced_weight) + ' percent from ' + source_group_arn)
+
+        return
+
+    def describe_forward_configs(self, elbv2_client: client) -> dict:
+        """
+        Reads the weights of the rule as they are now on the listener.
+        """
+        describe_rules_response = elbv2_client.describe_rules(RuleArns=[self.elb_rule_arn])
+
+        for elb_rule_entry in describe_rules_response['Rules']:
+            if elb_rule_entry['RuleArn'] != self.elb_rule_arn:
                 continue
 
-            new_weight = self.forward_configs.get(
-                key) + per_target_weight_to_shed
+            rule_actions = elb_rule_entry['Actions']
 
-            if (num_forwards == 0):
-                new_weight += remainder_weight
+            if len(rule_actions) == 0 or rule_actions[0]['Type'] != 'forward':
+                raise ELBRuleConflictError('Rule ' + self.elb_rule_arn + ' no longer forwards')
 
-            logger.debug('Receiving ' + str(per_target_weight_to_shed) +
-                         ' percent from ' + source_group_arn + ' on ' +
-                         key + '. New load in : ' + key + ' ' + str(new_weight))
+            return {
+                target_group['TargetGroupArn']: target_group['Weight']
+                for target_group in rule_actions[0]['ForwardConfig']['TargetGroups']
+            }
 
-            self.forward_configs[key] = new_weight
+        raise ELBRuleConflictError('Rule ' + self.elb_rule_arn + ' not found')
+
+    def rebase(self, current_forward_configs: dict) -> None:
+        """
+        Applies the weight changes made since the rule was read to current_forward_configs, the
+        weights now on the listener, and keeps those as the weights read. Raises
+        ELBRuleConflictError if the target groups changed or a weight would go out of range.
+        """
+        if set(current_forward_configs.keys()) != set(self.forward_configs.keys()):
+            raise ELBRuleConflictError('Target groups of rule ' + self.elb_rule_arn + ' changed')
+
+        merged_forward_configs = {
+            key: current_weight + self.forward_configs.get(key) - self.saved_forward_configs.get(key)
+            for key, current_weight in current_forward_configs.items()
+        }
+
+        if any(weight < 0 or weight > 100 for weight in merged_forward_configs.values()):
+            raise ELBRuleConflictError('Weight changes of rule ' + self.elb_rule_arn + ' conflict with ' +
+                                       json.dumps(current_forward_configs))
+
+        logger.debug('Rule ' + self.elb_rule_arn + ' changed to ' + json.dumps(current_forward_configs) +
+                     ', merged to ' + json.dumps(merged_forward_configs))
+
+        self.forward_configs = merged_forward_configs
+        self.saved_forward_configs = dict(current_forward_configs)
 
         return
 
@@ -149,7 +202,12 @@ class ELBListenerRule:
 
         return target_groups_list
 
-    def save(self, elbv2_client: client):
+    def save(self, elbv2_client: client) -> bool:
+        if not self.is_dirty():
+            logger.debug('No weight changes for rule ' + self.elb_rule_arn + ', skipping save')
+
+            return False
+
         if not self.default_rule:
             logger.debug('Modifying rule' + self.elb_rule_arn)
 
@@ -178,5 +236,9 @@ class ELBListenerRule:
                     }]
             )
 
+        self.saved_forward_configs = dict(self.forward_configs)
+
         logger.debug('Saved new forward configs: ' +
                      json.dumps(self.get_target_groups(), default=util.datetime_handler))
+
+        return True
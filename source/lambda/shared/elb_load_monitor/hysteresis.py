@@ -0,0 +1,86 @@
+"""
+Hysteresis between shedding and restoring so a target group near its alarm threshold settles
+instead of flipping between SHED and RESTORE on every evaluation.
+
+Restoring only starts once all of these hold:
+- shed_hold_sec have passed since the last shed step,
+- the alarm has been OK for restore_cooldown_sec,
+- the alarm has been OK for restore_ok_evaluations evaluations in a row.
+
+The state is carried from step to step in the ALBAlarmStatusMessage.
+"""
+import logging
+import time
+
+logger = logging.getLogger()
+
+
+class HysteresisState:
+    def __init__(self, last_shed_at: int = None, ok_since: int = None, ok_evaluations: int = 0) -> None:
+        # epoch seconds of the last shed step and of the first OK evaluation in a row
+        self.last_shed_at = last_shed_at
+        self.ok_since = ok_since
+        self.ok_evaluations = ok_evaluations
+
+
+class ShedHysteresis:
+    def __init__(
+        self, shed_hold_sec: int = 0, restore_cooldown_sec: int = 0, restore_ok_evaluations: int = 1,
+        clock=time.time
+    ) -> None:
+        self.shed_hold_sec = shed_hold_sec
+        self.restore_cooldown_sec = restore_cooldown_sec
+        self.restore_ok_evaluations = max(1, restore_ok_evaluations)
+        self.clock = clock
+
+    def record_alarm(self, hysteresis_state: HysteresisState) -> None:
+        hysteresis_state.ok_since = None
+        hysteresis_state.ok_evaluations = 0
+
+        return
+
+    def record_shed(self, hysteresis_state: HysteresisState) -> None:
+        self.record_alarm(hysteresis_state)
+        hysteresis_state.last_shed_at = int(self.clock())
+
+        return
+
+    def record_ok(self, hysteresis_state: HysteresisState) -> None:
+        if hysteresis_state.ok_since is None:
+            hysteresis_state.ok_since = int(self.clock())
+
+        hysteresis_state.ok_evaluations += 1
+
+        return
+
+    def can_restore(self, hysteresis_state: HysteresisState) -> bool:
+        now = self.clock()
+
+        if hysteresis_state.last_shed_at is not None and now - hysteresis_state.last_shed_at < self.shed_hold_sec:
+            logger.info('Holding shed weights, last shed ' + str(int(now - hysteresis_state.last_shed_at)) +
+                        's ago')
+
+            return False
+
+        if hysteresis_state.ok_since is None or now - hysteresis_state.ok_since < self.restore_cooldown_sec:
+            logger.info('Restore cooling down, alarm OK since ' + str(hysteresis_state.ok_since))
+
+            return False
+
+        if hysteresis_state.ok_evaluations < self.restore_ok_evaluations:
+            logger.info('Restore waiting for OK evaluations: ' + str(hysteresis_state.ok_evaluations) + ' of ' +
+                        str(self.restore_ok_evaluations))
+
+            return False
+
+        return True
+
+
+def get_shed_hysteresis(shed_hold_sec: int, restore_cooldown_sec: int, restore_ok_evaluations: int) -> ShedHysteresis:
+    """
+    Returns the hysteresis for the settings, or None if they do not delay restoring.
+    """
+    if shed_hold_sec <= 0 and restore_cooldown_sec <= 0 and restore_ok_evaluations <= 1:
+        return None
+
+    return ShedHysteresis(shed_hold_sec, restore_cooldown_sec, restore_ok_evaluations)
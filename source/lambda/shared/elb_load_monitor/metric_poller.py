@@ -0,0 +1,78 @@
+"""
+Decides the state of an alarm from recent datapoints of its metric instead of waiting for
+CloudWatch to change the alarm state.
+
+The alarm metric is read with GetMetricData at poll_period_sec resolution. The standard ALB
+metrics are published once a minute, so polling them at 60 seconds saves the wait for the
+alarm to be evaluated after the last breaching datapoint arrives. Shorter periods need a
+metric published at high resolution. The state is ALARM
+when datapoints_to_alarm of the last evaluation_periods datapoints breach the alarm threshold,
+INSUFFICIENT_DATA when there are fewer than datapoints_to_alarm datapoints, and OK otherwise.
+"""
+from boto3 import client
+
+import logging
+
+from elb_load_monitor.alb_alarm_messages import CWAlarmState
+from elb_load_monitor.cw_metrics import get_metric_datapoints
+
+logger = logging.getLogger()
+
+
+class MetricPoller:
+    def __init__(self, poll_period_sec: int = 60, evaluation_periods: int = 3, datapoints_to_alarm: int = None) -> None:
+        self.poll_period_sec = poll_period_sec
+        self.evaluation_periods = max(1, evaluation_periods)
+
+        if datapoints_to_alarm is None:
+            datapoints_to_alarm = self.evaluation_periods
+
+        self.datapoints_to_alarm = min(self.evaluation_periods, max(1, datapoints_to_alarm))
+
+    def poll(self, cw_client: client, metric_alarm: dict) -> CWAlarmState:
+        values = get_metric_datapoints(cw_client, metric_alarm, self.poll_period_sec, self.evaluation_periods)
+
+        cw_alarm_state = evaluate_datapoints(
+            values, metric_alarm.get('Threshold'), metric_alarm.get('ComparisonOperator'), self.datapoints_to_alarm)
+
+        logger.info('Polled ' + metric_alarm['AlarmName'] + ' at ' + str(self.poll_period_sec) + 's: ' +
+                    str(values) + ' ' + cw_alarm_state.name)
+
+        return cw_alarm_state
+
+
+def is_breaching(value: float, threshold: float, comparison_operator: str) -> bool:
+    if comparison_operator == 'GreaterThanThreshold':
+        return value > threshold
+    elif comparison_operator == 'GreaterThanOrEqualToThreshold':
+        return value >= threshold
+    elif comparison_operator == 'LessThanThreshold':
+        return value < threshold
+    elif comparison_operator == 'LessThanOrEqualToThreshold':
+        return value <= threshold
+
+    return False
+
+
+def evaluate_datapoints(
+    values: list, threshold: float, comparison_operator: str, datapoints_to_alarm: int
+) -> CWAlarmState:
+    if threshold is None or len(values) < datapoints_to_alarm:
+        return CWAlarmState.INSUFFICIENT_DATA
+
+    breaching = [value for value in values if is_breaching(value, threshold, comparison_operator)]
+
+    if len(breaching) >= datapoints_to_alarm:
+        return CWAlarmState.ALARM
+
+    return CWAlarmState.OK
+
+
+def get_metric_poller(enabled: bool, poll_period_sec: int, evaluation_periods: int) -> MetricPoller:
+    """
+    Returns the poller for the settings, or None to use the CloudWatch alarm state.
+    """
+    if not enabled:
+        return None
+
+    return MetricPoller(poll_period_sec, evaluation_periods)
@@ -0,0 +1,199 @@
+"""
+Metrics of the control loop in CloudWatch Embedded Metric Format (EMF).
+
+Values are buffered in memory during an invocation and written by flush() as one EMF record
+per set of dimensions, with repeated values of a metric collected into a Values list. In
+Lambda the records are printed to stdout, where CloudWatch Logs extracts the metrics without
+any PutMetricData call. Tests pass an InMemoryRecordSink to capture the records instead.
+
+InstrumentedClient wraps a boto3 client to record the latency of every API call.
+"""
+from boto3 import client
+
+import json
+import logging
+import threading
+import time
+
+logger = logging.getLogger()
+
+DEFAULT_NAMESPACE = 'ALBLoadShedding'
+
+UNIT_MILLISECONDS = 'Milliseconds'
+UNIT_COUNT = 'Count'
+UNIT_PERCENT = 'Percent'
+
+# EMF allows at most 100 values per metric in a record
+MAX_VALUES_PER_METRIC = 100
+
+
+def print_record(record: dict) -> None:
+    print(json.dumps(record))
+
+    return
+
+
+class InMemoryRecordSink:
+    def __init__(self) -> None:
+        self.records = []
+
+    def __call__(self, record: dict) -> None:
+        self.records.append(record)
+
+        return
+
+    def get_values(self, metric_name: str, **dimensions) -> list:
+        """
+        Returns every value of metric_name recorded with dimensions, in the order written.
+        """
+        values = []
+
+        for record in self.records:
+            if metric_name not in record or any(record.get(key) != value for key, value in dimensions.items()):
+                continue
+
+            value = record[metric_name]
+            values.extend(value if isinstance(value, list) else [value])
+
+        return values
+
+
+class EMFMetrics:
+    def __init__(self, namespace: str = DEFAULT_NAMESPACE, sink=print_record, clock=time.time) -> None:
+        self.namespace = namespace
+        self.sink = sink
+        self.clock = clock
+        # dimensions, as a tuple of items, to metric name to (unit, values)
+        self._metrics = dict()
+        self._lock = threading.Lock()
+
+    def put_metric(self, name: str, value: float, unit: str = UNIT_COUNT, dimensions: dict = None) -> None:
+        dimension_key = tuple(sorted((dimensions or {}).items()))
+
+        with self._lock:
+            metric_values = self._metrics.setdefault(dimension_key, dict())
+            metric_values.setdefault(name, (unit, []))[1].append(value)
+
+        return
+
+    def instrument(self, wrapped_client: client, service_name: str) -> client:
+        """
+        Returns wrapped_client with the latency of its API calls recorded.
+        """
+        if isinstance(wrapped_client, InstrumentedClient):
+            return wrapped_client
+
+        return InstrumentedClient(wrapped_client, service_name, self)
+
+    def flush(self) -> None:
+        """
+        Writes the buffered metrics as EMF records and clears them.
+        """
+        with self._lock:
+            buffered_metrics = self._metrics
+            self._metrics = dict()
+
+        timestamp = int(self.clock() * 1000)
+
+        for dimension_key, metric_values in buffered_metrics.items():
+            for record in get_emf_records(self.namespace, timestamp, dict(dimension_key), metric_values):
+                try:
+                    self.sink(record)
+                except Exception as e:
+                    logger.warning('Unable to write metrics: ' + str(e))
+
+        return
+
+
+class InstrumentedClient:
+    def __init__(self, wrapped_client: client, service_name: str, metrics: EMFMetrics) -> None:
+        self._client = wrapped_client
+        self._service_name = service_name
+        self._metrics = metrics
+
+    def __getattr__(self, name: str):
+        attribute = getattr(self._client, name)
+
+        if name.startswith('_') or not callable(attribute) or name in ('get_paginator', 'get_waiter', 'can_paginate'):
+            return attribute
+
+        def call(*args, **kwargs):
+            dimensions = {'Service': self._service_name, 'Operation': name}
+            start = time.perf_counter()
+
+            try:
+                return attribute(*args, **kwargs)
+            except Exception:
+                self._metrics.put_metric('ApiErrors', 1, UNIT_COUNT, dimensions)
+
+                raise
+            finally:
+                self._metrics.put_metric(
+                    'ApiLatency', (time.perf_counter() - start) * 1000, UNIT_MILLISECONDS, dimensions)
+
+        return call
+
+
+def get_emf_records(namespace: str, timestamp: int, dimensions: dict, metric_values: dict) -> list:
+    """
+    Returns the EMF records for the metrics of one set of dimensions, splitting metrics with
+    more than MAX_VALUES_PER_METRIC values across records.
+    """
+    records = []
+    offset = 0
+
+    while True:
+        record = {
+            '_aws': {
+                'Timestamp': timestamp,
+                'CloudWatchMetrics': [{
+                    'Namespace': namespace,
+                    'Dimensions': [sorted(dimensions.keys())],
+                    'Metrics': []
+                }]
+            }
+        }
+        record.update(dimensions)
+
+        for name, (unit, values) in metric_values.items():
+            record_values = values[offset:offset + MAX_VALUES_PER_METRIC]
+
+            if len(record_values) == 0:
+                continue
+
+            record['_aws']['CloudWatchMetrics'][0]['Metrics'].append({'Name': name, 'Unit': unit})
+            record[name] = record_values[0] if len(record_values) == 1 else record_values
+
+        if len(record['_aws']['CloudWatchMetrics'][0]['Metrics']) == 0:
+            return records
+
+        records.append(record)
+        offset += MAX_VALUES_PER_METRIC
+
+
+def put_control_step_metrics(
+        metrics: EMFMetrics, target_group_arn: str, action_name: str, decision_ms: float, elb_rules: list) -> None:
+    """
+    Records the action a control step chose for the target group, how long the step took to
+    decide and apply it, and the weight of every target group in elb_rules after it.
+    """
+    metrics.put_metric('DecisionLatency', decision_ms, UNIT_MILLISECONDS, {'TargetGroup': target_group_arn})
+    metrics.put_metric('Actions', 1, UNIT_COUNT, {'TargetGroup': target_group_arn, 'Action': action_name})
+
+    for elb_rule in elb_rules:
+        for target_group in elb_rule.get_target_groups():
+            metrics.put_metric(
+                'TargetGroupWeight', target_group['Weight'], UNIT_PERCENT,
+                {'TargetGroup': target_group['TargetGroupArn']})
+
+    return
+
+
+def get_metrics(enabled: bool, namespace: str = DEFAULT_NAMESPACE) -> EMFMetrics:
+    """
+    Returns the metrics for the settings, or None to only log.
+    """
+    if not enabled:
+        return None
+
+    return EMFMetrics(namespace)
@@ -0,0 +1,121 @@
+"""
+Per-listener cache of DescribeRules entries kept at module scope across warm invocations.
+
+Entries expire after ttl_sec and at most max_listeners listeners are kept, evicting the
+least recently used. After a rule is written its cached weights are updated to the weights
+that were applied, so a shed cycle can continue without re-reading the listener.
+"""
+from collections import OrderedDict
+
+import copy
+import logging
+import threading
+import time
+
+logger = logging.getLogger()
+
+
+class ListenerRuleCacheEntry:
+    def __init__(self, rule_entries: list, loaded_at: float) -> None:
+        self.rule_entries = rule_entries
+        self.loaded_at = loaded_at
+
+
+class ListenerRuleCache:
+    def __init__(self, ttl_sec: float = 0, max_listeners: int = 16, validate: bool = True, clock=time.monotonic) -> None:
+        self.ttl_sec = ttl_sec
+        self.max_listeners = max(1, max_listeners)
+        self.validate = validate
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def is_enabled(self) -> bool:
+        return self.ttl_sec > 0
+
+    def get(self, elb_listener_arn: str) -> list:
+        if not self.is_enabled():
+            return None
+
+        with self._lock:
+            entry = self._entries.get(elb_listener_arn)
+
+            if entry is None or self.clock() - entry.loaded_at >= self.ttl_sec:
+                if entry is not None:
+                    del self._entries[elb_listener_arn]
+
+                self.misses += 1
+
+                return None
+
+            self._entries.move_to_end(elb_listener_arn)
+            self.hits += 1
+
+            return entry.rule_entries
+
+    def put(self, elb_listener_arn: str, rule_entries: list) -> None:
+        if not self.is_enabled():
+            return
+
+        with self._lock:
+            self._entries[elb_listener_arn] = ListenerRuleCacheEntry(copy.deepcopy(rule_entries), self.clock())
+            self._entries.move_to_end(elb_listener_arn)
+
+            while len(self._entries) > self.max_listeners:
+                evicted_listener_arn, _ = self._entries.popitem(last=False)
+                logger.debug('Evicted cached rules for ' + evicted_listener_arn)
+
+        return
+
+    def update_weights(self, elb_listener_arn: str, elb_rule_arn: str, target_groups: list) -> None:
+        with self._lock:
+            entry = self._entries.get(elb_listener_arn)
+
+            if entry is None:
+                return
+
+            for rule_entry in entry.rule_entries:
+                if rule_entry['RuleArn'] == elb_rule_arn:
+                    rule_entry['Actions'][0]['ForwardConfig']['TargetGroups'] = copy.deepcopy(target_groups)
+
+        return
+
+    def invalidate(self, elb_listener_arn: str) -> None:
+        with self._lock:
+            self._entries.pop(elb_listener_arn, None)
+
+        return
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+        return
+
+
+_rule_cache = ListenerRuleCache()
+
+
+def get_rule_cache(ttl_sec: float, max_listeners: int, validate: bool) -> ListenerRuleCache:
+    """
+    Returns the module level cache, updating its settings. Cached rules are kept across calls.
+    """
+    _rule_cache.ttl_sec = ttl_sec
+    _rule_cache.max_listeners = max(1, max_listeners)
+    _rule_cache.validate = validate
+
+    return _rule_cache
+
+
+def get_forward_weights(rule_entry: dict) -> dict:
+    rule_actions = rule_entry.get('Actions', [])
+
+    if len(rule_actions) == 0 or rule_actions[0]['Type'] != 'forward':
+        return dict()
+
+    return {
+        target_group['TargetGroupArn']: target_group['Weight']
+        for target_group in rule_actions[0]['ForwardConfig']['TargetGroups']
+    }
@@ -0,0 +1,179 @@
+"""
+Applies ELBListenerRule weight changes with bounded concurrency.
+
+Each dirty rule is saved on a thread pool capped at max_concurrency. Throttling errors
+from the ELB API are retried with exponential backoff and full jitter.
+
+With version_check each rule is read again just before it is written. ModifyRule has no
+condition, so the weights read stand in for a version: if they moved since the rule was
+loaded, for example because another invocation shed on the same listener, the change is
+merged into them and the rule is read again until it holds still. Rules are checked
+independently, so rules that do not conflict are still written in parallel.
+"""
+from boto3 import client
+from botocore.exceptions import ClientError
+from concurrent.futures import ThreadPoolExecutor
+
+import logging
+import random
+import time
+
+from elb_load_monitor.elb_listener_rule import ELBListenerRule
+from elb_load_monitor.elb_listener_rule import ELBRuleConflictError
+from elb_load_monitor.tracing import STATUS_ERROR
+from elb_load_monitor.tracing import Tracer
+from elb_load_monitor.tracing import trace_span
+
+logger = logging.getLogger()
+
+THROTTLING_ERROR_CODES = (
+    'Throttling', 'ThrottlingException', 'RequestLimitExceeded', 'TooManyRequestsException'
+)
+
+
+class ELBRuleWriteResult:
+    def __init__(
+        self, elb_rule_arn: str, saved: bool, latency_ms: float, attempts: int, error: Exception = None,
+        conflicts: int = 0
+    ) -> None:
+        self.elb_rule_arn = elb_rule_arn
+        self.saved = saved
+        self.latency_ms = latency_ms
+        self.attempts = attempts
+        self.error = error
+        # times the rule was found changed by someone else and merged before writing
+        self.conflicts = conflicts
+
+    def to_json(self) -> dict:
+        result = {
+            'ruleArn': self.elb_rule_arn,
+            'saved': self.saved,
+            'latencyMs': round(self.latency_ms, 3),
+            'attempts': self.attempts
+        }
+
+        if self.conflicts > 0:
+            result['conflicts'] = self.conflicts
+
+        if self.error is not None:
+            result['error'] = str(self.error)
+
+        return result
+
+
+class ELBRuleWriteError(Exception):
+    def __init__(self, results: list) -> None:
+        self.results = results
+        failed_rule_arns = [result.elb_rule_arn for result in results if result.error is not None]
+
+        super().__init__('Failed to save rules: ' + ', '.join(failed_rule_arns))
+
+
+class ELBRuleWriter:
+    def __init__(
+        self, max_concurrency: int = 4, max_attempts: int = 5, base_backoff_sec: float = 0.1,
+        max_backoff_sec: float = 2.0, sleep=time.sleep, version_check: bool = False, tracer: Tracer = None
+    ) -> None:
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_attempts = max(1, max_attempts)
+        self.base_backoff_sec = base_backoff_sec
+        self.max_backoff_sec = max_backoff_sec
+        self.sleep = sleep
+        self.version_check = version_check
+        self.tracer = tracer
+
+    def write(self, elbv2_client: client, elb_rules: list) -> list:
+        """
+        Saves every dirty rule and returns an ELBRuleWriteResult per dirty rule, in the
+        order of elb_rules. Rules without weight changes are not written.
+        """
+        dirty_rules = [elb_rule for elb_rule in elb_rules if elb_rule.is_dirty()]
+        # writes on the pool threads are traced as children of the span of the caller
+        parent_span = self.tracer.get_current_span() if self.tracer is not None else None
+
+        if len(dirty_rules) <= 1 or self.max_concurrency == 1:
+            return [self.write_rule(elbv2_client, elb_rule, parent_span) for elb_rule in dirty_rules]
+
+        with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(dirty_rules))) as executor:
+            return list(executor.map(
+                lambda elb_rule: self.write_rule(elbv2_client, elb_rule, parent_span), dirty_rules))
+
+    def write_rule(self, elbv2_client: client, elb_rule: ELBListenerRule, parent_span=None) -> ELBRuleWriteResult:
+        with trace_span(self.tracer, 'write_rule', {'ruleArn': elb_rule.elb_rule_arn}, parent_span) as span:
+            result = self.write_rule_with_retries(elbv2_client, elb_rule)
+
+            if span is not None:
+                span.set_attribute('saved', result.saved)
+                span.set_attribute('attempts', result.attempts)
+                span.set_attribute('conflicts', result.conflicts)
+
+                if result.error is not None:
+                    span.status = STATUS_ERROR
+                    span.set_attribute('error', str(result.error))
+
+        return result
+
+    def write_rule_with_retries(self, elbv2_client: client, elb_rule: ELBListenerRule) -> ELBRuleWriteResult:
+        start = time.perf_counter()
+        attempts = 0
+        conflicts = 0
+
+        while True:
+            attempts += 1
+
+            try:
+                if self.version_check and not self.is_rule_current(elbv2_client, elb_rule):
+                    conflicts += 1
+
+                    if attempts >= self.max_attempts:
+                        raise ELBRuleConflictError('Rule ' + elb_rule.elb_rule_arn + ' kept changing')
+
+                    continue
+
+                saved = elb_rule.save(elbv2_client)
+
+                return ELBRuleWriteResult(
+                    elb_rule.elb_rule_arn, saved, (time.perf_counter() - start) * 1000, attempts,
+                    conflicts=conflicts)
+            except Exception as e:
+                if not is_throttling_error(e) or attempts >= self.max_attempts:
+                    logger.error('Error saving rule ' + elb_rule.elb_rule_arn + ' after ' + str(attempts) +
+                                 ' attempts: ' + str(e))
+
+                    return ELBRuleWriteResult(
+                        elb_rule.elb_rule_arn, False, (time.perf_counter() - start) * 1000, attempts, e,
+                        conflicts)
+
+                backoff_sec = random.uniform(
+                    0, min(self.max_backoff_sec, self.base_backoff_sec * (2 ** (attempts - 1))))
+
+                logger.warning('Throttled saving rule ' + elb_rule.elb_rule_arn + ', retrying in ' +
+                               str(round(backoff_sec, 3)) + 's')
+
+                self.sleep(backoff_sec)
+
+    def is_rule_current(self, elbv2_client: client, elb_rule: ELBListenerRule) -> bool:
+        """
+        Returns True if the rule on the listener still has the weights it was read at. Otherwise
+        merges the change into the weights now on the listener and returns False.
+        """
+        if not elb_rule.is_dirty():
+            return True
+
+        current_forward_configs = elb_rule.describe_forward_configs(elbv2_client)
+
+        if current_forward_configs == elb_rule.saved_forward_configs:
+            return True
+
+        logger.warning('Rule ' + elb_rule.elb_rule_arn + ' changed since it was read, merging')
+
+        elb_rule.rebase(current_forward_configs)
+
+        return False
+
+
+def is_throttling_error(e: Exception) -> bool:
+    if not isinstance(e, ClientError):
+        return False
+
+    return e.response.get('Error', {}).get('Code') in THROTTLING_ERROR_CODES
@@ -0,0 +1,126 @@
+"""
+Checks the load on the other target groups of a rule before shedding into them.
+
+The alarm metric of the target group being shed is read for every other target group by
+swapping the TargetGroup dimension, in one batched GetMetricData call. A target group whose
+metric breaches max_utilization of the alarm threshold is saturated and receives no shed
+weight. Target groups without a reading are not guarded.
+"""
+from boto3 import client
+
+import copy
+import logging
+
+from elb_load_monitor.cw_metrics import get_alarm_metric_values
+from elb_load_monitor.metric_poller import is_breaching
+
+logger = logging.getLogger()
+
+TARGET_GROUP_DIMENSION = 'TargetGroup'
+
+DECISION_ALLOW = 'allow'
+DECISION_SKIP = 'skip'
+DECISION_UNKNOWN = 'unknown'
+
+
+class SecondaryHealthDecision:
+    def __init__(self, target_group_arn: str, decision: str, metric_value: float = None,
+                 threshold: float = None) -> None:
+        self.target_group_arn = target_group_arn
+        self.decision = decision
+        self.metric_value = metric_value
+        self.threshold = threshold
+
+    def is_saturated(self) -> bool:
+        return self.decision == DECISION_SKIP
+
+    def to_json(self) -> dict:
+        result = {
+            'targetGroupArn': self.target_group_arn,
+            'decision': self.decision
+        }
+
+        if self.metric_value is not None:
+            result['metricValue'] = self.metric_value
+
+        if self.threshold is not None:
+            result['threshold'] = self.threshold
+
+        return result
+
+
+class SecondaryHealthGuard:
+    def __init__(self, max_utilization: float = 1.0) -> None:
+        self.max_utilization = max_utilization
+
+    def check(self, cw_client: client, metric_alarm: dict, target_group_arns: list) -> dict:
+        """
+        Returns a dict of target group ARN to SecondaryHealthDecision for target_group_arns,
+        read with the metric of metric_alarm.
+        """
+        secondary_metric_alarms = dict()
+
+        for target_group_arn in target_group_arns:
+            secondary_metric_alarm = get_target_group_metric_alarm(metric_alarm, target_group_arn)
+
+            if secondary_metric_alarm is not None:
+                secondary_metric_alarms[target_group_arn] = secondary_metric_alarm
+
+        metric_values = dict()
+
+        if len(secondary_metric_alarms) > 0:
+            metric_values = get_alarm_metric_values(cw_client, secondary_metric_alarms)
+
+        threshold = metric_alarm.get('Threshold')
+
+        if threshold is not None:
+            threshold = threshold * self.max_utilization
+
+        decisions = dict()
+
+        for target_group_arn in target_group_arns:
+            metric_value = metric_values.get(target_group_arn)
+
+            if metric_value is None or threshold is None:
+                decision = DECISION_UNKNOWN
+            elif is_breaching(metric_value, threshold, metric_alarm.get('ComparisonOperator')):
+                decision = DECISION_SKIP
+
+                logger.info('Secondary ' + target_group_arn + ' is saturated at ' + str(metric_value) +
+                            ', not shedding into it')
+            else:
+                decision = DECISION_ALLOW
+
+            decisions[target_group_arn] = SecondaryHealthDecision(target_group_arn, decision, metric_value, threshold)
+
+        return decisions
+
+
+def get_target_group_metric_alarm(metric_alarm: dict, target_group_arn: str) -> dict:
+    """
+    Returns a copy of metric_alarm with its TargetGroup dimension set to target_group_arn,
+    or None if the alarm metric has no TargetGroup dimension.
+    """
+    dimensions = metric_alarm.get('Dimensions', [])
+
+    if not any(dimension['Name'] == TARGET_GROUP_DIMENSION for dimension in dimensions):
+        return None
+
+    target_group_metric_alarm = copy.deepcopy(metric_alarm)
+
+    for dimension in target_group_metric_alarm['Dimensions']:
+        if dimension['Name'] == TARGET_GROUP_DIMENSION:
+            # the dimension is the resource part of the ARN, targetgroup/<name>/<id>
+            dimension['Value'] = target_group_arn.split(':')[-1]
+
+    return target_group_metric_alarm
+
+
+def get_secondary_health_guard(enabled: bool, max_utilization: float) -> SecondaryHealthGuard:
+    """
+    Returns the guard for the settings, or None to shed into every other target group.
+    """
+    if not enabled:
+        return None
+
+    return SecondaryHealthGuard(max_utilization)
@@ -0,0 +1,273 @@
+"""
+Shared budget for the weight several primary target groups may shed into one secondary.
+
+Every primary records a claim on each secondary: the largest weight the secondary holds in
+the primary's rules. The claims on a secondary may add up to at most budget_weight. Before a
+shed step a primary asks for more, and is granted at most its fair share of the budget, or
+more while the other primaries leave the budget unused. After the step it records the weight
+actually applied, so claims follow the rules and restoring gives the budget back.
+
+Every claim expires claim_duration_sec after the primary last recorded it. A primary renews
+its claims on every step of its chain, so the claim of a primary that crashed or lost its
+lease stops counting against the others once it expires.
+
+Claims are kept in a ShedBudgetStore and updated with optimistic concurrency, re-reading and
+retrying when another handler changed them in between. DynamoDBShedBudgetStore keeps them in
+the lease table so that all handlers share them. InMemoryShedBudgetStore keeps them in the
+process, for tests and local runs.
+"""
+from boto3 import client
+from botocore.exceptions import ClientError
+
+import abc
+import logging
+import threading
+import time
+
+from elb_load_monitor import clients
+
+logger = logging.getLogger()
+
+
+class ShedBudgetConflictError(Exception):
+    pass
+
+
+class ShedBudgetStore(abc.ABC):
+    @abc.abstractmethod
+    def get_claims(self, secondary_group_arn: str) -> tuple:
+        """
+        Returns the claims on the secondary, a dict of primary target group ARN to a tuple of the
+        weight and the epoch seconds the claim expires at, and the version they were read at.
+        """
+
+    @abc.abstractmethod
+    def put_claims(self, secondary_group_arn: str, claims: dict, version: int) -> None:
+        """
+        Writes the claims if they are still at version. Raises ShedBudgetConflictError otherwise.
+        """
+
+
+class InMemoryShedBudgetStore(ShedBudgetStore):
+    def __init__(self) -> None:
+        self._claims = dict()
+        self._lock = threading.Lock()
+
+    def get_claims(self, secondary_group_arn: str) -> tuple:
+        with self._lock:
+            claims, version = self._claims.get(secondary_group_arn, (dict(), 0))
+
+            return dict(claims), version
+
+    def put_claims(self, secondary_group_arn: str, claims: dict, version: int) -> None:
+        with self._lock:
+            _, current_version = self._claims.get(secondary_group_arn, (dict(), 0))
+
+            if current_version != version:
+                raise ShedBudgetConflictError(secondary_group_arn)
+
+            self._claims[secondary_group_arn] = (dict(claims), version + 1)
+
+        return
+
+
+class DynamoDBShedBudgetStore(ShedBudgetStore):
+    """
+    Keeps the claims on a secondary in one item of the lease table. The item expires with its
+    last claim, so that the TTL of the table removes budgets nobody renews.
+    """
+    def __init__(self, dynamodb_client: client, table_name: str) -> None:
+        self.dynamodb_client = dynamodb_client
+        self.table_name = table_name
+
+    @staticmethod
+    def get_budget_id(secondary_group_arn: str) -> str:
+        return 'budget#' + secondary_group_arn
+
+    def get_claims(self, secondary_group_arn: str) -> tuple:
+        get_item_response = self.dynamodb_client.get_item(
+            TableName=self.table_name,
+            Key={'leaseId': {'S': self.get_budget_id(secondary_group_arn)}},
+            ConsistentRead=True
+        )
+
+        item = get_item_response.get('Item')
+
+        if item is None:
+            return dict(), 0
+
+        claims = dict()
+
+        for primary_group_arn, claim in item.get('claims', {}).get('M', {}).items():
+            if 'M' in claim:
+                claims[primary_group_arn] = (int(claim['M']['weight']['N']), int(claim['M']['expiresAt']['N']))
+            else:
+                # claims written without an expiry are taken as expired
+                claims[primary_group_arn] = (int(claim['N']), 0)
+
+        return claims, int(item['version']['N'])
+
+    def put_claims(self, secondary_group_arn: str, claims: dict, version: int) -> None:
+        item = {
+            'leaseId': {'S': self.get_budget_id(secondary_group_arn)},
+            'claims': {'M': {
+                primary_group_arn: {'M': {'weight': {'N': str(weight)}, 'expiresAt': {'N': str(expires_at)}}}
+                for primary_group_arn, (weight, expires_at) in claims.items()
+            }},
+            'version': {'N': str(version + 1)}
+        }
+
+        if len(claims) > 0:
+            item['expiresAt'] = {'N': str(max(expires_at for _, expires_at in claims.values()))}
+
+        try:
+            self.dynamodb_client.put_item(
+                TableName=self.table_name,
+                Item=item,
+                ConditionExpression='attribute_not_exists(leaseId) OR version = :version',
+                ExpressionAttributeValues={
+                    ':version': {'N': str(version)}
+                }
+            )
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+                raise ShedBudgetConflictError(secondary_group_arn)
+
+            raise
+
+        return
+
+
+class ShedBudget:
+    def __init__(
+        self, store: ShedBudgetStore, budget_weight: int, max_attempts: int = 5, claim_duration_sec: int = 900,
+        clock=time.time
+    ) -> None:
+        self.store = store
+        self.budget_weight = budget_weight
+        self.max_attempts = max(1, max_attempts)
+        self.claim_duration_sec = claim_duration_sec
+        self.clock = clock
+
+    def acquire(self, secondary_group_arn: str, primary_group_arn: str, desired_weight: int) -> int:
+        """
+        Claims up to desired_weight on the secondary for the primary and returns the weight the
+        secondary may hold in the primary's rules, never less than the current claim.
+        """
+        def grant(claims: dict) -> int:
+            granted_weight = get_budget_cap(claims, primary_group_arn, desired_weight, self.budget_weight)
+
+            claims[primary_group_arn] = granted_weight
+
+            return granted_weight
+
+        return self.update(secondary_group_arn, primary_group_arn, grant)
+
+    def record(self, secondary_group_arn: str, primary_group_arn: str, weight: int) -> None:
+        """
+        Records the weight the secondary holds in the primary's rules after a step, renewing the
+        claim of the primary.
+        """
+        def set_claim(claims: dict) -> int:
+            if weight > 0:
+                claims[primary_group_arn] = weight
+            else:
+                claims.pop(primary_group_arn, None)
+
+            return weight
+
+        self.update(secondary_group_arn, primary_group_arn, set_claim)
+
+        return
+
+    def get_claims(self, secondary_group_arn: str) -> dict:
+        """
+        Returns the weights of the unexpired claims on the secondary by primary target group ARN.
+        """
+        claims, _ = self.store.get_claims(secondary_group_arn)
+
+        return self.get_unexpired_weights(claims)
+
+    def get_unexpired_weights(self, claims: dict) -> dict:
+        now = int(self.clock())
+
+        return {
+            claim_group_arn: weight for claim_group_arn, (weight, expires_at) in claims.items() if expires_at > now
+        }
+
+    def update(self, secondary_group_arn: str, primary_group_arn: str, update_claims) -> int:
+        """
+        Applies update_claims to the unexpired claim weights on the secondary and writes them
+        back, renewing the claim of the primary and dropping expired claims.
+        """
+        for attempt in range(1, self.max_attempts + 1):
+            claims, version = self.store.get_claims(secondary_group_arn)
+            weights = self.get_unexpired_weights(claims)
+            result = update_claims(weights)
+
+            updated_claims = {
+                claim_group_arn: (weight, claims[claim_group_arn][1]) for claim_group_arn, weight in weights.items()
+                if claim_group_arn != primary_group_arn
+            }
+
+            if primary_group_arn in weights:
+                updated_claims[primary_group_arn] = (
+                    weights[primary_group_arn], int(self.clock()) + self.claim_duration_sec)
+
+            try:
+                self.store.put_claims(secondary_group_arn, updated_claims, version)
+
+                return result
+            except ShedBudgetConflictError:
+                logger.info('Shed budget for ' + secondary_group_arn + ' changed, retrying (' + str(attempt) + ')')
+
+        raise ShedBudgetConflictError(secondary_group_arn)
+
+
+def get_budget_cap(claims: dict, primary_group_arn: str, desired_weight: int, budget_weight: int) -> int:
+    """
+    Returns the weight the primary may claim. Every primary with a claim, and the one asking,
+    is guaranteed an equal share of the budget. A primary may go over its share only with
+    budget the others have not claimed up to their share.
+    """
+    current_weight = claims.get(primary_group_arn, 0)
+
+    if desired_weight <= current_weight:
+        return desired_weight
+
+    other_claims = {
+        other_group_arn: claim for other_group_arn, claim in claims.items()
+        if other_group_arn != primary_group_arn and claim > 0
+    }
+
+    fair_share = budget_weight // (len(other_claims) + 1)
+    free_weight = budget_weight - sum(other_claims.values())
+    # weight held back for the others to grow into their share
+    reserved_weight = sum(max(0, fair_share - claim) for claim in other_claims.values())
+
+    cap = max(min(fair_share, free_weight), free_weight - reserved_weight)
+
+    return max(current_weight, min(desired_weight, cap))
+
+
+_in_memory_store = InMemoryShedBudgetStore()
+
+
+def get_shed_budget(
+    budget_weight: int, table_name: str = None, dynamodb_client: client = None, claim_duration_sec: int = 900
+) -> ShedBudget:
+    """
+    Returns the shed budget for the settings, or None if secondaries are not budgeted. Without a
+    lease table the budget is only shared within the process.
+    """
+    if budget_weight is None or budget_weight <= 0:
+        return None
+
+    if table_name is None:
+        return ShedBudget(_in_memory_store, budget_weight, claim_duration_sec=claim_duration_sec)
+
+    if dynamodb_client is None:
+        dynamodb_client = clients.get_client('dynamodb')
+
+    return ShedBudget(
+        DynamoDBShedBudgetStore(dynamodb_client, table_name), budget_weight, claim_duration_sec=claim_duration_sec)
@@ -0,0 +1,75 @@
+"""
+Works out the shed step from how far the alarm metric is over the alarm threshold.
+
+The metric of a target group alarm (for example RequestCountPerTarget) is assumed to scale
+with the weight forwarded to the target group. The proportional controller sheds enough
+weight in one step to bring the metric down to target_utilization of the threshold. The
+fixed elb_shed_percent is used as the smallest step, and the step is still bounded by
+max_elb_shed_percent when it is applied to a rule. The fixed step is also used while the
+newest complete period of the metric started before the last shed step, so that consecutive
+steps do not shed the same excess twice.
+"""
+import logging
+import math
+
+logger = logging.getLogger()
+
+SHED_CONTROLLER_FIXED = 'fixed'
+SHED_CONTROLLER_PROPORTIONAL = 'proportional'
+
+UPPER_BOUND_COMPARISON_OPERATORS = ('GreaterThanThreshold', 'GreaterThanOrEqualToThreshold')
+
+
+class ProportionalShedController:
+    def __init__(self, target_utilization: float = 0.9) -> None:
+        self.target_utilization = target_utilization
+
+    def get_load_ratio(self, metric_alarm: dict, metric_value: float) -> float:
+        """
+        Returns the alarm metric value divided by the target value (threshold * target_utilization),
+        or None if the metric cannot be used to size the shed step.
+        """
+        if metric_alarm is None or metric_alarm.get('ComparisonOperator') not in UPPER_BOUND_COMPARISON_OPERATORS:
+            return None
+
+        threshold = metric_alarm.get('Threshold')
+
+        if not threshold or threshold <= 0:
+            return None
+
+        if metric_value is None:
+            logger.info('No recent datapoint for ' + metric_alarm['AlarmName'] + ', using the fixed shed step')
+
+            return None
+
+        load_ratio = metric_value / (threshold * self.target_utilization)
+
+        logger.info('Alarm metric for ' + metric_alarm['AlarmName'] + ' is ' + str(metric_value) +
+                    ', threshold ' + str(threshold) + ', load ratio ' + str(round(load_ratio, 3)))
+
+        return load_ratio
+
+    def get_shed_weight(self, current_weight: int, load_ratio: float, min_shed_weight: int) -> int:
+        """
+        Returns the weight to shed from a rule forwarding current_weight to the target group so
+        that its share of the load drops by load_ratio. Never less than min_shed_weight.
+        """
+        if load_ratio is None or current_weight is None:
+            return min_shed_weight
+
+        target_weight = math.floor(current_weight / load_ratio) if load_ratio > 1 else current_weight
+
+        return max(min_shed_weight, current_weight - target_weight)
+
+
+def get_shed_controller(shed_controller: str, target_utilization: float) -> ProportionalShedController:
+    """
+    Returns the controller for the configured mode, or None for fixed size shed steps.
+    """
+    if shed_controller == SHED_CONTROLLER_PROPORTIONAL:
+        return ProportionalShedController(target_utilization)
+
+    if shed_controller != SHED_CONTROLLER_FIXED:
+        logger.warning('Unknown shed controller ' + str(shed_controller) + ', using fixed shed steps')
+
+    return None
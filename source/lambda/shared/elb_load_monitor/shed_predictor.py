@@ -0,0 +1,84 @@
+"""
+Predicts a breach of the alarm threshold from the trend of the alarm metric.
+
+A straight line is fitted by least squares over the last datapoints of the alarm metric. A breach
+is predicted when the line moves towards the threshold and crosses it within horizon_sec. The
+prediction is used to shed pre_shed_percent before the alarm fires.
+"""
+from boto3 import client
+
+import logging
+
+from elb_load_monitor.cw_metrics import get_metric_datapoints
+from elb_load_monitor.metric_poller import is_breaching
+
+logger = logging.getLogger()
+
+MIN_TREND_DATAPOINTS = 3
+
+
+class ShedPredictor:
+    def __init__(self, horizon_sec: int = 300, datapoints: int = 5, pre_shed_percent: int = 5) -> None:
+        self.horizon_sec = horizon_sec
+        self.datapoints = max(MIN_TREND_DATAPOINTS, datapoints)
+        self.pre_shed_percent = pre_shed_percent
+
+    def is_breach_predicted(self, cw_client: client, metric_alarm: dict) -> bool:
+        """
+        Reads the recent datapoints of the alarm metric at the alarm period and returns True if
+        they project a breach of the alarm threshold within horizon_sec.
+        """
+        period_sec = metric_alarm.get('Period', 60)
+        values = get_metric_datapoints(cw_client, metric_alarm, period_sec, self.datapoints)
+
+        projected_value = get_projected_value(values, period_sec, self.horizon_sec)
+
+        if projected_value is None or metric_alarm.get('Threshold') is None:
+            return False
+
+        comparison_operator = metric_alarm.get('ComparisonOperator')
+        trend_value = get_projected_value(values, period_sec, 0)
+        rising = comparison_operator in ('GreaterThanThreshold', 'GreaterThanOrEqualToThreshold')
+
+        # only a trend moving towards the threshold predicts a breach
+        if (projected_value > trend_value) != rising or projected_value == trend_value:
+            return False
+
+        breach_predicted = is_breaching(projected_value, metric_alarm['Threshold'], comparison_operator)
+
+        logger.info('Predicted ' + metric_alarm['AlarmName'] + ' in ' + str(self.horizon_sec) + 's: ' +
+                    str(round(projected_value, 3)) + ' from ' + str(values) +
+                    (', breaching' if breach_predicted else ''))
+
+        return breach_predicted
+
+
+def get_projected_value(values: list, period_sec: int, horizon_sec: int) -> float:
+    """
+    Fits a line through values, newest first and period_sec apart, and returns its value
+    horizon_sec after the newest datapoint. Returns None with fewer than MIN_TREND_DATAPOINTS.
+    """
+    if len(values) < MIN_TREND_DATAPOINTS:
+        return None
+
+    # time of each datapoint relative to the newest
+    times = [-index * period_sec for index in range(len(values))]
+    mean_time = sum(times) / len(times)
+    mean_value = sum(values) / len(values)
+
+    covariance = sum((offset - mean_time) * (value - mean_value) for offset, value in zip(times, values))
+    variance = sum((offset - mean_time) ** 2 for offset in times)
+
+    slope = covariance / variance
+
+    return mean_value + slope * (horizon_sec - mean_time)
+
+
+def get_shed_predictor(enabled: bool, horizon_sec: int, datapoints: int, pre_shed_percent: int) -> ShedPredictor:
+    """
+    Returns the predictor for the settings, or None to only shed once the alarm fires.
+    """
+    if not enabled:
+        return None
+
+    return ShedPredictor(horizon_sec, datapoints, pre_shed_percent)
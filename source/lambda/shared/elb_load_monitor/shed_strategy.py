@@ -0,0 +1,252 @@
+"""
+Pluggable policies for how much weight a shed or restore step moves and where it moves it.
+
+A ShedStrategy pairs a step policy (how much) with a weight distribution (where).
+LinearStepPolicy moves the configured percent on every step. AIMDStepPolicy sheds a
+fraction of the remaining weight (multiplicative decrease) and restores the configured
+percent (additive increase), so load is shed in few large steps and restored gently.
+EvenWeightDistribution splits shed weight evenly across the other target groups and
+restores from them in rule order. CapacityWeightDistribution splits shed weight in proportion
+to the healthy targets of the other target groups and restores in proportion to the weight
+they were given, rounding both with the largest-remainder method. GuardedWeightDistribution
+keeps shed weight away from saturated target groups. BudgetedWeightDistribution stops each
+target group from going over the weight granted to it by a shared shed budget.
+"""
+import abc
+import logging
+import math
+
+logger = logging.getLogger()
+
+SHED_POLICY_LINEAR = 'linear'
+SHED_POLICY_AIMD = 'aimd'
+SHED_DISTRIBUTION_EVEN = 'even'
+SHED_DISTRIBUTION_CAPACITY = 'capacity'
+
+
+class StepPolicy(abc.ABC):
+    @abc.abstractmethod
+    def get_shed_weight(self, current_weight: int, shed_percent: int) -> int:
+        """
+        Returns the weight to shed from a target group forwarded current_weight.
+        """
+
+    @abc.abstractmethod
+    def get_restore_weight(self, current_weight: int, restore_percent: int) -> int:
+        """
+        Returns the weight to restore to a target group forwarded current_weight.
+        """
+
+
+class LinearStepPolicy(StepPolicy):
+    def get_shed_weight(self, current_weight: int, shed_percent: int) -> int:
+        return shed_percent
+
+    def get_restore_weight(self, current_weight: int, restore_percent: int) -> int:
+        return restore_percent
+
+
+class AIMDStepPolicy(StepPolicy):
+    def __init__(self, decrease_factor: float = 0.5) -> None:
+        self.decrease_factor = decrease_factor
+
+    def get_shed_weight(self, current_weight: int, shed_percent: int) -> int:
+        # never less than the linear step, so shedding still finishes when little weight is left
+        return max(shed_percent, math.ceil(current_weight * self.decrease_factor))
+
+    def get_restore_weight(self, current_weight: int, restore_percent: int) -> int:
+        return restore_percent
+
+
+class WeightDistribution(abc.ABC):
+    @abc.abstractmethod
+    def get_shed_weights(self, forward_configs: dict, source_group_arn: str, weight: int) -> dict:
+        """
+        Returns a dict of target group ARN to the weight it receives when weight is shed from
+        source_group_arn.
+        """
+
+    @abc.abstractmethod
+    def get_restore_weights(self, forward_configs: dict, source_group_arn: str, weight: int) -> dict:
+        """
+        Returns a dict of target group ARN to the weight taken from it when up to weight is
+        restored to source_group_arn.
+        """
+
+
+class EvenWeightDistribution(WeightDistribution):
+    def get_shed_weights(self, forward_configs: dict, source_group_arn: str, weight: int) -> dict:
+        per_target_weight = weight
+
+        num_forwards = len(forward_configs)
+        remainder_weight = 0
+
+        if num_forwards > 2:
+            # if more than 2 forward configs, then split the weight evenly among the other targets
+            per_target_weight, remainder_weight = divmod(weight, num_forwards - 1)
+
+        shed_weights = dict()
+
+        for key in forward_configs.keys():
+            num_forwards -= 1
+
+            if key == source_group_arn:
+                continue
+
+            shed_weights[key] = per_target_weight
+
+            if num_forwards == 0:
+                shed_weights[key] += remainder_weight
+
+        return shed_weights
+
+    def get_restore_weights(self, forward_configs: dict, source_group_arn: str, weight: int) -> dict:
+        remaining_weight = weight
+        restore_weights = dict()
+
+        for key, current_weight in forward_configs.items():
+            if key == source_group_arn:
+                continue
+
+            # restore maximum weight possible from each target
+            restore_weights[key] = min(current_weight, remaining_weight)
+            remaining_weight -= restore_weights[key]
+
+        return restore_weights
+
+
+class CapacityWeightDistribution(WeightDistribution):
+    def __init__(self, get_healthy_target_count, fallback: WeightDistribution = None) -> None:
+        # callable returning the healthy target count of a target group ARN, or None if unknown
+        self.get_healthy_target_count = get_healthy_target_count
+
+        if fallback is None:
+            fallback = EvenWeightDistribution()
+
+        self.fallback = fallback
+
+    def get_shed_weights(self, forward_configs: dict, source_group_arn: str, weight: int) -> dict:
+        healthy_target_counts = {
+            key: self.get_healthy_target_count(key) for key in forward_configs.keys() if key != source_group_arn
+        }
+
+        if any(count is None for count in healthy_target_counts.values()) or \
+                sum(healthy_target_counts.values()) == 0:
+            logger.info('Healthy targets unknown for ' + source_group_arn + ' secondaries, shedding evenly')
+
+            return self.fallback.get_shed_weights(forward_configs, source_group_arn, weight)
+
+        return allocate_largest_remainder(weight, healthy_target_counts)
+
+    def get_restore_weights(self, forward_configs: dict, source_group_arn: str, weight: int) -> dict:
+        current_weights = {key: current_weight for key, current_weight in forward_configs.items()
+                           if key != source_group_arn}
+
+        if weight >= sum(current_weights.values()):
+            return current_weights
+
+        return allocate_largest_remainder(weight, current_weights)
+
+
+class GuardedWeightDistribution(WeightDistribution):
+    def __init__(self, weight_distribution: WeightDistribution, saturated_target_group_arns: set) -> None:
+        self.weight_distribution = weight_distribution
+        self.saturated_target_group_arns = saturated_target_group_arns
+
+    def get_shed_weights(self, forward_configs: dict, source_group_arn: str, weight: int) -> dict:
+        # saturated target groups are left out so their share goes to the others
+        unsaturated_forward_configs = {
+            key: current_weight for key, current_weight in forward_configs.items()
+            if key == source_group_arn or key not in self.saturated_target_group_arns
+        }
+
+        if len(unsaturated_forward_configs) == 1:
+            return dict()
+
+        return self.weight_distribution.get_shed_weights(unsaturated_forward_configs, source_group_arn, weight)
+
+    def get_restore_weights(self, forward_configs: dict, source_group_arn: str, weight: int) -> dict:
+        return self.weight_distribution.get_restore_weights(forward_configs, source_group_arn, weight)
+
+
+class BudgetedWeightDistribution(WeightDistribution):
+    def __init__(self, weight_distribution: WeightDistribution, budget_weights: dict) -> None:
+        self.weight_distribution = weight_distribution
+        # most weight each target group may hold after shedding
+        self.budget_weights = budget_weights
+
+    def get_shed_weights(self, forward_configs: dict, source_group_arn: str, weight: int) -> dict:
+        shed_weights = self.weight_distribution.get_shed_weights(forward_configs, source_group_arn, weight)
+
+        for key, shed_weight in shed_weights.items():
+            if key in self.budget_weights:
+                shed_weights[key] = min(shed_weight, max(0, self.budget_weights[key] - forward_configs.get(key)))
+
+        return shed_weights
+
+    def get_restore_weights(self, forward_configs: dict, source_group_arn: str, weight: int) -> dict:
+        return self.weight_distribution.get_restore_weights(forward_configs, source_group_arn, weight)
+
+
+class ShedStrategy:
+    def __init__(self, step_policy: StepPolicy = None, weight_distribution: WeightDistribution = None) -> None:
+        if step_policy is None:
+            step_policy = LinearStepPolicy()
+
+        if weight_distribution is None:
+            weight_distribution = EvenWeightDistribution()
+
+        self.step_policy = step_policy
+        self.weight_distribution = weight_distribution
+
+
+DEFAULT_SHED_STRATEGY = ShedStrategy()
+
+
+def allocate_largest_remainder(total: int, shares: dict) -> dict:
+    """
+    Splits the integer total across the keys of shares in proportion to their share. Every key
+    gets the floor of its quota and the points left over go one each to the largest remainders,
+    ties going to the earlier key.
+    """
+    total_shares = sum(shares.values())
+
+    if total_shares == 0:
+        return {key: 0 for key in shares.keys()}
+
+    allocations = dict()
+    remainders = []
+
+    for index, (key, share) in enumerate(shares.items()):
+        allocations[key], remainder = divmod(total * share, total_shares)
+        remainders.append((-remainder, index, key))
+
+    for _, _, key in sorted(remainders)[:total - sum(allocations.values())]:
+        allocations[key] += 1
+
+    return allocations
+
+
+def get_shed_strategy(
+    shed_policy: str, aimd_decrease_factor: float = 0.5, shed_distribution: str = SHED_DISTRIBUTION_EVEN,
+    get_healthy_target_count=None
+) -> ShedStrategy:
+    if shed_policy == SHED_POLICY_AIMD:
+        step_policy = AIMDStepPolicy(aimd_decrease_factor)
+    else:
+        if shed_policy != SHED_POLICY_LINEAR:
+            logger.warning('Unknown shed policy ' + str(shed_policy) + ', using linear steps')
+
+        step_policy = None
+
+    weight_distribution = None
+
+    if shed_distribution == SHED_DISTRIBUTION_CAPACITY and get_healthy_target_count is not None:
+        weight_distribution = CapacityWeightDistribution(get_healthy_target_count)
+    elif shed_distribution not in (SHED_DISTRIBUTION_EVEN, SHED_DISTRIBUTION_CAPACITY):
+        logger.warning('Unknown shed distribution ' + str(shed_distribution) + ', shedding evenly')
+
+    if step_policy is None and weight_distribution is None:
+        return DEFAULT_SHED_STRATEGY
+
+    return ShedStrategy(step_policy, weight_distribution)
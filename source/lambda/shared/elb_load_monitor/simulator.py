@@ -0,0 +1,663 @@
+"""
+Offline discrete-event simulator for tuning the shed and restore parameters.
+
+A TrafficCurve of requests per second is offered to a listener whose rules forward to a
+source target group and one or more secondaries, each with a capacity in requests per second.
+The utilization of a target group is the load its weights send it over its capacity. A
+simulated CloudWatch alarm evaluates the utilization of the source every period. Every alarm
+state change and every delivered SQS message runs a new ALBListenerRulesHandler, as the
+Lambdas do, against stand-ins for the ELB, SQS and CloudWatch APIs and a simulated clock.
+
+Each incident, from the alarm firing until the source has all of its weight back, is
+reported with:
+
+- time to relief: seconds until the utilization of the source was back under the threshold
+- overshoot: the weight shed beyond the least weight the source needed at the peak of the load,
+  not counting weight still held back while restoring after the peak
+- oscillations: the number of times the weight of the source changed direction
+- API calls: the calls made to each API during the incident
+
+Run python -m elb_load_monitor.simulator --help to simulate a recorded traffic curve.
+"""
+import argparse
+import collections
+import csv
+import heapq
+import json
+import logging
+import threading
+from datetime import datetime, timezone
+
+from elb_load_monitor.alb_alarm_messages import ALBAlarmEvent
+from elb_load_monitor.alb_alarm_messages import ALBAlarmStatusMessage
+from elb_load_monitor.alb_alarm_messages import CWAlarmState
+from elb_load_monitor.alb_listener_rules_handler import ALBListenerRulesHandler
+
+logger = logging.getLogger()
+
+LOAD_BALANCER_ARN = 'arn:aws:elasticloadbalancing:us-east-1:123456789012:loadbalancer/app/SimALB/0000000000000000'
+LISTENER_ARN = 'arn:aws:elasticloadbalancing:us-east-1:123456789012:listener/app/SimALB/0000000000000000/0000000000000000'
+ALARM_NAME = 'SimulatedAlarm'
+ALARM_ARN = 'arn:aws:cloudwatch:us-east-1:123456789012:alarm:' + ALARM_NAME
+SQS_QUEUE_URL = 'https://sqs.us-east-1.amazonaws.com/123456789012/simulated'
+
+# order of events due at the same time
+EVENT_SAMPLE = 0
+EVENT_EVALUATE = 1
+EVENT_MESSAGE = 2
+
+
+def get_target_group_arn(name: str) -> str:
+    return 'arn:aws:elasticloadbalancing:us-east-1:123456789012:targetgroup/' + name + '/0000000000000000'
+
+
+class SimulatedClock:
+    def __init__(self, start: float = 1700000000.0) -> None:
+        self.start = start
+        self.now = start
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class TrafficCurve:
+    def __init__(self, points: list) -> None:
+        """
+        points is a list of (offset seconds, requests per second). The load between points is
+        interpolated linearly and is constant before the first and after the last point.
+        """
+        if len(points) == 0:
+            raise ValueError('A traffic curve needs at least one point')
+
+        self.points = sorted((float(offset_sec), float(load)) for offset_sec, load in points)
+
+    @classmethod
+    def from_csv(cls, csv_file) -> 'TrafficCurve':
+        """
+        Reads rows of offset seconds and requests per second. Rows that are not numbers, such
+        as a header, are skipped.
+        """
+        points = []
+
+        for row in csv.reader(csv_file):
+            try:
+                points.append((float(row[0]), float(row[1])))
+            except (IndexError, ValueError):
+                continue
+
+        return cls(points)
+
+    @classmethod
+    def spike(
+        cls, base_load: float, peak_load: float, start_sec: float, ramp_sec: float, hold_sec: float,
+        duration_sec: float
+    ) -> 'TrafficCurve':
+        """
+        Returns a curve at base_load that ramps up to peak_load at start_sec, holds it for
+        hold_sec and ramps back down, ending at duration_sec.
+        """
+        peak_end_sec = start_sec + ramp_sec + hold_sec
+
+        return cls([
+            (0, base_load), (start_sec, base_load), (start_sec + ramp_sec, peak_load), (peak_end_sec, peak_load),
+            (peak_end_sec + ramp_sec, base_load), (max(duration_sec, peak_end_sec + ramp_sec), base_load)
+        ])
+
+    def get_load(self, offset_sec: float) -> float:
+        previous_offset_sec, previous_load = self.points[0]
+
+        if offset_sec <= previous_offset_sec:
+            return previous_load
+
+        for point_offset_sec, load in self.points[1:]:
+            if offset_sec <= point_offset_sec:
+                fraction = (offset_sec - previous_offset_sec) / (point_offset_sec - previous_offset_sec)
+
+                return previous_load + fraction * (load - previous_load)
+
+            previous_offset_sec, previous_load = point_offset_sec, load
+
+        return previous_load
+
+    def get_duration_sec(self) -> float:
+        return self.points[-1][0]
+
+
+class APICallCounter:
+    def __init__(self) -> None:
+        self.calls = collections.Counter()
+        self._lock = threading.Lock()
+
+    def record(self, service_name: str, operation_name: str) -> None:
+        # rules are written from the rule writer's threads
+        with self._lock:
+            self.calls[service_name + '.' + operation_name] += 1
+
+        return
+
+    def get_calls(self) -> collections.Counter:
+        with self._lock:
+            return collections.Counter(self.calls)
+
+
+class SimulatedELBv2Client:
+    """
+    A listener of rule_count rules, the last being the default rule, all forwarding with
+    forward_weights. Writes change the weights the simulated traffic is routed with.
+    """
+    def __init__(self, forward_weights: dict, rule_count: int, api_calls: APICallCounter) -> None:
+        self.api_calls = api_calls
+        self.rule_arns = [
+            LISTENER_ARN.replace(':listener/', ':listener-rule/') + '/' + format(index, '016x')
+            for index in range(rule_count - 1)
+        ]
+        # rule ARN, or the listener ARN for the default rule, to target group ARN to weight
+        self.rule_weights = {rule_arn: dict(forward_weights) for rule_arn in self.rule_arns + [LISTENER_ARN]}
+        self._lock = threading.Lock()
+
+    def get_rule_entry(self, rule_arn: str) -> dict:
+        default_rule = rule_arn == LISTENER_ARN
+
+        with self._lock:
+            target_groups = [
+                {'TargetGroupArn': target_group_arn, 'Weight': weight}
+                for target_group_arn, weight in self.rule_weights[rule_arn].items()
+            ]
+
+        return {
+            'RuleArn': LISTENER_ARN.replace(':listener/', ':listener-rule/') + '/default' if default_rule else rule_arn,
+            'Priority': 'default' if default_rule else str(self.rule_arns.index(rule_arn) + 1),
+            'IsDefault': default_rule,
+            'Actions': [{'Type': 'forward', 'ForwardConfig': {'TargetGroups': target_groups}}]
+        }
+
+    def get_weight(self, target_group_arn: str) -> float:
+        """
+        Returns the share of the listener traffic, in percent, forwarded to the target group,
+        with the traffic spread evenly over the rules.
+        """
+        with self._lock:
+            weights = [forward_weights.get(target_group_arn, 0) for forward_weights in self.rule_weights.values()]
+
+        return sum(weights) / len(weights)
+
+    def describe_rules(self, ListenerArn: str = None, RuleArns: list = None, PageSize: int = None,
+                       Marker: str = None) -> dict:
+        self.api_calls.record('elbv2', 'DescribeRules')
+
+        if RuleArns is not None:
+            default_rule_arn = self.get_rule_entry(LISTENER_ARN)['RuleArn']
+
+            return {'Rules': [
+                self.get_rule_entry(LISTENER_ARN if rule_arn == default_rule_arn else rule_arn)
+                for rule_arn in RuleArns
+            ]}
+
+        rule_arns = self.rule_arns + [LISTENER_ARN]
+        start = int(Marker or 0)
+        end = len(rule_arns) if PageSize is None else start + PageSize
+        describe_rules_response = {'Rules': [self.get_rule_entry(rule_arn) for rule_arn in rule_arns[start:end]]}
+
+        if end < len(rule_arns):
+            describe_rules_response['NextMarker'] = str(end)
+
+        return describe_rules_response
+
+    def modify_rule(self, RuleArn: str, Actions: list) -> dict:
+        self.api_calls.record('elbv2', 'ModifyRule')
+        self.set_weights(RuleArn, Actions)
+
+        return {}
+
+    def modify_listener(self, ListenerArn: str, DefaultActions: list) -> dict:
+        self.api_calls.record('elbv2', 'ModifyListener')
+        self.set_weights(LISTENER_ARN, DefaultActions)
+
+        return {}
+
+    def describe_target_health(self, TargetGroupArn: str) -> dict:
+        self.api_calls.record('elbv2', 'DescribeTargetHealth')
+
+        return {'TargetHealthDescriptions': [{'TargetHealth': {'State': 'healthy'}}]}
+
+    def set_weights(self, rule_arn: str, actions: list) -> None:
+        with self._lock:
+            self.rule_weights[rule_arn] = {
+                target_group['TargetGroupArn']: target_group['Weight']
+                for target_group in actions[0]['ForwardConfig']['TargetGroups']
+            }
+
+        return
+
+
+class SimulatedSQSClient:
+    def __init__(self, simulator: 'TrafficSimulator', api_calls: APICallCounter) -> None:
+        self.simulator = simulator
+        self.api_calls = api_calls
+
+    def send_message(self, QueueUrl: str, MessageBody: str, DelaySeconds: int = 0) -> dict:
+        self.api_calls.record('sqs', 'SendMessage')
+        self.simulator.schedule(self.simulator.get_offset_sec() + DelaySeconds, EVENT_MESSAGE, MessageBody)
+
+        return {'MessageId': str(self.api_calls.get_calls()['sqs.SendMessage'])}
+
+
+class SimulatedCloudWatchClient:
+    def __init__(self, simulator: 'TrafficSimulator', api_calls: APICallCounter) -> None:
+        self.simulator = simulator
+        self.api_calls = api_calls
+
+    def describe_alarms(self, AlarmNames: list = None, **kwargs) -> dict:
+        self.api_calls.record('cloudwatch', 'DescribeAlarms')
+
+        return {'MetricAlarms': [self.simulator.get_metric_alarm()], 'CompositeAlarms': []}
+
+    def get_metric_data(self, MetricDataQueries: list, MaxDatapoints: int = None, **kwargs) -> dict:
+        """
+        Returns the utilization of the target group of each query, newest first, ignoring the
+        requested time range in favour of the simulated clock.
+        """
+        self.api_calls.record('cloudwatch', 'GetMetricData')
+
+        metric_data_results = []
+
+        for query in MetricDataQueries:
+            metric_stat = query['MetricStat']
+            target_group_arn = self.simulator.get_dimension_target_group(metric_stat['Metric']['Dimensions'])
+            values = []
+
+            if target_group_arn is not None:
+                values = self.simulator.get_utilization_values(
+                    target_group_arn, metric_stat['Period'], MaxDatapoints or 3)
+
+            metric_data_results.append({'Id': query['Id'], 'Values': values, 'StatusCode': 'Complete'})
+
+        return {'MetricDataResults': metric_data_results}
+
+
+class Incident:
+    def __init__(self, start_sec: float, source_weight: float, api_calls_at_start: collections.Counter) -> None:
+        self.start_sec = start_sec
+        self.end_sec = None
+        self.time_to_relief_sec = None
+        self.oscillations = 0
+        self.peak_utilization = 0.0
+        self.min_source_weight = source_weight
+        # least weight the source needed to stay under the threshold during the incident
+        self.min_required_weight = 100.0
+        self.api_calls = dict()
+        self.api_calls_at_start = api_calls_at_start
+        self.last_source_weight = source_weight
+        self.last_direction = 0
+
+    @property
+    def overshoot_weight(self) -> float:
+        """
+        Returns the weight shed beyond what the source needed at the peak of the incident.
+        """
+        return max(0.0, self.min_required_weight - self.min_source_weight)
+
+    def record_required_weight(self, required_weight: float) -> None:
+        self.min_required_weight = min(self.min_required_weight, required_weight)
+
+        return
+
+    def record_weight(self, source_weight: float) -> None:
+        if source_weight == self.last_source_weight:
+            return
+
+        direction = 1 if source_weight > self.last_source_weight else -1
+
+        if self.last_direction != 0 and direction != self.last_direction:
+            self.oscillations += 1
+
+        self.last_direction = direction
+        self.last_source_weight = source_weight
+        self.min_source_weight = min(self.min_source_weight, source_weight)
+
+        return
+
+    def record_api_calls(self, api_calls: collections.Counter) -> None:
+        self.api_calls = dict(api_calls - self.api_calls_at_start)
+
+        return
+
+    def to_json(self) -> dict:
+        result = {
+            'startSec': self.start_sec,
+            'overshootWeight': round(self.overshoot_weight, 2),
+            'oscillations': self.oscillations,
+            'peakUtilization': round(self.peak_utilization, 3),
+            'minSourceWeight': round(self.min_source_weight, 2),
+            'minRequiredWeight': round(self.min_required_weight, 2),
+            'apiCalls': dict(sorted(self.api_calls.items())),
+            'totalApiCalls': sum(self.api_calls.values())
+        }
+
+        if self.end_sec is not None:
+            result['endSec'] = self.end_sec
+
+        if self.time_to_relief_sec is not None:
+            result['timeToReliefSec'] = self.time_to_relief_sec
+
+        return result
+
+
+class SimulationReport:
+    def __init__(self, incidents: list, api_calls: collections.Counter, final_weights: dict) -> None:
+        self.incidents = incidents
+        self.api_calls = api_calls
+        self.final_weights = final_weights
+
+    def to_json(self) -> dict:
+        return {
+            'incidents': [incident.to_json() for incident in self.incidents],
+            'apiCalls': dict(sorted(self.api_calls.items())),
+            'finalWeights': self.final_weights
+        }
+
+
+class TrafficSimulator:
+    def __init__(
+        self, traffic_curve: TrafficCurve, capacities: dict, source_group_arn: str, elb_shed_percent: int = 5,
+        max_elb_shed_percent: int = 100, elb_restore_percent: int = 5, shed_mesg_delay_sec: int = 60,
+        restore_mesg_delay_sec: int = 60, alarm_threshold: float = 0.8, alarm_period_sec: int = 60,
+        evaluation_periods: int = 1, sample_sec: int = 10, rule_count: int = 1, forward_weights: dict = None,
+        clock: SimulatedClock = None, handler_kwargs: dict = None
+    ) -> None:
+        """
+        capacities is a dict of target group ARN to the requests per second it serves at a
+        utilization of 1.0. The rules forward to every target group in capacities, all of the
+        traffic to source_group_arn unless forward_weights is given. Components of
+        handler_kwargs that keep time, such as ShedHysteresis, should use clock.
+        """
+        self.traffic_curve = traffic_curve
+        self.capacities = capacities
+        self.source_group_arn = source_group_arn
+        self.elb_shed_percent = elb_shed_percent
+        self.max_elb_shed_percent = max_elb_shed_percent
+        self.elb_restore_percent = elb_restore_percent
+        self.shed_mesg_delay_sec = shed_mesg_delay_sec
+        self.restore_mesg_delay_sec = restore_mesg_delay_sec
+        self.alarm_threshold = alarm_threshold
+        self.alarm_period_sec = alarm_period_sec
+        self.evaluation_periods = max(1, evaluation_periods)
+        self.sample_sec = sample_sec
+        self.clock = clock if clock is not None else SimulatedClock()
+        self.handler_kwargs = handler_kwargs or dict()
+
+        if forward_weights is None:
+            forward_weights = {
+                target_group_arn: 100 if target_group_arn == source_group_arn else 0 for target_group_arn in capacities
+            }
+
+        self.initial_source_weight = forward_weights[source_group_arn]
+
+        self.api_calls = APICallCounter()
+        self.elbv2_client = SimulatedELBv2Client(forward_weights, rule_count, self.api_calls)
+        self.sqs_client = SimulatedSQSClient(self, self.api_calls)
+        self.cw_client = SimulatedCloudWatchClient(self, self.api_calls)
+
+        self.alarm_state = CWAlarmState.OK
+        self.alarm_transitioned_at = self.clock()
+        # evaluations in a row that breached or did not
+        self.breaching_evaluations = 0
+        self.ok_evaluations = 0
+        # target group ARN to a list of (offset seconds, utilization)
+        self.samples = {target_group_arn: [] for target_group_arn in capacities}
+        self.incidents = []
+        self.incident = None
+        self._events = []
+        self._event_count = 0
+
+    def get_offset_sec(self) -> float:
+        return self.clock() - self.clock.start
+
+    def schedule(self, offset_sec: float, event_type: int, payload=None) -> None:
+        self._event_count += 1
+        heapq.heappush(self._events, (offset_sec, event_type, self._event_count, payload))
+
+        return
+
+    def run(self, duration_sec: float = None) -> SimulationReport:
+        """
+        Simulates the traffic curve, or duration_sec seconds of it, and returns the report.
+        """
+        if duration_sec is None:
+            duration_sec = self.traffic_curve.get_duration_sec()
+
+        offset_sec = 0
+
+        while offset_sec <= duration_sec:
+            self.schedule(offset_sec, EVENT_SAMPLE)
+            offset_sec += self.sample_sec
+
+        offset_sec = self.alarm_period_sec
+
+        while offset_sec <= duration_sec:
+            self.schedule(offset_sec, EVENT_EVALUATE)
+            offset_sec += self.alarm_period_sec
+
+        while len(self._events) > 0 and self._events[0][0] <= duration_sec:
+            offset_sec, event_type, _, payload = heapq.heappop(self._events)
+            self.clock.now = self.clock.start + offset_sec
+
+            if event_type == EVENT_SAMPLE:
+                self.sample()
+            elif event_type == EVENT_EVALUATE:
+                self.evaluate_alarm()
+            else:
+                self.deliver_message(payload)
+
+        if self.incident is not None:
+            self.incident.record_api_calls(self.api_calls.get_calls())
+
+        final_weights = {
+            target_group_arn: round(self.elbv2_client.get_weight(target_group_arn), 2)
+            for target_group_arn in self.capacities
+        }
+
+        return SimulationReport(self.incidents, self.api_calls.get_calls(), final_weights)
+
+    def get_utilization(self, target_group_arn: str, offset_sec: float) -> float:
+        load = self.traffic_curve.get_load(offset_sec) * self.elbv2_client.get_weight(target_group_arn) / 100
+
+        return load / self.capacities[target_group_arn]
+
+    def get_required_source_weight(self, offset_sec: float) -> float:
+        """
+        Returns the most weight the source can take while staying at the alarm threshold.
+        """
+        load = self.traffic_curve.get_load(offset_sec)
+
+        if load <= 0:
+            return 100.0
+
+        return min(100.0, self.alarm_threshold * self.capacities[self.source_group_arn] * 100 / load)
+
+    def sample(self) -> None:
+        offset_sec = self.get_offset_sec()
+
+        for target_group_arn, samples in self.samples.items():
+            samples.append((offset_sec, self.get_utilization(target_group_arn, offset_sec)))
+
+        if self.incident is None:
+            return
+
+        utilization = self.samples[self.source_group_arn][-1][1]
+
+        self.incident.peak_utilization = max(self.incident.peak_utilization, utilization)
+
+        if self.incident.time_to_relief_sec is None and utilization <= self.alarm_threshold:
+            self.incident.time_to_relief_sec = offset_sec - self.incident.start_sec
+
+        self.incident.record_required_weight(self.get_required_source_weight(offset_sec))
+
+        return
+
+    def get_utilization_values(self, target_group_arn: str, period_sec: int, count: int) -> list:
+        """
+        Returns the mean utilization of the target group in each of the last count periods,
+        newest first. Periods without samples have no value.
+        """
+        offset_sec = self.get_offset_sec()
+        values = []
+
+        for index in range(count):
+            period_end_sec = offset_sec - index * period_sec
+            period_samples = [
+                utilization for sample_offset_sec, utilization in self.samples[target_group_arn]
+                if period_end_sec - period_sec < sample_offset_sec <= period_end_sec
+            ]
+
+            if len(period_samples) > 0:
+                values.append(sum(period_samples) / len(period_samples))
+
+        return values
+
+    def get_dimension_target_group(self, dimensions: list) -> str:
+        for dimension in dimensions:
+            if dimension['Name'] != 'TargetGroup':
+                continue
+
+            for target_group_arn in self.capacities:
+                if target_group_arn.split(':')[-1] == dimension['Value']:
+                    return target_group_arn
+
+        return None
+
+    def get_metric_alarm(self) -> dict:
+        return {
+            'AlarmName': ALARM_NAME,
+            'AlarmArn': ALARM_ARN,
+            'StateValue': self.alarm_state.name,
+            'StateTransitionedTimestamp': datetime.fromtimestamp(self.alarm_transitioned_at, timezone.utc),
+            'MetricName': 'Utilization',
+            'Namespace': 'Simulation',
+            'Statistic': 'Average',
+            'Dimensions': [{'Name': 'TargetGroup', 'Value': self.source_group_arn.split(':')[-1]}],
+            'Period': self.alarm_period_sec,
+            'EvaluationPeriods': self.evaluation_periods,
+            'Threshold': self.alarm_threshold,
+            'ComparisonOperator': 'GreaterThanThreshold'
+        }
+
+    def evaluate_alarm(self) -> None:
+        values = self.get_utilization_values(self.source_group_arn, self.alarm_period_sec, 1)
+
+        if len(values) == 0:
+            return
+
+        if values[0] > self.alarm_threshold:
+            self.breaching_evaluations += 1
+            self.ok_evaluations = 0
+        else:
+            self.ok_evaluations += 1
+            self.breaching_evaluations = 0
+
+        if self.alarm_state != CWAlarmState.ALARM and self.breaching_evaluations >= self.evaluation_periods:
+            self.set_alarm_state(CWAlarmState.ALARM)
+        elif self.alarm_state != CWAlarmState.OK and self.ok_evaluations >= self.evaluation_periods:
+            self.set_alarm_state(CWAlarmState.OK)
+
+        return
+
+    def set_alarm_state(self, cw_alarm_state: CWAlarmState) -> None:
+        self.alarm_state = cw_alarm_state
+        self.alarm_transitioned_at = self.clock()
+
+        logger.debug('Simulated alarm is ' + cw_alarm_state.name + ' at ' + str(self.get_offset_sec()))
+
+        if cw_alarm_state == CWAlarmState.ALARM and self.incident is None:
+            self.incident = Incident(
+                self.get_offset_sec(), self.elbv2_client.get_weight(self.source_group_arn),
+                self.api_calls.get_calls())
+            self.incidents.append(self.incident)
+
+        alb_alarm_event = ALBAlarmEvent(
+            'simulated-' + str(self._event_count), ALARM_ARN, ALARM_NAME, cw_alarm_state, self.clock())
+
+        self.create_handler().handle_alarm(
+            self.elbv2_client, self.sqs_client, SQS_QUEUE_URL, alb_alarm_event, self.cw_client)
+        self.record_step()
+
+        return
+
+    def deliver_message(self, message_body: str) -> None:
+        alb_alarm_status_message = ALBAlarmStatusMessage.from_json(json.loads(message_body))
+
+        self.create_handler().handle_alarm_status_message(
+            self.cw_client, self.elbv2_client, self.sqs_client, alb_alarm_status_message)
+        self.record_step()
+
+        return
+
+    def create_handler(self) -> ALBListenerRulesHandler:
+        return ALBListenerRulesHandler(
+            self.elbv2_client, LOAD_BALANCER_ARN, LISTENER_ARN, self.source_group_arn, self.elb_shed_percent,
+            self.max_elb_shed_percent, self.elb_restore_percent, self.shed_mesg_delay_sec,
+            self.restore_mesg_delay_sec, clock=self.clock, **self.handler_kwargs)
+
+    def record_step(self) -> None:
+        """
+        Follows the weight of the source in the open incident and closes the incident once the
+        alarm is OK and the source has all of its weight back.
+        """
+        if self.incident is None:
+            return
+
+        source_weight = self.elbv2_client.get_weight(self.source_group_arn)
+
+        self.incident.record_weight(source_weight)
+        self.incident.record_api_calls(self.api_calls.get_calls())
+
+        if self.alarm_state == CWAlarmState.OK and source_weight >= self.initial_source_weight:
+            self.incident.end_sec = self.get_offset_sec()
+            self.incident = None
+
+        return
+
+
+def main(args: list = None) -> None:
+    parser = argparse.ArgumentParser(
+        description='Simulates load shedding over a traffic curve and reports on every incident as JSON')
+    parser.add_argument('traffic_csv', help='CSV file of offset seconds and requests per second')
+    parser.add_argument('--source-capacity', type=float, required=True,
+                        help='Requests per second the source target group serves at full utilization')
+    parser.add_argument('--secondary-capacity', type=float, action='append', required=True,
+                        help='Requests per second of a secondary target group, repeat for more secondaries')
+    parser.add_argument('--elb-shed-percent', type=int, default=5)
+    parser.add_argument('--max-elb-shed-percent', type=int, default=100)
+    parser.add_argument('--elb-restore-percent', type=int, default=5)
+    parser.add_argument('--shed-mesg-delay-sec', type=int, default=60)
+    parser.add_argument('--restore-mesg-delay-sec', type=int, default=60)
+    parser.add_argument('--alarm-threshold', type=float, default=0.8,
+                        help='Utilization of the source above which the alarm breaches')
+    parser.add_argument('--alarm-period-sec', type=int, default=60)
+    parser.add_argument('--evaluation-periods', type=int, default=1)
+    parser.add_argument('--rule-count', type=int, default=1)
+    parsed_args = parser.parse_args(args)
+
+    with open(parsed_args.traffic_csv, newline='') as traffic_csv:
+        traffic_curve = TrafficCurve.from_csv(traffic_csv)
+
+    source_group_arn = get_target_group_arn('Source')
+    capacities = {source_group_arn: parsed_args.source_capacity}
+
+    for index, secondary_capacity in enumerate(parsed_args.secondary_capacity):
+        capacities[get_target_group_arn('Secondary' + str(index + 1))] = secondary_capacity
+
+    simulator = TrafficSimulator(
+        traffic_curve, capacities, source_group_arn, parsed_args.elb_shed_percent,
+        parsed_args.max_elb_shed_percent, parsed_args.elb_restore_percent, parsed_args.shed_mesg_delay_sec,
+        parsed_args.restore_mesg_delay_sec, parsed_args.alarm_threshold, parsed_args.alarm_period_sec,
+        parsed_args.evaluation_periods, rule_count=parsed_args.rule_count)
+
+    print(json.dumps(simulator.run().to_json(), indent=2))
+
+    return
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.WARNING)
+    main()
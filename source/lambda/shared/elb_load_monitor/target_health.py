@@ -0,0 +1,51 @@
+"""
+Counts the healthy targets of target groups with DescribeTargetHealth.
+
+Counts are read once per target group and kept for the life of the counter, which is
+created per invocation, so every rule of a shed step sees the same capacity.
+"""
+from boto3 import client
+
+import logging
+import threading
+
+logger = logging.getLogger()
+
+HEALTHY_TARGET_STATES = ('healthy',)
+
+
+class TargetHealthCounter:
+    def __init__(self, elbv2_client: client) -> None:
+        self.elbv2_client = elbv2_client
+        self.describe_target_health_calls = 0
+        self._healthy_target_counts = dict()
+        self._lock = threading.Lock()
+
+    def get_healthy_target_count(self, target_group_arn: str) -> int:
+        """
+        Returns the number of healthy targets in the target group, or None if it cannot be read.
+        """
+        with self._lock:
+            if target_group_arn not in self._healthy_target_counts:
+                self._healthy_target_counts[target_group_arn] = self.describe_healthy_target_count(target_group_arn)
+
+            return self._healthy_target_counts[target_group_arn]
+
+    def describe_healthy_target_count(self, target_group_arn: str) -> int:
+        try:
+            describe_target_health_response = self.elbv2_client.describe_target_health(
+                TargetGroupArn=target_group_arn)
+            self.describe_target_health_calls += 1
+        except Exception as e:
+            logger.warning('Unable to describe target health for ' + target_group_arn + ': ' + str(e))
+
+            return None
+
+        healthy_target_count = len([
+            target_health for target_health in describe_target_health_response['TargetHealthDescriptions']
+            if target_health['TargetHealth']['State'] in HEALTHY_TARGET_STATES
+        ])
+
+        logger.debug(target_group_arn + ' has ' + str(healthy_target_count) + ' healthy targets')
+
+        return healthy_target_count
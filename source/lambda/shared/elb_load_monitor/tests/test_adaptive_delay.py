@@ -0,0 +1,64 @@
+from elb_load_monitor.adaptive_delay import AdaptiveDelay
+from elb_load_monitor.adaptive_delay import LEASE_MARGIN_SEC
+from elb_load_monitor.adaptive_delay import get_adaptive_delay
+from elb_load_monitor.alb_alarm_messages import CWAlarmState
+
+import unittest
+
+
+class TestAdaptiveDelay(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.adaptive_delay = AdaptiveDelay(min_delay_sec=10, max_delay_sec=900)
+
+    def test_rising_metric(self) -> None:
+        self.assertEqual(self.adaptive_delay.get_delay_sec(60, CWAlarmState.ALARM, True, 150.0, 100.0, 60), 10)
+
+        # a rising metric only shortens the delay while in ALARM
+        self.assertEqual(self.adaptive_delay.get_delay_sec(60, CWAlarmState.OK, True, 150.0, 100.0, 60), 60)
+
+    def test_settling(self) -> None:
+        # weights changed, the configured delay is used
+        self.assertEqual(self.adaptive_delay.get_delay_sec(60, CWAlarmState.ALARM, True, 100.0, 102.0, 10), 60)
+
+        # nothing changed, the delay grows
+        self.assertEqual(self.adaptive_delay.get_delay_sec(60, CWAlarmState.OK, False, 50.0, 50.0, 60), 120)
+        self.assertEqual(self.adaptive_delay.get_delay_sec(60, CWAlarmState.OK, False, 50.0, 50.0, 120), 240)
+        self.assertEqual(self.adaptive_delay.get_delay_sec(60, CWAlarmState.OK, False, None, None, 10), 60)
+
+    def test_insufficient_data_backoff(self) -> None:
+        delays = []
+        previous_delay_sec = None
+
+        for _ in range(6):
+            previous_delay_sec = self.adaptive_delay.get_delay_sec(
+                60, CWAlarmState.INSUFFICIENT_DATA, False, previous_delay_sec=previous_delay_sec)
+            delays.append(previous_delay_sec)
+
+        self.assertEqual(delays, [60, 120, 240, 480, 900, 900])
+
+    def test_get_adaptive_delay(self) -> None:
+        self.assertIsNone(get_adaptive_delay(False, 10, 900))
+
+        adaptive_delay = get_adaptive_delay(True, 5, 2000)
+        self.assertEqual(adaptive_delay.min_delay_sec, 5)
+        self.assertEqual(adaptive_delay.max_delay_sec, 900)
+
+    def test_get_adaptive_delay_within_lease(self) -> None:
+        # the shortest lease the stack allows must not expire while backing off
+        adaptive_delay = get_adaptive_delay(True, 10, 900, lease_duration_sec=300)
+        self.assertEqual(adaptive_delay.max_delay_sec, 240)
+
+        delays = []
+        delay_sec = None
+
+        for _ in range(6):
+            delay_sec = adaptive_delay.get_delay_sec(60, CWAlarmState.OK, False, previous_delay_sec=delay_sec)
+            delays.append(delay_sec)
+
+        self.assertEqual(delays, [60, 120, 240, 240, 240, 240])
+        self.assertTrue(all(delay_sec + LEASE_MARGIN_SEC <= 300 for delay_sec in delays))
+
+        # the default lease still caps the default maximum delay
+        self.assertEqual(get_adaptive_delay(True, 10, 900, lease_duration_sec=900).max_delay_sec, 840)
+        self.assertEqual(get_adaptive_delay(True, 10, 120, lease_duration_sec=900).max_delay_sec, 120)
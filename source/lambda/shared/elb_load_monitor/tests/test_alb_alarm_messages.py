@@ -92,3 +92,60 @@ def test_alarm_event_creation():
     assert event.alarm_event_id == 'event-123'
     assert event.alarm_name == 'test-alarm'
     assert event.cw_alarm_state == CWAlarmState.ALARM
+
+
+def test_alarm_status_message_target_group_rule_count():
+    """Test the optional rule count is only serialized when known"""
+    message = ALBAlarmStatusMessage(
+        'arn:alarm', 'test', 'arn:lb', 'arn:listener', 'arn:tg',
+        'https://sqs', 60, 120, 5, 100, 5, ALBAlarmAction.SHED
+    )
+
+    assert 'targetGroupRuleCount' not in message.to_json()
+    assert ALBAlarmStatusMessage.from_json(message.to_json()).target_group_rule_count is None
+
+    message.target_group_rule_count = 3
+
+    assert ALBAlarmStatusMessage.from_json(message.to_json()).target_group_rule_count == 3
+
+
+def test_alarm_status_message_hysteresis_state():
+    """Test the hysteresis state is only serialized when tracked"""
+    message = ALBAlarmStatusMessage(
+        'arn:alarm', 'test', 'arn:lb', 'arn:listener', 'arn:tg',
+        'https://sqs', 60, 120, 5, 100, 5, ALBAlarmAction.RESTORE
+    )
+
+    assert 'lastShedAt' not in message.to_json()
+    assert 'okEvaluations' not in message.to_json()
+
+    message.last_shed_at = 1000
+    message.ok_since = 1060
+    message.ok_evaluations = 2
+
+    parsed = ALBAlarmStatusMessage.from_json(message.to_json())
+
+    assert parsed.last_shed_at == 1000
+    assert parsed.ok_since == 1060
+    assert parsed.ok_evaluations == 2
+
+
+def test_alarm_status_message_latency_timestamps():
+    """Test the alarm and hop timestamps are only serialized when set"""
+    message = ALBAlarmStatusMessage(
+        'arn:alarm', 'test', 'arn:lb', 'arn:listener', 'arn:tg',
+        'https://sqs', 60, 120, 5, 100, 5, ALBAlarmAction.SHED
+    )
+
+    assert 'alarmAt' not in message.to_json()
+    assert 'sentAt' not in message.to_json()
+
+    message.alarm_at = 1700000000.25
+    message.sent_at = 1700000062.5
+    message.hops = 3
+
+    parsed = ALBAlarmStatusMessage.from_json(message.to_json())
+
+    assert parsed.alarm_at == 1700000000.25
+    assert parsed.sent_at == 1700000062.5
+    assert parsed.hops == 3
@@ -1,9 +1,27 @@
 import logging
+from datetime import datetime, timezone
+from elb_load_monitor.adaptive_delay import AdaptiveDelay
 from elb_load_monitor.alb_alarm_messages import ALBAlarmEvent
 from elb_load_monitor.alb_alarm_messages import ALBAlarmAction
 from elb_load_monitor.alb_alarm_messages import ALBAlarmStatusMessage
 from elb_load_monitor.alb_alarm_messages import CWAlarmState
 from elb_load_monitor.alb_listener_rules_handler import ALBListenerRulesHandler
+from elb_load_monitor.hysteresis import ShedHysteresis
+from elb_load_monitor.metric_poller import MetricPoller
+from elb_load_monitor.metrics import EMFMetrics
+from elb_load_monitor.metrics import InMemoryRecordSink
+from elb_load_monitor.rule_cache import ListenerRuleCache
+from elb_load_monitor.secondary_guard import SecondaryHealthGuard
+from elb_load_monitor.shed_budget import InMemoryShedBudgetStore
+from elb_load_monitor.shed_budget import ShedBudget
+from elb_load_monitor.shed_controller import ProportionalShedController
+from elb_load_monitor.shed_predictor import ShedPredictor
+from elb_load_monitor.shed_strategy import AIMDStepPolicy
+from elb_load_monitor.shed_strategy import EvenWeightDistribution
+from elb_load_monitor.shed_strategy import ShedStrategy
+from elb_load_monitor.rule_writer import ELBRuleWriter
+from elb_load_monitor.tracing import InMemorySpanExporter
+from elb_load_monitor.tracing import Tracer
 from unittest.mock import ANY, MagicMock
 
 import json
@@ -53,6 +71,7 @@ class TestALBListenerRulesHandler(unittest.TestCase):
         self.shed_mesg_delay_sec = 60
         self.restore_mesg_delay_sec = 120
         self.sqs_queue_url = 'test_queue_url'
+        self.clock = lambda: 1000.0
 
         return
 
@@ -66,7 +85,7 @@ class TestALBListenerRulesHandler(unittest.TestCase):
         alb_listener_rules_handler = ALBListenerRulesHandler(
             self.elbv2_client, self.load_balancer_arn, self.elb_listener_arn, self.target_group_arn,
             self.elb_shed_percent, self.max_elb_shed_percent, self.elb_restore_percent,
-            self.shed_mesg_delay_sec, self.restore_mesg_delay_sec)
+            self.shed_mesg_delay_sec, self.restore_mesg_delay_sec, clock=self.clock)
 
         alarm_action = alb_listener_rules_handler.handle_alarm(
             self.elbv2_client, sqs_client, self.sqs_queue_url, alb_alarm_event)
@@ -90,7 +109,10 @@ class TestALBListenerRulesHandler(unittest.TestCase):
             'sqsQueueURL': self.sqs_queue_url,
             'shedMesgDelaySec': self.shed_mesg_delay_sec,
             'restoreMesgDelaySec': self.restore_mesg_delay_sec,
-            'targetGroupArn': self.target_group_arn
+            'targetGroupArn': self.target_group_arn,
+            'targetGroupRuleCount': 2,
+            'sentAt': 1000.0,
+            'hops': 1
         }
 
         sqs_client.send_message.assert_called_with(
@@ -139,10 +161,10 @@ class TestALBListenerRulesHandler(unittest.TestCase):
         alb_listener_rules_handler = ALBListenerRulesHandler(
             self.elbv2_client, self.load_balancer_arn, self.elb_listener_arn, self.target_group_arn,
             self.elb_shed_percent, self.max_elb_shed_percent, self.elb_restore_percent,
-            self.shed_mesg_delay_sec, self.restore_mesg_delay_sec)
+            self.shed_mesg_delay_sec, self.restore_mesg_delay_sec, clock=self.clock)
 
-        alb_listener_rules_handler.elb_rules[0].forward_configs[self.target_group_arn] = 90
-        alb_listener_rules_handler.elb_rules[0].forward_configs[self.secondary_target_group_arn] = 10
+        alb_listener_rules_handler.elb_rules[0].add_forward_config(self.target_group_arn, 90)
+        alb_listener_rules_handler.elb_rules[0].add_forward_config(self.secondary_target_group_arn, 10)
 
         alarm_action = alb_listener_rules_handler.handle_alarm(
             self.elbv2_client, sqs_client, self.sqs_queue_url, alb_alarm_event)
@@ -166,7 +188,10 @@ class TestALBListenerRulesHandler(unittest.TestCase):
             'sqsQueueURL': self.sqs_queue_url,
             'shedMesgDelaySec': self.shed_mesg_delay_sec,
             'restoreMesgDelaySec': self.restore_mesg_delay_sec,
-            'targetGroupArn': self.target_group_arn
+            'targetGroupArn': self.target_group_arn,
+            'targetGroupRuleCount': 2,
+            'sentAt': 1000.0,
+            'hops': 1
         }
 
         sqs_client.send_message.assert_called_with(
@@ -182,10 +207,10 @@ class TestALBListenerRulesHandler(unittest.TestCase):
         alb_listener_rules_handler = ALBListenerRulesHandler(
             self.elbv2_client, self.load_balancer_arn, self.elb_listener_arn, self.target_group_arn,
             self.elb_shed_percent, self.max_elb_shed_percent, self.elb_restore_percent,
-            self.shed_mesg_delay_sec, self.restore_mesg_delay_sec)
+            self.shed_mesg_delay_sec, self.restore_mesg_delay_sec, clock=self.clock)
 
-        alb_listener_rules_handler.elb_rules[0].forward_configs[self.target_group_arn] = 90
-        alb_listener_rules_handler.elb_rules[0].forward_configs[self.secondary_target_group_arn] = 10
+        alb_listener_rules_handler.elb_rules[0].add_forward_config(self.target_group_arn, 90)
+        alb_listener_rules_handler.elb_rules[0].add_forward_config(self.secondary_target_group_arn, 10)
 
         alb_alarm_status_message = ALBAlarmStatusMessage(
             self.cw_alarm_arn, self.cw_alarm_name, self.load_balancer_arn, self.elb_listener_arn,
@@ -217,7 +242,10 @@ class TestALBListenerRulesHandler(unittest.TestCase):
             'sqsQueueURL': self.sqs_queue_url,
             'shedMesgDelaySec': self.shed_mesg_delay_sec,
             'restoreMesgDelaySec': self.restore_mesg_delay_sec,
-            'targetGroupArn': self.target_group_arn
+            'targetGroupArn': self.target_group_arn,
+            'targetGroupRuleCount': 2,
+            'sentAt': 1000.0,
+            'hops': 1
         }
 
         sqs_client.send_message.assert_called_with(
@@ -233,10 +261,10 @@ class TestALBListenerRulesHandler(unittest.TestCase):
         alb_listener_rules_handler = ALBListenerRulesHandler(
             self.elbv2_client, self.load_balancer_arn, self.elb_listener_arn, self.target_group_arn,
             self.elb_shed_percent, self.max_elb_shed_percent, self.elb_restore_percent,
-            self.shed_mesg_delay_sec, self.restore_mesg_delay_sec)
+            self.shed_mesg_delay_sec, self.restore_mesg_delay_sec, clock=self.clock)
 
-        alb_listener_rules_handler.elb_rules[0].forward_configs[self.target_group_arn] = 90
-        alb_listener_rules_handler.elb_rules[0].forward_configs[self.secondary_target_group_arn] = 10
+        alb_listener_rules_handler.elb_rules[0].add_forward_config(self.target_group_arn, 90)
+        alb_listener_rules_handler.elb_rules[0].add_forward_config(self.secondary_target_group_arn, 10)
 
         alb_alarm_status_message = ALBAlarmStatusMessage(
             self.cw_alarm_arn, self.cw_alarm_name, self.load_balancer_arn, self.elb_listener_arn,
@@ -267,7 +295,10 @@ class TestALBListenerRulesHandler(unittest.TestCase):
             'sqsQueueURL': self.sqs_queue_url,
             'shedMesgDelaySec': self.shed_mesg_delay_sec,
             'restoreMesgDelaySec': self.restore_mesg_delay_sec,
-            'targetGroupArn': self.target_group_arn
+            'targetGroupArn': self.target_group_arn,
+            'targetGroupRuleCount': 2,
+            'sentAt': 1000.0,
+            'hops': 1
         }
 
         sqs_client.send_message.assert_called_with(
@@ -283,10 +314,10 @@ class TestALBListenerRulesHandler(unittest.TestCase):
         alb_listener_rules_handler = ALBListenerRulesHandler(
             self.elbv2_client, self.load_balancer_arn, self.elb_listener_arn, self.target_group_arn,
             self.elb_shed_percent, self.max_elb_shed_percent, self.elb_restore_percent,
-            self.shed_mesg_delay_sec, self.restore_mesg_delay_sec)
+            self.shed_mesg_delay_sec, self.restore_mesg_delay_sec, clock=self.clock)
 
-        alb_listener_rules_handler.elb_rules[0].forward_configs[self.target_group_arn] = 80
-        alb_listener_rules_handler.elb_rules[0].forward_configs[self.secondary_target_group_arn] = 20
+        alb_listener_rules_handler.elb_rules[0].add_forward_config(self.target_group_arn, 80)
+        alb_listener_rules_handler.elb_rules[0].add_forward_config(self.secondary_target_group_arn, 20)
 
         alb_alarm_status_message = ALBAlarmStatusMessage(
             self.cw_alarm_arn, self.cw_alarm_name, self.load_balancer_arn, self.elb_listener_arn,
@@ -318,7 +349,10 @@ class TestALBListenerRulesHandler(unittest.TestCase):
             'sqsQueueURL': self.sqs_queue_url,
             'shedMesgDelaySec': self.shed_mesg_delay_sec,
             'restoreMesgDelaySec': self.restore_mesg_delay_sec,
-            'targetGroupArn': self.target_group_arn
+            'targetGroupArn': self.target_group_arn,
+            'targetGroupRuleCount': 2,
+            'sentAt': 1000.0,
+            'hops': 1
         }
 
         sqs_client.send_message.assert_called_with(
@@ -334,10 +368,10 @@ class TestALBListenerRulesHandler(unittest.TestCase):
         alb_listener_rules_handler = ALBListenerRulesHandler(
             self.elbv2_client, self.load_balancer_arn, self.elb_listener_arn, self.target_group_arn,
             self.elb_shed_percent, self.max_elb_shed_percent, self.elb_restore_percent,
-            self.shed_mesg_delay_sec, self.restore_mesg_delay_sec)
+            self.shed_mesg_delay_sec, self.restore_mesg_delay_sec, clock=self.clock)
 
-        alb_listener_rules_handler.elb_rules[0].forward_configs[self.target_group_arn] = 80
-        alb_listener_rules_handler.elb_rules[0].forward_configs[self.secondary_target_group_arn] = 20
+        alb_listener_rules_handler.elb_rules[0].add_forward_config(self.target_group_arn, 80)
+        alb_listener_rules_handler.elb_rules[0].add_forward_config(self.secondary_target_group_arn, 20)
 
         alb_alarm_status_message = ALBAlarmStatusMessage(
             self.cw_alarm_arn, self.cw_alarm_name, self.load_balancer_arn, self.elb_listener_arn,
@@ -368,7 +402,10 @@ class TestALBListenerRulesHandler(unittest.TestCase):
             'sqsQueueURL': self.sqs_queue_url,
             'shedMesgDelaySec': self.shed_mesg_delay_sec,
             'restoreMesgDelaySec': self.restore_mesg_delay_sec,
-            'targetGroupArn': self.target_group_arn
+            'targetGroupArn': self.target_group_arn,
+            'targetGroupRuleCount': 2,
+            'sentAt': 1000.0,
+            'hops': 1
         }
 
         sqs_client.send_message.assert_called_with(
@@ -387,8 +424,8 @@ class TestALBListenerRulesHandler(unittest.TestCase):
             self.elb_shed_percent, self.max_elb_shed_percent, self.elb_restore_percent,
             self.shed_mesg_delay_sec, self.restore_mesg_delay_sec)
 
-        alb_listener_rules_handler.elb_rules[0].forward_configs[self.target_group_arn] = 90
-        alb_listener_rules_handler.elb_rules[0].forward_configs[self.secondary_target_group_arn] = 10
+        alb_listener_rules_handler.elb_rules[0].add_forward_config(self.target_group_arn, 90)
+        alb_listener_rules_handler.elb_rules[0].add_forward_config(self.secondary_target_group_arn, 10)
 
         alb_alarm_status_message = ALBAlarmStatusMessage(
             self.cw_alarm_arn, self.cw_alarm_name, self.load_balancer_arn, self.elb_listener_arn,
@@ -411,3 +448,958 @@ class TestALBListenerRulesHandler(unittest.TestCase):
         sqs_client.send_message.assert_not_called()
 
         return
+
+    def test_shed_skips_unchanged_rules(self) -> None:
+        # only the rules forwarding to the target group are written, and only those count as skipped
+        describe_rules_response = self.elbv2_client.describe_rules.return_value
+        describe_rules_response['Rules'][1]['Actions'][0]['ForwardConfig']['TargetGroups'] = [
+            {'TargetGroupArn': self.secondary_target_group_arn, 'Weight': 100}
+        ]
+
+        alb_listener_rules_handler = ALBListenerRulesHandler(
+            self.elbv2_client, self.load_balancer_arn, self.elb_listener_arn, self.target_group_arn,
+            self.elb_shed_percent, self.max_elb_shed_percent, self.elb_restore_percent,
+            self.shed_mesg_delay_sec, self.restore_mesg_delay_sec)
+
+        alb_listener_rules_handler.shed(
+            self.elbv2_client, self.target_group_arn, self.elb_shed_percent, self.max_elb_shed_percent)
+
+        self.assertEqual(alb_listener_rules_handler.rule_writes, 1)
+        self.assertEqual(alb_listener_rules_handler.rule_writes_skipped, 0)
+        self.elbv2_client.modify_rule.assert_called_once_with(
+            RuleArn=self.elb_listener_rule_arn, Actions=ANY)
+        self.elbv2_client.modify_listener.assert_not_called()
+
+        # the first rule is unchanged after a no-op restore
+        alb_listener_rules_handler.elb_rules[0].add_forward_config(self.target_group_arn, 80)
+        alb_listener_rules_handler.restore(self.elbv2_client, self.target_group_arn, 0)
+
+        self.assertEqual(alb_listener_rules_handler.rule_writes, 1)
+        self.assertEqual(alb_listener_rules_handler.rule_writes_skipped, 1)
+        self.assertEqual(alb_listener_rules_handler.rule_write_failures, 0)
+
+        return
+
+    def test_target_group_rules_index(self) -> None:
+        # rules that do not forward to the target group are never evaluated or modified
+        describe_rules_response = self.elbv2_client.describe_rules.return_value
+        describe_rules_response['Rules'][1]['Actions'][0]['ForwardConfig']['TargetGroups'] = [
+            {'TargetGroupArn': self.secondary_target_group_arn, 'Weight': 100}
+        ]
+
+        alb_listener_rules_handler = ALBListenerRulesHandler(
+            self.elbv2_client, self.load_balancer_arn, self.elb_listener_arn, self.target_group_arn,
+            self.elb_shed_percent, self.max_elb_shed_percent, self.elb_restore_percent,
+            self.shed_mesg_delay_sec, self.restore_mesg_delay_sec)
+
+        elb_rules = alb_listener_rules_handler.get_elb_rules()
+
+        self.assertEqual(
+            alb_listener_rules_handler.get_target_group_rules(self.target_group_arn), [elb_rules[0]])
+        self.assertEqual(
+            alb_listener_rules_handler.get_target_group_rules(self.secondary_target_group_arn), elb_rules)
+        self.assertEqual(alb_listener_rules_handler.get_target_group_rules('unknown'), [])
+
+        self.assertTrue(alb_listener_rules_handler.is_sheddable(self.target_group_arn, self.max_elb_shed_percent))
+        self.assertFalse(alb_listener_rules_handler.is_restorable(self.target_group_arn))
+
+        alb_listener_rules_handler.shed(
+            self.elbv2_client, self.target_group_arn, self.elb_shed_percent, self.max_elb_shed_percent)
+
+        self.assertEqual(elb_rules[1].forward_configs, {self.secondary_target_group_arn: 100})
+        self.assertTrue(alb_listener_rules_handler.is_restorable(self.target_group_arn))
+
+        return
+
+    def test_describe_rules_pagination(self) -> None:
+        # every page is read when the number of rules for the target group is unknown
+        rules = self.elbv2_client.describe_rules.return_value['Rules']
+        self.elbv2_client.describe_rules = MagicMock(side_effect=[
+            {'Rules': [rules[0]], 'NextMarker': 'page2'},
+            {'Rules': [rules[1]]}
+        ])
+
+        alb_listener_rules_handler = ALBListenerRulesHandler(
+            self.elbv2_client, self.load_balancer_arn, self.elb_listener_arn, self.target_group_arn,
+            self.elb_shed_percent, self.max_elb_shed_percent, self.elb_restore_percent,
+            self.shed_mesg_delay_sec, self.restore_mesg_delay_sec, describe_rules_page_size=1)
+
+        self.assertEqual(len(alb_listener_rules_handler.elb_rules), 2)
+        self.assertEqual(alb_listener_rules_handler.describe_rules_calls, 2)
+        self.assertTrue(alb_listener_rules_handler.elb_rules_complete)
+        self.assertEqual(alb_listener_rules_handler.get_target_group_rule_count(), 2)
+        self.elbv2_client.describe_rules.assert_any_call(ListenerArn=self.elb_listener_arn, PageSize=1)
+        self.elbv2_client.describe_rules.assert_called_with(
+            ListenerArn=self.elb_listener_arn, PageSize=1, Marker='page2')
+
+        return
+
+    def test_describe_rules_stops_early(self) -> None:
+        # stop reading pages once every rule forwarding to the target group has been found
+        rules = self.elbv2_client.describe_rules.return_value['Rules']
+        self.elbv2_client.describe_rules = MagicMock(side_effect=[
+            {'Rules': [rules[0]], 'NextMarker': 'page2'},
+            {'Rules': [rules[1]]}
+        ])
+
+        alb_listener_rules_handler = ALBListenerRulesHandler(
+            self.elbv2_client, self.load_balancer_arn, self.elb_listener_arn, self.target_group_arn,
+            self.elb_shed_percent, self.max_elb_shed_percent, self.elb_restore_percent,
+            self.shed_mesg_delay_sec, self.restore_mesg_delay_sec, describe_rules_page_size=1,
+            target_group_rule_count=1)
+
+        self.assertEqual(len(alb_listener_rules_handler.elb_rules), 1)
+        self.assertEqual(alb_listener_rules_handler.describe_rules_calls, 1)
+        self.assertFalse(alb_listener_rules_handler.elb_rules_complete)
+        self.elbv2_client.describe_rules.assert_called_once()
+
+        return
+
+    def test_handle_alarm_ok_does_not_read_rules(self) -> None:
+        # the OK path only queues a RESTORE message and must not call DescribeRules
+        alb_alarm_event = ALBAlarmEvent(
+            alarm_event_id='some_id', alarm_arn=self.cw_alarm_arn,
+            alarm_name=self.cw_alarm_name, cw_alarm_state=CWAlarmState.OK)
+
+        sqs_client = MagicMock()
+
+        alb_listener_rules_handler = ALBListenerRulesHandler(
+            self.elbv2_client, self.load_balancer_arn, self.elb_listener_arn, self.target_group_arn,
+            self.elb_shed_percent, self.max_elb_shed_percent, self.elb_restore_percent,
+            self.shed_mesg_delay_sec, self.restore_mesg_delay_sec)
+
+        alarm_action = alb_listener_rules_handler.handle_alarm(
+            self.elbv2_client, sqs_client, self.sqs_queue_url, alb_alarm_event)
+
+        self.assertEqual(alarm_action, ALBAlarmAction.RESTORE)
+        self.elbv2_client.describe_rules.assert_not_called()
+        sqs_client.send_message.assert_called_once()
+
+        # rules are read on first access
+        self.assertEqual(len(alb_listener_rules_handler.elb_rules), 2)
+        self.elbv2_client.describe_rules.assert_called_once()
+
+        return
+
+    def test_handle_alarm_status_message_insufficient_data_does_not_read_rules(self) -> None:
+        cw_client = MagicMock()
+        cw_client.describe_alarms.return_value = {'MetricAlarms': [{'AlarmName': self.cw_alarm_name, 'StateValue': 'INSUFFICIENT_DATA'}]}
+        sqs_client = MagicMock()
+
+        alb_listener_rules_handler = ALBListenerRulesHandler(
+            self.elbv2_client, self.load_balancer_arn, self.elb_listener_arn, self.target_group_arn,
+            self.elb_shed_percent, self.max_elb_shed_percent, self.elb_restore_percent,
+            self.shed_mesg_delay_sec, self.restore_mesg_delay_sec, target_group_rule_count=2)
+
+        alb_alarm_status_message = ALBAlarmStatusMessage(
+            self.cw_alarm_arn, self.cw_alarm_name, self.load_balancer_arn, self.elb_listener_arn,
+            self.target_group_arn, self.sqs_queue_url, self.shed_mesg_delay_sec, self.restore_mesg_delay_sec,
+            self.elb_shed_percent, self.max_elb_shed_percent, self.elb_restore_percent, ALBAlarmAction.SHED
+        )
+
+        alarm_action = alb_listener_rules_handler.handle_alarm_status_message(
+            cw_client, self.elbv2_client, sqs_client, alb_alarm_status_message)
+
+        self.assertEqual(alarm_action, ALBAlarmAction.SHED)
+        self.elbv2_client.describe_rules.assert_not_called()
+
+        # the rule count hint is passed on to the next step
+        message_body = json.loads(sqs_client.send_message.call_args.kwargs['MessageBody'])
+        self.assertEqual(message_body['targetGroupRuleCount'], 2)
+
+        return
+
+    def test_rule_cache_reused_after_write(self) -> None:
+        # a warm invocation reuses the cached rules, including the weights written in the last step
+        rule_cache = ListenerRuleCache(ttl_sec=300, validate=False)
+
+        alb_listener_rules_handler = ALBListenerRulesHandler(
+            self.elbv2_client, self.load_balancer_arn, self.elb_listener_arn, self.target_group_arn,
+            self.elb_shed_percent, self.max_elb_shed_percent, self.elb_restore_percent,
+            self.shed_mesg_delay_sec, self.restore_mesg_delay_sec, rule_cache=rule_cache)
+
+        alb_listener_rules_handler.shed(
+            self.elbv2_client, self.target_group_arn, self.elb_shed_percent, self.max_elb_shed_percent)
+
+        self.assertFalse(alb_listener_rules_handler.rule_cache_hit)
+
+        alb_listener_rules_handler = ALBListenerRulesHandler(
+            self.elbv2_client, self.load_balancer_arn, self.elb_listener_arn, self.target_group_arn,
+            self.elb_shed_percent, self.max_elb_shed_percent, self.elb_restore_percent,
+            self.shed_mesg_delay_sec, self.restore_mesg_delay_sec, rule_cache=rule_cache)
+
+        self.assertEqual(
+            alb_listener_rules_handler.elb_rules[0].forward_configs.get(self.target_group_arn), 80)
+        self.assertEqual(
+            alb_listener_rules_handler.elb_rules[1].forward_configs.get(self.target_group_arn), 80)
+        self.assertTrue(alb_listener_rules_handler.rule_cache_hit)
+        self.assertEqual(alb_listener_rules_handler.describe_rules_calls, 0)
+        self.elbv2_client.describe_rules.assert_called_once()
+
+        return
+
+    def test_rule_cache_validation(self) -> None:
+        rule_cache = ListenerRuleCache(ttl_sec=300, validate=True)
+        rules = self.elbv2_client.describe_rules.return_value['Rules']
+
+        alb_listener_rules_handler = ALBListenerRulesHandler(
+            self.elbv2_client, self.load_balancer_arn, self.elb_listener_arn, self.target_group_arn,
+            self.elb_shed_percent, self.max_elb_shed_percent, self.elb_restore_percent,
+            self.shed_mesg_delay_sec, self.restore_mesg_delay_sec, rule_cache=rule_cache)
+        alb_listener_rules_handler.get_elb_rules()
+
+        # the validation read only asks for the rules forwarding to the target group
+        alb_listener_rules_handler = ALBListenerRulesHandler(
+            self.elbv2_client, self.load_balancer_arn, self.elb_listener_arn, self.target_group_arn,
+            self.elb_shed_percent, self.max_elb_shed_percent, self.elb_restore_percent,
+            self.shed_mesg_delay_sec, self.restore_mesg_delay_sec, rule_cache=rule_cache)
+        alb_listener_rules_handler.get_elb_rules()
+
+        self.assertTrue(alb_listener_rules_handler.rule_cache_hit)
+        self.elbv2_client.describe_rules.assert_called_with(
+            RuleArns=[rule['RuleArn'] for rule in rules])
+
+        # weights changed outside of the tool invalidate the cache
+        changed_response = json.loads(json.dumps(self.elbv2_client.describe_rules.return_value))
+        changed_response['Rules'][0]['Actions'][0]['ForwardConfig']['TargetGroups'][1]['Weight'] = 50
+        changed_response['Rules'][0]['Actions'][0]['ForwardConfig']['TargetGroups'][0]['Weight'] = 50
+        self.elbv2_client.describe_rules.return_value = changed_response
+
+        alb_listener_rules_handler = ALBListenerRulesHandler(
+            self.elbv2_client, self.load_balancer_arn, self.elb_listener_arn, self.target_group_arn,
+            self.elb_shed_percent, self.max_elb_shed_percent, self.elb_restore_percent,
+            self.shed_mesg_delay_sec, self.restore_mesg_delay_sec, rule_cache=rule_cache)
+
+        self.assertEqual(
+            alb_listener_rules_handler.elb_rules[0].forward_configs.get(self.target_group_arn), 50)
+        self.assertFalse(alb_listener_rules_handler.rule_cache_hit)
+        self.elbv2_client.describe_rules.assert_called_with(ListenerArn=self.elb_listener_arn)
+
+        return
+
+    def test_handle_alarm_folds_into_running_control_loop(self) -> None:
+        control_lease = MagicMock()
+        control_lease.acquire.return_value = False
+        sqs_client = MagicMock()
+
+        alb_alarm_event = ALBAlarmEvent(
+            alarm_event_id='some_id', alarm_arn=self.cw_alarm_arn,
+            alarm_name=self.cw_alarm_name, cw_alarm_state=CWAlarmState.ALARM)
+
+        alb_listener_rules_handler = ALBListenerRulesHandler(
+            self.elbv2_client, self.load_balancer_arn, self.elb_listener_arn, self.target_group_arn,
+            self.elb_shed_percent, self.max_elb_shed_percent, self.elb_restore_percent,
+            self.shed_mesg_delay_sec, self.restore_mesg_delay_sec, control_lease=control_lease)
+
+        alarm_action = alb_listener_rules_handler.handle_alarm(
+            self.elbv2_client, sqs_client, self.sqs_queue_url, alb_alarm_event)
+
+        # the running loop picks up the new alarm state, nothing is shed or queued
+        self.assertEqual(alarm_action, ALBAlarmAction.NONE)
+        control_lease.fold.assert_called_once_with(self.target_group_arn + '#' + self.cw_alarm_name, 'ALARM')
+        self.elbv2_client.describe_rules.assert_not_called()
+        self.elbv2_client.modify_rule.assert_not_called()
+        sqs_client.send_message.assert_not_called()
+
+        return
+
+    def test_handle_alarm_status_message_control_lease(self) -> None:
+        control_lease = MagicMock()
+        control_lease.acquire.return_value = True
+        sqs_client = MagicMock()
+
+        alb_listener_rules_handler = ALBListenerRulesHandler(
+            self.elbv2_client, self.load_balancer_arn, self.elb_listener_arn, self.target_group_arn,
+            self.elb_shed_percent, self.max_elb_shed_percent, self.elb_restore_percent,
+            self.shed_mesg_delay_sec, self.restore_mesg_delay_sec, control_lease=control_lease)
+
+        alb_alarm_status_message = ALBAlarmStatusMessage(
+            self.cw_alarm_arn, self.cw_alarm_name, self.load_balancer_arn, self.elb_listener_arn,
+            self.target_group_arn, self.sqs_queue_url, self.shed_mesg_delay_sec, self.restore_mesg_delay_sec,
+            self.elb_shed_percent, self.max_elb_shed_percent, self.elb_restore_percent, ALBAlarmAction.SHED,
+            chain_id='chain1'
+        )
+
+        alarm_action = alb_listener_rules_handler.handle_alarm_status_message(
+            self.cw_client_in_alarm, self.elbv2_client, sqs_client, alb_alarm_status_message)
+
+        # the chain renews its lease and passes its id on to the next step
+        self.assertEqual(alarm_action, ALBAlarmAction.SHED)
+        control_lease.acquire.assert_called_once_with(self.target_group_arn + '#' + self.cw_alarm_name, 'chain1')
+        control_lease.release.assert_not_called()
+        message_body = json.loads(sqs_client.send_message.call_args.kwargs['MessageBody'])
+        self.assertEqual(message_body['chainId'], 'chain1')
+
+        # the chain ends when there is nothing left to restore and releases its lease
+        alb_alarm_status_message.alb_alarm_action = ALBAlarmAction.RESTORE
+        alb_alarm_status_message.elb_restore_percent = 100
+
+        alarm_action = alb_listener_rules_handler.handle_alarm_status_message(
+            self.cw_client_ok, self.elbv2_client, sqs_client, alb_alarm_status_message)
+
+        self.assertEqual(alarm_action, ALBAlarmAction.NONE)
+        control_lease.release.assert_called_once_with(self.target_group_arn + '#' + self.cw_alarm_name, 'chain1')
+
+        # a chain that lost its lease ends without reading the alarm
+        control_lease.acquire.return_value = False
+        cw_client = MagicMock()
+
+        alarm_action = alb_listener_rules_handler.handle_alarm_status_message(
+            cw_client, self.elbv2_client, sqs_client, alb_alarm_status_message)
+
+        self.assertEqual(alarm_action, ALBAlarmAction.NONE)
+        cw_client.describe_alarms.assert_not_called()
+        self.assertEqual(sqs_client.send_message.call_count, 1)
+
+        return
+
+    def test_handle_alarm_status_message_folded_alarm(self) -> None:
+        control_lease = MagicMock()
+        control_lease.acquire.return_value = True
+        control_lease.get_folded_state.return_value = None
+        sqs_client = MagicMock()
+
+        alb_listener_rules_handler = ALBListenerRulesHandler(
+            self.elbv2_client, self.load_balancer_arn, self.elb_listener_arn, self.target_group_arn,
+            self.elb_shed_percent, self.max_elb_shed_percent, self.elb_restore_percent,
+            self.shed_mesg_delay_sec, self.restore_mesg_delay_sec, control_lease=control_lease)
+
+        alb_alarm_status_message = ALBAlarmStatusMessage(
+            self.cw_alarm_arn, self.cw_alarm_name, self.load_balancer_arn, self.elb_listener_arn,
+            self.target_group_arn, self.sqs_queue_url, self.shed_mesg_delay_sec, self.restore_mesg_delay_sec,
+            self.elb_shed_percent, self.max_elb_shed_percent, self.elb_restore_percent, ALBAlarmAction.RESTORE,
+            chain_id='chain1'
+        )
+
+        # a restore chain that finds the alarm firing switches to shedding on its next step
+        alarm_action = alb_listener_rules_handler.handle_alarm_status_message(
+            self.cw_client_in_alarm, self.elbv2_client, sqs_client, alb_alarm_status_message)
+
+        self.assertEqual(alarm_action, ALBAlarmAction.SHED)
+        self.elbv2_client.modify_rule.assert_not_called()
+
+        # with the ALARM event folded into it, it sheds right away
+        control_lease.get_folded_state.return_value = 'ALARM'
+
+        alarm_action = alb_listener_rules_handler.handle_alarm_status_message(
+            self.cw_client_in_alarm, self.elbv2_client, sqs_client, alb_alarm_status_message)
+
+        self.assertEqual(alarm_action, ALBAlarmAction.SHED)
+        control_lease.get_folded_state.assert_called_with(self.target_group_arn + '#' + self.cw_alarm_name)
+        self.elbv2_client.modify_rule.assert_called()
+
+        for elb_rule in alb_listener_rules_handler.get_elb_rules():
+            self.assertEqual(elb_rule.forward_configs.get(self.target_group_arn), 100 - self.elb_shed_percent)
+
+        return
+
+    def test_handle_alarm_status_message_proportional_shed(self) -> None:
+        # the alarm metric is at twice its threshold, the controller aims for 90% of it
+        self.cw_client_in_alarm.get_metric_data.return_value = {
+            'MetricDataResults': [{'Id': 'm0', 'Values': [2.0]}]
+        }
+        sqs_client = MagicMock()
+
+        alb_listener_rules_handler = ALBListenerRulesHandler(
+            self.elbv2_client, self.load_balancer_arn, self.elb_listener_arn, self.target_group_arn,
+            self.elb_shed_percent, 50, self.elb_restore_percent,
+            self.shed_mesg_delay_sec, self.restore_mesg_delay_sec,
+            shed_controller=ProportionalShedController(target_utilization=0.9))
+
+        alb_alarm_status_message = ALBAlarmStatusMessage(
+            self.cw_alarm_arn, self.cw_alarm_name, self.load_balancer_arn, self.elb_listener_arn,
+            self.target_group_arn, self.sqs_queue_url, self.shed_mesg_delay_sec, self.restore_mesg_delay_sec,
+            self.elb_shed_percent, 50, self.elb_restore_percent, ALBAlarmAction.SHED
+        )
+
+        alarm_action = alb_listener_rules_handler.handle_alarm_status_message(
+            self.cw_client_in_alarm, self.elbv2_client, sqs_client, alb_alarm_status_message)
+
+        # 55 is needed but the step is bounded by maxElbShedPercent, reached in one step
+        self.assertEqual(alarm_action, ALBAlarmAction.NONE)
+
+        for elb_rule in alb_listener_rules_handler.get_elb_rules():
+            self.assertEqual(elb_rule.forward_configs.get(self.target_group_arn), 50)
+            self.assertEqual(elb_rule.forward_configs.get(self.secondary_target_group_arn), 50)
+
+        self.cw_client_in_alarm.describe_alarms.assert_called_once()
+        self.cw_client_in_alarm.get_metric_data.assert_called_once()
+
+        return
+
+    def test_handle_alarm_status_message_proportional_shed_after_shed(self) -> None:
+        # the newest complete period of the alarm metric, at twice its threshold, started at 940
+        self.cw_client_in_alarm.get_metric_data.return_value = {
+            'MetricDataResults': [{
+                'Id': 'm0', 'Values': [2.0], 'Timestamps': [datetime.fromtimestamp(940, timezone.utc)]
+            }]
+        }
+
+        for last_shed_at, source_weight in ((900, 50), (960, 80)):
+            sqs_client = MagicMock()
+
+            alb_listener_rules_handler = ALBListenerRulesHandler(
+                self.elbv2_client, self.load_balancer_arn, self.elb_listener_arn, self.target_group_arn,
+                self.elb_shed_percent, 50, self.elb_restore_percent,
+                self.shed_mesg_delay_sec, self.restore_mesg_delay_sec,
+                shed_controller=ProportionalShedController(target_utilization=0.9), clock=lambda: 1000)
+
+            alb_alarm_status_message = ALBAlarmStatusMessage(
+                self.cw_alarm_arn, self.cw_alarm_name, self.load_balancer_arn, self.elb_listener_arn,
+                self.target_group_arn, self.sqs_queue_url, self.shed_mesg_delay_sec, self.restore_mesg_delay_sec,
+                self.elb_shed_percent, 50, self.elb_restore_percent, ALBAlarmAction.SHED, last_shed_at=last_shed_at
+            )
+
+            alb_listener_rules_handler.handle_alarm_status_message(
+                self.cw_client_in_alarm, self.elbv2_client, sqs_client, alb_alarm_status_message)
+
+            # a datapoint from before the last shed step does not show that step yet, the fixed
+            # step is shed instead of sizing the same excess again
+            for elb_rule in alb_listener_rules_handler.get_elb_rules():
+                self.assertEqual(elb_rule.forward_configs.get(self.target_group_arn), source_weight)
+
+        # the next step knows when this one shed
+        message_body = json.loads(sqs_client.send_message.call_args.kwargs['MessageBody'])
+        self.assertEqual(message_body['lastShedAt'], 1000)
+
+        return
+
+    def test_handle_alarm_proportional_shed_falls_back_to_fixed_step(self) -> None:
+        cw_client = MagicMock()
+        cw_client.describe_alarms.side_effect = Exception('throttled')
+        sqs_client = MagicMock()
+
+        alb_alarm_event = ALBAlarmEvent(
+            alarm_event_id='some_id', alarm_arn=self.cw_alarm_arn,
+            alarm_name=self.cw_alarm_name, cw_alarm_state=CWAlarmState.ALARM)
+
+        alb_listener_rules_handler = ALBListenerRulesHandler(
+            self.elbv2_client, self.load_balancer_arn, self.elb_listener_arn, self.target_group_arn,
+            self.elb_shed_percent, self.max_elb_shed_percent, self.elb_restore_percent,
+            self.shed_mesg_delay_sec, self.restore_mesg_delay_sec,
+            shed_controller=ProportionalShedController())
+
+        alarm_action = alb_listener_rules_handler.handle_alarm(
+            self.elbv2_client, sqs_client, self.sqs_queue_url, alb_alarm_event, cw_client)
+
+        self.assertEqual(alarm_action, ALBAlarmAction.SHED)
+
+        for elb_rule in alb_listener_rules_handler.get_elb_rules():
+            self.assertEqual(elb_rule.forward_configs.get(self.target_group_arn), 80)
+
+        return
+
+    def test_handle_alarm_status_message_restore_hysteresis(self) -> None:
+        # the rules have 20% shed and the alarm has to be OK twice in a row before restoring
+        self.elbv2_client.describe_rules.return_value['Rules'][0]['Actions'][0]['ForwardConfig']['TargetGroups'][0]['Weight'] = 20
+        self.elbv2_client.describe_rules.return_value['Rules'][0]['Actions'][0]['ForwardConfig']['TargetGroups'][1]['Weight'] = 80
+        sqs_client = MagicMock()
+
+        alb_alarm_status_message = ALBAlarmStatusMessage(
+            self.cw_alarm_arn, self.cw_alarm_name, self.load_balancer_arn, self.elb_listener_arn,
+            self.target_group_arn, self.sqs_queue_url, self.shed_mesg_delay_sec, self.restore_mesg_delay_sec,
+            self.elb_shed_percent, self.max_elb_shed_percent, self.elb_restore_percent, ALBAlarmAction.RESTORE,
+            last_shed_at=0
+        )
+
+        for ok_evaluations, primary_weight in ((1, 80), (2, 90)):
+            alb_listener_rules_handler = ALBListenerRulesHandler(
+                self.elbv2_client, self.load_balancer_arn, self.elb_listener_arn, self.target_group_arn,
+                self.elb_shed_percent, self.max_elb_shed_percent, self.elb_restore_percent,
+                self.shed_mesg_delay_sec, self.restore_mesg_delay_sec,
+                hysteresis=ShedHysteresis(restore_ok_evaluations=2))
+
+            alarm_action = alb_listener_rules_handler.handle_alarm_status_message(
+                self.cw_client_ok, self.elbv2_client, sqs_client, alb_alarm_status_message)
+
+            self.assertEqual(alarm_action, ALBAlarmAction.RESTORE)
+            self.assertEqual(
+                alb_listener_rules_handler.get_elb_rules()[0].forward_configs.get(self.target_group_arn),
+                primary_weight)
+
+            message_body = json.loads(sqs_client.send_message.call_args.kwargs['MessageBody'])
+            self.assertEqual(message_body['okEvaluations'], ok_evaluations)
+            self.assertEqual(message_body['lastShedAt'], 0)
+
+            alb_alarm_status_message = ALBAlarmStatusMessage.from_json(message_body)
+
+        # the first step only counts the OK evaluation
+        self.assertEqual(self.elbv2_client.modify_rule.call_count, 1)
+
+        return
+
+    def test_handle_alarm_status_message_adaptive_delay(self) -> None:
+        self.cw_client_in_alarm.get_metric_data.return_value = {
+            'MetricDataResults': [{'Id': 'm0', 'Values': [3.0]}]
+        }
+        sqs_client = MagicMock()
+
+        alb_listener_rules_handler = ALBListenerRulesHandler(
+            self.elbv2_client, self.load_balancer_arn, self.elb_listener_arn, self.target_group_arn,
+            self.elb_shed_percent, self.max_elb_shed_percent, self.elb_restore_percent,
+            self.shed_mesg_delay_sec, self.restore_mesg_delay_sec, adaptive_delay=AdaptiveDelay(min_delay_sec=10))
+
+        alb_alarm_status_message = ALBAlarmStatusMessage(
+            self.cw_alarm_arn, self.cw_alarm_name, self.load_balancer_arn, self.elb_listener_arn,
+            self.target_group_arn, self.sqs_queue_url, self.shed_mesg_delay_sec, self.restore_mesg_delay_sec,
+            self.elb_shed_percent, self.max_elb_shed_percent, self.elb_restore_percent, ALBAlarmAction.SHED,
+            delay_sec=60, metric_value=2.0
+        )
+
+        alb_listener_rules_handler.handle_alarm_status_message(
+            self.cw_client_in_alarm, self.elbv2_client, sqs_client, alb_alarm_status_message)
+
+        # the metric is still rising, the next evaluation is brought forward
+        self.assertEqual(sqs_client.send_message.call_args.kwargs['DelaySeconds'], 10)
+        message_body = json.loads(sqs_client.send_message.call_args.kwargs['MessageBody'])
+        self.assertEqual(message_body['delaySec'], 10)
+        self.assertEqual(message_body['metricValue'], 3.0)
+
+        # the metric is compared over complete periods, the read ends where the period in progress starts
+        get_metric_data_args = self.cw_client_in_alarm.get_metric_data.call_args.kwargs
+        self.assertEqual(get_metric_data_args['EndTime'].timestamp() % 60, 0)
+
+        # insufficient data backs off from the previous delay without reading the metric
+        cw_client = MagicMock()
+        cw_client.describe_alarms.return_value = {
+            'MetricAlarms': [{'AlarmName': self.cw_alarm_name, 'StateValue': 'INSUFFICIENT_DATA'}]}
+        alb_alarm_status_message.delay_sec = 240
+
+        alb_listener_rules_handler.handle_alarm_status_message(
+            cw_client, self.elbv2_client, sqs_client, alb_alarm_status_message)
+
+        self.assertEqual(sqs_client.send_message.call_args.kwargs['DelaySeconds'], 480)
+        cw_client.get_metric_data.assert_not_called()
+
+        return
+
+    def test_handle_alarm_status_message_polled_alarm_state(self) -> None:
+        self.cw_client_ok.get_metric_data.return_value = {
+            'MetricDataResults': [{'Id': 'm0', 'Values': [2.0, 1.5, 1.2]}]
+        }
+        sqs_client = MagicMock()
+
+        alb_listener_rules_handler = ALBListenerRulesHandler(
+            self.elbv2_client, self.load_balancer_arn, self.elb_listener_arn, self.target_group_arn,
+            self.elb_shed_percent, self.max_elb_shed_percent, self.elb_restore_percent,
+            self.shed_mesg_delay_sec, self.restore_mesg_delay_sec,
+            metric_poller=MetricPoller(poll_period_sec=10, evaluation_periods=3))
+
+        alb_alarm_status_message = ALBAlarmStatusMessage(
+            self.cw_alarm_arn, self.cw_alarm_name, self.load_balancer_arn, self.elb_listener_arn,
+            self.target_group_arn, self.sqs_queue_url, self.shed_mesg_delay_sec, self.restore_mesg_delay_sec,
+            self.elb_shed_percent, self.max_elb_shed_percent, self.elb_restore_percent, ALBAlarmAction.SHED
+        )
+
+        # the alarm is still OK but the last three 10 second datapoints breach its threshold
+        alb_alarm_action = alb_listener_rules_handler.handle_alarm_status_message(
+            self.cw_client_ok, self.elbv2_client, sqs_client, alb_alarm_status_message)
+
+        self.assertEqual(alb_alarm_action, ALBAlarmAction.SHED)
+        self.assertEqual(
+            self.cw_client_ok.get_metric_data.call_args.kwargs['MetricDataQueries'][0]['MetricStat']['Period'], 10)
+
+        # without enough datapoints the alarm state is used
+        self.cw_client_ok.get_metric_data.return_value = {
+            'MetricDataResults': [{'Id': 'm0', 'Values': [2.0]}]
+        }
+
+        alb_alarm_action = alb_listener_rules_handler.handle_alarm_status_message(
+            self.cw_client_ok, self.elbv2_client, sqs_client, alb_alarm_status_message)
+
+        self.assertEqual(alb_alarm_action, ALBAlarmAction.RESTORE)
+
+        return
+
+    def test_handle_predicted_breach(self) -> None:
+        sqs_client = MagicMock()
+
+        alb_listener_rules_handler = ALBListenerRulesHandler(
+            self.elbv2_client, self.load_balancer_arn, self.elb_listener_arn, self.target_group_arn,
+            self.elb_shed_percent, self.max_elb_shed_percent, self.elb_restore_percent,
+            self.shed_mesg_delay_sec, self.restore_mesg_delay_sec, shed_predictor=ShedPredictor(pre_shed_percent=5))
+
+        alb_alarm_event = ALBAlarmEvent('event_id', self.cw_alarm_arn, self.cw_alarm_name, CWAlarmState.OK)
+
+        alarm_action = alb_listener_rules_handler.handle_predicted_breach(
+            self.elbv2_client, sqs_client, self.sqs_queue_url, alb_alarm_event)
+
+        self.assertEqual(alarm_action, ALBAlarmAction.SHED)
+        self.assertEqual(
+            alb_listener_rules_handler.get_elb_rules()[0].forward_configs.get(self.target_group_arn), 95)
+
+        message_body = json.loads(sqs_client.send_message.call_args.kwargs['MessageBody'])
+        self.assertEqual(message_body['albAlarmAction'], 'SHED')
+        self.assertTrue(message_body['preShed'])
+        self.assertEqual(message_body['preShedWeight'], 5)
+
+        return
+
+    def test_handle_predicted_breach_aimd(self) -> None:
+        sqs_client = MagicMock()
+        shed_strategy = ShedStrategy(AIMDStepPolicy(0.5), EvenWeightDistribution())
+
+        alb_listener_rules_handler = ALBListenerRulesHandler(
+            self.elbv2_client, self.load_balancer_arn, self.elb_listener_arn, self.target_group_arn,
+            self.elb_shed_percent, self.max_elb_shed_percent, self.elb_restore_percent,
+            self.shed_mesg_delay_sec, self.restore_mesg_delay_sec, shed_strategy=shed_strategy,
+            shed_predictor=ShedPredictor(pre_shed_percent=5))
+
+        alb_alarm_event = ALBAlarmEvent('event_id', self.cw_alarm_arn, self.cw_alarm_name, CWAlarmState.OK)
+
+        alarm_action = alb_listener_rules_handler.handle_predicted_breach(
+            self.elbv2_client, sqs_client, self.sqs_queue_url, alb_alarm_event)
+
+        # the pre-shed moves pre_shed_percent, not half the weight as an AIMD shed step would
+        self.assertEqual(alarm_action, ALBAlarmAction.SHED)
+        self.assertEqual(
+            alb_listener_rules_handler.get_elb_rules()[0].forward_configs.get(self.target_group_arn), 95)
+
+        message_body = json.loads(sqs_client.send_message.call_args.kwargs['MessageBody'])
+        self.assertEqual(message_body['preShedWeight'], 5)
+
+        # the predicted breach did not happen, exactly the pre-shed weight is given back
+        self.elbv2_client.describe_rules.return_value['Rules'][0]['Actions'][0]['ForwardConfig']['TargetGroups'][0]['Weight'] = 5
+        self.elbv2_client.describe_rules.return_value['Rules'][0]['Actions'][0]['ForwardConfig']['TargetGroups'][1]['Weight'] = 95
+        self.cw_client_ok.get_metric_data.return_value = {
+            'MetricDataResults': [{'Id': 'm0', 'Values': [0.6, 0.6, 0.6, 0.6, 0.6]}]
+        }
+
+        alb_listener_rules_handler = ALBListenerRulesHandler(
+            self.elbv2_client, self.load_balancer_arn, self.elb_listener_arn, self.target_group_arn,
+            self.elb_shed_percent, self.max_elb_shed_percent, 1,
+            self.shed_mesg_delay_sec, self.restore_mesg_delay_sec, shed_strategy=shed_strategy,
+            shed_predictor=ShedPredictor(pre_shed_percent=5))
+
+        alarm_action = alb_listener_rules_handler.handle_alarm_status_message(
+            self.cw_client_ok, self.elbv2_client, sqs_client, ALBAlarmStatusMessage.from_json(message_body))
+
+        self.assertEqual(alarm_action, ALBAlarmAction.NONE)
+        self.assertEqual(
+            alb_listener_rules_handler.get_elb_rules()[0].forward_configs.get(self.target_group_arn), 100)
+
+        return
+
+    def test_handle_alarm_status_message_pre_shed(self) -> None:
+        # 5% was shed ahead of a predicted breach
+        self.elbv2_client.describe_rules.return_value['Rules'][0]['Actions'][0]['ForwardConfig']['TargetGroups'][0]['Weight'] = 5
+        self.elbv2_client.describe_rules.return_value['Rules'][0]['Actions'][0]['ForwardConfig']['TargetGroups'][1]['Weight'] = 95
+        sqs_client = MagicMock()
+
+        alb_alarm_status_message = ALBAlarmStatusMessage(
+            self.cw_alarm_arn, self.cw_alarm_name, self.load_balancer_arn, self.elb_listener_arn,
+            self.target_group_arn, self.sqs_queue_url, self.shed_mesg_delay_sec, self.restore_mesg_delay_sec,
+            self.elb_shed_percent, self.max_elb_shed_percent, self.elb_restore_percent, ALBAlarmAction.SHED,
+            pre_shed=True
+        )
+
+        # the metric is still rising towards the threshold of 1.0, the pre-shed load is held
+        self.cw_client_ok.get_metric_data.return_value = {
+            'MetricDataResults': [{'Id': 'm0', 'Values': [0.9, 0.8, 0.7, 0.6, 0.5]}]
+        }
+
+        alb_listener_rules_handler = ALBListenerRulesHandler(
+            self.elbv2_client, self.load_balancer_arn, self.elb_listener_arn, self.target_group_arn,
+            self.elb_shed_percent, self.max_elb_shed_percent, self.elb_restore_percent,
+            self.shed_mesg_delay_sec, self.restore_mesg_delay_sec, shed_predictor=ShedPredictor(pre_shed_percent=5))
+
+        alarm_action = alb_listener_rules_handler.handle_alarm_status_message(
+            self.cw_client_ok, self.elbv2_client, sqs_client, alb_alarm_status_message)
+
+        self.assertEqual(alarm_action, ALBAlarmAction.SHED)
+        self.elbv2_client.modify_rule.assert_not_called()
+        self.assertTrue(json.loads(sqs_client.send_message.call_args.kwargs['MessageBody'])['preShed'])
+
+        # the metric levelled off, the breach did not happen and the pre-shed load is given back
+        self.cw_client_ok.get_metric_data.return_value = {
+            'MetricDataResults': [{'Id': 'm0', 'Values': [0.6, 0.6, 0.6, 0.6, 0.6]}]
+        }
+
+        alb_listener_rules_handler = ALBListenerRulesHandler(
+            self.elbv2_client, self.load_balancer_arn, self.elb_listener_arn, self.target_group_arn,
+            self.elb_shed_percent, self.max_elb_shed_percent, self.elb_restore_percent,
+            self.shed_mesg_delay_sec, self.restore_mesg_delay_sec, shed_predictor=ShedPredictor(pre_shed_percent=5))
+
+        alarm_action = alb_listener_rules_handler.handle_alarm_status_message(
+            self.cw_client_ok, self.elbv2_client, sqs_client, alb_alarm_status_message)
+
+        self.assertEqual(alarm_action, ALBAlarmAction.NONE)
+        self.assertEqual(
+            alb_listener_rules_handler.get_elb_rules()[0].forward_configs.get(self.target_group_arn), 100)
+
+        return
+
+    def test_handle_alarm_status_message_pre_shed_breach(self) -> None:
+        sqs_client = MagicMock()
+
+        alb_alarm_status_message = ALBAlarmStatusMessage(
+            self.cw_alarm_arn, self.cw_alarm_name, self.load_balancer_arn, self.elb_listener_arn,
+            self.target_group_arn, self.sqs_queue_url, self.shed_mesg_delay_sec, self.restore_mesg_delay_sec,
+            self.elb_shed_percent, self.max_elb_shed_percent, self.elb_restore_percent, ALBAlarmAction.SHED,
+            pre_shed=True
+        )
+
+        alb_listener_rules_handler = ALBListenerRulesHandler(
+            self.elbv2_client, self.load_balancer_arn, self.elb_listener_arn, self.target_group_arn,
+            self.elb_shed_percent, self.max_elb_shed_percent, self.elb_restore_percent,
+            self.shed_mesg_delay_sec, self.restore_mesg_delay_sec, shed_predictor=ShedPredictor(pre_shed_percent=5))
+
+        # the predicted breach happened, shedding carries on as for an alarm
+        alarm_action = alb_listener_rules_handler.handle_alarm_status_message(
+            self.cw_client_in_alarm, self.elbv2_client, sqs_client, alb_alarm_status_message)
+
+        self.assertEqual(alarm_action, ALBAlarmAction.SHED)
+        self.assertEqual(
+            alb_listener_rules_handler.get_elb_rules()[0].forward_configs.get(self.target_group_arn), 80)
+        self.assertNotIn('preShed', json.loads(sqs_client.send_message.call_args.kwargs['MessageBody']))
+
+        return
+
+    def test_handle_alarm_status_message_secondary_guard(self) -> None:
+        sqs_client = MagicMock()
+
+        alb_alarm_status_message = ALBAlarmStatusMessage(
+            self.cw_alarm_arn, self.cw_alarm_name, self.load_balancer_arn, self.elb_listener_arn,
+            self.target_group_arn, self.sqs_queue_url, self.shed_mesg_delay_sec, self.restore_mesg_delay_sec,
+            self.elb_shed_percent, self.max_elb_shed_percent, self.elb_restore_percent, ALBAlarmAction.SHED
+        )
+
+        for secondary_metric_value, primary_weight, decision in ((1.5, 100, 'skip'), (0.5, 80, 'allow')):
+            self.cw_client_in_alarm.get_metric_data.reset_mock()
+            self.cw_client_in_alarm.get_metric_data.return_value = {
+                'MetricDataResults': [{'Id': 'm0', 'Values': [secondary_metric_value]}]
+            }
+
+            alb_listener_rules_handler = ALBListenerRulesHandler(
+                self.elbv2_client, self.load_balancer_arn, self.elb_listener_arn, self.target_group_arn,
+                self.elb_shed_percent, self.max_elb_shed_percent, self.elb_restore_percent,
+                self.shed_mesg_delay_sec, self.restore_mesg_delay_sec, secondary_guard=SecondaryHealthGuard())
+
+            alarm_action = alb_listener_rules_handler.handle_alarm_status_message(
+                self.cw_client_in_alarm, self.elbv2_client, sqs_client, alb_alarm_status_message)
+
+            self.assertEqual(alarm_action, ALBAlarmAction.SHED)
+            self.assertEqual(
+                alb_listener_rules_handler.get_elb_rules()[0].forward_configs.get(self.target_group_arn),
+                primary_weight)
+
+            # the secondary metric is read with the dimensions of the alarm
+            metric_data_query = self.cw_client_in_alarm.get_metric_data.call_args.kwargs['MetricDataQueries'][0]
+            self.assertIn(
+                {'Name': 'TargetGroup', 'Value': 'targetgroup/TestGroup/1566e30628006197'},
+                metric_data_query['MetricStat']['Metric']['Dimensions'])
+
+            self.assertEqual(alb_listener_rules_handler.get_secondary_health_report(), [{
+                'targetGroupArn': self.secondary_target_group_arn, 'decision': decision,
+                'metricValue': secondary_metric_value, 'threshold': 1.0
+            }])
+
+        return
+
+    def test_handle_alarm_status_message_shed_budget(self) -> None:
+        sqs_client = MagicMock()
+        shed_budget = ShedBudget(InMemoryShedBudgetStore(), 30)
+        # another primary already sheds 20 into the secondary
+        shed_budget.record(self.secondary_target_group_arn, 'other_target_group', 20)
+
+        alb_alarm_status_message = ALBAlarmStatusMessage(
+            self.cw_alarm_arn, self.cw_alarm_name, self.load_balancer_arn, self.elb_listener_arn,
+            self.target_group_arn, self.sqs_queue_url, self.shed_mesg_delay_sec, self.restore_mesg_delay_sec,
+            self.elb_shed_percent, self.max_elb_shed_percent, self.elb_restore_percent, ALBAlarmAction.SHED
+        )
+
+        alb_listener_rules_handler = ALBListenerRulesHandler(
+            self.elbv2_client, self.load_balancer_arn, self.elb_listener_arn, self.target_group_arn,
+            self.elb_shed_percent, self.max_elb_shed_percent, self.elb_restore_percent,
+            self.shed_mesg_delay_sec, self.restore_mesg_delay_sec, shed_budget=shed_budget)
+
+        alarm_action = alb_listener_rules_handler.handle_alarm_status_message(
+            self.cw_client_in_alarm, self.elbv2_client, sqs_client, alb_alarm_status_message)
+
+        self.assertEqual(alarm_action, ALBAlarmAction.SHED)
+
+        # only the 10 left in the budget is shed, in every rule
+        for elb_rule in alb_listener_rules_handler.get_elb_rules():
+            self.assertEqual(elb_rule.forward_configs.get(self.target_group_arn), 90)
+            self.assertEqual(elb_rule.forward_configs.get(self.secondary_target_group_arn), 10)
+
+        self.assertEqual(shed_budget.get_claims(self.secondary_target_group_arn), {
+            'other_target_group': 20, self.target_group_arn: 10
+        })
+
+        return
+
+    def test_handle_alarm_status_message_renews_shed_budget(self) -> None:
+        sqs_client = MagicMock()
+        now = [1000]
+        shed_budget = ShedBudget(InMemoryShedBudgetStore(), 30, claim_duration_sec=900, clock=lambda: now[0])
+
+        alb_listener_rules_handler = ALBListenerRulesHandler(
+            self.elbv2_client, self.load_balancer_arn, self.elb_listener_arn, self.target_group_arn,
+            self.elb_shed_percent, self.max_elb_shed_percent, self.elb_restore_percent,
+            self.shed_mesg_delay_sec, self.restore_mesg_delay_sec, shed_budget=shed_budget)
+
+        alb_alarm_status_message = ALBAlarmStatusMessage(
+            self.cw_alarm_arn, self.cw_alarm_name, self.load_balancer_arn, self.elb_listener_arn,
+            self.target_group_arn, self.sqs_queue_url, self.shed_mesg_delay_sec, self.restore_mesg_delay_sec,
+            self.elb_shed_percent, self.max_elb_shed_percent, self.elb_restore_percent, ALBAlarmAction.SHED
+        )
+
+        alb_listener_rules_handler.handle_alarm_status_message(
+            self.cw_client_in_alarm, self.elbv2_client, sqs_client, alb_alarm_status_message)
+
+        self.assertEqual(
+            shed_budget.store.get_claims(self.secondary_target_group_arn)[0], {self.target_group_arn: (20, 1900)})
+
+        # a step that does not move any weight still renews the claim of the chain
+        now[0] = 1600
+        cw_client = MagicMock()
+        cw_client.describe_alarms.return_value = {
+            'MetricAlarms': [{'AlarmName': self.cw_alarm_name, 'StateValue': 'INSUFFICIENT_DATA'}]}
+
+        alarm_action = alb_listener_rules_handler.handle_alarm_status_message(
+            cw_client, self.elbv2_client, sqs_client, alb_alarm_status_message)
+
+        self.assertEqual(alarm_action, ALBAlarmAction.SHED)
+        self.assertEqual(
+            shed_budget.store.get_claims(self.secondary_target_group_arn)[0], {self.target_group_arn: (20, 2500)})
+
+        return
+
+    def test_handle_alarm_status_message_latency(self) -> None:
+        sqs_client = MagicMock()
+        metrics_sink = InMemoryRecordSink()
+        metrics = EMFMetrics(sink=metrics_sink)
+
+        # the alarm changed state at 1000 and the message was sent with a 60s delay at 1030
+        alb_alarm_status_message = ALBAlarmStatusMessage(
+            self.cw_alarm_arn, self.cw_alarm_name, self.load_balancer_arn, self.elb_listener_arn,
+            self.target_group_arn, self.sqs_queue_url, self.shed_mesg_delay_sec, self.restore_mesg_delay_sec,
+            self.elb_shed_percent, self.max_elb_shed_percent, self.elb_restore_percent, ALBAlarmAction.SHED,
+            alarm_at=1000.0, sent_at=1030.0, hops=1
+        )
+
+        alb_listener_rules_handler = ALBListenerRulesHandler(
+            self.elbv2_client, self.load_balancer_arn, self.elb_listener_arn, self.target_group_arn,
+            self.elb_shed_percent, self.max_elb_shed_percent, self.elb_restore_percent,
+            self.shed_mesg_delay_sec, self.restore_mesg_delay_sec, metrics=metrics, clock=lambda: 1095.0)
+
+        alarm_action = alb_listener_rules_handler.handle_alarm_status_message(
+            self.cw_client_in_alarm, self.elbv2_client, sqs_client, alb_alarm_status_message)
+
+        self.assertEqual(alarm_action, ALBAlarmAction.SHED)
+        self.assertEqual(alb_listener_rules_handler.queue_wait_sec, 5.0)
+        self.assertEqual(alb_listener_rules_handler.alarm_to_apply_sec, 95.0)
+
+        # the next message carries the alarm time on
+        message = json.loads(sqs_client.send_message.call_args.kwargs['MessageBody'])
+        self.assertEqual((message['alarmAt'], message['sentAt'], message['hops']), (1000.0, 1095.0, 2))
+
+        metrics.flush()
+
+        self.assertEqual(metrics_sink.get_values('QueueWait', TargetGroup=self.target_group_arn), [5000.0])
+        self.assertEqual(
+            metrics_sink.get_values('AlarmToApplyLag', TargetGroup=self.target_group_arn, Action='SHED'), [95000.0])
+
+        # a state change newer than the chain is taken from the alarm
+        alb_listener_rules_handler.track_message_latency(alb_alarm_status_message, {self.cw_alarm_name: {
+            'StateValue': 'ALARM',
+            'StateTransitionedTimestamp': datetime(1970, 1, 1, 0, 17, 50, tzinfo=timezone.utc)
+        }})
+        self.assertEqual(alb_listener_rules_handler.alarm_at, 1070.0)
+
+        return
+
+    def test_handle_alarm_status_message_latency_polled_chain(self) -> None:
+        sqs_client = MagicMock()
+        cw_client = MagicMock()
+
+        # the poller started shedding at 99900 while the alarm has been OK since a day earlier
+        metric_alarm = json.loads(open(pathlib.Path(__file__).parent/'test_cw_ok.json', 'r').read())['MetricAlarms'][0]
+        metric_alarm['StateTransitionedTimestamp'] = datetime.fromtimestamp(13500, timezone.utc)
+        cw_client.describe_alarms = MagicMock(return_value={'MetricAlarms': [metric_alarm]})
+        cw_client.get_metric_data = MagicMock(return_value={
+            'MetricDataResults': [{'Id': 'm0', 'Values': [5.0, 5.0, 5.0]}]
+        })
+
+        alb_alarm_status_message = ALBAlarmStatusMessage(
+            self.cw_alarm_arn, self.cw_alarm_name, self.load_balancer_arn, self.elb_listener_arn,
+            self.target_group_arn, self.sqs_queue_url, self.shed_mesg_delay_sec, self.restore_mesg_delay_sec,
+            self.elb_shed_percent, self.max_elb_shed_percent, self.elb_restore_percent, ALBAlarmAction.SHED,
+            alarm_at=99900.0, sent_at=99910.0, hops=1
+        )
+
+        alb_listener_rules_handler = ALBListenerRulesHandler(
+            self.elbv2_client, self.load_balancer_arn, self.elb_listener_arn, self.target_group_arn,
+            self.elb_shed_percent, self.max_elb_shed_percent, self.elb_restore_percent,
+            self.shed_mesg_delay_sec, self.restore_mesg_delay_sec, clock=lambda: 99970.0,
+            metric_poller=MetricPoller(poll_period_sec=10, evaluation_periods=3))
+
+        alarm_action = alb_listener_rules_handler.handle_alarm_status_message(
+            cw_client, self.elbv2_client, sqs_client, alb_alarm_status_message)
+
+        self.assertEqual(alarm_action, ALBAlarmAction.SHED)
+        self.assertEqual(alb_listener_rules_handler.alarm_at, 99900.0)
+        self.assertEqual(alb_listener_rules_handler.alarm_to_apply_sec, 70.0)
+
+        # the alarm catching up with the poller is a newer change in the direction of the chain
+        metric_alarm['StateValue'] = 'ALARM'
+        metric_alarm['StateTransitionedTimestamp'] = datetime.fromtimestamp(99960, timezone.utc)
+
+        alb_listener_rules_handler.track_message_latency(alb_alarm_status_message, {self.cw_alarm_name: metric_alarm})
+        self.assertEqual(alb_listener_rules_handler.alarm_at, 99960.0)
+
+        return
+
+    def test_trace_across_message_loop(self) -> None:
+        sqs_client = MagicMock()
+        exporter = InMemorySpanExporter()
+        tracer = Tracer(exporter)
+
+        alb_alarm_event = ALBAlarmEvent(
+            alarm_event_id='some_id', alarm_arn=self.cw_alarm_arn,
+            alarm_name=self.cw_alarm_name, cw_alarm_state=CWAlarmState.ALARM)
+
+        alb_listener_rules_handler = ALBListenerRulesHandler(
+            self.elbv2_client, self.load_balancer_arn, self.elb_listener_arn, self.target_group_arn,
+            self.elb_shed_percent, self.max_elb_shed_percent, self.elb_restore_percent,
+            self.shed_mesg_delay_sec, self.restore_mesg_delay_sec, rule_writer=ELBRuleWriter(tracer=tracer),
+            tracer=tracer)
+
+        with alb_listener_rules_handler.trace_step('handle_alarm') as span:
+            alarm_action = alb_listener_rules_handler.handle_alarm(
+                self.elbv2_client, sqs_client, self.sqs_queue_url, alb_alarm_event)
+
+        self.assertEqual(alarm_action, ALBAlarmAction.SHED)
+
+        # the next step of the chain continues the trace from the message
+        alb_alarm_status_message = ALBAlarmStatusMessage.from_json(
+            json.loads(sqs_client.send_message.call_args.kwargs['MessageBody']))
+
+        alb_listener_rules_handler = ALBListenerRulesHandler(
+            self.elbv2_client, self.load_balancer_arn, self.elb_listener_arn, self.target_group_arn,
+            self.elb_shed_percent, self.max_elb_shed_percent, self.elb_restore_percent,
+            self.shed_mesg_delay_sec, self.restore_mesg_delay_sec, rule_writer=ELBRuleWriter(tracer=tracer),
+            tracer=tracer)
+
+        with alb_listener_rules_handler.trace_step(
+                'handle_alarm_status_message', alb_alarm_status_message.trace_context):
+            alb_listener_rules_handler.handle_alarm_status_message(
+                self.cw_client_in_alarm, self.elbv2_client, sqs_client, alb_alarm_status_message)
+
+        self.assertEqual({exported_span.trace_id for exported_span in exporter.spans}, {span.trace_id})
+        self.assertEqual(
+            [exported_span.name for exported_span in exporter.spans],
+            ['load_rules', 'write_rule', 'write_rule', 'save_rules', 'send_message', 'handle_alarm'] +
+            ['load_rules', 'write_rule', 'write_rule', 'save_rules', 'send_message', 'handle_alarm_status_message'])
+
+        spans = {exported_span.span_id: exported_span for exported_span in exporter.spans}
+        first_send_span, step_span = exporter.get_spans('send_message')[0], exporter.spans[-1]
+
+        self.assertEqual(step_span.parent_id, first_send_span.span_id)
+
+        for write_span in exporter.get_spans('write_rule'):
+            self.assertEqual(spans[write_span.parent_id].name, 'save_rules')
+            self.assertTrue(write_span.attributes['saved'])
+
+        return
@@ -0,0 +1,29 @@
+from elb_load_monitor import clients
+from unittest.mock import patch
+
+import unittest
+
+
+class TestClients(unittest.TestCase):
+
+    def setUp(self) -> None:
+        clients.reset_clients()
+
+    def tearDown(self) -> None:
+        clients.reset_clients()
+
+    def test_get_client_reuses_client(self) -> None:
+        with patch('elb_load_monitor.clients.boto3.client', side_effect=lambda name: object()) as boto3_client:
+            elbv2_client = clients.get_client('elbv2')
+
+            self.assertIs(clients.get_client('elbv2'), elbv2_client)
+            self.assertIsNot(clients.get_client('sqs'), elbv2_client)
+            self.assertEqual(boto3_client.call_count, 2)
+
+    def test_reset_clients(self) -> None:
+        with patch('elb_load_monitor.clients.boto3.client', side_effect=lambda name: object()) as boto3_client:
+            elbv2_client = clients.get_client('elbv2')
+            clients.reset_clients()
+
+            self.assertIsNot(clients.get_client('elbv2'), elbv2_client)
+            self.assertEqual(boto3_client.call_count, 2)
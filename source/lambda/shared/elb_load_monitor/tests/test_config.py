@@ -0,0 +1,160 @@
+from elb_load_monitor import config
+from elb_load_monitor.config import ALBMonitorConfig
+
+import unittest
+
+
+class TestConfig(unittest.TestCase):
+
+    def setUp(self) -> None:
+        config.reset_config()
+        self.environ = {
+            'ELB_ARN': 'arn:lb',
+            'ELB_LISTENER_ARN': 'arn:listener',
+            'SQS_QUEUE_URL': 'https://sqs',
+            'ELB_SHED_PERCENT': '10',
+            'MAX_ELB_SHED_PERCENT': '50',
+            'ELB_RESTORE_PERCENT': '5',
+            'SHED_MESG_DELAY_SEC': '60',
+            'RESTORE_MESG_DELAY_SEC': '120',
+            'MAX_RULE_WRITE_CONCURRENCY': '8',
+            'RULE_WRITE_VERSION_CHECK': 'true',
+            'DESCRIBE_RULES_PAGE_SIZE': '50',
+            'RULE_CACHE_TTL_SEC': '300',
+            'RULE_CACHE_MAX_LISTENERS': '4',
+            'RULE_CACHE_VALIDATE': 'false',
+            'LEASE_TABLE_NAME': 'leases',
+            'LEASE_DURATION_SEC': '600',
+            'SHED_CONTROLLER': 'proportional',
+            'SHED_TARGET_UTILIZATION': '0.8',
+            'SHED_POLICY': 'aimd',
+            'AIMD_DECREASE_FACTOR': '0.4',
+            'SHED_DISTRIBUTION': 'capacity',
+            'SECONDARY_GUARD': 'true',
+            'SECONDARY_MAX_UTILIZATION': '0.8',
+            'SHED_BUDGET_WEIGHT': '60',
+            'EMF_METRICS': 'true',
+            'METRICS_NAMESPACE': 'LoadShedding',
+            'TRACING': 'true',
+            'SHED_HOLD_SEC': '300',
+            'RESTORE_COOLDOWN_SEC': '120',
+            'RESTORE_OK_EVALUATIONS': '3',
+            'ADAPTIVE_DELAY': 'true',
+            'MIN_MESG_DELAY_SEC': '5',
+            'MAX_MESG_DELAY_SEC': '600',
+            'POLL_MODE': 'true',
+            'POLL_PERIOD_SEC': '30',
+            'POLL_EVALUATION_PERIODS': '2',
+            'POLL_INTERVAL_SEC': '15',
+            'POLL_DURATION_SEC': '45',
+            'CW_ALARM_NAME': 'alarm',
+            'ELB_TARGET_GROUP_ARN': 'arn:tg',
+            'PREDICTIVE_SHED': 'true',
+            'PREDICT_HORIZON_SEC': '600',
+            'PREDICT_DATAPOINTS': '10',
+            'PRE_SHED_PERCENT': '2'
+        }
+
+    def tearDown(self) -> None:
+        config.reset_config()
+
+    def test_from_environ(self) -> None:
+        alb_monitor_config = ALBMonitorConfig.from_environ(self.environ)
+
+        self.assertEqual(alb_monitor_config.load_balancer_arn, 'arn:lb')
+        self.assertEqual(alb_monitor_config.elb_listener_arn, 'arn:listener')
+        self.assertEqual(alb_monitor_config.sqs_queue_url, 'https://sqs')
+        self.assertEqual(alb_monitor_config.elb_shed_percent, 10)
+        self.assertEqual(alb_monitor_config.max_elb_shed_percent, 50)
+        self.assertEqual(alb_monitor_config.elb_restore_percent, 5)
+        self.assertEqual(alb_monitor_config.shed_mesg_delay_sec, 60)
+        self.assertEqual(alb_monitor_config.restore_mesg_delay_sec, 120)
+        self.assertEqual(alb_monitor_config.max_rule_write_concurrency, 8)
+        self.assertTrue(alb_monitor_config.rule_write_version_check)
+        self.assertEqual(alb_monitor_config.describe_rules_page_size, 50)
+        self.assertEqual(alb_monitor_config.rule_cache_ttl_sec, 300)
+        self.assertEqual(alb_monitor_config.rule_cache_max_listeners, 4)
+        self.assertFalse(alb_monitor_config.rule_cache_validate)
+        self.assertEqual(alb_monitor_config.lease_table_name, 'leases')
+        self.assertEqual(alb_monitor_config.lease_duration_sec, 600)
+        self.assertEqual(alb_monitor_config.shed_controller, 'proportional')
+        self.assertEqual(alb_monitor_config.shed_target_utilization, 0.8)
+        self.assertEqual(alb_monitor_config.shed_policy, 'aimd')
+        self.assertEqual(alb_monitor_config.aimd_decrease_factor, 0.4)
+        self.assertEqual(alb_monitor_config.shed_distribution, 'capacity')
+        self.assertTrue(alb_monitor_config.secondary_guard)
+        self.assertEqual(alb_monitor_config.secondary_max_utilization, 0.8)
+        self.assertEqual(alb_monitor_config.shed_budget_weight, 60)
+        self.assertTrue(alb_monitor_config.emf_metrics)
+        self.assertEqual(alb_monitor_config.metrics_namespace, 'LoadShedding')
+        self.assertTrue(alb_monitor_config.tracing)
+        self.assertEqual(alb_monitor_config.shed_hold_sec, 300)
+        self.assertEqual(alb_monitor_config.restore_cooldown_sec, 120)
+        self.assertEqual(alb_monitor_config.restore_ok_evaluations, 3)
+        self.assertTrue(alb_monitor_config.adaptive_delay)
+        self.assertEqual(alb_monitor_config.min_mesg_delay_sec, 5)
+        self.assertEqual(alb_monitor_config.max_mesg_delay_sec, 600)
+        self.assertTrue(alb_monitor_config.poll_mode)
+        self.assertEqual(alb_monitor_config.poll_period_sec, 30)
+        self.assertEqual(alb_monitor_config.poll_evaluation_periods, 2)
+        self.assertEqual(alb_monitor_config.poll_interval_sec, 15)
+        self.assertEqual(alb_monitor_config.poll_duration_sec, 45)
+        self.assertEqual(alb_monitor_config.cw_alarm_name, 'alarm')
+        self.assertEqual(alb_monitor_config.target_group_arn, 'arn:tg')
+        self.assertTrue(alb_monitor_config.predictive_shed)
+        self.assertEqual(alb_monitor_config.predict_horizon_sec, 600)
+        self.assertEqual(alb_monitor_config.predict_datapoints, 10)
+        self.assertEqual(alb_monitor_config.pre_shed_percent, 2)
+
+    def test_from_environ_defaults(self) -> None:
+        alb_monitor_config = ALBMonitorConfig.from_environ({})
+
+        self.assertIsNone(alb_monitor_config.load_balancer_arn)
+        self.assertEqual(alb_monitor_config.elb_shed_percent, 5)
+        self.assertEqual(alb_monitor_config.max_elb_shed_percent, 100)
+        self.assertEqual(alb_monitor_config.elb_restore_percent, 5)
+        self.assertEqual(alb_monitor_config.shed_mesg_delay_sec, 60)
+        self.assertEqual(alb_monitor_config.restore_mesg_delay_sec, 60)
+        self.assertEqual(alb_monitor_config.max_rule_write_concurrency, 4)
+        self.assertFalse(alb_monitor_config.rule_write_version_check)
+        self.assertEqual(alb_monitor_config.describe_rules_page_size, 400)
+        self.assertEqual(alb_monitor_config.rule_cache_ttl_sec, 0)
+        self.assertTrue(alb_monitor_config.rule_cache_validate)
+        self.assertIsNone(alb_monitor_config.lease_table_name)
+        self.assertEqual(alb_monitor_config.lease_duration_sec, 900)
+        self.assertEqual(alb_monitor_config.shed_controller, 'fixed')
+        self.assertEqual(alb_monitor_config.shed_target_utilization, 0.9)
+        self.assertEqual(alb_monitor_config.shed_policy, 'linear')
+        self.assertEqual(alb_monitor_config.aimd_decrease_factor, 0.5)
+        self.assertEqual(alb_monitor_config.shed_distribution, 'even')
+        self.assertFalse(alb_monitor_config.secondary_guard)
+        self.assertEqual(alb_monitor_config.secondary_max_utilization, 1.0)
+        self.assertEqual(alb_monitor_config.shed_budget_weight, 0)
+        self.assertFalse(alb_monitor_config.emf_metrics)
+        self.assertEqual(alb_monitor_config.metrics_namespace, 'ALBLoadShedding')
+        self.assertFalse(alb_monitor_config.tracing)
+        self.assertEqual(alb_monitor_config.shed_hold_sec, 0)
+        self.assertEqual(alb_monitor_config.restore_ok_evaluations, 1)
+        self.assertFalse(alb_monitor_config.adaptive_delay)
+        self.assertEqual(alb_monitor_config.max_mesg_delay_sec, 900)
+        self.assertFalse(alb_monitor_config.poll_mode)
+        self.assertEqual(alb_monitor_config.poll_period_sec, 60)
+        self.assertEqual(alb_monitor_config.poll_evaluation_periods, 3)
+        self.assertIsNone(alb_monitor_config.cw_alarm_name)
+        self.assertFalse(alb_monitor_config.predictive_shed)
+        self.assertEqual(alb_monitor_config.predict_horizon_sec, 300)
+        self.assertEqual(alb_monitor_config.pre_shed_percent, 5)
+
+    def test_get_config_is_cached(self) -> None:
+        alb_monitor_config = config.get_config(self.environ)
+
+        self.assertIs(config.get_config(dict(self.environ)), alb_monitor_config)
+
+    def test_get_config_reparsed_on_change(self) -> None:
+        alb_monitor_config = config.get_config(self.environ)
+
+        self.environ['ELB_SHED_PERCENT'] = '20'
+        new_alb_monitor_config = config.get_config(self.environ)
+
+        self.assertIsNot(new_alb_monitor_config, alb_monitor_config)
+        self.assertEqual(new_alb_monitor_config.elb_shed_percent, 20)
@@ -0,0 +1,115 @@
+from elb_load_monitor.control_lease import ControlLoopLease
+from elb_load_monitor.control_lease import get_control_lease
+from moto import mock_aws
+
+import boto3
+import unittest
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@mock_aws
+class TestControlLoopLease(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.dynamodb_client = boto3.client('dynamodb', region_name='us-east-1')
+        self.dynamodb_client.create_table(
+            TableName='leases',
+            KeySchema=[{'AttributeName': 'leaseId', 'KeyType': 'HASH'}],
+            AttributeDefinitions=[{'AttributeName': 'leaseId', 'AttributeType': 'S'}],
+            BillingMode='PAY_PER_REQUEST')
+
+        self.clock = FakeClock()
+        self.control_lease = ControlLoopLease(self.dynamodb_client, 'leases', lease_duration_sec=900, clock=self.clock)
+        self.lease_id = ControlLoopLease.get_lease_id('target_group', 'alarm')
+
+        return
+
+    def get_item(self) -> dict:
+        return self.dynamodb_client.get_item(TableName='leases', Key={'leaseId': {'S': self.lease_id}}).get('Item')
+
+    def test_acquire_and_renew(self) -> None:
+        self.assertTrue(self.control_lease.acquire(self.lease_id, 'chain1'))
+
+        self.clock.now += 60
+        self.assertTrue(self.control_lease.acquire(self.lease_id, 'chain1'))
+        self.assertEqual(self.get_item()['expiresAt']['N'], str(int(self.clock.now) + 900))
+
+        return
+
+    def test_acquire_held_by_another_chain(self) -> None:
+        self.assertTrue(self.control_lease.acquire(self.lease_id, 'chain1'))
+        self.assertFalse(self.control_lease.acquire(self.lease_id, 'chain2'))
+        self.assertEqual(self.get_item()['chainId']['S'], 'chain1')
+
+        # a lease that is not renewed expires
+        self.clock.now += 901
+        self.assertTrue(self.control_lease.acquire(self.lease_id, 'chain2'))
+        self.assertEqual(self.get_item()['chainId']['S'], 'chain2')
+
+        return
+
+    def test_fold(self) -> None:
+        # nothing is recorded without a lease
+        self.control_lease.fold(self.lease_id, 'ALARM')
+        self.assertIsNone(self.get_item())
+
+        self.control_lease.acquire(self.lease_id, 'chain1')
+        self.control_lease.fold(self.lease_id, 'ALARM')
+        self.control_lease.fold(self.lease_id, 'OK')
+
+        item = self.get_item()
+        self.assertEqual(item['foldedEvents']['N'], '2')
+        self.assertEqual(item['lastFoldedState']['S'], 'OK')
+        self.assertEqual(item['chainId']['S'], 'chain1')
+
+        return
+
+    def test_renew_takes_folded_state(self) -> None:
+        self.control_lease.acquire(self.lease_id, 'chain1')
+        self.assertIsNone(self.control_lease.get_folded_state(self.lease_id))
+
+        self.control_lease.fold(self.lease_id, 'ALARM')
+        self.assertTrue(self.control_lease.acquire(self.lease_id, 'chain1'))
+        self.assertEqual(self.control_lease.get_folded_state(self.lease_id), 'ALARM')
+        self.assertNotIn('lastFoldedState', self.get_item())
+
+        # each folded event is taken once
+        self.assertTrue(self.control_lease.acquire(self.lease_id, 'chain1'))
+        self.assertIsNone(self.control_lease.get_folded_state(self.lease_id))
+
+        # events folded into an expired lease are not taken by the next chain
+        self.control_lease.fold(self.lease_id, 'ALARM')
+        self.clock.now += 901
+        self.assertTrue(self.control_lease.acquire(self.lease_id, 'chain2'))
+        self.assertIsNone(self.control_lease.get_folded_state(self.lease_id))
+
+        return
+
+    def test_release(self) -> None:
+        self.control_lease.acquire(self.lease_id, 'chain1')
+
+        # only the owning chain can release the lease
+        self.control_lease.release(self.lease_id, 'chain2')
+        self.assertIsNotNone(self.get_item())
+
+        self.control_lease.release(self.lease_id, 'chain1')
+        self.assertIsNone(self.get_item())
+        self.assertTrue(self.control_lease.acquire(self.lease_id, 'chain2'))
+
+        return
+
+    def test_get_control_lease(self) -> None:
+        self.assertIsNone(get_control_lease(None, 900, self.dynamodb_client))
+
+        control_lease = get_control_lease('leases', 300, self.dynamodb_client)
+        self.assertEqual(control_lease.table_name, 'leases')
+        self.assertEqual(control_lease.lease_duration_sec, 300)
+
+        return
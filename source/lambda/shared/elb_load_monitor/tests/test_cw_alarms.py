@@ -0,0 +1,49 @@
+from elb_load_monitor.alb_alarm_messages import CWAlarmState
+from elb_load_monitor.cw_alarms import describe_alarm_states
+from unittest.mock import MagicMock
+
+import unittest
+
+
+class TestCWAlarms(unittest.TestCase):
+
+    def test_describe_alarm_states_batches_names(self) -> None:
+        alarm_names = ['alarm' + str(i) for i in range(150)]
+
+        cw_client = MagicMock()
+        cw_client.describe_alarms.side_effect = lambda **kwargs: {
+            'MetricAlarms': [
+                {'AlarmName': alarm_name, 'StateValue': 'ALARM'} for alarm_name in kwargs['AlarmNames']
+            ]
+        }
+
+        # duplicates are only requested once
+        alarm_states = describe_alarm_states(cw_client, alarm_names + alarm_names[:10])
+
+        self.assertEqual(len(alarm_states), 150)
+        self.assertEqual(alarm_states['alarm149'], CWAlarmState.ALARM)
+        self.assertEqual(cw_client.describe_alarms.call_count, 2)
+        self.assertEqual(len(cw_client.describe_alarms.call_args_list[0].kwargs['AlarmNames']), 100)
+        self.assertEqual(len(cw_client.describe_alarms.call_args_list[1].kwargs['AlarmNames']), 50)
+
+    def test_describe_alarm_states_follows_next_token(self) -> None:
+        cw_client = MagicMock()
+        cw_client.describe_alarms.side_effect = [
+            {'MetricAlarms': [{'AlarmName': 'alarm1', 'StateValue': 'OK'}], 'NextToken': 'token'},
+            {'MetricAlarms': [{'AlarmName': 'alarm2', 'StateValue': 'INSUFFICIENT_DATA'}]}
+        ]
+
+        alarm_states = describe_alarm_states(cw_client, ['alarm1', 'alarm2', 'missing'])
+
+        self.assertEqual(alarm_states, {
+            'alarm1': CWAlarmState.OK,
+            'alarm2': CWAlarmState.INSUFFICIENT_DATA
+        })
+        cw_client.describe_alarms.assert_called_with(
+            AlarmNames=['alarm1', 'alarm2', 'missing'], MaxRecords=100, NextToken='token')
+
+    def test_describe_alarm_states_no_alarms(self) -> None:
+        cw_client = MagicMock()
+
+        self.assertEqual(describe_alarm_states(cw_client, []), {})
+        cw_client.describe_alarms.assert_not_called()
@@ -0,0 +1,122 @@
+from datetime import datetime, timezone
+from elb_load_monitor.cw_metrics import get_alarm_metric_values
+from elb_load_monitor.cw_metrics import get_latest_alarm_datapoints
+from elb_load_monitor.cw_metrics import get_metric_datapoints
+from unittest.mock import MagicMock
+
+import unittest
+
+
+def metric_alarm(alarm_name: str, period: int = 60) -> dict:
+    return {
+        'AlarmName': alarm_name,
+        'Namespace': 'AWS/ApplicationELB',
+        'MetricName': 'TargetResponseTime',
+        'Dimensions': [{'Name': 'TargetGroup', 'Value': 'targetgroup/' + alarm_name + '/1'}],
+        'ExtendedStatistic': 'p99',
+        'Period': period
+    }
+
+
+class TestCWMetrics(unittest.TestCase):
+
+    def test_get_alarm_metric_values(self) -> None:
+        # in the third minute of a five minute period
+        end_time = datetime(2024, 1, 1, 12, 2, 30, tzinfo=timezone.utc)
+
+        cw_client = MagicMock()
+        cw_client.get_metric_data.side_effect = [
+            {'MetricDataResults': [{'Id': 'm0', 'Values': [1.5, 1.0]}], 'NextToken': 'token'},
+            {'MetricDataResults': [{'Id': 'm0', 'Values': [0.5]}]},
+            {'MetricDataResults': [{'Id': 'm1', 'Values': []}]}
+        ]
+
+        metric_values = get_alarm_metric_values(
+            cw_client, {
+                'alarm1': metric_alarm('alarm1'),
+                'alarm2': metric_alarm('alarm2', period=300),
+                # metric math alarms have no single metric to read
+                'alarm3': {'AlarmName': 'alarm3', 'Metrics': []}
+            }, end_time)
+
+        self.assertEqual(metric_values, {'alarm1': 1.5})
+        self.assertEqual(cw_client.get_metric_data.call_count, 3)
+
+        # each period is read up to the start of the period in progress
+        get_metric_data_args = cw_client.get_metric_data.call_args_list[1].kwargs
+        self.assertEqual(len(get_metric_data_args['MetricDataQueries']), 1)
+        self.assertEqual(get_metric_data_args['MetricDataQueries'][0]['MetricStat']['Stat'], 'p99')
+        self.assertEqual(get_metric_data_args['StartTime'], datetime(2024, 1, 1, 11, 59, tzinfo=timezone.utc))
+        self.assertEqual(get_metric_data_args['EndTime'], datetime(2024, 1, 1, 12, 2, tzinfo=timezone.utc))
+        self.assertEqual(get_metric_data_args['NextToken'], 'token')
+
+        get_metric_data_args = cw_client.get_metric_data.call_args_list[2].kwargs
+        self.assertEqual(get_metric_data_args['MetricDataQueries'][0]['Id'], 'm1')
+        self.assertEqual(get_metric_data_args['StartTime'], datetime(2024, 1, 1, 11, 45, tzinfo=timezone.utc))
+        self.assertEqual(get_metric_data_args['EndTime'], datetime(2024, 1, 1, 12, 0, tzinfo=timezone.utc))
+
+    def test_get_latest_alarm_datapoints(self) -> None:
+        end_time = datetime(2024, 1, 1, 12, 0, 30, tzinfo=timezone.utc)
+        newest = datetime(2024, 1, 1, 11, 59, tzinfo=timezone.utc)
+        oldest = datetime(2024, 1, 1, 11, 58, tzinfo=timezone.utc)
+
+        cw_client = MagicMock()
+        cw_client.get_metric_data.return_value = {
+            'MetricDataResults': [
+                {'Id': 'm0', 'Values': [1.5, 1.0], 'Timestamps': [newest, oldest]},
+                {'Id': 'm1', 'Values': [0.5]}
+            ]
+        }
+
+        latest_datapoints = get_latest_alarm_datapoints(
+            cw_client, {'alarm1': metric_alarm('alarm1'), 'alarm2': metric_alarm('alarm2')}, end_time)
+
+        self.assertEqual(latest_datapoints, {'alarm1': (newest, 1.5), 'alarm2': (None, 0.5)})
+        self.assertEqual(cw_client.get_metric_data.call_count, 1)
+
+    def test_get_alarm_metric_values_no_metrics(self) -> None:
+        cw_client = MagicMock()
+
+        self.assertEqual(get_alarm_metric_values(cw_client, {}), {})
+        cw_client.get_metric_data.assert_not_called()
+
+    def test_get_metric_datapoints(self) -> None:
+        end_time = datetime(2024, 1, 1, 12, 0, tzinfo=timezone.utc)
+
+        cw_client = MagicMock()
+        cw_client.get_metric_data.return_value = {
+            'MetricDataResults': [{'Id': 'm0', 'Values': [3.0, 2.0, 1.0, 0.5]}]
+        }
+
+        values = get_metric_datapoints(cw_client, metric_alarm('alarm1'), 10, 3, end_time)
+
+        self.assertEqual(values, [3.0, 2.0, 1.0])
+
+        get_metric_data_args = cw_client.get_metric_data.call_args.kwargs
+        self.assertEqual(get_metric_data_args['MetricDataQueries'][0]['MetricStat']['Period'], 10)
+        self.assertEqual(get_metric_data_args['StartTime'], datetime(2024, 1, 1, 11, 59, 20, tzinfo=timezone.utc))
+        self.assertEqual(get_metric_data_args['ScanBy'], 'TimestampDescending')
+
+    def test_get_metric_datapoints_complete_periods(self) -> None:
+        cw_client = MagicMock()
+        cw_client.get_metric_data.return_value = {'MetricDataResults': [{'Id': 'm0', 'Values': []}]}
+
+        # 25 seconds into a minute only the minutes before it are complete
+        get_metric_datapoints(
+            cw_client, metric_alarm('alarm1'), 60, 5, datetime(2024, 1, 1, 12, 0, 25, tzinfo=timezone.utc))
+
+        get_metric_data_args = cw_client.get_metric_data.call_args.kwargs
+        self.assertEqual(get_metric_data_args['EndTime'], datetime(2024, 1, 1, 12, 0, tzinfo=timezone.utc))
+        self.assertEqual(get_metric_data_args['StartTime'], datetime(2024, 1, 1, 11, 54, tzinfo=timezone.utc))
+
+        get_metric_datapoints(
+            cw_client, metric_alarm('alarm1'), 10, 3, datetime(2024, 1, 1, 12, 0, 25, tzinfo=timezone.utc))
+
+        self.assertEqual(
+            cw_client.get_metric_data.call_args.kwargs['EndTime'], datetime(2024, 1, 1, 12, 0, 20, tzinfo=timezone.utc))
+
+    def test_get_metric_datapoints_metric_math(self) -> None:
+        cw_client = MagicMock()
+
+        self.assertEqual(get_metric_datapoints(cw_client, {'AlarmName': 'alarm3', 'Metrics': []}, 10, 3), [])
+        cw_client.get_metric_data.assert_not_called()
@@ -1,5 +1,8 @@
 import unittest
+from unittest.mock import MagicMock
 from elb_load_monitor.elb_listener_rule import ELBListenerRule
+from elb_load_monitor.shed_strategy import AIMDStepPolicy, ShedStrategy
+from elb_load_monitor.shed_strategy import EvenWeightDistribution, GuardedWeightDistribution
 
 
 class TestELBListenerRule(unittest.TestCase):
@@ -214,6 +217,19 @@ class TestELBListenerRule(unittest.TestCase):
         self.assertEqual(rule.forward_configs['primary'], 50)
         self.assertEqual(rule.forward_configs['secondary'], 50)
 
+    def test_shed_into_saturated_target_groups(self) -> None:
+        """Test weight no other target group can take stays with the source"""
+        rule = ELBListenerRule("arn", "listener", False)
+        rule.add_forward_config("primary", 80)
+        rule.add_forward_config("secondary", 20)
+
+        rule.shed('primary', 10, 100, ShedStrategy(
+            weight_distribution=GuardedWeightDistribution(EvenWeightDistribution(), {'secondary'})))
+
+        self.assertEqual(rule.forward_configs['primary'], 80)
+        self.assertEqual(rule.forward_configs['secondary'], 20)
+        self.assertFalse(rule.is_dirty())
+
     def test_restore_with_zero_weight(self) -> None:
         """Test restore when STG has 0 weight"""
         rule = ELBListenerRule("arn", "listener", False)
@@ -263,3 +279,77 @@ class TestELBListenerRule(unittest.TestCase):
         # Should shed all 10, not go negative
         self.assertEqual(rule.forward_configs['primary'], 0)
         self.assertEqual(rule.forward_configs['secondary'], 100)
+
+    def test_shed_and_restore_aimd(self) -> None:
+        """Test the AIMD policy halves the weight on each shed and restores in linear steps"""
+        shed_strategy = ShedStrategy(AIMDStepPolicy(0.5))
+
+        rule = ELBListenerRule("arn", "listener", False)
+        rule.add_forward_config("primary", 100)
+        rule.add_forward_config("secondary", 0)
+
+        rule.shed('primary', 5, 100, shed_strategy)
+        self.assertEqual(rule.forward_configs['primary'], 50)
+
+        rule.shed('primary', 5, 100, shed_strategy)
+        self.assertEqual(rule.forward_configs['primary'], 25)
+        self.assertEqual(rule.forward_configs['secondary'], 75)
+
+        # still bounded by the maximum shed weight
+        rule.shed('primary', 5, 80, shed_strategy)
+        self.assertEqual(rule.forward_configs['primary'], 20)
+
+        rule.restore('primary', 5, shed_strategy)
+        self.assertEqual(rule.forward_configs['primary'], 25)
+        self.assertEqual(rule.forward_configs['secondary'], 75)
+
+    def test_save_skips_unchanged_rule(self) -> None:
+        """Test save does not call the ELB API when the weights did not change"""
+        elbv2_client = MagicMock()
+        rule = ELBListenerRule("arn", "listener", False)
+        rule.add_forward_config("primary", 100)
+        rule.add_forward_config("secondary", 0)
+
+        self.assertFalse(rule.is_dirty())
+        self.assertFalse(rule.save(elbv2_client))
+        elbv2_client.modify_rule.assert_not_called()
+
+        # shedding from a target group not in the rule leaves the rule unchanged
+        rule.shed('other', 10, 100)
+        self.assertFalse(rule.save(elbv2_client))
+        elbv2_client.modify_rule.assert_not_called()
+
+    def test_save_writes_changed_rule_once(self) -> None:
+        """Test save writes a changed rule and marks it clean"""
+        elbv2_client = MagicMock()
+        rule = ELBListenerRule("arn", "listener", False)
+        rule.add_forward_config("primary", 100)
+        rule.add_forward_config("secondary", 0)
+
+        rule.shed('primary', 10, 100)
+        self.assertTrue(rule.is_dirty())
+        self.assertTrue(rule.save(elbv2_client))
+        self.assertFalse(rule.is_dirty())
+        self.assertFalse(rule.save(elbv2_client))
+
+        elbv2_client.modify_rule.assert_called_once()
+
+    def test_save_default_rule(self) -> None:
+        """Test save modifies the listener for the default rule"""
+        elbv2_client = MagicMock()
+        rule = ELBListenerRule("arn", "listener", True)
+        rule.add_forward_config("primary", 100)
+        rule.add_forward_config("secondary", 0)
+
+        rule.shed('primary', 10, 100)
+        self.assertTrue(rule.save(elbv2_client))
+
+        elbv2_client.modify_listener.assert_called_once()
+        elbv2_client.modify_rule.assert_not_called()
+
+    def test_is_sheddable_missing_target_group(self) -> None:
+        """Test is_sheddable is False for rules not forwarding to the target group"""
+        rule = ELBListenerRule("arn", "listener", False)
+        rule.add_forward_config("secondary", 100)
+
+        self.assertFalse(rule.is_sheddable('primary', 100))
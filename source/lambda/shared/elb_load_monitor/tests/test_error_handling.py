@@ -3,6 +3,7 @@ from unittest.mock import MagicMock
 from botocore.exceptions import ClientError
 from elb_load_monitor.alb_listener_rules_handler import ALBListenerRulesHandler
 from elb_load_monitor.alb_alarm_messages import ALBAlarmEvent, CWAlarmState, ALBAlarmAction
+from elb_load_monitor.rule_writer import ELBRuleWriteError
 
 
 @pytest.fixture
@@ -144,3 +145,44 @@ def test_describe_rules_with_no_forward_actions():
     
     # Should skip non-forward rules
     assert len(handler.get_elb_rules()) == 0
+
+
+def test_modify_rule_failure_raises_after_all_rules_written():
+    """Test a failed rule write is reported after the other rules are written"""
+    elbv2 = MagicMock()
+    elbv2.describe_rules.return_value = {
+        'Rules': [{
+            'RuleArn': 'arn:rule' + str(i),
+            'IsDefault': False,
+            'Actions': [{
+                'Type': 'forward',
+                'ForwardConfig': {
+                    'TargetGroups': [
+                        {'TargetGroupArn': 'arn:tg', 'Weight': 100},
+                        {'TargetGroupArn': 'arn:tg2', 'Weight': 0}
+                    ]
+                }
+            }]
+        } for i in range(3)]
+    }
+
+    def modify_rule(RuleArn, Actions):
+        if RuleArn == 'arn:rule1':
+            raise ClientError({'Error': {'Code': 'AccessDenied', 'Message': 'Access denied'}}, 'ModifyRule')
+
+    elbv2.modify_rule.side_effect = modify_rule
+
+    handler = ALBListenerRulesHandler(
+        elbv2, 'arn:lb', 'arn:listener', 'arn:tg', 5, 100, 5, 60, 120
+    )
+
+    with pytest.raises(ELBRuleWriteError) as error:
+        handler.shed(elbv2, 'arn:tg', 5, 100)
+
+    assert 'arn:rule1' in str(error.value)
+    assert elbv2.modify_rule.call_count == 3
+    assert handler.rule_writes == 2
+    # the failed write is not counted as a skipped rule
+    assert handler.rule_writes_skipped == 0
+    assert handler.rule_write_failures == 1
+    assert [result.saved for result in handler.rule_write_results] == [True, False, True]
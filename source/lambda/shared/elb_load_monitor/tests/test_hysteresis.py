@@ -0,0 +1,76 @@
+from elb_load_monitor.hysteresis import HysteresisState
+from elb_load_monitor.hysteresis import ShedHysteresis
+from elb_load_monitor.hysteresis import get_shed_hysteresis
+
+import unittest
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class TestShedHysteresis(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.clock = FakeClock()
+
+    def test_shed_hold(self) -> None:
+        hysteresis = ShedHysteresis(shed_hold_sec=300, clock=self.clock)
+        hysteresis_state = HysteresisState()
+
+        hysteresis.record_shed(hysteresis_state)
+        self.assertEqual(hysteresis_state.last_shed_at, 1000)
+
+        self.clock.now += 60
+        hysteresis.record_ok(hysteresis_state)
+        self.assertFalse(hysteresis.can_restore(hysteresis_state))
+
+        self.clock.now += 240
+        self.assertTrue(hysteresis.can_restore(hysteresis_state))
+
+    def test_restore_cooldown(self) -> None:
+        hysteresis = ShedHysteresis(restore_cooldown_sec=120, clock=self.clock)
+        hysteresis_state = HysteresisState()
+
+        # never restore before an OK evaluation
+        self.assertFalse(hysteresis.can_restore(hysteresis_state))
+
+        hysteresis.record_ok(hysteresis_state)
+        self.clock.now += 60
+        hysteresis.record_ok(hysteresis_state)
+        self.assertFalse(hysteresis.can_restore(hysteresis_state))
+
+        self.clock.now += 60
+        hysteresis.record_ok(hysteresis_state)
+        self.assertEqual(hysteresis_state.ok_since, 1000)
+        self.assertTrue(hysteresis.can_restore(hysteresis_state))
+
+    def test_ok_evaluations_reset_by_alarm(self) -> None:
+        hysteresis = ShedHysteresis(restore_ok_evaluations=3, clock=self.clock)
+        hysteresis_state = HysteresisState()
+
+        hysteresis.record_ok(hysteresis_state)
+        hysteresis.record_ok(hysteresis_state)
+        self.assertFalse(hysteresis.can_restore(hysteresis_state))
+
+        # a flap back into ALARM starts the count again
+        hysteresis.record_alarm(hysteresis_state)
+        self.assertIsNone(hysteresis_state.ok_since)
+
+        hysteresis.record_ok(hysteresis_state)
+        hysteresis.record_ok(hysteresis_state)
+        self.assertFalse(hysteresis.can_restore(hysteresis_state))
+
+        hysteresis.record_ok(hysteresis_state)
+        self.assertTrue(hysteresis.can_restore(hysteresis_state))
+
+    def test_get_shed_hysteresis(self) -> None:
+        self.assertIsNone(get_shed_hysteresis(0, 0, 1))
+
+        hysteresis = get_shed_hysteresis(300, 0, 2)
+        self.assertEqual(hysteresis.shed_hold_sec, 300)
+        self.assertEqual(hysteresis.restore_ok_evaluations, 2)
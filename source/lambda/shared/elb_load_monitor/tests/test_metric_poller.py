@@ -0,0 +1,141 @@
+from datetime import datetime, timedelta, timezone
+from elb_load_monitor.alb_alarm_messages import CWAlarmState
+from elb_load_monitor.metric_poller import MetricPoller
+from elb_load_monitor.metric_poller import evaluate_datapoints
+from elb_load_monitor.metric_poller import get_metric_poller
+from unittest.mock import MagicMock, patch
+
+import unittest
+
+SPIKE_START = datetime(2024, 1, 1, 12, 0, tzinfo=timezone.utc)
+
+
+def metric_alarm(period: int = 60, evaluation_periods: int = 3) -> dict:
+    return {
+        'AlarmName': 'alarm',
+        'Namespace': 'AWS/ApplicationELB',
+        'MetricName': 'RequestCountPerTarget',
+        'Dimensions': [{'Name': 'TargetGroup', 'Value': 'targetgroup/tg/1'}],
+        'Statistic': 'Sum',
+        'Period': period,
+        'EvaluationPeriods': evaluation_periods,
+        'Threshold': 100.0,
+        'ComparisonOperator': 'GreaterThanThreshold'
+    }
+
+
+class MinuteMetric:
+    """
+    A metric published once a minute like the standard ALB metrics, that jumps from 50 to 200
+    at SPIKE_START. The datapoint of a minute can be read publish_delay_sec after the minute
+    ends. Periods below a minute return the minute datapoints in the requested range.
+    """
+    def __init__(self, publish_delay_sec: int) -> None:
+        self.publish_delay_sec = publish_delay_sec
+        self.now = SPIKE_START
+
+    def get_metric_data(self, **kwargs) -> dict:
+        minute = SPIKE_START - timedelta(minutes=10)
+        values = []
+
+        while minute < kwargs['EndTime']:
+            published = minute + timedelta(seconds=60 + self.publish_delay_sec) <= self.now
+
+            if minute >= kwargs['StartTime'] and published:
+                values.insert(0, 200.0 if minute >= SPIKE_START else 50.0)
+
+            minute += timedelta(minutes=1)
+
+        return {'MetricDataResults': [{'Id': 'm0', 'Values': values[:kwargs.get('MaxDatapoints')]}]}
+
+
+def get_time_to_alarm_sec(
+    metric_poller: MetricPoller, interval_sec: int, publish_delay_sec: int, max_sec: int = 600
+) -> int:
+    """
+    Polls the minute metric every interval_sec from SPIKE_START and returns the seconds until
+    the poller first reports ALARM, or None if it does not within max_sec.
+    """
+    minute_metric = MinuteMetric(publish_delay_sec)
+    cw_client = MagicMock()
+    cw_client.get_metric_data.side_effect = minute_metric.get_metric_data
+    elapsed_sec = 0
+
+    while elapsed_sec <= max_sec:
+        minute_metric.now = SPIKE_START + timedelta(seconds=elapsed_sec)
+
+        with patch('elb_load_monitor.cw_metrics.datetime') as mock_datetime:
+            mock_datetime.now.return_value = minute_metric.now
+
+            if metric_poller.poll(cw_client, metric_alarm()) == CWAlarmState.ALARM:
+                return elapsed_sec
+
+        elapsed_sec += interval_sec
+
+    return None
+
+
+class TestMetricPoller(unittest.TestCase):
+
+    def test_evaluate_datapoints(self) -> None:
+        self.assertEqual(
+            evaluate_datapoints([150.0, 120.0, 110.0], 100.0, 'GreaterThanThreshold', 3), CWAlarmState.ALARM)
+        self.assertEqual(
+            evaluate_datapoints([150.0, 100.0, 110.0], 100.0, 'GreaterThanThreshold', 3), CWAlarmState.OK)
+        self.assertEqual(
+            evaluate_datapoints([150.0, 100.0, 110.0], 100.0, 'GreaterThanOrEqualToThreshold', 3),
+            CWAlarmState.ALARM)
+        self.assertEqual(
+            evaluate_datapoints([150.0, 50.0, 110.0], 100.0, 'GreaterThanThreshold', 2), CWAlarmState.ALARM)
+        self.assertEqual(
+            evaluate_datapoints([50.0, 20.0], 100.0, 'LessThanThreshold', 2), CWAlarmState.ALARM)
+        self.assertEqual(
+            evaluate_datapoints([150.0], 100.0, 'GreaterThanThreshold', 3), CWAlarmState.INSUFFICIENT_DATA)
+        self.assertEqual(
+            evaluate_datapoints([150.0, 150.0, 150.0], None, 'GreaterThanThreshold', 3),
+            CWAlarmState.INSUFFICIENT_DATA)
+
+    def test_poll(self) -> None:
+        cw_client = MagicMock()
+        cw_client.get_metric_data.return_value = {
+            'MetricDataResults': [{'Id': 'm0', 'Values': [150.0, 50.0, 110.0]}]
+        }
+
+        metric_poller = MetricPoller(poll_period_sec=10, evaluation_periods=3, datapoints_to_alarm=2)
+
+        self.assertEqual(metric_poller.poll(cw_client, metric_alarm()), CWAlarmState.ALARM)
+
+        get_metric_data_args = cw_client.get_metric_data.call_args.kwargs
+        self.assertEqual(get_metric_data_args['MetricDataQueries'][0]['MetricStat']['Period'], 10)
+        self.assertEqual(get_metric_data_args['MaxDatapoints'], 3)
+        self.assertEqual(get_metric_data_args['EndTime'] - get_metric_data_args['StartTime'], timedelta(seconds=40))
+
+    def test_time_to_first_shed(self) -> None:
+        # the alarm is evaluated once a minute and the poller every 10 seconds, on the same 3
+        # breaching minutes. Polling only saves the wait for the alarm to pick up the last of them
+        gains_sec = []
+
+        for publish_delay_sec in range(0, 60, 10):
+            alarm_time_to_alarm_sec = get_time_to_alarm_sec(
+                MetricPoller(poll_period_sec=60, evaluation_periods=3), 60, publish_delay_sec)
+            polled_time_to_alarm_sec = get_time_to_alarm_sec(
+                MetricPoller(poll_period_sec=60, evaluation_periods=3), 10, publish_delay_sec)
+
+            self.assertEqual(polled_time_to_alarm_sec, 180 + publish_delay_sec)
+            gains_sec.append(alarm_time_to_alarm_sec - polled_time_to_alarm_sec)
+
+        self.assertEqual(gains_sec, [0, 50, 40, 30, 20, 10])
+
+    def test_poll_period_below_metric_resolution(self) -> None:
+        # 10 second datapoints of a metric published once a minute never fill the evaluation
+        # periods, so the alarm state is used instead
+        self.assertIsNone(get_time_to_alarm_sec(MetricPoller(poll_period_sec=10, evaluation_periods=3), 10, 0))
+
+    def test_get_metric_poller(self) -> None:
+        self.assertIsNone(get_metric_poller(False, 10, 3))
+
+        metric_poller = get_metric_poller(True, 30, 2)
+
+        self.assertEqual(metric_poller.poll_period_sec, 30)
+        self.assertEqual(metric_poller.evaluation_periods, 2)
+        self.assertEqual(metric_poller.datapoints_to_alarm, 2)
@@ -0,0 +1,95 @@
+from elb_load_monitor.elb_listener_rule import ELBListenerRule
+from elb_load_monitor.metrics import EMFMetrics
+from elb_load_monitor.metrics import InMemoryRecordSink
+from elb_load_monitor.metrics import get_metrics
+from elb_load_monitor.metrics import put_control_step_metrics
+from unittest.mock import MagicMock
+
+import unittest
+
+
+class TestEMFMetrics(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.sink = InMemoryRecordSink()
+        self.metrics = EMFMetrics('Test', sink=self.sink, clock=lambda: 1700000000.5)
+
+        return
+
+    def test_flush(self) -> None:
+        self.metrics.put_metric('Latency', 12.5, 'Milliseconds', {'Operation': 'describe_rules'})
+        self.metrics.put_metric('Latency', 7.5, 'Milliseconds', {'Operation': 'describe_rules'})
+        self.metrics.put_metric('Errors', 1, 'Count', {'Operation': 'describe_rules'})
+        self.metrics.put_metric('Latency', 3.0, 'Milliseconds', {'Operation': 'modify_rule'})
+
+        # nothing is written until flushed
+        self.assertEqual(self.sink.records, [])
+
+        self.metrics.flush()
+
+        self.assertEqual(self.sink.records[0], {
+            '_aws': {
+                'Timestamp': 1700000000500,
+                'CloudWatchMetrics': [{
+                    'Namespace': 'Test',
+                    'Dimensions': [['Operation']],
+                    'Metrics': [{'Name': 'Latency', 'Unit': 'Milliseconds'}, {'Name': 'Errors', 'Unit': 'Count'}]
+                }]
+            },
+            'Operation': 'describe_rules',
+            'Latency': [12.5, 7.5],
+            'Errors': 1
+        })
+        self.assertEqual(self.sink.get_values('Latency', Operation='modify_rule'), [3.0])
+
+        self.metrics.flush()
+        self.assertEqual(len(self.sink.records), 2)
+
+    def test_flush_splits_values(self) -> None:
+        for value in range(250):
+            self.metrics.put_metric('Weight', value, 'Percent', {'TargetGroup': 'tg'})
+
+        self.metrics.flush()
+
+        self.assertEqual([len(record['Weight']) for record in self.sink.records], [100, 100, 50])
+        self.assertEqual(self.sink.get_values('Weight', TargetGroup='tg'), list(range(250)))
+
+    def test_instrument(self) -> None:
+        elbv2_client = MagicMock()
+        elbv2_client.describe_rules.return_value = {'Rules': []}
+        elbv2_client.modify_rule.side_effect = Exception('Access denied')
+
+        instrumented_client = self.metrics.instrument(elbv2_client, 'elbv2')
+
+        self.assertEqual(instrumented_client.describe_rules(ListenerArn='listener'), {'Rules': []})
+        self.assertRaises(Exception, instrumented_client.modify_rule, RuleArn='rule')
+        elbv2_client.describe_rules.assert_called_once_with(ListenerArn='listener')
+        self.assertIs(self.metrics.instrument(instrumented_client, 'elbv2'), instrumented_client)
+
+        self.metrics.flush()
+
+        self.assertEqual(len(self.sink.get_values('ApiLatency', Service='elbv2', Operation='describe_rules')), 1)
+        self.assertEqual(len(self.sink.get_values('ApiLatency', Service='elbv2', Operation='modify_rule')), 1)
+        self.assertEqual(self.sink.get_values('ApiErrors', Operation='modify_rule'), [1])
+        self.assertEqual(self.sink.get_values('ApiErrors', Operation='describe_rules'), [])
+
+    def test_put_control_step_metrics(self) -> None:
+        elb_rules = []
+
+        for primary_weight in (80, 90):
+            elb_rule = ELBListenerRule('rule' + str(primary_weight), 'listener', False)
+            elb_rule.add_forward_config('primary', primary_weight)
+            elb_rule.add_forward_config('secondary', 100 - primary_weight)
+            elb_rules.append(elb_rule)
+
+        put_control_step_metrics(self.metrics, 'primary', 'SHED', 42.0, elb_rules)
+        self.metrics.flush()
+
+        self.assertEqual(self.sink.get_values('DecisionLatency', TargetGroup='primary'), [42.0])
+        self.assertEqual(self.sink.get_values('Actions', TargetGroup='primary', Action='SHED'), [1])
+        self.assertEqual(self.sink.get_values('TargetGroupWeight', TargetGroup='primary'), [80, 90])
+        self.assertEqual(self.sink.get_values('TargetGroupWeight', TargetGroup='secondary'), [20, 10])
+
+    def test_get_metrics(self) -> None:
+        self.assertIsNone(get_metrics(False))
+        self.assertEqual(get_metrics(True, 'Test').namespace, 'Test')
@@ -0,0 +1,98 @@
+from elb_load_monitor.rule_cache import ListenerRuleCache
+from elb_load_monitor.rule_cache import get_forward_weights
+from elb_load_monitor.rule_cache import get_rule_cache
+
+import unittest
+
+
+def rule_entry(rule_arn: str, primary_weight: int) -> dict:
+    return {
+        'RuleArn': rule_arn,
+        'IsDefault': False,
+        'Actions': [{
+            'Type': 'forward',
+            'ForwardConfig': {
+                'TargetGroups': [
+                    {'TargetGroupArn': 'primary', 'Weight': primary_weight},
+                    {'TargetGroupArn': 'secondary', 'Weight': 100 - primary_weight}
+                ]
+            }
+        }]
+    }
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class TestListenerRuleCache(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.clock = FakeClock()
+        self.rule_cache = ListenerRuleCache(ttl_sec=60, max_listeners=2, clock=self.clock)
+
+    def test_disabled_cache(self) -> None:
+        rule_cache = ListenerRuleCache(ttl_sec=0)
+        rule_cache.put('listener', [rule_entry('rule', 100)])
+
+        self.assertIsNone(rule_cache.get('listener'))
+
+    def test_get_put_and_ttl(self) -> None:
+        rule_entries = [rule_entry('rule', 100)]
+        self.rule_cache.put('listener', rule_entries)
+
+        # the cache keeps its own copy
+        rule_entries[0]['RuleArn'] = 'changed'
+
+        self.assertEqual(self.rule_cache.get('listener')[0]['RuleArn'], 'rule')
+
+        self.clock.now = 60
+        self.assertIsNone(self.rule_cache.get('listener'))
+        self.assertEqual(self.rule_cache.hits, 1)
+        self.assertEqual(self.rule_cache.misses, 1)
+
+    def test_lru_eviction(self) -> None:
+        self.rule_cache.put('listener1', [rule_entry('rule1', 100)])
+        self.rule_cache.put('listener2', [rule_entry('rule2', 100)])
+        self.rule_cache.get('listener1')
+        self.rule_cache.put('listener3', [rule_entry('rule3', 100)])
+
+        self.assertIsNotNone(self.rule_cache.get('listener1'))
+        self.assertIsNone(self.rule_cache.get('listener2'))
+        self.assertIsNotNone(self.rule_cache.get('listener3'))
+
+    def test_update_weights(self) -> None:
+        self.rule_cache.put('listener', [rule_entry('rule1', 100), rule_entry('rule2', 100)])
+        self.rule_cache.update_weights('listener', 'rule2', [
+            {'TargetGroupArn': 'primary', 'Weight': 90},
+            {'TargetGroupArn': 'secondary', 'Weight': 10}
+        ])
+
+        rule_entries = self.rule_cache.get('listener')
+
+        self.assertEqual(get_forward_weights(rule_entries[0]), {'primary': 100, 'secondary': 0})
+        self.assertEqual(get_forward_weights(rule_entries[1]), {'primary': 90, 'secondary': 10})
+
+    def test_invalidate(self) -> None:
+        self.rule_cache.put('listener', [rule_entry('rule', 100)])
+        self.rule_cache.invalidate('listener')
+
+        self.assertIsNone(self.rule_cache.get('listener'))
+
+    def test_get_forward_weights_non_forward_rule(self) -> None:
+        self.assertEqual(get_forward_weights({'RuleArn': 'rule', 'Actions': [{'Type': 'redirect'}]}), {})
+        self.assertEqual(get_forward_weights({'RuleArn': 'rule', 'Actions': []}), {})
+
+    def test_get_rule_cache_is_shared(self) -> None:
+        rule_cache = get_rule_cache(30, 4, False)
+
+        self.assertIs(get_rule_cache(30, 4, False), rule_cache)
+        self.assertEqual(rule_cache.ttl_sec, 30)
+        self.assertEqual(rule_cache.max_listeners, 4)
+        self.assertFalse(rule_cache.validate)
+
+        get_rule_cache(0, 16, True).clear()
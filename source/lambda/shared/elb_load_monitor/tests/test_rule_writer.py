@@ -0,0 +1,165 @@
+from botocore.exceptions import ClientError
+from elb_load_monitor.elb_listener_rule import ELBListenerRule
+from elb_load_monitor.elb_listener_rule import ELBRuleConflictError
+from elb_load_monitor.rule_writer import ELBRuleWriter
+from elb_load_monitor.rule_writer import is_throttling_error
+from unittest.mock import MagicMock
+
+import threading
+import time
+import unittest
+
+
+def throttling_error() -> ClientError:
+    return ClientError({'Error': {'Code': 'Throttling', 'Message': 'Rate exceeded'}}, 'ModifyRule')
+
+
+def dirty_rule(rule_arn: str) -> ELBListenerRule:
+    elb_rule = ELBListenerRule(rule_arn, 'listener', False)
+    elb_rule.add_forward_config('primary', 100)
+    elb_rule.add_forward_config('secondary', 0)
+    elb_rule.shed('primary', 10, 100)
+
+    return elb_rule
+
+
+def describe_rules_response(rule_arn: str, primary_weight: int) -> dict:
+    return {'Rules': [{
+        'RuleArn': rule_arn,
+        'Actions': [{'Type': 'forward', 'ForwardConfig': {'TargetGroups': [
+            {'TargetGroupArn': 'primary', 'Weight': primary_weight},
+            {'TargetGroupArn': 'secondary', 'Weight': 100 - primary_weight}
+        ]}}]
+    }]}
+
+
+class TestELBRuleWriter(unittest.TestCase):
+
+    def test_write_skips_clean_rules(self) -> None:
+        elbv2_client = MagicMock()
+        clean_rule = ELBListenerRule('clean', 'listener', False)
+        clean_rule.add_forward_config('primary', 100)
+
+        results = ELBRuleWriter().write(elbv2_client, [clean_rule, dirty_rule('dirty')])
+
+        self.assertEqual([result.elb_rule_arn for result in results], ['dirty'])
+        self.assertTrue(results[0].saved)
+        self.assertEqual(results[0].attempts, 1)
+        self.assertGreaterEqual(results[0].latency_ms, 0)
+        elbv2_client.modify_rule.assert_called_once()
+
+    def test_write_runs_in_parallel_with_concurrency_cap(self) -> None:
+        lock = threading.Lock()
+        active = [0, 0]
+
+        def modify_rule(**kwargs):
+            with lock:
+                active[0] += 1
+                active[1] = max(active[1], active[0])
+            time.sleep(0.02)
+            with lock:
+                active[0] -= 1
+
+        elbv2_client = MagicMock()
+        elbv2_client.modify_rule.side_effect = modify_rule
+        elb_rules = [dirty_rule('rule' + str(i)) for i in range(8)]
+
+        results = ELBRuleWriter(max_concurrency=3).write(elbv2_client, elb_rules)
+
+        self.assertEqual([result.elb_rule_arn for result in results], ['rule' + str(i) for i in range(8)])
+        self.assertTrue(all(result.saved for result in results))
+        self.assertEqual(elbv2_client.modify_rule.call_count, 8)
+        self.assertGreater(active[1], 1)
+        self.assertLessEqual(active[1], 3)
+
+    def test_write_retries_throttling(self) -> None:
+        sleep = MagicMock()
+        elbv2_client = MagicMock()
+        elbv2_client.modify_rule.side_effect = [throttling_error(), throttling_error(), None]
+        elb_rule = dirty_rule('rule')
+
+        results = ELBRuleWriter(sleep=sleep).write(elbv2_client, [elb_rule])
+
+        self.assertTrue(results[0].saved)
+        self.assertEqual(results[0].attempts, 3)
+        self.assertEqual(sleep.call_count, 2)
+        self.assertFalse(elb_rule.is_dirty())
+
+    def test_write_gives_up_after_max_attempts(self) -> None:
+        elbv2_client = MagicMock()
+        elbv2_client.modify_rule.side_effect = throttling_error()
+        elb_rule = dirty_rule('rule')
+
+        results = ELBRuleWriter(max_attempts=3, sleep=MagicMock()).write(elbv2_client, [elb_rule])
+
+        self.assertFalse(results[0].saved)
+        self.assertEqual(results[0].attempts, 3)
+        self.assertIsInstance(results[0].error, ClientError)
+        self.assertTrue(elb_rule.is_dirty())
+        self.assertIn('error', results[0].to_json())
+
+    def test_write_does_not_retry_other_errors(self) -> None:
+        elbv2_client = MagicMock()
+        elbv2_client.modify_rule.side_effect = ClientError(
+            {'Error': {'Code': 'AccessDenied', 'Message': 'Access denied'}}, 'ModifyRule')
+
+        results = ELBRuleWriter(sleep=MagicMock()).write(elbv2_client, [dirty_rule('rule')])
+
+        self.assertEqual(results[0].attempts, 1)
+        self.assertIsNotNone(results[0].error)
+
+    def test_write_checks_rule_version(self) -> None:
+        elbv2_client = MagicMock()
+        elbv2_client.describe_rules.side_effect = lambda RuleArns: describe_rules_response(RuleArns[0], 100)
+        elb_rules = [dirty_rule('rule' + str(i)) for i in range(4)]
+
+        results = ELBRuleWriter(version_check=True).write(elbv2_client, elb_rules)
+
+        # unchanged rules are read once each and written as shed
+        self.assertTrue(all(result.saved and result.conflicts == 0 for result in results))
+        self.assertEqual(elbv2_client.describe_rules.call_count, 4)
+        self.assertEqual(elbv2_client.modify_rule.call_count, 4)
+        self.assertEqual(elb_rules[0].forward_configs, {'primary': 90, 'secondary': 10})
+
+    def test_write_merges_concurrent_change(self) -> None:
+        elbv2_client = MagicMock()
+        # another invocation shed 20 after the rule was read
+        elbv2_client.describe_rules.return_value = describe_rules_response('rule', 80)
+        elb_rule = dirty_rule('rule')
+
+        results = ELBRuleWriter(version_check=True).write(elbv2_client, [elb_rule])
+
+        self.assertTrue(results[0].saved)
+        self.assertEqual(results[0].attempts, 2)
+        self.assertEqual(results[0].to_json()['conflicts'], 1)
+        self.assertEqual(elbv2_client.describe_rules.call_count, 2)
+        self.assertEqual(elbv2_client.modify_rule.call_args.kwargs['Actions'][0]['ForwardConfig']['TargetGroups'], [
+            {'TargetGroupArn': 'primary', 'Weight': 70},
+            {'TargetGroupArn': 'secondary', 'Weight': 30}
+        ])
+        self.assertFalse(elb_rule.is_dirty())
+
+    def test_write_does_not_overwrite_conflicting_change(self) -> None:
+        elbv2_client = MagicMock()
+        elbv2_client.describe_rules.return_value = describe_rules_response('rule', 5)
+
+        results = ELBRuleWriter(version_check=True).write(elbv2_client, [dirty_rule('rule')])
+
+        self.assertFalse(results[0].saved)
+        self.assertIsInstance(results[0].error, ELBRuleConflictError)
+        elbv2_client.modify_rule.assert_not_called()
+
+        # a rule that never holds still is not written either
+        elbv2_client.describe_rules.return_value = None
+        elbv2_client.describe_rules.side_effect = [
+            describe_rules_response('rule', primary_weight) for primary_weight in (80, 70, 60)]
+
+        results = ELBRuleWriter(max_attempts=3, version_check=True).write(elbv2_client, [dirty_rule('rule')])
+
+        self.assertFalse(results[0].saved)
+        self.assertEqual(results[0].conflicts, 3)
+        elbv2_client.modify_rule.assert_not_called()
+
+    def test_is_throttling_error(self) -> None:
+        self.assertTrue(is_throttling_error(throttling_error()))
+        self.assertFalse(is_throttling_error(Exception('Throttling')))
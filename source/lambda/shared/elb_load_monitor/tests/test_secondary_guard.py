@@ -0,0 +1,80 @@
+from elb_load_monitor.secondary_guard import SecondaryHealthGuard
+from elb_load_monitor.secondary_guard import get_secondary_health_guard
+from elb_load_monitor.secondary_guard import get_target_group_metric_alarm
+from unittest.mock import MagicMock
+
+import unittest
+
+SECONDARY_ARN = 'arn:aws:elasticloadbalancing:us-east-1:YOUR_ACCOUNT_ID_HERE:targetgroup/secondary/1'
+TERTIARY_ARN = 'arn:aws:elasticloadbalancing:us-east-1:YOUR_ACCOUNT_ID_HERE:targetgroup/tertiary/2'
+QUATERNARY_ARN = 'arn:aws:elasticloadbalancing:us-east-1:YOUR_ACCOUNT_ID_HERE:targetgroup/quaternary/3'
+
+
+def metric_alarm() -> dict:
+    return {
+        'AlarmName': 'alarm',
+        'Namespace': 'AWS/ApplicationELB',
+        'MetricName': 'RequestCountPerTarget',
+        'Dimensions': [
+            {'Name': 'TargetGroup', 'Value': 'targetgroup/primary/0'},
+            {'Name': 'LoadBalancer', 'Value': 'app/alb/1'}
+        ],
+        'Statistic': 'Sum',
+        'Period': 60,
+        'Threshold': 1000.0,
+        'ComparisonOperator': 'GreaterThanThreshold'
+    }
+
+
+class TestSecondaryHealthGuard(unittest.TestCase):
+
+    def test_get_target_group_metric_alarm(self) -> None:
+        primary_metric_alarm = metric_alarm()
+
+        secondary_metric_alarm = get_target_group_metric_alarm(primary_metric_alarm, SECONDARY_ARN)
+
+        self.assertEqual(secondary_metric_alarm['Dimensions'], [
+            {'Name': 'TargetGroup', 'Value': 'targetgroup/secondary/1'},
+            {'Name': 'LoadBalancer', 'Value': 'app/alb/1'}
+        ])
+        # the alarm of the primary is not changed
+        self.assertEqual(primary_metric_alarm['Dimensions'][0]['Value'], 'targetgroup/primary/0')
+
+        self.assertIsNone(get_target_group_metric_alarm({'AlarmName': 'alarm', 'Dimensions': []}, SECONDARY_ARN))
+
+    def test_check(self) -> None:
+        cw_client = MagicMock()
+        cw_client.get_metric_data.return_value = {
+            'MetricDataResults': [
+                {'Id': 'm0', 'Values': [1200.0]},
+                {'Id': 'm1', 'Values': [850.0]},
+                {'Id': 'm2', 'Values': []}
+            ]
+        }
+
+        secondary_health_guard = SecondaryHealthGuard(max_utilization=0.8)
+
+        decisions = secondary_health_guard.check(
+            cw_client, metric_alarm(), [SECONDARY_ARN, TERTIARY_ARN, QUATERNARY_ARN])
+
+        # one GetMetricData call for every secondary
+        cw_client.get_metric_data.assert_called_once()
+        self.assertEqual(len(cw_client.get_metric_data.call_args.kwargs['MetricDataQueries']), 3)
+
+        self.assertEqual(decisions[SECONDARY_ARN].to_json(), {
+            'targetGroupArn': SECONDARY_ARN, 'decision': 'skip', 'metricValue': 1200.0, 'threshold': 800.0})
+        self.assertTrue(decisions[SECONDARY_ARN].is_saturated())
+        self.assertEqual(decisions[TERTIARY_ARN].decision, 'skip')
+        self.assertEqual(decisions[QUATERNARY_ARN].decision, 'unknown')
+        self.assertFalse(decisions[QUATERNARY_ARN].is_saturated())
+
+        cw_client.get_metric_data.return_value = {
+            'MetricDataResults': [{'Id': 'm0', 'Values': [1200.0]}, {'Id': 'm1', 'Values': [850.0]}]
+        }
+
+        decisions = SecondaryHealthGuard().check(cw_client, metric_alarm(), [SECONDARY_ARN, TERTIARY_ARN])
+        self.assertEqual(decisions[TERTIARY_ARN].decision, 'allow')
+
+    def test_get_secondary_health_guard(self) -> None:
+        self.assertIsNone(get_secondary_health_guard(False, 1.0))
+        self.assertEqual(get_secondary_health_guard(True, 0.7).max_utilization, 0.7)
@@ -0,0 +1,140 @@
+from elb_load_monitor.shed_budget import DynamoDBShedBudgetStore
+from elb_load_monitor.shed_budget import InMemoryShedBudgetStore
+from elb_load_monitor.shed_budget import ShedBudget
+from elb_load_monitor.shed_budget import ShedBudgetConflictError
+from elb_load_monitor.shed_budget import get_budget_cap
+from elb_load_monitor.shed_budget import get_shed_budget
+from moto import mock_aws
+
+import boto3
+import unittest
+
+
+class ConflictingStore(InMemoryShedBudgetStore):
+    """
+    Changes the claims from another handler after the first conflicts reads.
+    """
+    def __init__(self, conflicts: int) -> None:
+        super().__init__()
+        self.conflicts = conflicts
+
+    def get_claims(self, secondary_group_arn: str) -> tuple:
+        claims, version = super().get_claims(secondary_group_arn)
+
+        if self.conflicts > 0:
+            self.conflicts -= 1
+            super().put_claims(secondary_group_arn, dict(claims, other=(20, 2000)), version)
+
+        return claims, version
+
+
+class TestShedBudget(unittest.TestCase):
+
+    def test_get_budget_cap(self) -> None:
+        # the first primary may use the whole budget
+        self.assertEqual(get_budget_cap({}, 'a', 30, 100), 30)
+        self.assertEqual(get_budget_cap({}, 'a', 120, 100), 100)
+        # the next gets its share, the rest stays free for the first to grow into its share
+        self.assertEqual(get_budget_cap({'a': 30}, 'b', 80, 100), 50)
+        self.assertEqual(get_budget_cap({'a': 60}, 'b', 80, 100), 40)
+        # a newcomer gets what is left when that is less than its share
+        self.assertEqual(get_budget_cap({'a': 30, 'b': 50}, 'c', 40, 100), 20)
+        # a primary over its share leaves room for an arriving one up to the fair share
+        self.assertEqual(get_budget_cap({'a': 70, 'b': 10}, 'b', 80, 100), 30)
+        # and may not grow past its share while others are below theirs
+        self.assertEqual(get_budget_cap({'a': 50, 'b': 10}, 'a', 80, 100), 50)
+        # a claim already held is kept, and shrinking is always allowed
+        self.assertEqual(get_budget_cap({'a': 70, 'b': 50}, 'a', 90, 100), 70)
+        self.assertEqual(get_budget_cap({'a': 70}, 'a', 20, 100), 20)
+
+    def test_acquire_and_record(self) -> None:
+        shed_budget = ShedBudget(InMemoryShedBudgetStore(), 60, claim_duration_sec=900, clock=lambda: 1000)
+
+        self.assertEqual(shed_budget.acquire('s', 'a', 40), 40)
+        self.assertEqual(shed_budget.acquire('s', 'b', 40), 20)
+        self.assertEqual(shed_budget.store.get_claims('s')[0], {'a': (40, 1900), 'b': (20, 1900)})
+
+        # restoring gives the budget back
+        shed_budget.record('s', 'a', 0)
+        self.assertEqual(shed_budget.get_claims('s'), {'b': 20})
+        self.assertEqual(shed_budget.acquire('s', 'b', 50), 50)
+
+    def test_acquire_retries_on_conflict(self) -> None:
+        shed_budget = ShedBudget(ConflictingStore(conflicts=2), 100, clock=lambda: 1000)
+
+        # the claim of the other handler is seen on the retry
+        self.assertEqual(shed_budget.acquire('s', 'a', 90), 50)
+        self.assertEqual(shed_budget.get_claims('s'), {'other': 20, 'a': 50})
+
+        shed_budget = ShedBudget(ConflictingStore(conflicts=5), 100, max_attempts=3, clock=lambda: 1000)
+
+        with self.assertRaises(ShedBudgetConflictError):
+            shed_budget.acquire('s', 'a', 90)
+
+    def test_expired_claims(self) -> None:
+        now = [1000]
+        shed_budget = ShedBudget(InMemoryShedBudgetStore(), 60, claim_duration_sec=900, clock=lambda: now[0])
+
+        self.assertEqual(shed_budget.acquire('s', 'a', 40), 40)
+        self.assertEqual(shed_budget.acquire('s', 'b', 40), 20)
+
+        # b renews its claim, a stops renewing and its claim no longer counts once expired
+        now[0] = 1500
+        shed_budget.record('s', 'b', 20)
+        now[0] = 1900
+        self.assertEqual(shed_budget.get_claims('s'), {'b': 20})
+        self.assertEqual(shed_budget.acquire('s', 'b', 50), 50)
+        self.assertEqual(shed_budget.store.get_claims('s')[0], {'b': (50, 2800)})
+
+    def test_get_shed_budget(self) -> None:
+        self.assertIsNone(get_shed_budget(0))
+        self.assertIsInstance(get_shed_budget(50).store, InMemoryShedBudgetStore)
+        self.assertEqual(get_shed_budget(50).budget_weight, 50)
+        self.assertEqual(get_shed_budget(50, claim_duration_sec=300).claim_duration_sec, 300)
+
+
+@mock_aws
+class TestDynamoDBShedBudgetStore(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.dynamodb_client = boto3.client('dynamodb', region_name='us-east-1')
+        self.dynamodb_client.create_table(
+            TableName='leases',
+            KeySchema=[{'AttributeName': 'leaseId', 'KeyType': 'HASH'}],
+            AttributeDefinitions=[{'AttributeName': 'leaseId', 'AttributeType': 'S'}],
+            BillingMode='PAY_PER_REQUEST')
+
+        self.store = DynamoDBShedBudgetStore(self.dynamodb_client, 'leases')
+
+        return
+
+    def test_put_and_get_claims(self) -> None:
+        self.assertEqual(self.store.get_claims('s'), ({}, 0))
+
+        self.store.put_claims('s', {'a': (30, 1900)}, 0)
+        self.assertEqual(self.store.get_claims('s'), ({'a': (30, 1900)}, 1))
+
+        # a write from a stale read conflicts
+        with self.assertRaises(ShedBudgetConflictError):
+            self.store.put_claims('s', {'b': (30, 1900)}, 0)
+
+        self.store.put_claims('s', {'a': (30, 1900), 'b': (30, 2500)}, 1)
+        self.assertEqual(self.store.get_claims('s'), ({'a': (30, 1900), 'b': (30, 2500)}, 2))
+
+        # the item expires with its last claim
+        item = self.dynamodb_client.get_item(TableName='leases', Key={'leaseId': {'S': 'budget#s'}})['Item']
+        self.assertEqual(item['expiresAt'], {'N': '2500'})
+
+    def test_claims_without_expiry(self) -> None:
+        self.dynamodb_client.put_item(TableName='leases', Item={
+            'leaseId': {'S': 'budget#s'}, 'claims': {'M': {'a': {'N': '30'}}}, 'version': {'N': '1'}
+        })
+
+        self.assertEqual(self.store.get_claims('s'), ({'a': (30, 0)}, 1))
+
+    def test_shared_between_budgets(self) -> None:
+        first_budget = get_shed_budget(60, 'leases', self.dynamodb_client)
+        second_budget = get_shed_budget(60, 'leases', self.dynamodb_client)
+
+        self.assertEqual(first_budget.acquire('s', 'a', 50), 50)
+        self.assertEqual(second_budget.acquire('s', 'b', 50), 10)
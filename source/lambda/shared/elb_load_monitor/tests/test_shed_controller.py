@@ -0,0 +1,54 @@
+from elb_load_monitor.shed_controller import ProportionalShedController
+from elb_load_monitor.shed_controller import get_shed_controller
+
+import unittest
+
+
+def metric_alarm(comparison_operator: str = 'GreaterThanThreshold', threshold: float = 100.0) -> dict:
+    return {
+        'AlarmName': 'alarm',
+        'StateValue': 'ALARM',
+        'Namespace': 'AWS/ApplicationELB',
+        'MetricName': 'RequestCountPerTarget',
+        'Dimensions': [{'Name': 'TargetGroup', 'Value': 'targetgroup/tg/1'}],
+        'Statistic': 'Sum',
+        'Period': 60,
+        'Threshold': threshold,
+        'ComparisonOperator': comparison_operator
+    }
+
+
+class TestProportionalShedController(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.shed_controller = ProportionalShedController(target_utilization=0.8)
+
+    def test_get_load_ratio(self) -> None:
+        # the metric against 80% of the threshold
+        self.assertEqual(self.shed_controller.get_load_ratio(metric_alarm(), 160.0), 2.0)
+        self.assertEqual(self.shed_controller.get_load_ratio(metric_alarm('GreaterThanOrEqualToThreshold'), 40.0), 0.5)
+
+    def test_get_load_ratio_unsupported_alarms(self) -> None:
+        self.assertIsNone(self.shed_controller.get_load_ratio(None, 160.0))
+        self.assertIsNone(self.shed_controller.get_load_ratio(metric_alarm('LessThanThreshold'), 160.0))
+        self.assertIsNone(self.shed_controller.get_load_ratio(metric_alarm(threshold=0), 160.0))
+
+        # no recent datapoint
+        self.assertIsNone(self.shed_controller.get_load_ratio(metric_alarm(), None))
+
+    def test_get_shed_weight(self) -> None:
+        # twice the target load halves the weight
+        self.assertEqual(self.shed_controller.get_shed_weight(100, 2.0, 5), 50)
+        self.assertEqual(self.shed_controller.get_shed_weight(60, 1.5, 5), 20)
+
+        # never less than the fixed step
+        self.assertEqual(self.shed_controller.get_shed_weight(100, 1.01, 5), 5)
+        self.assertEqual(self.shed_controller.get_shed_weight(100, 0.5, 5), 5)
+        self.assertEqual(self.shed_controller.get_shed_weight(100, None, 5), 5)
+
+    def test_get_shed_controller(self) -> None:
+        self.assertIsNone(get_shed_controller('fixed', 0.9))
+        self.assertIsNone(get_shed_controller('unknown', 0.9))
+
+        shed_controller = get_shed_controller('proportional', 0.7)
+        self.assertEqual(shed_controller.target_utilization, 0.7)
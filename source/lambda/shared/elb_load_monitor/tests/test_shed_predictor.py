@@ -0,0 +1,120 @@
+from elb_load_monitor.shed_predictor import ShedPredictor
+from elb_load_monitor.shed_predictor import get_projected_value
+from elb_load_monitor.shed_predictor import get_shed_predictor
+from datetime import datetime, timedelta, timezone
+from unittest.mock import MagicMock, patch
+
+import unittest
+
+TREND_START = datetime(2024, 1, 1, 12, 0, tzinfo=timezone.utc)
+
+
+def metric_alarm(comparison_operator: str = 'GreaterThanThreshold') -> dict:
+    return {
+        'AlarmName': 'alarm',
+        'Namespace': 'AWS/ApplicationELB',
+        'MetricName': 'RequestCountPerTarget',
+        'Dimensions': [{'Name': 'TargetGroup', 'Value': 'targetgroup/tg/1'}],
+        'Statistic': 'Sum',
+        'Period': 60,
+        'Threshold': 1000.0,
+        'ComparisonOperator': comparison_operator
+    }
+
+
+def cw_client_with_values(values: list) -> MagicMock:
+    cw_client = MagicMock()
+    cw_client.get_metric_data.return_value = {'MetricDataResults': [{'Id': 'm0', 'Values': values}]}
+
+    return cw_client
+
+
+def get_rising_metric_data(now: datetime):
+    """
+    Returns a GetMetricData stub for a Sum rising by 50 a minute from 700 at TREND_START. The
+    minute in progress at now holds only the part of its Sum received so far.
+    """
+    def get_metric_data(**kwargs) -> dict:
+        values = []
+        minute = TREND_START
+
+        while minute < kwargs['EndTime']:
+            value = 700.0 + 50 * (minute - TREND_START).total_seconds() / 60
+
+            if minute + timedelta(minutes=1) > now:
+                value = value * (now - minute).total_seconds() / 60
+
+            if minute >= kwargs['StartTime']:
+                values.insert(0, value)
+
+            minute += timedelta(minutes=1)
+
+        return {'MetricDataResults': [{'Id': 'm0', 'Values': values[:kwargs['MaxDatapoints']]}]}
+
+    return get_metric_data
+
+
+class TestShedPredictor(unittest.TestCase):
+
+    def test_get_projected_value(self) -> None:
+        # rising 100 per minute, newest first
+        self.assertAlmostEqual(get_projected_value([800.0, 700.0, 600.0], 60, 0), 800.0)
+        self.assertAlmostEqual(get_projected_value([800.0, 700.0, 600.0], 60, 180), 1100.0)
+        self.assertAlmostEqual(get_projected_value([500.0, 500.0, 500.0], 60, 300), 500.0)
+        self.assertIsNone(get_projected_value([800.0, 700.0], 60, 300))
+
+    def test_is_breach_predicted(self) -> None:
+        shed_predictor = ShedPredictor(horizon_sec=300, datapoints=5)
+
+        # 900 rising by 50 per minute reaches 1150 in 5 minutes
+        cw_client = cw_client_with_values([900.0, 850.0, 800.0, 750.0, 700.0])
+        self.assertTrue(shed_predictor.is_breach_predicted(cw_client, metric_alarm()))
+
+        get_metric_data_args = cw_client.get_metric_data.call_args.kwargs
+        self.assertEqual(get_metric_data_args['MetricDataQueries'][0]['MetricStat']['Period'], 60)
+        self.assertEqual(get_metric_data_args['MaxDatapoints'], 5)
+
+        # rising too slowly to breach within the horizon
+        self.assertFalse(shed_predictor.is_breach_predicted(
+            cw_client_with_values([900.0, 890.0, 880.0, 870.0, 860.0]), metric_alarm()))
+
+        # already above the threshold but falling, the alarm deals with it
+        self.assertFalse(shed_predictor.is_breach_predicted(
+            cw_client_with_values([1200.0, 1300.0, 1400.0]), metric_alarm()))
+
+        # too few datapoints for a trend
+        self.assertFalse(shed_predictor.is_breach_predicted(
+            cw_client_with_values([900.0, 500.0]), metric_alarm()))
+
+    def test_is_breach_predicted_ignores_partial_period(self) -> None:
+        shed_predictor = ShedPredictor(horizon_sec=300, datapoints=5)
+        # 15 seconds into the sixth minute, the last complete minute is at 900
+        now = TREND_START + timedelta(minutes=5, seconds=15)
+
+        cw_client = MagicMock()
+        cw_client.get_metric_data.side_effect = get_rising_metric_data(now)
+
+        with patch('elb_load_monitor.cw_metrics.datetime') as mock_datetime:
+            mock_datetime.now.return_value = now
+
+            self.assertTrue(shed_predictor.is_breach_predicted(cw_client, metric_alarm()))
+
+        self.assertEqual(cw_client.get_metric_data.call_args.kwargs['EndTime'], TREND_START + timedelta(minutes=5))
+
+    def test_is_breach_predicted_less_than_threshold(self) -> None:
+        shed_predictor = ShedPredictor(horizon_sec=300, datapoints=3)
+
+        self.assertTrue(shed_predictor.is_breach_predicted(
+            cw_client_with_values([1100.0, 1200.0, 1300.0]), metric_alarm('LessThanThreshold')))
+        self.assertFalse(shed_predictor.is_breach_predicted(
+            cw_client_with_values([1100.0, 1000.0, 900.0]), metric_alarm('LessThanThreshold')))
+
+    def test_get_shed_predictor(self) -> None:
+        self.assertIsNone(get_shed_predictor(False, 300, 5, 5))
+
+        shed_predictor = get_shed_predictor(True, 600, 2, 10)
+
+        self.assertEqual(shed_predictor.horizon_sec, 600)
+        # a trend needs at least 3 datapoints
+        self.assertEqual(shed_predictor.datapoints, 3)
+        self.assertEqual(shed_predictor.pre_shed_percent, 10)
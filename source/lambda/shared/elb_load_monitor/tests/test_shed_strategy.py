@@ -0,0 +1,109 @@
+from elb_load_monitor.shed_strategy import AIMDStepPolicy
+from elb_load_monitor.shed_strategy import CapacityWeightDistribution
+from elb_load_monitor.shed_strategy import DEFAULT_SHED_STRATEGY
+from elb_load_monitor.shed_strategy import EvenWeightDistribution
+from elb_load_monitor.shed_strategy import GuardedWeightDistribution
+from elb_load_monitor.shed_strategy import LinearStepPolicy
+from elb_load_monitor.shed_strategy import allocate_largest_remainder
+from elb_load_monitor.shed_strategy import get_shed_strategy
+
+import unittest
+
+
+class TestShedStrategy(unittest.TestCase):
+
+    def test_linear_step_policy(self) -> None:
+        step_policy = LinearStepPolicy()
+
+        self.assertEqual(step_policy.get_shed_weight(100, 5), 5)
+        self.assertEqual(step_policy.get_shed_weight(30, 5), 5)
+        self.assertEqual(step_policy.get_restore_weight(30, 10), 10)
+
+    def test_aimd_step_policy(self) -> None:
+        step_policy = AIMDStepPolicy(decrease_factor=0.5)
+
+        self.assertEqual(step_policy.get_shed_weight(100, 5), 50)
+        self.assertEqual(step_policy.get_shed_weight(25, 5), 13)
+        # never less than the linear step
+        self.assertEqual(step_policy.get_shed_weight(6, 5), 5)
+        self.assertEqual(step_policy.get_restore_weight(50, 5), 5)
+
+    def test_even_weight_distribution(self) -> None:
+        weight_distribution = EvenWeightDistribution()
+        forward_configs = {'primary': 80, 'secondary': 15, 'tertiary': 5}
+
+        self.assertEqual(
+            weight_distribution.get_shed_weights(forward_configs, 'primary', 11), {'secondary': 5, 'tertiary': 6})
+        self.assertEqual(
+            weight_distribution.get_shed_weights({'primary': 80, 'secondary': 20}, 'primary', 11), {'secondary': 11})
+        self.assertEqual(
+            weight_distribution.get_restore_weights(forward_configs, 'primary', 18), {'secondary': 15, 'tertiary': 3})
+        self.assertEqual(
+            weight_distribution.get_restore_weights(forward_configs, 'primary', 30), {'secondary': 15, 'tertiary': 5})
+
+    def test_allocate_largest_remainder(self) -> None:
+        # quotas 3.33, 3.33 and 3.33: one point left over goes to the first tie
+        self.assertEqual(allocate_largest_remainder(10, {'a': 1, 'b': 1, 'c': 1}), {'a': 4, 'b': 3, 'c': 3})
+        # quotas 1.67, 3.33 and 5.0
+        self.assertEqual(allocate_largest_remainder(10, {'a': 1, 'b': 2, 'c': 3}), {'a': 2, 'b': 3, 'c': 5})
+        # quotas 0.45, 1.36 and 9.18
+        self.assertEqual(allocate_largest_remainder(11, {'a': 1, 'b': 3, 'c': 20}), {'a': 1, 'b': 1, 'c': 9})
+        self.assertEqual(allocate_largest_remainder(5, {'a': 0, 'b': 0}), {'a': 0, 'b': 0})
+
+    def test_capacity_weight_distribution(self) -> None:
+        healthy_target_counts = {'secondary': 2, 'tertiary': 8}
+        weight_distribution = CapacityWeightDistribution(healthy_target_counts.get)
+        forward_configs = {'primary': 80, 'secondary': 4, 'tertiary': 16}
+
+        # the larger secondary takes most of the shed weight
+        self.assertEqual(
+            weight_distribution.get_shed_weights(forward_configs, 'primary', 11), {'secondary': 2, 'tertiary': 9})
+        # and gives most of it back
+        self.assertEqual(
+            weight_distribution.get_restore_weights(forward_configs, 'primary', 10), {'secondary': 2, 'tertiary': 8})
+        self.assertEqual(
+            weight_distribution.get_restore_weights(forward_configs, 'primary', 30), {'secondary': 4, 'tertiary': 16})
+
+        # secondaries without healthy targets get nothing
+        healthy_target_counts['secondary'] = 0
+        self.assertEqual(
+            weight_distribution.get_shed_weights(forward_configs, 'primary', 11), {'secondary': 0, 'tertiary': 11})
+
+    def test_capacity_weight_distribution_unknown_health(self) -> None:
+        weight_distribution = CapacityWeightDistribution({'secondary': 2}.get)
+        forward_configs = {'primary': 80, 'secondary': 15, 'tertiary': 5}
+
+        # falls back to splitting evenly
+        self.assertEqual(
+            weight_distribution.get_shed_weights(forward_configs, 'primary', 11), {'secondary': 5, 'tertiary': 6})
+
+        weight_distribution = CapacityWeightDistribution({'secondary': 0, 'tertiary': 0}.get)
+        self.assertEqual(
+            weight_distribution.get_shed_weights(forward_configs, 'primary', 11), {'secondary': 5, 'tertiary': 6})
+
+    def test_guarded_weight_distribution(self) -> None:
+        weight_distribution = GuardedWeightDistribution(EvenWeightDistribution(), {'secondary'})
+        forward_configs = {'primary': 80, 'secondary': 15, 'tertiary': 5}
+
+        # the saturated secondary's share goes to the tertiary
+        self.assertEqual(
+            weight_distribution.get_shed_weights(forward_configs, 'primary', 11), {'tertiary': 11})
+        # nowhere to shed
+        self.assertEqual(
+            weight_distribution.get_shed_weights({'primary': 80, 'secondary': 20}, 'primary', 11), {})
+        # restoring takes weight back from saturated target groups too
+        self.assertEqual(
+            weight_distribution.get_restore_weights(forward_configs, 'primary', 18), {'secondary': 15, 'tertiary': 3})
+
+    def test_get_shed_strategy(self) -> None:
+        self.assertIs(get_shed_strategy('linear'), DEFAULT_SHED_STRATEGY)
+        self.assertIs(get_shed_strategy('unknown'), DEFAULT_SHED_STRATEGY)
+
+        shed_strategy = get_shed_strategy('aimd', 0.3)
+        self.assertIsInstance(shed_strategy.step_policy, AIMDStepPolicy)
+        self.assertEqual(shed_strategy.step_policy.decrease_factor, 0.3)
+        self.assertIsInstance(shed_strategy.weight_distribution, EvenWeightDistribution)
+
+        shed_strategy = get_shed_strategy('linear', shed_distribution='capacity', get_healthy_target_count={}.get)
+        self.assertIsInstance(shed_strategy.step_policy, LinearStepPolicy)
+        self.assertIsInstance(shed_strategy.weight_distribution, CapacityWeightDistribution)
@@ -0,0 +1,205 @@
+from elb_load_monitor.hysteresis import ShedHysteresis
+from elb_load_monitor.simulator import APICallCounter
+from elb_load_monitor.simulator import Incident
+from elb_load_monitor.simulator import LISTENER_ARN
+from elb_load_monitor.simulator import SimulatedClock
+from elb_load_monitor.simulator import SimulatedELBv2Client
+from elb_load_monitor.simulator import TrafficCurve
+from elb_load_monitor.simulator import TrafficSimulator
+from elb_load_monitor.simulator import get_target_group_arn
+from elb_load_monitor.simulator import main
+
+import collections
+import contextlib
+import io
+import json
+import tempfile
+import unittest
+
+
+class TestTrafficCurve(unittest.TestCase):
+
+    def test_get_load(self) -> None:
+        traffic_curve = TrafficCurve([(60, 100), (0, 50), (120, 100)])
+
+        self.assertEqual(traffic_curve.get_load(-10), 50)
+        self.assertEqual(traffic_curve.get_load(30), 75)
+        self.assertEqual(traffic_curve.get_load(90), 100)
+        self.assertEqual(traffic_curve.get_load(600), 100)
+        self.assertEqual(traffic_curve.get_duration_sec(), 120)
+
+    def test_from_csv(self) -> None:
+        traffic_curve = TrafficCurve.from_csv(io.StringIO('offset_sec,requests_per_sec\n0,10\n60,20\n\n'))
+
+        self.assertEqual(traffic_curve.points, [(0.0, 10.0), (60.0, 20.0)])
+
+        with self.assertRaises(ValueError):
+            TrafficCurve.from_csv(io.StringIO('offset_sec,requests_per_sec\n'))
+
+    def test_spike(self) -> None:
+        traffic_curve = TrafficCurve.spike(50, 150, 600, 300, 1200, 3600)
+
+        self.assertEqual(traffic_curve.get_load(600), 50)
+        self.assertEqual(traffic_curve.get_load(750), 100)
+        self.assertEqual(traffic_curve.get_load(1500), 150)
+        self.assertEqual(traffic_curve.get_load(2400), 50)
+        self.assertEqual(traffic_curve.get_duration_sec(), 3600)
+
+
+class TestSimulatedELBv2Client(unittest.TestCase):
+
+    def test_rules(self) -> None:
+        source_group_arn, secondary_group_arn = get_target_group_arn('Source'), get_target_group_arn('Secondary')
+        api_calls = APICallCounter()
+        elbv2_client = SimulatedELBv2Client({source_group_arn: 100, secondary_group_arn: 0}, 3, api_calls)
+
+        describe_rules_response = elbv2_client.describe_rules(ListenerArn=LISTENER_ARN, PageSize=2)
+
+        self.assertEqual(len(describe_rules_response['Rules']), 2)
+        self.assertEqual(describe_rules_response['NextMarker'], '2')
+
+        default_rule_entry = elbv2_client.describe_rules(ListenerArn=LISTENER_ARN, Marker='2')['Rules'][0]
+
+        self.assertTrue(default_rule_entry['IsDefault'])
+
+        # half of the traffic of one rule of three
+        elbv2_client.modify_rule(RuleArn=elbv2_client.rule_arns[0], Actions=[{'Type': 'forward', 'ForwardConfig': {
+            'TargetGroups': [
+                {'TargetGroupArn': source_group_arn, 'Weight': 50},
+                {'TargetGroupArn': secondary_group_arn, 'Weight': 50}
+            ]
+        }}])
+
+        self.assertAlmostEqual(elbv2_client.get_weight(secondary_group_arn), 50 / 3)
+        self.assertEqual(
+            elbv2_client.describe_rules(RuleArns=[default_rule_entry['RuleArn']])['Rules'][0]['IsDefault'], True)
+        self.assertEqual(api_calls.get_calls(), collections.Counter({
+            'elbv2.DescribeRules': 3, 'elbv2.ModifyRule': 1
+        }))
+
+
+class TestIncident(unittest.TestCase):
+
+    def test_record_weight(self) -> None:
+        incident = Incident(60.0, 100, collections.Counter({'sqs.SendMessage': 2}))
+
+        for source_weight in (80, 60, 60, 70, 80, 70, 100):
+            incident.record_weight(source_weight)
+
+        incident.record_api_calls(collections.Counter({'sqs.SendMessage': 9, 'elbv2.ModifyRule': 6}))
+
+        self.assertEqual(incident.oscillations, 3)
+        self.assertEqual(incident.min_source_weight, 60)
+        self.assertEqual(incident.to_json()['apiCalls'], {'elbv2.ModifyRule': 6, 'sqs.SendMessage': 7})
+        self.assertEqual(incident.to_json()['totalApiCalls'], 13)
+        self.assertNotIn('endSec', incident.to_json())
+
+
+class TestTrafficSimulator(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.source_group_arn = get_target_group_arn('Source')
+        self.secondary_group_arn = get_target_group_arn('Secondary')
+        self.capacities = {self.source_group_arn: 100, self.secondary_group_arn: 200}
+        # the source can serve the base load, but needs to shed a third of the peak
+        self.traffic_curve = TrafficCurve.spike(50, 150, 600, 300, 1500, 5400)
+
+        return
+
+    def test_no_incident_below_threshold(self) -> None:
+        simulator = TrafficSimulator(TrafficCurve([(0, 50), (3600, 60)]), self.capacities, self.source_group_arn)
+
+        report = simulator.run()
+
+        self.assertEqual(report.incidents, [])
+        self.assertEqual(sum(report.api_calls.values()), 0)
+
+        return
+
+    def test_spike(self) -> None:
+        simulator = TrafficSimulator(
+            self.traffic_curve, self.capacities, self.source_group_arn, elb_shed_percent=20, elb_restore_percent=20)
+
+        report = simulator.run()
+        first_incident = report.to_json()['incidents'][0]
+
+        # the 60 second average breaches at 720 and the first shed step relieves the source, but
+        # the alarm is still in ALARM for the next step, which sheds more than needed
+        self.assertEqual(first_incident['startSec'], 720.0)
+        self.assertEqual(first_incident['timeToReliefSec'], 10.0)
+        self.assertEqual(first_incident['minSourceWeight'], 40.0)
+        self.assertGreater(first_incident['overshootWeight'], 0)
+        self.assertIn('endSec', first_incident)
+        self.assertGreater(first_incident['apiCalls']['elbv2.ModifyListener'], 0)
+        self.assertGreater(first_incident['apiCalls']['sqs.SendMessage'], 0)
+
+        # restoring while the peak holds fires the alarm again
+        self.assertGreater(len(report.incidents), 1)
+        self.assertTrue(all(incident.end_sec is not None for incident in report.incidents))
+        self.assertEqual(report.final_weights, {self.source_group_arn: 100.0, self.secondary_group_arn: 0.0})
+
+        return
+
+    def test_larger_steps_relieve_sooner(self) -> None:
+        times_to_relief = []
+
+        for elb_shed_percent in (5, 20):
+            simulator = TrafficSimulator(
+                self.traffic_curve, self.capacities, self.source_group_arn, elb_shed_percent=elb_shed_percent,
+                elb_restore_percent=elb_shed_percent)
+
+            times_to_relief.append(simulator.run().incidents[0].time_to_relief_sec)
+
+        self.assertGreater(times_to_relief[0], times_to_relief[1])
+
+        return
+
+    def test_slow_restore_is_not_overshoot(self) -> None:
+        traffic_curve = TrafficCurve([(0, 50), (600, 50), (601, 110), (1200, 110), (1201, 50), (3600, 50)])
+        simulator = TrafficSimulator(
+            traffic_curve, self.capacities, self.source_group_arn, elb_shed_percent=5, elb_restore_percent=1)
+
+        report = simulator.run()
+        incident = report.to_json()['incidents'][0]
+
+        # the source needs at most 72.73 at the peak, and restoring 1 at a time after the peak
+        # holds its weight well below the 100 it needs then
+        self.assertEqual(incident['minRequiredWeight'], 72.73)
+        self.assertEqual(incident['minSourceWeight'], 69.0)
+        self.assertEqual(incident['overshootWeight'], 3.73)
+
+        return
+
+    def test_hysteresis_reduces_incidents(self) -> None:
+        incident_counts = []
+
+        for restore_cooldown_sec in (0, 600):
+            clock = SimulatedClock()
+            simulator = TrafficSimulator(
+                self.traffic_curve, self.capacities, self.source_group_arn, elb_shed_percent=20,
+                elb_restore_percent=20, clock=clock,
+                handler_kwargs={'hysteresis': ShedHysteresis(restore_cooldown_sec=restore_cooldown_sec, clock=clock)})
+
+            incident_counts.append(len(simulator.run().incidents))
+
+        self.assertLess(incident_counts[1], incident_counts[0])
+
+        return
+
+    def test_main(self) -> None:
+        with tempfile.NamedTemporaryFile('w', suffix='.csv') as traffic_csv:
+            traffic_csv.write('offset_sec,requests_per_sec\n0,50\n600,50\n900,150\n2400,150\n2700,50\n3600,50\n')
+            traffic_csv.flush()
+
+            output = io.StringIO()
+
+            with contextlib.redirect_stdout(output):
+                main([traffic_csv.name, '--source-capacity', '100', '--secondary-capacity', '200',
+                      '--elb-shed-percent', '20', '--elb-restore-percent', '20'])
+
+        report = json.loads(output.getvalue())
+
+        self.assertGreater(len(report['incidents']), 0)
+        self.assertEqual(report['incidents'][0]['startSec'], 720.0)
+
+        return
@@ -0,0 +1,37 @@
+from elb_load_monitor.target_health import TargetHealthCounter
+from unittest.mock import MagicMock
+
+import unittest
+
+
+class TestTargetHealthCounter(unittest.TestCase):
+
+    def test_get_healthy_target_count(self) -> None:
+        elbv2_client = MagicMock()
+        elbv2_client.describe_target_health.return_value = {
+            'TargetHealthDescriptions': [
+                {'Target': {'Id': 'i-1'}, 'TargetHealth': {'State': 'healthy'}},
+                {'Target': {'Id': 'i-2'}, 'TargetHealth': {'State': 'unhealthy'}},
+                {'Target': {'Id': 'i-3'}, 'TargetHealth': {'State': 'healthy'}},
+                {'Target': {'Id': 'i-4'}, 'TargetHealth': {'State': 'draining'}}
+            ]
+        }
+
+        target_health_counter = TargetHealthCounter(elbv2_client)
+
+        self.assertEqual(target_health_counter.get_healthy_target_count('arn:tg'), 2)
+        self.assertEqual(target_health_counter.get_healthy_target_count('arn:tg'), 2)
+
+        # read once per target group
+        elbv2_client.describe_target_health.assert_called_once_with(TargetGroupArn='arn:tg')
+        self.assertEqual(target_health_counter.describe_target_health_calls, 1)
+
+    def test_get_healthy_target_count_error(self) -> None:
+        elbv2_client = MagicMock()
+        elbv2_client.describe_target_health.side_effect = Exception('AccessDenied')
+
+        target_health_counter = TargetHealthCounter(elbv2_client)
+
+        self.assertIsNone(target_health_counter.get_healthy_target_count('arn:tg'))
+        self.assertIsNone(target_health_counter.get_healthy_target_count('arn:tg'))
+        elbv2_client.describe_target_health.assert_called_once()
@@ -0,0 +1,85 @@
+from elb_load_monitor.tracing import InMemorySpanExporter
+from elb_load_monitor.tracing import STATUS_ERROR
+from elb_load_monitor.tracing import Tracer
+from elb_load_monitor.tracing import get_tracer
+from elb_load_monitor.tracing import parse_trace_context
+from elb_load_monitor.tracing import trace_span
+
+import unittest
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        self.now += 0.5
+
+        return self.now
+
+
+class TestTracer(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.exporter = InMemorySpanExporter()
+        self.tracer = Tracer(self.exporter, clock=FakeClock())
+
+        return
+
+    def test_span_nesting(self) -> None:
+        with self.tracer.span('step', {'targetGroupArn': 'tg'}) as step_span:
+            with self.tracer.span('load_rules') as load_span:
+                self.assertIs(self.tracer.get_current_span(), load_span)
+
+            with self.tracer.span('send_message'):
+                trace_context = self.tracer.get_trace_context()
+
+        self.assertIsNone(self.tracer.get_current_span())
+        # spans are exported as they finish
+        self.assertEqual([span.name for span in self.exporter.spans], ['load_rules', 'send_message', 'step'])
+        self.assertIsNone(step_span.parent_id)
+        self.assertEqual(load_span.parent_id, step_span.span_id)
+        self.assertEqual(load_span.trace_id, step_span.trace_id)
+        self.assertEqual(step_span.get_duration_ms(), 2500.0)
+        self.assertEqual(step_span.to_json()['attributes'], {'targetGroupArn': 'tg'})
+
+        send_span = self.exporter.get_spans('send_message')[0]
+        self.assertEqual(trace_context, '00-' + send_span.trace_id + '-' + send_span.span_id + '-01')
+
+    def test_span_continues_trace_context(self) -> None:
+        with self.tracer.span('handle_alarm'):
+            trace_context = self.tracer.get_trace_context()
+
+        with self.tracer.span('handle_alarm_status_message', trace_context=trace_context) as span:
+            pass
+
+        alarm_span = self.exporter.get_spans('handle_alarm')[0]
+
+        self.assertEqual(span.trace_id, alarm_span.trace_id)
+        self.assertEqual(span.parent_id, alarm_span.span_id)
+
+        # a malformed context starts a new trace
+        with self.tracer.span('step', trace_context='garbage') as span:
+            pass
+
+        self.assertNotEqual(span.trace_id, alarm_span.trace_id)
+        self.assertIsNone(span.parent_id)
+        self.assertEqual(parse_trace_context(None), (None, None))
+
+    def test_span_records_error(self) -> None:
+        with self.assertRaises(ValueError):
+            with self.tracer.span('write_rule'):
+                raise ValueError('Access denied')
+
+        span = self.exporter.get_spans('write_rule')[0]
+
+        self.assertEqual(span.status, STATUS_ERROR)
+        self.assertEqual(span.attributes['error'], 'Access denied')
+        self.assertIsNotNone(span.end)
+
+    def test_trace_span_without_tracer(self) -> None:
+        with trace_span(None, 'step') as span:
+            self.assertIsNone(span)
+
+        self.assertIsNone(get_tracer(False))
+        self.assertIsNotNone(get_tracer(True))
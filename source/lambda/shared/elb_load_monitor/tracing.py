@@ -0,0 +1,201 @@
+"""
+Lightweight tracing of the control loop.
+
+A Tracer opens spans around rule loading, each control step, every rule write and the SQS
+send. The trace context of the span that sends a message travels in the message as a W3C
+traceparent, so every step of a shed or restore chain, across the alarm Lambda and many SQS
+Lambda invocations, is part of the trace started by the alarm.
+
+Finished spans are handed to an exporter. LoggingSpanExporter writes them to the log as JSON.
+InMemorySpanExporter keeps them for tests. Any object with an export(span) method can be used.
+"""
+import contextlib
+import json
+import logging
+import secrets
+import threading
+import time
+
+logger = logging.getLogger()
+
+TRACEPARENT_VERSION = '00'
+TRACEPARENT_SAMPLED = '01'
+
+STATUS_OK = 'ok'
+STATUS_ERROR = 'error'
+
+
+class Span:
+    def __init__(self, name: str, trace_id: str, span_id: str, parent_id: str = None, start: float = None,
+                 attributes: dict = None) -> None:
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = span_id
+        self.parent_id = parent_id
+        self.start = start
+        self.end = None
+        self.attributes = dict(attributes or {})
+        self.status = STATUS_OK
+
+    def set_attribute(self, key: str, value) -> None:
+        self.attributes[key] = value
+
+        return
+
+    def get_duration_ms(self) -> float:
+        if self.end is None:
+            return None
+
+        return (self.end - self.start) * 1000
+
+    def get_trace_context(self) -> str:
+        return '-'.join((TRACEPARENT_VERSION, self.trace_id, self.span_id, TRACEPARENT_SAMPLED))
+
+    def to_json(self) -> dict:
+        result = {
+            'name': self.name,
+            'traceId': self.trace_id,
+            'spanId': self.span_id,
+            'start': round(self.start, 6),
+            'status': self.status
+        }
+
+        if self.parent_id is not None:
+            result['parentId'] = self.parent_id
+
+        if self.end is not None:
+            result['durationMs'] = round(self.get_duration_ms(), 3)
+
+        if len(self.attributes) > 0:
+            result['attributes'] = self.attributes
+
+        return result
+
+
+class InMemorySpanExporter:
+    def __init__(self) -> None:
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def export(self, span: Span) -> None:
+        with self._lock:
+            self.spans.append(span)
+
+        return
+
+    def get_spans(self, name: str = None) -> list:
+        return [span for span in self.spans if name is None or span.name == name]
+
+
+class LoggingSpanExporter:
+    def export(self, span: Span) -> None:
+        logger.info('Span: ' + json.dumps(span.to_json(), default=str))
+
+        return
+
+
+class Tracer:
+    def __init__(self, exporter=None, clock=time.time) -> None:
+        if exporter is None:
+            exporter = LoggingSpanExporter()
+
+        self.exporter = exporter
+        self.clock = clock
+        # spans open on the current thread, innermost last
+        self._local = threading.local()
+
+    def get_current_span(self) -> Span:
+        stack = getattr(self._local, 'stack', None)
+
+        if not stack:
+            return None
+
+        return stack[-1]
+
+    def get_trace_context(self) -> str:
+        """
+        Returns the traceparent of the current span, or None outside of a span.
+        """
+        current_span = self.get_current_span()
+
+        if current_span is None:
+            return None
+
+        return current_span.get_trace_context()
+
+    @contextlib.contextmanager
+    def span(self, name: str, attributes: dict = None, parent: Span = None, trace_context: str = None):
+        """
+        Opens a span for the duration of the with block. The span is a child of parent, of the
+        span trace_context was taken from or of the current span of the thread, in that order.
+        Without any, it starts a new trace.
+        """
+        trace_id, parent_id = None, None
+
+        if parent is None and trace_context is None:
+            parent = self.get_current_span()
+
+        if parent is not None:
+            trace_id, parent_id = parent.trace_id, parent.span_id
+        elif trace_context is not None:
+            trace_id, parent_id = parse_trace_context(trace_context)
+
+        if trace_id is None:
+            trace_id = secrets.token_hex(16)
+
+        span = Span(name, trace_id, secrets.token_hex(8), parent_id, self.clock(), attributes)
+
+        stack = getattr(self._local, 'stack', None)
+
+        if stack is None:
+            stack = self._local.stack = []
+
+        stack.append(span)
+
+        try:
+            yield span
+        except Exception as e:
+            span.status = STATUS_ERROR
+            span.set_attribute('error', str(e))
+
+            raise
+        finally:
+            stack.pop()
+            span.end = self.clock()
+
+            try:
+                self.exporter.export(span)
+            except Exception as e:
+                logger.warning('Unable to export span ' + name + ': ' + str(e))
+
+
+def parse_trace_context(trace_context: str) -> tuple:
+    """
+    Returns the trace id and parent span id of a traceparent, or (None, None) if it is malformed.
+    """
+    parts = (trace_context or '').split('-')
+
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None, None
+
+    return parts[1], parts[2]
+
+
+def trace_span(tracer: Tracer, name: str, attributes: dict = None, parent: Span = None, trace_context: str = None):
+    """
+    Returns tracer.span(...), or a context that does nothing when tracing is off.
+    """
+    if tracer is None:
+        return contextlib.nullcontext()
+
+    return tracer.span(name, attributes, parent, trace_context)
+
+
+def get_tracer(enabled: bool) -> Tracer:
+    """
+    Returns the tracer for the settings, or None to not trace.
+    """
+    if not enabled:
+        return None
+
+    return Tracer(LoggingSpanExporter())
@@ -1,7 +1,26 @@
 import datetime
 
+# formats of the timestamps in EventBridge alarm events, such as 2019-10-02T17:04:40.985+0000
+TIMESTAMP_FORMATS = ('%Y-%m-%dT%H:%M:%S.%f%z', '%Y-%m-%dT%H:%M:%S%z')
+
 
 def datetime_handler(x):
     if isinstance(x, datetime.datetime):
         return x.isoformat()
     raise TypeError("Unknown type")
+
+
+def parse_timestamp(value: str) -> float:
+    """
+    Returns the epoch seconds of an event timestamp, or None if it cannot be parsed.
+    """
+    if not value:
+        return None
+
+    for timestamp_format in TIMESTAMP_FORMATS:
+        try:
+            return datetime.datetime.strptime(value.replace('Z', '+0000'), timestamp_format).timestamp()
+        except ValueError:
+            continue
+
+    return None
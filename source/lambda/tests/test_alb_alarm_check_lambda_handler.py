@@ -52,7 +52,7 @@ def test_sqs_message_handler_shed_action(sqs_event_shed, lambda_context):
     # Mock describe_rules and describe_alarms
     elbv2.describe_rules = MagicMock(return_value={'Rules': []})
     cw.describe_alarms = MagicMock(return_value={
-        'MetricAlarms': [{'StateValue': 'ALARM'}]
+        'MetricAlarms': [{'AlarmName': 'test-alarm', 'StateValue': 'ALARM'}]
     })
     
     response = alb_alarm_check_lambda_handler.lambda_handler(sqs_event_shed, lambda_context, elbv2, sqs, cw)
@@ -88,7 +88,7 @@ def test_sqs_message_handler_restore_action(lambda_context):
     
     elbv2.describe_rules = MagicMock(return_value={'Rules': []})
     cw.describe_alarms = MagicMock(return_value={
-        'MetricAlarms': [{'StateValue': 'OK'}]
+        'MetricAlarms': [{'AlarmName': 'test-alarm', 'StateValue': 'OK'}]
     })
     
     response = alb_alarm_check_lambda_handler.lambda_handler(event, lambda_context, elbv2, sqs, cw)
@@ -106,8 +106,161 @@ def test_sqs_message_handler_empty_records(lambda_context):
 
 
 def test_sqs_message_handler_malformed_message(lambda_context):
-    """Test handler handles malformed JSON"""
-    event = {'Records': [{'body': 'not valid json'}]}
-    
-    with pytest.raises(json.JSONDecodeError):
-        alb_alarm_check_lambda_handler.lambda_handler(event, lambda_context)
+    """Test handler reports malformed JSON as a batch item failure"""
+    event = {'Records': [{'messageId': 'bad-message', 'body': 'not valid json'}]}
+
+    response = alb_alarm_check_lambda_handler.lambda_handler(
+        event, lambda_context, MagicMock(), MagicMock(), MagicMock())
+
+    assert response['batchItemFailures'] == [{'itemIdentifier': 'bad-message'}]
+
+
+def test_sqs_message_handler_processes_all_records(sqs_event_shed, lambda_context):
+    """Test every record in the batch is processed and rules are read once per target group"""
+    body = json.loads(sqs_event_shed['Records'][0]['body'])
+    other_body = dict(body, targetGroupArn='arn:aws:elasticloadbalancing:us-east-1:YOUR_ACCOUNT_ID_HERE:targetgroup/other/def')
+
+    event = {
+        'Records': [
+            {'messageId': 'm1', 'body': json.dumps(body)},
+            {'messageId': 'm2', 'body': json.dumps(other_body)},
+            {'messageId': 'm3', 'body': json.dumps(body)}
+        ]
+    }
+
+    elbv2 = MagicMock()
+    elbv2.describe_rules.return_value = {'Rules': []}
+    sqs = MagicMock()
+    cw = MagicMock()
+    cw.describe_alarms.return_value = {'MetricAlarms': [{'AlarmName': 'test-alarm', 'StateValue': 'ALARM'}]}
+
+    response = alb_alarm_check_lambda_handler.lambda_handler(event, lambda_context, elbv2, sqs, cw)
+
+    assert response['batchItemFailures'] == []
+    # alarm states for the whole batch are resolved with a single call
+    cw.describe_alarms.assert_called_once_with(AlarmNames=['test-alarm'], MaxRecords=100)
+    assert elbv2.describe_rules.call_count == 2
+
+
+def test_sqs_message_handler_partial_batch_failure(sqs_event_shed, lambda_context):
+    """Test only the failed record is reported for redelivery"""
+    body = sqs_event_shed['Records'][0]['body']
+    event = {
+        'Records': [
+            {'messageId': 'm1', 'body': body},
+            {'messageId': 'm2', 'body': body}
+        ]
+    }
+
+    elbv2 = MagicMock()
+    elbv2.describe_rules.return_value = {'Rules': []}
+    sqs = MagicMock()
+    sqs.send_message.side_effect = [None, Exception('Throttling')]
+    cw = MagicMock()
+    cw.describe_alarms.return_value = {
+        'MetricAlarms': [{'AlarmName': 'test-alarm', 'StateValue': 'INSUFFICIENT_DATA'}]
+    }
+
+    response = alb_alarm_check_lambda_handler.lambda_handler(event, lambda_context, elbv2, sqs, cw)
+
+    assert response['statusCode'] == 200
+    assert response['batchItemFailures'] == [{'itemIdentifier': 'm2'}]
+
+
+def test_sqs_message_handler_falls_back_to_per_message_alarm_lookup(sqs_event_shed, lambda_context):
+    """Test alarm states are looked up per message if the batch lookup fails"""
+    elbv2 = MagicMock()
+    elbv2.describe_rules.return_value = {'Rules': []}
+    sqs = MagicMock()
+    cw = MagicMock()
+    cw.describe_alarms.side_effect = [
+        Exception('Throttling'),
+        {'MetricAlarms': [{'AlarmName': 'test-alarm', 'StateValue': 'INSUFFICIENT_DATA'}]}
+    ]
+
+    response = alb_alarm_check_lambda_handler.lambda_handler(sqs_event_shed, lambda_context, elbv2, sqs, cw)
+
+    assert response['batchItemFailures'] == []
+    assert response['message'] == 'New Alarm State:SHED'
+    assert cw.describe_alarms.call_count == 2
+
+
+def test_sqs_message_handler_reports_secondary_health(sqs_event_shed, lambda_context, monkeypatch):
+    """Test saturated secondaries are not shed into and the decision is reported"""
+    monkeypatch.setenv('SECONDARY_GUARD', 'true')
+
+    target_group_arn = 'arn:aws:elasticloadbalancing:us-east-1:YOUR_ACCOUNT_ID_HERE:targetgroup/test/abc'
+    secondary_target_group_arn = 'arn:aws:elasticloadbalancing:us-east-1:YOUR_ACCOUNT_ID_HERE:targetgroup/other/def'
+
+    elbv2 = MagicMock()
+    elbv2.describe_rules.return_value = {'Rules': [{
+        'RuleArn': 'rule',
+        'IsDefault': False,
+        'Actions': [{'Type': 'forward', 'ForwardConfig': {'TargetGroups': [
+            {'TargetGroupArn': target_group_arn, 'Weight': 100},
+            {'TargetGroupArn': secondary_target_group_arn, 'Weight': 0}
+        ]}}]
+    }]}
+    cw = MagicMock()
+    cw.describe_alarms.return_value = {'MetricAlarms': [{
+        'AlarmName': 'test-alarm',
+        'StateValue': 'ALARM',
+        'Namespace': 'AWS/ApplicationELB',
+        'MetricName': 'RequestCountPerTarget',
+        'Dimensions': [{'Name': 'TargetGroup', 'Value': 'targetgroup/test/abc'}],
+        'Statistic': 'Sum',
+        'Period': 60,
+        'Threshold': 100.0,
+        'ComparisonOperator': 'GreaterThanThreshold'
+    }]}
+    cw.get_metric_data.return_value = {'MetricDataResults': [{'Id': 'm0', 'Values': [250.0]}]}
+
+    response = alb_alarm_check_lambda_handler.lambda_handler(sqs_event_shed, lambda_context, elbv2, MagicMock(), cw)
+
+    assert response['secondaryHealth'] == {
+        target_group_arn: [{
+            'targetGroupArn': secondary_target_group_arn, 'decision': 'skip', 'metricValue': 250.0,
+            'threshold': 100.0
+        }]
+    }
+    elbv2.modify_rule.assert_not_called()
+
+
+def test_sqs_message_handler_emits_emf_metrics(sqs_event_shed, lambda_context, monkeypatch, capsys):
+    """Test every step writes EMF records for API latency, the action and the weights"""
+    monkeypatch.setenv('EMF_METRICS', 'true')
+
+    target_group_arn = 'arn:aws:elasticloadbalancing:us-east-1:YOUR_ACCOUNT_ID_HERE:targetgroup/test/abc'
+    secondary_target_group_arn = 'arn:aws:elasticloadbalancing:us-east-1:YOUR_ACCOUNT_ID_HERE:targetgroup/other/def'
+
+    elbv2 = MagicMock()
+    elbv2.describe_rules.return_value = {'Rules': [{
+        'RuleArn': 'rule',
+        'IsDefault': False,
+        'Actions': [{'Type': 'forward', 'ForwardConfig': {'TargetGroups': [
+            {'TargetGroupArn': target_group_arn, 'Weight': 100},
+            {'TargetGroupArn': secondary_target_group_arn, 'Weight': 0}
+        ]}}]
+    }]}
+    cw = MagicMock()
+    cw.describe_alarms.return_value = {'MetricAlarms': [{'AlarmName': 'test-alarm', 'StateValue': 'ALARM'}]}
+
+    response = alb_alarm_check_lambda_handler.lambda_handler(sqs_event_shed, lambda_context, elbv2, MagicMock(), cw)
+
+    assert response['message'] == 'New Alarm State:SHED'
+
+    records = [json.loads(line) for line in capsys.readouterr().out.splitlines() if line.startswith('{"_aws"')]
+    metrics = dict()
+
+    for record in records:
+        for metric in record['_aws']['CloudWatchMetrics'][0]['Metrics']:
+            key = (metric['Name'], record.get('Operation') or record.get('Action') or record.get('TargetGroup'))
+            metrics[key] = record[metric['Name']]
+
+    assert ('ApiLatency', 'describe_rules') in metrics
+    assert ('ApiLatency', 'modify_rule') in metrics
+    assert ('ApiLatency', 'send_message') in metrics
+    assert metrics[('Actions', 'SHED')] == 1
+    assert ('DecisionLatency', target_group_arn) in metrics
+    assert metrics[('TargetGroupWeight', target_group_arn)] == 95
+    assert metrics[('TargetGroupWeight', secondary_target_group_arn)] == 5
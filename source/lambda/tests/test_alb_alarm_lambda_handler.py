@@ -71,6 +71,34 @@ def test_lambda_handler_alarm_state(alarm_event, lambda_context, lambda_env_vars
     assert 'Processed alarm' in response['message']
 
 
+def test_lambda_handler_carries_alarm_timestamp(alarm_event, lambda_context, lambda_env_vars):
+    """Test the alarm state change time is sent with the first message of the chain"""
+    alarm_event['detail']['state']['timestamp'] = '2024-01-01T12:00:00.500+0000'
+
+    elbv2 = MagicMock()
+    elbv2.describe_rules.return_value = {'Rules': [{
+        'RuleArn': 'rule',
+        'IsDefault': False,
+        'Actions': [{'Type': 'forward', 'ForwardConfig': {'TargetGroups': [
+            {'TargetGroupArn': 'arn:aws:elasticloadbalancing:us-east-1:YOUR_ACCOUNT_ID_HERE:targetgroup/test/abc',
+             'Weight': 100},
+            {'TargetGroupArn': 'arn:aws:elasticloadbalancing:us-east-1:YOUR_ACCOUNT_ID_HERE:targetgroup/other/def',
+             'Weight': 0}
+        ]}}]
+    }]}
+    sqs = MagicMock()
+
+    response = alb_alarm_lambda_handler.lambda_handler(alarm_event, lambda_context, elbv2, sqs)
+
+    assert response['message'] == 'Processed alarm:SHED'
+
+    message = json.loads(sqs.send_message.call_args.kwargs['MessageBody'])
+
+    assert message['alarmAt'] == 1704110400.5
+    assert message['hops'] == 1
+    assert message['sentAt'] >= message['alarmAt']
+
+
 def test_lambda_handler_invalid_event_type(lambda_context, lambda_env_vars):
     """Test handler rejects invalid event types"""
     event = {
@@ -127,3 +155,115 @@ def test_lambda_handler_ok_state(lambda_context, lambda_env_vars):
     assert response['statusCode'] == 200
 
 
+
+@pytest.fixture
+def poll_env_vars(monkeypatch, lambda_env_vars):
+    """Set poll mode environment variables"""
+    monkeypatch.setenv('POLL_MODE', 'true')
+    monkeypatch.setenv('POLL_PERIOD_SEC', '10')
+    monkeypatch.setenv('POLL_EVALUATION_PERIODS', '3')
+    monkeypatch.setenv('POLL_INTERVAL_SEC', '10')
+    monkeypatch.setenv('POLL_DURATION_SEC', '50')
+    monkeypatch.setenv('CW_ALARM_NAME', 'test')
+    monkeypatch.setenv('ELB_TARGET_GROUP_ARN', 'arn:aws:elasticloadbalancing:us-east-1:YOUR_ACCOUNT_ID_HERE:targetgroup/test/abc')
+
+
+@pytest.fixture
+def scheduled_event():
+    return {
+        'id': 'test-id',
+        'detail-type': 'Scheduled Event',
+        'source': 'aws.events',
+        'resources': ['arn:aws:events:us-east-1:YOUR_ACCOUNT_ID_HERE:rule/ALBTargetGroupPollRule'],
+        'detail': {},
+        'account': 'YOUR_ACCOUNT_ID_HERE',
+        'region': 'us-east-1'
+    }
+
+
+def polled_cw_client(values):
+    cw_client = MagicMock()
+    cw_client.describe_alarms.return_value = {
+        'MetricAlarms': [{
+            'AlarmName': 'test',
+            'AlarmArn': 'arn:aws:cloudwatch:us-east-1:YOUR_ACCOUNT_ID_HERE:alarm:test',
+            'StateValue': 'OK',
+            'Namespace': 'AWS/ApplicationELB',
+            'MetricName': 'RequestCountPerTarget',
+            'Dimensions': [{'Name': 'TargetGroup', 'Value': 'targetgroup/test/abc'}],
+            'Statistic': 'Sum',
+            'Period': 60,
+            'Threshold': 100.0,
+            'ComparisonOperator': 'GreaterThanThreshold'
+        }]
+    }
+    cw_client.get_metric_data.return_value = {'MetricDataResults': [{'Id': 'm0', 'Values': values}]}
+    return cw_client
+
+
+def test_lambda_handler_scheduled_event_poll_mode_disabled(scheduled_event, lambda_context, lambda_env_vars):
+    """Test scheduled events are ignored unless poll mode is on"""
+    cw_client = MagicMock()
+
+    response = alb_alarm_lambda_handler.lambda_handler(
+        scheduled_event, lambda_context, MagicMock(), MagicMock(), cw_client=cw_client)
+
+    assert response['message'] == 'Polling disabled'
+    cw_client.describe_alarms.assert_not_called()
+
+
+def test_lambda_handler_scheduled_event_sheds_on_breach(scheduled_event, lambda_context, poll_env_vars):
+    """Test a polled breach starts shedding before the alarm changes state"""
+    elbv2 = MagicMock()
+    elbv2.describe_rules.return_value = {'Rules': []}
+    cw_client = polled_cw_client([150.0, 120.0, 110.0])
+
+    response = alb_alarm_lambda_handler.lambda_handler(
+        scheduled_event, lambda_context, elbv2, MagicMock(), cw_client=cw_client)
+
+    assert response['statusCode'] == 200
+    assert response['polls'] == 1
+    # the listener has no rules to shed from, reading them shows the shed was attempted
+    elbv2.describe_rules.assert_called()
+
+
+def test_poll_alarm_metric_polls_for_duration(scheduled_event, poll_env_vars):
+    """Test the metric is polled every interval until the duration runs out"""
+    from elb_load_monitor import config
+
+    elapsed = [0]
+
+    def sleep(sec):
+        elapsed[0] += sec
+
+    elbv2 = MagicMock()
+    cw_client = polled_cw_client([150.0, 50.0, 110.0])
+
+    response = alb_alarm_lambda_handler.poll_alarm_metric(
+        scheduled_event, config.get_config(), elbv2, MagicMock(), cw_client, None, sleep=sleep,
+        clock=lambda: elapsed[0])
+
+    assert response['message'] == 'Polled alarm:NONE'
+    # polls at 0, 10, 20, 30, 40 and 50 seconds
+    assert response['polls'] == 6
+    assert cw_client.get_metric_data.call_count == 6
+    elbv2.describe_rules.assert_not_called()
+
+
+def test_lambda_handler_scheduled_event_predicted_breach(scheduled_event, lambda_context, lambda_env_vars, monkeypatch):
+    """Test a breach predicted from the metric trend pre-sheds without poll mode"""
+    monkeypatch.setenv('PREDICTIVE_SHED', 'true')
+    monkeypatch.setenv('CW_ALARM_NAME', 'test')
+    monkeypatch.setenv('ELB_TARGET_GROUP_ARN', 'arn:aws:elasticloadbalancing:us-east-1:YOUR_ACCOUNT_ID_HERE:targetgroup/test/abc')
+
+    elbv2 = MagicMock()
+    elbv2.describe_rules.return_value = {'Rules': []}
+    cw_client = polled_cw_client([95.0, 80.0, 65.0, 50.0, 35.0])
+
+    response = alb_alarm_lambda_handler.lambda_handler(
+        scheduled_event, lambda_context, elbv2, MagicMock(), cw_client=cw_client)
+
+    assert response['polls'] == 1
+    # the trend is read at the alarm period
+    assert cw_client.get_metric_data.call_args.kwargs['MetricDataQueries'][0]['MetricStat']['Period'] == 60
+    elbv2.describe_rules.assert_called()